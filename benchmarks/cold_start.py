@@ -0,0 +1,187 @@
+"""
+Cold start of the Lambda ingest handler (src/api/lambda_handler.py).
+
+Each run starts a fresh interpreter, as a new execution environment would,
+and times importing the handler, creating its Kinesis client, the first
+invocation with a single event and the first with a batch, against a stub
+client with no latency so the network is left out, and then warm
+invocations. Reports the median of --runs, next to the import of the
+FastAPI app, and a `python -X importtime` breakdown of the handler's
+import by top-level package.
+
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --module src.api.main --top 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLER = "src.api.lambda_handler"
+APP = "src.api.main"
+
+# Runs in the fresh interpreter; imports nothing before the handler
+PROBE = """
+import time
+started = time.perf_counter()
+import src.api.lambda_handler as lambda_handler
+imported = time.perf_counter()
+import sys
+after_import = sorted(sys.modules)
+lambda_handler.get_client()
+client = time.perf_counter()
+after_client = sorted(sys.modules)
+
+import json
+from benchmarks.stubs import StubKinesisClient
+requests = json.loads(sys.stdin.read())
+lambda_handler._client = StubKinesisClient(latency=0)
+timings = {"import": imported - started, "client": client - imported}
+for name in ("event", "batch"):
+    invoked = time.perf_counter()
+    response = lambda_handler.handler(requests[name])
+    timings["first_" + name] = time.perf_counter() - invoked
+    assert response["statusCode"] == 200, response
+warm = []
+for _ in range(50):
+    invoked = time.perf_counter()
+    lambda_handler.handler(requests["event"])
+    warm.append(time.perf_counter() - invoked)
+timings["warm_event"] = sorted(warm)[len(warm) // 2]
+print(json.dumps({"timings": timings, "after_import": after_import, "after_client": after_client}))
+"""
+
+TIMINGS = (
+    ("import", "import"),
+    ("client", "Kinesis client"),
+    ("first_event", "first invocation"),
+    ("first_batch", "first batch of 100"),
+    ("warm_event", "warm invocation")
+)
+
+
+def environment() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    return env
+
+
+def proxy_requests() -> Dict[str, Any]:
+    """A payload 1.0 single event and a payload 2.0 batch, as API Gateway sends them."""
+    from benchmarks.suite import synthetic_events
+
+    event = synthetic_events(1, event_type="game_start")[0]
+    return {
+        "event": {
+            "httpMethod": "POST",
+            "path": "/events/game-start",
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(event),
+            "isBase64Encoded": False
+        },
+        "batch": {
+            "version": "2.0",
+            "rawPath": "/prod/events/batch",
+            "requestContext": {"http": {"method": "POST", "path": "/prod/events/batch"}},
+            "headers": {"content-type": "application/json"},
+            "body": json.dumps(synthetic_events(100)),
+            "isBase64Encoded": False
+        }
+    }
+
+
+def probe(requests: Dict[str, Any]) -> Dict[str, Any]:
+    """One cold start in a fresh interpreter: timings in seconds and the modules loaded."""
+    result = subprocess.run([sys.executable, "-c", PROBE], input=json.dumps(requests), capture_output=True,
+                            text=True, cwd=ROOT, env=environment(), check=True)
+    return json.loads(result.stdout)
+
+
+def cold_start(runs: int) -> Tuple[Dict[str, float], Dict[str, Any]]:
+    """Median timings in seconds over `runs` fresh interpreters, and the last run's output."""
+    requests = proxy_requests()
+    results = [probe(requests) for _ in range(runs)]
+    timings = {name: statistics.median(result["timings"][name] for result in results) for name, _ in TIMINGS}
+    timings["cold_start"] = timings["import"] + timings["client"] + timings["first_event"]
+    return timings, results[-1]
+
+
+def import_times(module: str) -> List[Tuple[str, int, int, int]]:
+    """
+    (module, depth, self us, cumulative us) for every module `import module`
+    loads, from -X importtime; depth 1 are the imports of `module` itself.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True,
+                            text=True, cwd=ROOT, env=environment(), check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def import_seconds(module: str, runs: int) -> float:
+    """Median cumulative import time of `module` over fresh interpreters."""
+    return statistics.median(
+        next(cumulative for name, _, _, cumulative in import_times(module) if name == module) / 1e6
+        for _ in range(runs)
+    )
+
+
+def direct_imports(rows: List[Tuple[str, int, int, int]], module: str) -> List[Tuple[str, float]]:
+    """Cumulative seconds of each import of `module` itself, slowest first."""
+    end = next(index for index, (name, depth, _, _) in enumerate(rows) if depth == 0 and name == module)
+    start = end
+    # -X importtime lists a module after everything it imported
+    while start > 0 and rows[start - 1][1] > 0:
+        start -= 1
+    direct = [(name, cumulative / 1e6) for name, depth, _, cumulative in rows[start:end] if depth == 1]
+    return sorted(direct, key=lambda row: -row[1])
+
+
+def by_package(rows: List[Tuple[str, int, int, int]]) -> List[Tuple[str, float, int]]:
+    """Self time in seconds and module count per top-level package, slowest first."""
+    totals, counts = defaultdict(int), defaultdict(int)
+    for name, _, self_us, _ in rows:
+        package = ".".join(name.split(".")[:3]) if name.startswith("src.") else name.split(".")[0]
+        totals[package] += self_us
+        counts[package] += 1
+    return sorted(((package, us / 1e6, counts[package]) for package, us in totals.items()), key=lambda row: -row[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--module", default=HANDLER, help="Module whose import to break down")
+    parser.add_argument("--top", type=int, default=12, help="Packages to list in the breakdown")
+    args = parser.parse_args()
+
+    timings, _ = cold_start(args.runs)
+    app_seconds = import_seconds(APP, args.runs)
+    print(f"{HANDLER}, median of {args.runs} fresh interpreters (stub Kinesis, no network):")
+    for name, label in TIMINGS:
+        print(f"  {label:<22} {timings[name] * 1000:>8.2f} ms")
+    print(f"  {'cold start':<22} {timings['cold_start'] * 1000:>8.2f} ms  (import, client, first invocation)")
+    print(f"{APP} import: {app_seconds * 1000:.0f} ms\n")
+
+    rows = import_times(args.module)
+    total = sum(self_us for _, _, self_us, _ in rows) / 1e6
+    print(f"python -X importtime -c 'import {args.module}': {len(rows)} modules, {total * 1000:.0f} ms")
+    print("Self time by package:")
+    for package, seconds, count in by_package(rows)[:args.top]:
+        print(f"  {package:<28} {seconds * 1000:>7.1f} ms {seconds / total:>6.1%}  {count:>4} modules")
+    print(f"Cumulative time of what {args.module} imports itself:")
+    for name, seconds in direct_imports(rows, args.module)[:args.top]:
+        print(f"  {name:<28} {seconds * 1000:>7.1f} ms {seconds / total:>6.1%}")
+
+
+if __name__ == "__main__":
+    main()
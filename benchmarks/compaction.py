@@ -0,0 +1,130 @@
+"""
+Compression and scan speed of compacted Parquet against raw Firehose JSON.
+
+Generates an hour of events as small raw objects of concatenated JSON (as
+Firehose writes them) in a temporary local lake, runs the compaction job,
+and compares:
+- bytes on disk: raw JSON, raw JSON gzipped, Parquet
+- an analytical scan (revenue per game and average session duration per
+  game) over the raw objects and over the Parquet files
+- a rerun, which should be skipped via the manifest
+
+    python -m benchmarks.compaction --events 200000 --per-object 500
+"""
+import argparse
+import gzip
+import json
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pyarrow.parquet as pq
+
+from src.processors.compaction import RAW_PREFIX, CompactionJob, iter_json_records, partition_path
+from src.utils.storage import LocalStorage
+from tests.test_data_generator import (
+    generate_game_start_event,
+    generate_game_end_event,
+    generate_purchase_event,
+    generate_progress_event
+)
+
+HOUR = datetime(2024, 1, 15, 13)
+
+
+def generate(raw: LocalStorage, events: int, per_object: int, rng: random.Random) -> int:
+    """Write the hour's raw objects; returns their total size."""
+    players = [f"player_{i:06d}" for i in range(max(events // 20, 1))]
+    total, buffer, part = 0, [], 0
+    for i in range(events):
+        player_id = rng.choice(players)
+        session_id = f"session_{i // 8}"
+        game_id = f"game_{rng.randint(1, 3)}"
+        kind = rng.random()
+        if kind < 0.15:
+            event = generate_game_start_event(player_id, session_id)
+        elif kind < 0.3:
+            event = generate_game_end_event(player_id, session_id, game_id)
+        elif kind < 0.35:
+            event = generate_purchase_event(player_id, session_id, game_id)
+        else:
+            event = generate_progress_event(player_id, session_id, game_id)
+        event["timestamp"] = (HOUR + timedelta(seconds=rng.random() * 3600)).isoformat()
+        buffer.append(json.dumps(event))
+        if len(buffer) == per_object or i == events - 1:
+            data = "".join(buffer).encode()
+            raw.write(f"{RAW_PREFIX}{partition_path(HOUR)}game-events-to-s3-{part:06d}", data)
+            total += len(data)
+            buffer, part = [], part + 1
+    return total
+
+
+def scan_raw(raw: LocalStorage):
+    revenue, durations = defaultdict(float), defaultdict(list)
+    for obj in raw.list(f"{RAW_PREFIX}{partition_path(HOUR)}"):
+        for event in iter_json_records(raw.read(obj["key"])):
+            if event["event_type"] == "purchase":
+                revenue[event["game_id"]] += event["amount"]
+            elif event["event_type"] == "game_end":
+                durations[event["game_id"]].append(event["duration"])
+    return dict(revenue), {game: sum(d) / len(d) for game, d in durations.items()}
+
+
+def scan_parquet(root: str):
+    base = f"{root}/events/event_type={{}}/{partition_path(HOUR)}"
+    purchases = pq.read_table(base.format("purchase"), columns=["game_id", "amount"])
+    sessions = pq.read_table(base.format("game_end"), columns=["game_id", "duration"])
+    revenue = purchases.group_by("game_id").aggregate([("amount", "sum")])
+    durations = sessions.group_by("game_id").aggregate([("duration", "mean")])
+    return (
+        dict(zip(revenue["game_id"].to_pylist(), revenue["amount_sum"].to_pylist())),
+        dict(zip(durations["game_id"].to_pylist(), durations["duration_mean"].to_pylist()))
+    )
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--per-object", type=int, default=500, help="Events per raw object")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as root:
+        raw, processed = LocalStorage(f"{root}/raw"), LocalStorage(f"{root}/processed")
+        raw_bytes = generate(raw, args.events, args.per_object, rng)
+        gzip_bytes = sum(
+            len(gzip.compress(raw.read(obj["key"])))
+            for obj in raw.list(RAW_PREFIX)
+        )
+
+        job = CompactionJob(raw, processed)
+        manifest, compact_seconds = timed(job.compact_hour, HOUR)
+        rerun, rerun_seconds = timed(job.compact_hour, HOUR)
+
+        print(f"events {manifest['records']:,} ({manifest['rejected']} rejected) in "
+              f"{len(manifest['sources'])} raw objects -> {len(manifest['outputs'])} Parquet files")
+        print(f"compaction {compact_seconds:.2f} s, rerun skipped={rerun['skipped']} in {rerun_seconds * 1000:.1f} ms")
+        print(f"raw JSON   {raw_bytes / 1e6:>8.2f} MB")
+        print(f"raw gzip   {gzip_bytes / 1e6:>8.2f} MB  ({raw_bytes / gzip_bytes:.1f}x)")
+        print(f"parquet    {manifest['output_bytes'] / 1e6:>8.2f} MB  ({raw_bytes / manifest['output_bytes']:.1f}x)")
+
+        (raw_revenue, raw_durations), raw_seconds = timed(scan_raw, raw)
+        (pq_revenue, pq_durations), pq_seconds = timed(scan_parquet, processed.root)
+        for game, total in raw_revenue.items():
+            assert abs(pq_revenue[game] - total) < 1e-6 * max(total, 1)
+            assert abs(pq_durations[game] - raw_durations[game]) < 1e-6 * raw_durations[game]
+        print(f"scan raw JSON {raw_seconds * 1000:>8.1f} ms, Parquet {pq_seconds * 1000:>8.1f} ms "
+              f"({raw_seconds / pq_seconds:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Memory, false positive rate and cost of the event_id deduplicator.
+
+For each target false positive rate (or --bits-per-event), fills every
+bucket filter of src/api/dedup.py to its capacity and reports the memory
+per million events held, the hash count, the false positive rate measured
+on event_ids never added against the target and the filters' own
+estimate, and the time of add and of a lookup, in process memory and in a
+shared file mapping. Then replays an hour of arrivals with resent events
+and counts the duplicates removed and the new events wrongly dropped,
+against an exact set of the same event_ids.
+
+    python -m benchmarks.dedup --capacity 200000
+    python -m benchmarks.dedup --bits-per-event 8 12 16
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+from src.api.dedup import EventDeduplicator
+
+
+def event_ids(count: int, rng: random.Random):
+    return [uuid.UUID(int=rng.getrandbits(128), version=4) for _ in range(count)]
+
+
+def measure(capacity: int, rng: random.Random, path=None, **config):
+    """Fill every slot of a 1 h, 6 bucket ring to capacity, then look up new event_ids."""
+    now = [0.0]
+    dedup = EventDeduplicator(horizon_seconds=3600, buckets=6, bucket_capacity=capacity, path=path,
+                              clock=lambda: now[0], **config)
+    added, add_seconds = [], 0.0
+    for slot in range(dedup.slots):
+        now[0] = slot * dedup.bucket_seconds
+        bucket = event_ids(capacity, rng)
+        started = time.perf_counter()
+        for event_id in bucket:
+            dedup.add(event_id)
+        add_seconds += time.perf_counter() - started
+        added += bucket[:1000]
+    fresh = event_ids(capacity, rng)
+    started = time.perf_counter()
+    false_positives = sum(1 for event_id in fresh if event_id in dedup)
+    lookup_seconds = (time.perf_counter() - started) / capacity
+    # The oldest bucket is past the horizon only once the next one starts
+    missed = sum(1 for event_id in added if event_id not in dedup)
+    assert missed == 0, f"{missed} added event_ids not found"
+    result = (dedup.bytes_per_million, dedup.hashes, false_positives / capacity,
+              dedup.estimated_false_positive_rate(), add_seconds / (capacity * dedup.slots), lookup_seconds)
+    dedup.close()
+    return result
+
+
+def replay_hour(capacity: int, rate: float, duplicate_share: float, rng: random.Random, **config):
+    """An hour of arrivals at `rate` per second: duplicates, removed, false drops, exact set and filter bytes."""
+    now = [0.0]
+    dedup = EventDeduplicator(horizon_seconds=3600, buckets=6, bucket_capacity=capacity,
+                              clock=lambda: now[0], **config)
+    seen, recent = set(), []
+    duplicates = removed = false_drops = 0
+    for i in range(int(rate * 3600)):
+        now[0] = i / rate
+        if recent and rng.random() < duplicate_share:
+            # A retry of an event sent in the last few minutes
+            event_id = recent[-1 - rng.randrange(min(len(recent), int(rate * 300)))]
+        else:
+            event_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+            recent.append(event_id)
+        is_duplicate = event_id in seen
+        duplicates += is_duplicate
+        if event_id in dedup:
+            if is_duplicate:
+                removed += 1
+            else:
+                false_drops += 1
+            continue
+        dedup.add(event_id)
+        seen.add(event_id)
+    exact_bytes = sys.getsizeof(seen) + sum(sys.getsizeof(event_id) + 16 for event_id in seen)
+    return duplicates, removed, false_drops, exact_bytes, dedup.memory_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capacity", type=int, default=50000, help="Events per bucket filter")
+    parser.add_argument("--false-positive-rates", type=float, nargs="+", default=[0.01, 0.001, 0.0001, 0.00001])
+    parser.add_argument("--bits-per-event", type=float, nargs="+", help="Size filters by memory instead")
+    parser.add_argument("--rate", type=float, default=200, help="Events per second of the replayed hour")
+    parser.add_argument("--duplicates", type=float, default=0.02, help="Share of arrivals that are resends")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    configs = ([{"bits_per_event": bits} for bits in args.bits_per_event] if args.bits_per_event
+               else [{"false_positive_rate": rate} for rate in args.false_positive_rates])
+    print(f"1 h horizon in 6 buckets, 7 filters of {args.capacity:,} events each, all full\n")
+    print(f"{'config':<18} {'MB/M events':>11} {'k':>3} {'target fp':>10} {'measured fp':>11} "
+          f"{'estimated':>10} {'add':>8} {'lookup':>8} {'shared add':>11} {'lookup':>8}")
+    with tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir("/dev/shm") else None) as directory:
+        for config in configs:
+            name, value = next(iter(config.items()))
+            label = f"fp {value:g}" if name == "false_positive_rate" else f"{value:g} bits/event"
+            per_million, hashes, measured, estimated, add, lookup = measure(args.capacity, rng, **config)
+            path = os.path.join(directory, f"dedup-{value:g}")
+            *_, shared_add, shared_lookup = measure(args.capacity, rng, path=path, **config)
+            target = value if name == "false_positive_rate" else estimated
+            print(f"{label:<18} {per_million / 1e6:>11.2f} {hashes:>3} {target:>10.2e} {measured:>11.2e} "
+                  f"{estimated:>10.2e} {add * 1e6:>5.2f} us {lookup * 1e6:>5.2f} us "
+                  f"{shared_add * 1e6:>8.2f} us {shared_lookup * 1e6:>5.2f} us")
+
+    config = configs[len(configs) // 2]
+    capacity = int(args.rate * 600 * 1.1)
+    duplicates, removed, false_drops, exact_bytes, memory = replay_hour(
+        capacity, args.rate, args.duplicates, rng, **config)
+    print(f"\nOne hour at {args.rate:g} events/s with {args.duplicates:.0%} resends ({config}): "
+          f"{removed:,} of {duplicates:,} duplicates removed, {false_drops} new events dropped; "
+          f"filters and reservations {memory / 1e6:.1f} MB vs {exact_bytes / 1e6:.1f} MB for an exact set")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+HyperLogLog accuracy and memory against exact distinct counts.
+
+For each precision and cardinality, reports the mean and worst relative
+error over several trials, the sketch size and the memory an exact set of
+the same IDs needs (roughly what COUNT(DISTINCT) keeps in state). The
+rollup case merges a day of 5-minute window sketches, with players
+recurring across windows, and compares the daily estimate with the exact
+union.
+
+    python -m benchmarks.distinct_counts --trials 3
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+
+from src.processors.sketches import HyperLogLog
+
+
+def exact_set_bytes(values: set) -> int:
+    return sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+
+
+def measure(precision: int, cardinality: int, trials: int, rng: random.Random):
+    errors, add_seconds = [], 0.0
+    exact_bytes = 0
+    for _ in range(trials):
+        values = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(cardinality)]
+        sketch = HyperLogLog(precision)
+        started = time.perf_counter()
+        sketch.update(values)
+        add_seconds += time.perf_counter() - started
+        errors.append(abs(sketch.count() - cardinality) / cardinality)
+        exact_bytes = exact_set_bytes(set(values))
+    return (sum(errors) / len(errors), max(errors), len(sketch.to_bytes()), exact_bytes,
+            add_seconds / (trials * cardinality) * 1e6)
+
+
+def rollup(precision: int, players: int, windows: int, per_window: int, rng: random.Random):
+    population = [f"player_{i}" for i in range(players)]
+    merged, exact = HyperLogLog(precision), set()
+    for _ in range(windows):
+        active = rng.sample(population, per_window)
+        window = HyperLogLog(precision)
+        window.update(active)
+        merged.merge(HyperLogLog.from_bytes(window.to_bytes()))
+        exact.update(active)
+    return merged.count(), len(exact)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--precisions", type=int, nargs="+", default=[10, 12, 14])
+    parser.add_argument("--cardinalities", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'p':>3} {'distinct':>9} {'mean err':>9} {'max err':>8} {'sketch B':>9} {'exact B':>11} {'add us':>7}")
+    for precision in args.precisions:
+        for cardinality in args.cardinalities:
+            mean_error, max_error, sketch_bytes, exact_bytes, add_us = measure(
+                precision, cardinality, args.trials, rng)
+            print(f"{precision:>3} {cardinality:>9} {mean_error:>8.2%} {max_error:>7.2%} "
+                  f"{sketch_bytes:>9} {exact_bytes:>11} {add_us:>7.2f}")
+
+    print("\nDaily rollup of 288 five-minute windows (2000 active of 50000 players each):")
+    for precision in args.precisions:
+        estimate, exact = rollup(precision, 50000, 288, 2000, rng)
+        print(f"  p={precision}: estimate {estimate}, exact {exact}, error {abs(estimate - exact) / exact:.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Micro-benchmark of event validation and serialization, per event type.
+
+Compares the previous ingest path (JSON decode, catch-all model, model_dump,
+dict mutation, json.dumps) with the discriminated-union path that validates
+from bytes and serializes straight back to bytes. Single-threaded, so the
+numbers are events/sec per core.
+
+    python -m benchmarks.event_validation --seconds 1
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+from src.api.main import serialize_event
+from src.models.base import game_event_adapter
+
+
+class LegacyGameEvent(BaseModel):
+    """The catch-all model the API validated against before."""
+    event_id: str
+    timestamp: str
+    game_id: str
+    player_id: str
+    session_id: str
+    event_type: str
+    version: str
+    device_info: Optional[Dict[str, Any]] = None
+    client_version: Optional[str] = None
+    duration: Optional[int] = None
+    score: Optional[int] = None
+    level_reached: Optional[int] = None
+    coins_earned: Optional[int] = None
+    item_id: Optional[str] = None
+    item_name: Optional[str] = None
+    currency_type: Optional[str] = None
+    amount: Optional[float] = None
+    currency_code: Optional[str] = None
+    level: Optional[int] = None
+    xp_earned: Optional[int] = None
+    achievements: Optional[list] = None
+    current_state: Optional[Dict[str, Any]] = None
+
+
+BASE = {
+    "event_id": str(uuid.uuid4()),
+    "timestamp": "2023-11-01T12:00:00",
+    "game_id": "game_1",
+    "player_id": "player_1234abcd",
+    "session_id": "session_1234abcd",
+    "version": "1.0"
+}
+
+EVENTS = {
+    "game_start": {
+        **BASE, "event_type": "game_start",
+        "device_info": {"os": "iOS", "model": "iPhone 12", "os_version": "15.0"},
+        "client_version": "2.1.0"
+    },
+    "game_end": {
+        **BASE, "event_type": "game_end",
+        "duration": 300, "score": 1000, "level_reached": 5, "coins_earned": 150
+    },
+    "purchase": {
+        **BASE, "event_type": "purchase",
+        "item_id": "boost_1", "item_name": "Power Boost", "currency_type": "real",
+        "amount": 0.99, "currency_code": "USD"
+    },
+    "progress": {
+        **BASE, "event_type": "progress",
+        "level": 5, "xp_earned": 100, "achievements": ["first_win", "speed_demon"],
+        "current_state": {"health": 100, "coins": 1000, "inventory": ["sword", "shield"]}
+    }
+}
+
+
+def legacy_path(body: bytes) -> bytes:
+    event = LegacyGameEvent.model_validate(json.loads(body))
+    event_data = event.model_dump()
+    event_data["server_timestamp"] = datetime.utcnow().isoformat()
+    return json.dumps(event_data).encode()
+
+
+def fast_path(body: bytes) -> bytes:
+    return serialize_event(game_event_adapter.validate_json(body), datetime.utcnow())
+
+
+def events_per_second(func, body: bytes, seconds: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(1000):
+            func(body)
+        count += 1000
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=1.0, help="Measurement time per case")
+    args = parser.parse_args()
+
+    print(f"{'event_type':<12} {'legacy ev/s':>12} {'fast ev/s':>12} {'speedup':>8}")
+    for event_type, event in EVENTS.items():
+        body = json.dumps(event).encode()
+        legacy = events_per_second(legacy_path, body, args.seconds)
+        fast = events_per_second(fast_path, body, args.seconds)
+        print(f"{event_type:<12} {legacy:>12.0f} {fast:>12.0f} {fast / legacy:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Records/sec per slot of the windowed aggregations, before and after moving
+payload extraction out of Python UDFs.
+
+"before" reads events with their type-specific fields in a JSON `payload`
+string and extracts them with the scalar Python UDFs the processor used to
+have (the revenue query parses each purchase twice). "after" reads the flat
+events the API writes, with typed columns parsed by the JSON format in the
+JVM. Both run the session and revenue queries at parallelism 1 into
+blackhole sinks over the same synthetic events, so the difference is the
+extraction cost. Needs apache-flink and a JVM.
+
+    python -m benchmarks.flink_payload_extraction --events 500000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pyflink.table import DataTypes, EnvironmentSettings, TableEnvironment
+from pyflink.table.udf import udf
+from pyflink.common import Row
+
+from src.processors.stream_processor import event_columns_ddl
+
+HEADER_FIELDS = ("event_id", "timestamp", "game_id", "player_id", "session_id", "event_type", "version")
+
+
+@udf(result_type=DataTypes.ROW([
+    DataTypes.FIELD("duration", DataTypes.INT()),
+    DataTypes.FIELD("score", DataTypes.INT()),
+    DataTypes.FIELD("level", DataTypes.INT())
+]))
+def extract_game_end_data(payload: str) -> Row:
+    data = json.loads(payload)
+    return Row(
+        duration=data.get('duration', 0),
+        score=data.get('score', 0),
+        level=data.get('level_reached', 0)
+    )
+
+
+@udf(result_type=DataTypes.ROW([
+    DataTypes.FIELD("amount", DataTypes.DOUBLE()),
+    DataTypes.FIELD("currency_code", DataTypes.STRING())
+]))
+def extract_purchase_data(payload: str) -> Row:
+    data = json.loads(payload)
+    return Row(
+        amount=float(data.get('amount', 0.0)),
+        currency_code=data.get('currency_code', 'USD')
+    )
+
+
+def write_events(directory: str, count: int, seed: int):
+    """Write the same synthetic events in the flat and payload layouts."""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    flat_path = os.path.join(directory, "flat", "events.json")
+    payload_path = os.path.join(directory, "payload", "events.json")
+    os.makedirs(os.path.dirname(flat_path))
+    os.makedirs(os.path.dirname(payload_path))
+    with open(flat_path, "w") as flat, open(payload_path, "w") as nested:
+        for i in range(count):
+            event = {
+                "event_id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "timestamp": (start + timedelta(milliseconds=i * 10)).isoformat(),
+                "game_id": f"game_{rng.randint(1, 3)}",
+                "player_id": f"player_{rng.randint(1, 10000)}",
+                "session_id": f"session_{rng.randint(1, 50000)}",
+                "version": "1.0"
+            }
+            if rng.random() < 0.5:
+                event.update(event_type="game_end", duration=rng.randint(60, 3600), score=rng.randint(100, 10000),
+                             level_reached=rng.randint(1, 10), coins_earned=rng.randint(10, 1000))
+            else:
+                event.update(event_type="purchase", item_id="boost_1", item_name="Power Boost",
+                             currency_type="real", amount=rng.choice([0.99, 1.99, 4.99]), currency_code="USD")
+            flat.write(json.dumps(event) + "\n")
+            header = {k: event[k] for k in HEADER_FIELDS}
+            header["payload"] = json.dumps({k: v for k, v in event.items() if k not in HEADER_FIELDS})
+            nested.write(json.dumps(header) + "\n")
+    return os.path.dirname(flat_path), os.path.dirname(payload_path)
+
+
+def create_env() -> TableEnvironment:
+    t_env = TableEnvironment.create(EnvironmentSettings.in_streaming_mode())
+    t_env.get_config().set("parallelism.default", "1")
+    return t_env
+
+
+def create_sinks(t_env: TableEnvironment):
+    for name, columns in (("session_sink", "total_sessions BIGINT, avg_duration DOUBLE"),
+                          ("revenue_sink", "total_revenue DOUBLE, transaction_count BIGINT, avg_transaction DOUBLE")):
+        t_env.execute_sql(f"""
+            CREATE TABLE {name} (
+                window_start TIMESTAMP(3), window_end TIMESTAMP(3), game_id STRING, {columns}
+            ) WITH ('connector' = 'blackhole')
+        """)
+
+
+def run_before(path: str) -> float:
+    t_env = create_env()
+    t_env.execute_sql(f"""
+        CREATE TABLE game_events (
+            event_id STRING, `timestamp` TIMESTAMP(3), game_id STRING, player_id STRING,
+            session_id STRING, event_type STRING, version STRING, payload STRING,
+            WATERMARK FOR `timestamp` AS `timestamp` - INTERVAL '5' SECOND
+        ) WITH ('connector' = 'filesystem', 'path' = '{path}', 'format' = 'json',
+                'json.timestamp-format.standard' = 'ISO-8601')
+    """)
+    create_sinks(t_env)
+    t_env.create_temporary_function("extract_game_end_data", extract_game_end_data)
+    t_env.create_temporary_function("extract_purchase_data", extract_purchase_data)
+    statements = t_env.create_statement_set()
+    statements.add_insert_sql("""
+        INSERT INTO session_sink
+        SELECT TUMBLE_START(`timestamp`, INTERVAL '5' MINUTE), TUMBLE_END(`timestamp`, INTERVAL '5' MINUTE),
+               game_id, COUNT(DISTINCT session_id), AVG(extract_game_end_data(payload).duration)
+        FROM game_events WHERE event_type = 'game_end'
+        GROUP BY TUMBLE(`timestamp`, INTERVAL '5' MINUTE), game_id
+    """)
+    statements.add_insert_sql("""
+        INSERT INTO revenue_sink
+        SELECT TUMBLE_START(`timestamp`, INTERVAL '5' MINUTE), TUMBLE_END(`timestamp`, INTERVAL '5' MINUTE),
+               game_id, SUM(extract_purchase_data(payload).amount), COUNT(*),
+               AVG(extract_purchase_data(payload).amount)
+        FROM game_events WHERE event_type = 'purchase'
+        GROUP BY TUMBLE(`timestamp`, INTERVAL '5' MINUTE), game_id
+    """)
+    started = time.perf_counter()
+    statements.execute().wait()
+    return time.perf_counter() - started
+
+
+def run_after(path: str) -> float:
+    t_env = create_env()
+    t_env.execute_sql(f"""
+        CREATE TABLE game_events (
+            `timestamp` TIMESTAMP(3),
+            {event_columns_ddl()},
+            WATERMARK FOR `timestamp` AS `timestamp` - INTERVAL '5' SECOND
+        ) WITH ('connector' = 'filesystem', 'path' = '{path}', 'format' = 'json',
+                'json.timestamp-format.standard' = 'ISO-8601')
+    """)
+    create_sinks(t_env)
+    statements = t_env.create_statement_set()
+    statements.add_insert_sql("""
+        INSERT INTO session_sink
+        SELECT TUMBLE_START(`timestamp`, INTERVAL '5' MINUTE), TUMBLE_END(`timestamp`, INTERVAL '5' MINUTE),
+               game_id, COUNT(DISTINCT session_id), AVG(CAST(duration AS DOUBLE))
+        FROM game_events WHERE event_type = 'game_end'
+        GROUP BY TUMBLE(`timestamp`, INTERVAL '5' MINUTE), game_id
+    """)
+    statements.add_insert_sql("""
+        INSERT INTO revenue_sink
+        SELECT TUMBLE_START(`timestamp`, INTERVAL '5' MINUTE), TUMBLE_END(`timestamp`, INTERVAL '5' MINUTE),
+               game_id, SUM(amount), COUNT(*), AVG(amount)
+        FROM game_events WHERE event_type = 'purchase'
+        GROUP BY TUMBLE(`timestamp`, INTERVAL '5' MINUTE), game_id
+    """)
+    started = time.perf_counter()
+    statements.execute().wait()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        flat_path, payload_path = write_events(directory, args.events, args.seed)
+        print(f"{'variant':<8} {'seconds':>8} {'records/s/slot':>15}")
+        for name, run, path in (("before", run_before, payload_path), ("after", run_after, flat_path)):
+            elapsed = run(path)
+            print(f"{name:<8} {elapsed:>8.1f} {args.events / elapsed:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Leaderboard update and query throughput at scale.
+
+Builds one board of --players players (as a snapshot restore would), then
+measures score submissions (a mix of improvements and no-ops), rank lookups
+for random players, top-100 pages, and the snapshot round trip.
+
+    python -m benchmarks.leaderboard --players 10000000
+"""
+import argparse
+import random
+import resource
+import time
+
+from src.utils.leaderboard import Leaderboard, decode_snapshot, encode_snapshot
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(label: str, count: int, func):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {count:>10} ops {elapsed:>8.2f} s {count / elapsed:>12,.0f} ops/s "
+          f"{elapsed / count * 1e6:>8.2f} us/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=10_000_000)
+    parser.add_argument("--operations", type=int, default=200_000)
+    parser.add_argument("--snapshot", action="store_true", help="Also time the snapshot round trip")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    baseline = rss_mb()
+    started = time.perf_counter()
+    board = Leaderboard.from_entries(
+        (f"player_{i}", rng.randrange(1_000_000)) for i in range(args.players)
+    )
+    print(f"built {len(board):,} players in {time.perf_counter() - started:.1f} s, "
+          f"~{rss_mb() - baseline:,.0f} MB")
+
+    players = [f"player_{rng.randrange(args.players)}" for _ in range(args.operations)]
+    scores = [rng.randrange(1_200_000) for _ in range(args.operations)]
+
+    def updates():
+        for player_id, score in zip(players, scores):
+            board.submit(player_id, score)
+
+    def ranks():
+        for player_id in players:
+            board.rank(player_id)
+
+    def pages():
+        for i in range(args.operations // 100):
+            board.top(100, (i * 100) % len(board))
+
+    timed("submit (best-score updates)", args.operations, updates)
+    timed("rank lookup", args.operations, ranks)
+    timed("top-100 page", args.operations // 100, pages)
+
+    if args.snapshot:
+        started = time.perf_counter()
+        data = encode_snapshot(board)
+        encoded = time.perf_counter() - started
+        started = time.perf_counter()
+        restored = decode_snapshot(data)
+        decoded = time.perf_counter() - started
+        assert restored.top(10) == board.top(10)
+        print(f"snapshot {len(data) / 1e6:,.1f} MB, encode {encoded:.1f} s, restore {decoded:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Per-request cost of the Prometheus instrumentation on POST /events/{type}.
+
+Times the work the handler adds per request (clock reads, the label lookups
+and two histogram observations, plus the wrapper coroutine) with the
+lock-free histograms of src/api/metrics.py and, for comparison, with
+prometheus_client's Histogram. Then times whole requests through the ASGI
+app against a stub Kinesis client and reports the instrumentation as a
+share of it, and checks that GET /metrics renders.
+
+    python -m benchmarks.metrics_overhead --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+import timeit
+
+import httpx
+import prometheus_client
+from prometheus_client import CollectorRegistry
+
+from benchmarks.stubs import StubKinesisClient
+from benchmarks.suite import synthetic_events
+from src.api import metrics
+from src.api.aggregator import RecordAggregator
+from src.api.dedup import EventDeduplicator
+from src.api.producer import KinesisProducer
+
+EVENT_TYPE_PATHS = {"game-end": "game_end"}
+
+
+def instrumentation(request_seconds, validation_seconds):
+    """The instrumentation statements of ingest_event, without the request."""
+    async def inner(metric_type):
+        started = time.perf_counter()
+        validation_seconds.labels(metric_type).observe(time.perf_counter() - started)
+
+    async def handler(event_type):
+        started = time.perf_counter()
+        metric_type = EVENT_TYPE_PATHS.get(event_type, "unknown")
+        try:
+            return await inner(metric_type)
+        finally:
+            request_seconds.labels(metric_type).observe(time.perf_counter() - started)
+
+    return _driver(handler)
+
+
+def uninstrumented():
+    """The same call without the wrapper coroutine, clocks or histograms."""
+    async def handler(event_type):
+        return EVENT_TYPE_PATHS.get(event_type, "unknown")
+
+    return _driver(handler)
+
+
+def _driver(handler):
+    def run():
+        coroutine = handler("game-end")
+        try:
+            coroutine.send(None)
+        except StopIteration:
+            pass
+    return run
+
+
+def per_call(function, number: int) -> float:
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+
+async def ingest(requests: int, concurrency: int) -> float:
+    from src.api import main
+
+    stub = StubKinesisClient(latency=0)
+    main.producer = KinesisProducer(client=stub, max_workers=8)
+    main.aggregator = RecordAggregator(main.producer, main.STREAM_NAME, linger_ms=1)
+    # The bodies repeat; a dedup clock a day on per burst keeps every event new
+    bursts = [0]
+    main.deduplicator = EventDeduplicator(bucket_capacity=10000, clock=lambda: bursts[0] * 86400.0)
+    await main.aggregator.start()
+    bodies = [json.dumps(event).encode() for event in synthetic_events(1000, event_type="game_end")]
+    headers = {"Content-Type": "application/json"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        async def burst(offset):
+            bursts[0] += 1
+            await asyncio.gather(*(
+                client.post("/events/game-end", content=bodies[(offset + i) % len(bodies)], headers=headers)
+                for i in range(concurrency)
+            ))
+            stub.records.clear()
+
+        await burst(0)
+        started = time.perf_counter()
+        for offset in range(0, requests, concurrency):
+            await burst(offset)
+        elapsed = (time.perf_counter() - started) / requests
+
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        assert 'game_api_request_seconds_count{event_type="game_end"}' in response.text
+        assert "kinesis_records_total" in response.text
+    await main.aggregator.close()
+    main.producer.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--calls", type=int, default=100000, help="Calls per timing of the instrumentation alone")
+    args = parser.parse_args()
+
+    registry = CollectorRegistry()
+    variants = {
+        "none": uninstrumented(),
+        "src.api.metrics": instrumentation(metrics.REQUEST_SECONDS, metrics.VALIDATION_SECONDS),
+        "prometheus_client": instrumentation(*(
+            prometheus_client.Histogram(f"bench_{name}_seconds", "", ["event_type"], registry=registry)
+            for name in ("request", "validation")
+        )),
+    }
+    timings = {name: per_call(run, args.calls) for name, run in variants.items()}
+    print(f"{'histograms':<20} {'per request':>12} {'added':>10}")
+    for name, seconds in timings.items():
+        print(f"{name:<20} {seconds * 1e6:>9.2f} us {(seconds - timings['none']) * 1e6:>7.2f} us")
+
+    request_seconds = asyncio.run(ingest(args.requests, args.concurrency))
+    overhead = timings["src.api.metrics"] - timings["none"]
+    print(f"\nPOST /events/game-end: {request_seconds * 1e6:.1f} us per request in process; "
+          f"instrumentation {overhead * 1e6:.2f} us ({overhead / request_seconds:.1%})")
+
+
+if __name__ == "__main__":
+    main()
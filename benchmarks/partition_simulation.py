@@ -0,0 +1,123 @@
+"""
+Replay a skewed player population against each partitioning strategy and
+report per-shard load balance.
+
+Players are drawn from a Zipf distribution over `--players` ranks, with a
+bot flood that sends `--bot-share` of all events from one player over
+`--bot-sessions` sessions. By default the bot alone sends more than a
+shard's 1000 records/s, so only a strategy that spreads its key keeps it
+from throttling. Each simulated second is routed through the partitioner
+and a uniform shard map; records beyond a shard's limit count as
+throttled. The adaptive rows salt the bot's key once it passes the hot
+key threshold, per session or at random.
+
+    python -m benchmarks.partition_simulation --shards 4 --rate 3000 --seconds 30
+"""
+import argparse
+import random
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.api.partitioning import (
+    SHARD_MAX_RECORDS_PER_SECOND,
+    AdaptivePartitioner,
+    ExplicitHashPartitioner,
+    PlayerPartitioner,
+    SaltedGamePartitioner,
+    SessionPartitioner,
+    ShardMap,
+    ShardThroughput
+)
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_events(args, rng: np.random.Generator):
+    """Per-second lists of (player, session, game) tuples."""
+    ranks = np.arange(1, args.players + 1)
+    weights = 1.0 / ranks ** args.zipf
+    weights /= weights.sum()
+    for _ in range(args.seconds):
+        players = rng.choice(args.players, size=args.rate, p=weights)
+        bots = rng.random(args.rate) < args.bot_share
+        events = []
+        for player, bot in zip(players, bots):
+            player_id = "bot_0" if bot else f"player_{player}"
+            session = int(rng.integers(0, args.bot_sessions if bot else 3))
+            events.append(SimpleNamespace(
+                player_id=player_id,
+                session_id=f"{player_id}_session_{session}",
+                game_id=f"game_{player % 3}"
+            ))
+        yield events
+
+
+def simulate(name, partitioner, shard_map, seconds_of_events, clock):
+    loads = Counter()
+    throttled = 0
+    peak = Counter()
+    for second, events in enumerate(seconds_of_events):
+        clock.now = float(second)
+        per_second = Counter()
+        for event in events:
+            partition_key, explicit_hash_key = partitioner.partition(event)
+            per_second[shard_map.shard_for(partition_key, explicit_hash_key)] += 1
+        for shard_id, count in per_second.items():
+            loads[shard_id] += count
+            peak[shard_id] = max(peak[shard_id], count)
+            throttled += max(0, count - SHARD_MAX_RECORDS_PER_SECOND)
+
+    total = sum(loads.values())
+    counts = [loads[shard_id] for shard_id in shard_map.shard_ids]
+    mean = total / len(counts)
+    print(f"{name:<16} {max(counts) / mean:>8.2f} {min(counts) / mean:>8.2f} "
+          f"{max(peak.values()):>9} {throttled / total:>10.2%}   "
+          + " ".join(f"{c / total:.2f}" for c in counts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--players", type=int, default=100000)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of player activity")
+    parser.add_argument("--bot-share", type=float, default=0.4, help="Fraction of events from one bot player")
+    parser.add_argument("--bot-sessions", type=int, default=50, help="Sessions the bot's events are spread over")
+    parser.add_argument("--rate", type=int, default=3000, help="Events per simulated second")
+    parser.add_argument("--seconds", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    events = list(make_events(args, np.random.default_rng(args.seed)))
+    shard_map = ShardMap.uniform(args.shards)
+
+    strategies = [
+        ("player", lambda clock: PlayerPartitioner()),
+        ("session", lambda clock: SessionPartitioner()),
+        ("game_salted", lambda clock: SaltedGamePartitioner(16)),
+        ("explicit_hash", lambda clock: ExplicitHashPartitioner(shard_map)),
+        ("player+adaptive", lambda clock: AdaptivePartitioner(
+            PlayerPartitioner(), ShardThroughput(clock=clock), salt_buckets=8)),
+        ("player+random", lambda clock: AdaptivePartitioner(
+            PlayerPartitioner(), ShardThroughput(clock=clock), salt_buckets=8, salt="random",
+            rng=random.Random(args.seed))),
+    ]
+
+    print(f"{args.rate} events/s over {args.shards} shards, {args.players} players "
+          f"(zipf {args.zipf}, bot share {args.bot_share:.0%}: {args.rate * args.bot_share:.0f} events/s "
+          f"over {args.bot_sessions} sessions)")
+    print(f"{'strategy':<16} {'max/mean':>8} {'min/mean':>8} {'peak rec/s':>9} {'throttled':>10}   shard shares")
+    for name, factory in strategies:
+        clock = SimulatedClock()
+        simulate(name, factory(clock), shard_map, events, clock)
+
+
+if __name__ == "__main__":
+    main()
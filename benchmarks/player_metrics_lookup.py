@@ -0,0 +1,100 @@
+"""
+Lookup latency of GET /metrics/player/{player_id}.
+
+Fills a stub DynamoDB table through the updater path, then issues open-loop
+lookups for Zipf-distributed player IDs (a few players are looked up far more
+often than the rest) through the route handler, with the read-through cache
+disabled and enabled. Latency is measured from each lookup's due time.
+
+    python -m benchmarks.player_metrics_lookup --players 1000000 --lookups 20000 --rate 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import numpy as np
+
+from benchmarks.stubs import StubDynamoDBClient
+from src.api import main
+from src.api.cache import TTLCache
+from src.utils.player_metrics import PlayerMetricsStore
+from tests.test_data_generator import generate_game_end_event, generate_purchase_event
+
+
+def populate(store: PlayerMetricsStore, players: int, events_per_player: int):
+    events = []
+    for i in range(players):
+        player_id = f"player_{i}"
+        for j in range(events_per_player):
+            events.append(generate_game_end_event(player_id, f"session_{i}_{j}", "game_1"))
+            events.append(generate_purchase_event(player_id, f"session_{i}_{j}", "game_1"))
+    store.apply(events)
+
+
+async def run_lookups(player_ids, rate: float):
+    latencies = []
+
+    async def lookup(player_id: str, due: float):
+        await main.get_player_metrics(player_id)
+        latencies.append(time.perf_counter() - due)
+
+    tasks = []
+    started = time.perf_counter()
+    for i, player_id in enumerate(player_ids):
+        due = started + i / rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(lookup(player_id, due)))
+    await asyncio.gather(*tasks)
+
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "max_ms": latencies[-1] * 1000
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=1_000_000, help="Distinct players looked up")
+    parser.add_argument("--populate", type=int, default=10_000, help="Players written to the stub table")
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--rate", type=float, default=2000, help="Offered lookups/sec")
+    parser.add_argument("--zipf", type=float, default=1.2, help="Zipf exponent of player popularity")
+    parser.add_argument("--latency", type=float, default=0.004, help="Median stub DynamoDB read latency")
+    parser.add_argument("--cache-size", type=int, default=100_000)
+    parser.add_argument("--ttl", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    ranks = rng.zipf(args.zipf, size=args.lookups) % args.players
+    player_ids = [f"player_{rank}" for rank in ranks]
+
+    stub = StubDynamoDBClient(latency=args.latency, seed=args.seed)
+    main.player_store = PlayerMetricsStore(client=stub)
+    latency, stub.latency = stub.latency, 0
+    populate(main.player_store, args.populate, 2)
+    stub.latency = latency
+
+    # Warm up the executor threads and client before measuring
+    main.player_cache = TTLCache(max_size=0, ttl=args.ttl)
+    asyncio.run(run_lookups(player_ids[:1000], args.rate))
+
+    print(f"{'cache':<8} {'hit %':>6} {'reads':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, cache_size in (("off", 0), ("on", args.cache_size)):
+        main.player_cache = TTLCache(max_size=cache_size, ttl=args.ttl)
+        stub.calls = 0
+        result = asyncio.run(run_lookups(player_ids, args.rate))
+        cache = main.player_cache
+        hit_ratio = cache.hits / (cache.hits + cache.misses)
+        print(f"{name:<8} {hit_ratio:>6.1%} {stub.calls:>7} {result['p50_ms']:>8.2f} "
+              f"{result['p99_ms']:>8.2f} {result['max_ms']:>8.2f}")
+    main.dynamodb_executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,63 @@
+"""
+DDSketch percentile accuracy and size against exact percentiles.
+
+Samples long-tailed session durations (lognormal, seconds), scores and
+purchase amounts, sketches them in 5-minute-sized windows, merges the
+windows as a downstream rollup would, and compares p50/p95/p99 with exact
+percentiles over the raw values. Also reports the serialized sketch size
+and the bin count, which bounds accumulator memory.
+
+    python -m benchmarks.quantile_sketches --windows 288 --per-window 2000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.processors.sketches import DDSketch
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+DISTRIBUTIONS = {
+    "duration": lambda rng, n: rng.lognormal(mean=6.0, sigma=1.2, size=n).round(),
+    "score": lambda rng, n: rng.pareto(1.5, size=n).round() * 100,
+    "amount": lambda rng, n: rng.choice([0.99, 1.99, 4.99, 9.99, 19.99, 99.99], size=n,
+                                        p=[0.5, 0.2, 0.15, 0.1, 0.04, 0.01]),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--windows", type=int, default=288, help="Windows merged into the rollup")
+    parser.add_argument("--per-window", type=int, default=2000, help="Values per window")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'metric':<9} {'q':>5} {'exact':>12} {'sketch':>12} {'rel err':>8}")
+    for name, sample in DISTRIBUTIONS.items():
+        windows, values = [], []
+        add_seconds = 0.0
+        for _ in range(args.windows):
+            window_values = sample(rng, args.per_window).tolist()
+            sketch = DDSketch()
+            started = time.perf_counter()
+            sketch.update(window_values)
+            add_seconds += time.perf_counter() - started
+            windows.append(sketch.to_bytes())
+            values.extend(window_values)
+
+        merged = DDSketch.merge_all(windows)
+        for q in QUANTILES:
+            exact = float(np.quantile(values, q, method="lower"))
+            estimate = merged.quantile(q)
+            error = abs(estimate - exact) / exact if exact else abs(estimate)
+            print(f"{name:<9} {q:>5} {exact:>12.2f} {estimate:>12.2f} {error:>7.2%}")
+        window_bytes = max(len(data) for data in windows)
+        print(f"{name:<9} window sketch <= {window_bytes} B, rollup sketch {len(merged.to_bytes())} B, "
+              f"{len(merged.positive)} bins, exact values {len(values) * 8} B, "
+              f"add {add_seconds / len(values) * 1e6:.2f} us/value\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+import itertools
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from src.api.partitioning import HASH_KEY_SPACE, ShardMap, hash_key
+
+
+class StubKinesisClient:
+    """
+    Local stand-in for the boto3 Kinesis client used by benchmarks.
+
+    Each call blocks for `latency` seconds to mimic the network round trip,
+    and a `failure_rate` fraction of records is rejected with
+    ProvisionedThroughputExceededException.
+    """
+
+    def __init__(self, latency: float = 0.02, failure_rate: float = 0.0,
+                 shard_count: int = 2, seed: Optional[int] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.shard_map = ShardMap.uniform(shard_count)
+        self.records: List[Dict[str, Any]] = []
+        self.calls = 0
+        self._sequence = itertools.count()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _accept(self, data: bytes, partition_key: str, explicit_hash_key: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            sequence_number = str(next(self._sequence))
+            self.records.append({"Data": data, "PartitionKey": partition_key})
+        return {
+            "SequenceNumber": sequence_number,
+            "ShardId": self.shard_map.shard_for(partition_key, explicit_hash_key)
+        }
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def put_record(self, StreamName: str, Data: bytes, PartitionKey: str, **kwargs) -> Dict[str, Any]:
+        self._call()
+        return self._accept(Data, PartitionKey)
+
+    def put_records(self, StreamName: str, Records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self._call()
+        results, failed = [], 0
+        for record in Records:
+            if self._random.random() < self.failure_rate:
+                failed += 1
+                results.append({
+                    "ErrorCode": "ProvisionedThroughputExceededException",
+                    "ErrorMessage": "Rate exceeded for shard"
+                })
+            else:
+                results.append(self._accept(record["Data"], record["PartitionKey"], record.get("ExplicitHashKey")))
+        return {"FailedRecordCount": failed, "Records": results}
+
+    def list_shards(self, **kwargs) -> Dict[str, Any]:
+        self._call()
+        return {
+            "Shards": [
+                {
+                    "ShardId": shard_id,
+                    "HashKeyRange": {"StartingHashKey": str(start), "EndingHashKey": str(end)},
+                    "SequenceNumberRange": {"StartingSequenceNumber": "0"}
+                }
+                for start, end, shard_id in self.shard_map.ranges
+            ]
+        }
+
+    def list_streams(self, **kwargs) -> Dict[str, Any]:
+        self._call()
+        return {"StreamNames": ["game-events-stream"], "HasMoreStreams": False}
+
+
+class FaultyKinesisClient(StubKinesisClient):
+    """
+    StubKinesisClient that injects the faults the ingest spill log is for.
+
+    outage() makes every call fail with a connection error for a while, as
+    when Kinesis or the network is down, and throttle() rejects a share of
+    records with ProvisionedThroughputExceededException for a while. With
+    reorder, the records of a PutRecords call are written in random order,
+    which Kinesis allows, so callers relying on request order are caught.
+    """
+
+    def __init__(self, latency: float = 0.0, shard_count: int = 2, seed: Optional[int] = None,
+                 reorder: bool = True, clock=time.monotonic):
+        super().__init__(latency=latency, shard_count=shard_count, seed=seed)
+        self.reorder = reorder
+        self.clock = clock
+        self._faults: List[Any] = []
+
+    def outage(self, seconds: float):
+        self._faults.append(("outage", self.clock() + seconds, 1.0))
+
+    def throttle(self, seconds: float, failure_rate: float):
+        self._faults.append(("throttle", self.clock() + seconds, failure_rate))
+
+    def _fault(self, kind: str) -> float:
+        now = self.clock()
+        return max((rate for fault, until, rate in self._faults if fault == kind and now < until), default=0.0)
+
+    def _call(self):
+        super()._call()
+        if self._fault("outage"):
+            raise EndpointConnectionError(endpoint_url="http://stub-kinesis")
+
+    def put_records(self, StreamName: str, Records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self._call()
+        failure_rate = max(self.failure_rate, self._fault("throttle"))
+        order = list(range(len(Records)))
+        if self.reorder:
+            self._random.shuffle(order)
+        results: List[Dict[str, Any]] = [{}] * len(Records)
+        for i in order:
+            record = Records[i]
+            if self._random.random() < failure_rate:
+                results[i] = {
+                    "ErrorCode": "ProvisionedThroughputExceededException",
+                    "ErrorMessage": "Rate exceeded for shard"
+                }
+            else:
+                results[i] = self._accept(record["Data"], record["PartitionKey"], record.get("ExplicitHashKey"))
+        return {"FailedRecordCount": sum(1 for result in results if "ErrorCode" in result), "Records": results}
+
+
+class StubKinesisStream:
+    """
+    In-memory Kinesis stream with the read side of the API, for consumers.
+
+    Records are stored per shard with stream-wide increasing sequence
+    numbers. Shards can be split and merged, closing the parent and opening
+    children that list their parents, as Kinesis does. Enhanced fan-out
+    subscriptions push events as records arrive, end after
+    `subscription_events` events (real ones last 5 minutes) and send an
+    empty event every `heartbeat` seconds while idle.
+    """
+
+    def __init__(self, stream_name: str = "game-events-stream", shard_count: int = 2,
+                 latency: float = 0.0, subscription_events: int = 50, heartbeat: float = 0.2):
+        self.stream_name = stream_name
+        self.latency = latency
+        self.subscription_events = subscription_events
+        self.heartbeat = heartbeat
+        self.calls = 0
+        self.consumers: Dict[str, str] = {}
+        self._shards: Dict[str, Dict[str, Any]] = {}
+        self._records: Dict[str, List[Dict[str, Any]]] = {}
+        self._next_sequence = 1
+        self._shard_ids = itertools.count()
+        self._changed = threading.Condition()
+        step = HASH_KEY_SPACE // shard_count
+        for i in range(shard_count):
+            self._open_shard(i * step, HASH_KEY_SPACE - 1 if i == shard_count - 1 else (i + 1) * step - 1)
+
+    def _sequence_number(self) -> str:
+        self._next_sequence += 1
+        return str(self._next_sequence - 1)
+
+    def _call(self):
+        with self._changed:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _open_shard(self, start: int, end: int, parent: Optional[str] = None,
+                    adjacent_parent: Optional[str] = None) -> str:
+        shard_id = f"shardId-{next(self._shard_ids):012d}"
+        shard = {
+            "ShardId": shard_id,
+            "HashKeyRange": {"StartingHashKey": str(start), "EndingHashKey": str(end)},
+            "SequenceNumberRange": {"StartingSequenceNumber": self._sequence_number()}
+        }
+        if parent is not None:
+            shard["ParentShardId"] = parent
+        if adjacent_parent is not None:
+            shard["AdjacentParentShardId"] = adjacent_parent
+        self._shards[shard_id] = shard
+        self._records[shard_id] = []
+        return shard_id
+
+    def _close_shard(self, shard_id: str):
+        self._shards[shard_id]["SequenceNumberRange"]["EndingSequenceNumber"] = self._sequence_number()
+
+    def _open_shard_for(self, hash_value: int) -> str:
+        return ShardMap(list(self._shards.values())).shard_for_hash(hash_value)
+
+    def put_records(self, StreamName: str, Records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self._call()
+        results = []
+        with self._changed:
+            for record in Records:
+                explicit = record.get("ExplicitHashKey")
+                shard_id = self._open_shard_for(int(explicit) if explicit else hash_key(record["PartitionKey"]))
+                sequence_number = self._sequence_number()
+                self._records[shard_id].append({
+                    "SequenceNumber": sequence_number,
+                    "ApproximateArrivalTimestamp": time.time(),
+                    "Data": record["Data"],
+                    "PartitionKey": record["PartitionKey"]
+                })
+                results.append({"SequenceNumber": sequence_number, "ShardId": shard_id})
+            self._changed.notify_all()
+        return {"FailedRecordCount": 0, "Records": results}
+
+    def split_shard(self, StreamName: str, ShardToSplit: str, NewStartingHashKey: str):
+        self._call()
+        with self._changed:
+            shard = self._shards[ShardToSplit]
+            start, end = (int(shard["HashKeyRange"][key]) for key in ("StartingHashKey", "EndingHashKey"))
+            self._close_shard(ShardToSplit)
+            self._open_shard(start, int(NewStartingHashKey) - 1, parent=ShardToSplit)
+            self._open_shard(int(NewStartingHashKey), end, parent=ShardToSplit)
+            self._changed.notify_all()
+
+    def merge_shards(self, StreamName: str, ShardToMerge: str, AdjacentShardToMerge: str):
+        self._call()
+        with self._changed:
+            ranges = [self._shards[shard_id]["HashKeyRange"] for shard_id in (ShardToMerge, AdjacentShardToMerge)]
+            self._close_shard(ShardToMerge)
+            self._close_shard(AdjacentShardToMerge)
+            self._open_shard(min(int(r["StartingHashKey"]) for r in ranges),
+                             max(int(r["EndingHashKey"]) for r in ranges),
+                             parent=ShardToMerge, adjacent_parent=AdjacentShardToMerge)
+            self._changed.notify_all()
+
+    def list_shards(self, **kwargs) -> Dict[str, Any]:
+        self._call()
+        with self._changed:
+            return {"Shards": [dict(shard, SequenceNumberRange=dict(shard["SequenceNumberRange"]))
+                               for shard in self._shards.values()]}
+
+    def open_shards(self) -> List[str]:
+        return ShardMap(self.list_shards()["Shards"]).shard_ids
+
+    def _position(self, shard_id: str, iterator_type: str, sequence_number: Optional[str] = None,
+                  timestamp: Optional[Any] = None) -> int:
+        """Index in the shard's records of the next record to read."""
+        records = self._records[shard_id]
+        if iterator_type == "TRIM_HORIZON":
+            return 0
+        if iterator_type == "LATEST":
+            return len(records)
+        if iterator_type == "AT_TIMESTAMP":
+            cutoff = timestamp.timestamp()
+            return next((i for i, r in enumerate(records) if r["ApproximateArrivalTimestamp"] >= cutoff),
+                        len(records))
+        after = iterator_type == "AFTER_SEQUENCE_NUMBER"
+        return next((i for i, r in enumerate(records)
+                     if int(r["SequenceNumber"]) > int(sequence_number)
+                     or not after and int(r["SequenceNumber"]) == int(sequence_number)), len(records))
+
+    def get_shard_iterator(self, StreamName: str, ShardId: str, ShardIteratorType: str,
+                           StartingSequenceNumber: Optional[str] = None, Timestamp: Optional[Any] = None,
+                           **kwargs) -> Dict[str, Any]:
+        self._call()
+        with self._changed:
+            position = self._position(ShardId, ShardIteratorType, StartingSequenceNumber, Timestamp)
+        return {"ShardIterator": f"{ShardId}/{position}"}
+
+    def get_records(self, ShardIterator: str, Limit: int = 10000) -> Dict[str, Any]:
+        self._call()
+        shard_id, position = ShardIterator.rsplit("/", 1)
+        with self._changed:
+            records = self._records[shard_id][int(position):int(position) + Limit]
+            position = int(position) + len(records)
+            behind = len(self._records[shard_id]) - position
+            closed = "EndingSequenceNumber" in self._shards[shard_id]["SequenceNumberRange"]
+        response = {"Records": records, "MillisBehindLatest": 1000 if behind else 0}
+        if not (closed and not behind):
+            response["NextShardIterator"] = f"{shard_id}/{position}"
+        return response
+
+    def describe_stream_summary(self, StreamName: str) -> Dict[str, Any]:
+        self._call()
+        return {"StreamDescriptionSummary": {"StreamARN": f"arn:aws:kinesis:us-east-1:000000000000:stream/{StreamName}"}}
+
+    def register_stream_consumer(self, StreamARN: str, ConsumerName: str) -> Dict[str, Any]:
+        self._call()
+        arn = self.consumers[ConsumerName] = f"{StreamARN}/consumer/{ConsumerName}:1"
+        return {"Consumer": {"ConsumerName": ConsumerName, "ConsumerARN": arn, "ConsumerStatus": "ACTIVE"}}
+
+    def describe_stream_consumer(self, StreamARN: Optional[str] = None, ConsumerName: Optional[str] = None,
+                                 ConsumerARN: Optional[str] = None) -> Dict[str, Any]:
+        self._call()
+        name = ConsumerName or next((n for n, arn in self.consumers.items() if arn == ConsumerARN), None)
+        if name not in self.consumers:
+            raise ClientError({"Error": {"Code": "ResourceNotFoundException", "Message": "No such consumer"}},
+                              "DescribeStreamConsumer")
+        return {"ConsumerDescription": {"ConsumerName": name, "ConsumerARN": self.consumers[name],
+                                        "ConsumerStatus": "ACTIVE"}}
+
+    def subscribe_to_shard(self, ConsumerARN: str, ShardId: str, StartingPosition: Dict[str, Any]) -> Dict[str, Any]:
+        self._call()
+        with self._changed:
+            position = self._position(ShardId, StartingPosition["Type"], StartingPosition.get("SequenceNumber"),
+                                      StartingPosition.get("Timestamp"))
+        return {"EventStream": self._events(ShardId, position)}
+
+    def _events(self, shard_id: str, position: int):
+        for _ in range(self.subscription_events):
+            with self._changed:
+                if position == len(self._records[shard_id]):
+                    self._changed.wait(self.heartbeat)
+                records = self._records[shard_id][position:position + 1000]
+                position += len(records)
+                behind = len(self._records[shard_id]) - position
+                event = {"Records": records, "MillisBehindLatest": 1000 if behind else 0}
+                if "EndingSequenceNumber" in self._shards[shard_id]["SequenceNumberRange"] and not behind:
+                    event["ChildShards"] = [
+                        {"ShardId": s["ShardId"]} for s in self._shards.values()
+                        if shard_id in (s.get("ParentShardId"), s.get("AdjacentParentShardId"))
+                    ]
+                else:
+                    # Resume AT the next record, or at the next sequence number to be written
+                    event["ContinuationSequenceNumber"] = (self._records[shard_id][position]["SequenceNumber"]
+                                                           if behind else str(self._next_sequence))
+            yield {"SubscribeToShardEvent": event}
+            if "ChildShards" in event:
+                return
+
+
+class StubDynamoDBClient:
+    """
+    Local stand-in for the low-level boto3 DynamoDB client.
+
+    Supports the GetItem and UpdateItem calls made by
+    src/utils/player_metrics.py. Each call blocks for `latency` seconds
+    scaled by a lognormal factor with sigma `jitter`, so latency has a tail.
+    """
+
+    def __init__(self, latency: float = 0.004, jitter: float = 0.5, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.items: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+            factor = self._random.lognormvariate(0, self.jitter) if self.jitter else 1
+        if self.latency:
+            time.sleep(self.latency * factor)
+
+    def get_item(self, TableName: str, Key: Dict[str, Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        self._call()
+        item = self.items.get(Key["p"]["S"])
+        return {"Item": dict(item)} if item is not None else {}
+
+    def update_item(self, TableName: str, Key: Dict[str, Dict[str, str]], UpdateExpression: str,
+                    ExpressionAttributeValues: Dict[str, Dict[str, str]],
+                    ExpressionAttributeNames: Optional[Dict[str, str]] = None, **kwargs) -> Dict[str, Any]:
+        """Applies expressions of the form "ADD a :a, b :b SET c = :c"."""
+        self._call()
+        names = ExpressionAttributeNames or {}
+        adds, _, sets = UpdateExpression.partition(" SET ")
+        with self._lock:
+            item = self.items.setdefault(Key["p"]["S"], dict(Key))
+            for clause in adds[len("ADD "):].split(", "):
+                name, placeholder = clause.split(" ")
+                name = names.get(name, name)
+                current = float(item[name]["N"]) if name in item else 0
+                total = current + float(ExpressionAttributeValues[placeholder]["N"])
+                item[name] = {"N": str(int(total)) if total.is_integer() else str(round(total, 2))}
+            for clause in sets.split(", ") if sets else []:
+                name, placeholder = clause.split(" = ")
+                item[names.get(name, name)] = ExpressionAttributeValues[placeholder]
+        return {}
@@ -0,0 +1,496 @@
+"""
+Regression benchmark suite for the ingest, processing and query paths.
+
+Each case times one operation on a synthetic dataset generated from a fixed
+seed, so runs on the same machine are comparable. A case is run in rounds
+of enough calls to take --min-time seconds, --repeat times, and reported as
+the median and minimum time per item (an event, a record, a lookup).
+Results can be saved as a named baseline and later runs compared against
+it; the comparison exits non-zero if any case is slower than the baseline
+by more than --max-slowdown.
+
+    python -m benchmarks.suite --save main
+    python -m benchmarks.suite --compare main --max-slowdown 0.2
+    python -m benchmarks.suite -k ingest -k lookup --repeat 9
+
+Baselines are JSON files in .benchmarks/ (or --baseline-dir). They are
+only meaningful on the machine that produced them, so save one from the
+base branch before comparing a change. Cases whose dependencies are
+missing (the Flink UDFs need apache-flink) are reported as skipped.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmarks.stubs import StubDynamoDBClient, StubKinesisClient
+from src.models import codec
+from src.models.base import game_event_adapter, game_event_list_adapter
+from src.processors.sketches import DDSketch, HyperLogLog
+from src.utils.player_metrics import PlayerMetricsStore
+from tests.test_data_generator import (
+    generate_game_start_event,
+    generate_game_end_event,
+    generate_purchase_event,
+    generate_progress_event
+)
+
+SEED = 20240115
+BASELINE_DIR = ".benchmarks"
+EVENT_TYPES = ("game_start", "game_end", "purchase", "progress")
+
+
+class Skip(Exception):
+    """Raised by a case whose dependencies are not installed."""
+
+
+class Benchmark:
+    """
+    A timed operation: `run()` processes `items` items. `close` releases
+    whatever the setup created.
+    """
+
+    def __init__(self, run: Callable[[], Any], items: int = 1, close: Optional[Callable[[], Any]] = None):
+        self.run = run
+        self.items = items
+        self.close = close or (lambda: None)
+
+
+CASES: Dict[str, Callable[[], Benchmark]] = {}
+
+
+def case(name: str):
+    """Register a benchmark setup under `name`."""
+    def register(setup: Callable[[], Benchmark]):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def synthetic_events(count: int, seed: int = SEED, event_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Deterministic events: the generator's shapes with seeded IDs and timestamps."""
+    rng = random.Random(seed)
+    random.seed(seed)
+    start = datetime(2024, 1, 15, 12)
+    events = []
+    for i in range(count):
+        player_id, session_id = f"player_{rng.randrange(10000):05d}", f"session_{i:08d}"
+        kind = event_type or rng.choice(EVENT_TYPES)
+        if kind == "game_start":
+            event = generate_game_start_event(player_id, session_id)
+        elif kind == "game_end":
+            event = generate_game_end_event(player_id, session_id, f"game_{rng.randint(1, 3)}")
+        elif kind == "purchase":
+            event = generate_purchase_event(player_id, session_id, f"game_{rng.randint(1, 3)}")
+        else:
+            event = generate_progress_event(player_id, session_id, f"game_{rng.randint(1, 3)}")
+        event["event_id"] = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        event["timestamp"] = (start + timedelta(milliseconds=i * 10)).isoformat()
+        events.append(event)
+    return events
+
+
+def _cycle(values: List[Any]) -> Callable[[], Any]:
+    """A function returning the next value of a list, round robin."""
+    position = [0]
+
+    def next_value():
+        position[0] = (position[0] + 1) % len(values)
+        return values[position[0]]
+    return next_value
+
+
+# Models and encodings
+
+def _validate_case(event_type: str):
+    def setup() -> Benchmark:
+        bodies = _cycle([json.dumps(event).encode() for event in synthetic_events(256, event_type=event_type)])
+        return Benchmark(lambda: game_event_adapter.validate_json(bodies()))
+    return setup
+
+
+for _event_type in EVENT_TYPES:
+    case(f"models.validate_json.{_event_type}")(_validate_case(_event_type))
+
+
+@case("models.validate_batch")
+def validate_batch() -> Benchmark:
+    body = json.dumps(synthetic_events(1000)).encode()
+    return Benchmark(lambda: game_event_list_adapter.validate_json(body), items=1000)
+
+
+@case("api.serialize_event")
+def serialize_event() -> Benchmark:
+    from src.api.main import serialize_event
+
+    events = _cycle([game_event_adapter.validate_python(event) for event in synthetic_events(256)])
+    stamp = datetime(2024, 1, 15, 12)
+    return Benchmark(lambda: serialize_event(events(), stamp))
+
+
+@case("codec.encode")
+def codec_encode() -> Benchmark:
+    events = _cycle([game_event_adapter.validate_python(event) for event in synthetic_events(256)])
+    return Benchmark(lambda: codec.encode(events()))
+
+
+@case("codec.decode_fields")
+def codec_decode() -> Benchmark:
+    records = _cycle([codec.encode(game_event_adapter.validate_python(event)) for event in synthetic_events(256)])
+    return Benchmark(lambda: codec.decode_fields(records()))
+
+
+# Ingest API, in process against a stub Kinesis client with no latency
+
+def _api(linger_ms: float):
+    from src.api import main
+    from src.api.aggregator import RecordAggregator
+    from src.api.dedup import EventDeduplicator
+    from src.api.producer import KinesisProducer
+
+    loop = asyncio.new_event_loop()
+    stub = StubKinesisClient(latency=0, seed=SEED)
+    main.producer = KinesisProducer(client=stub, max_workers=8)
+    main.aggregator = RecordAggregator(main.producer, main.STREAM_NAME, linger_ms=linger_ms)
+    # The cases resend the same events; the dedup clock moves a day on per
+    # round, so every event is new and pays for the lookup and the add
+    rounds = [0]
+    main.deduplicator = EventDeduplicator(bucket_capacity=10000, clock=lambda: rounds[0] * 86400.0)
+
+    def next_round():
+        rounds[0] += 1
+    loop.run_until_complete(main.aggregator.start())
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+
+    def close():
+        loop.run_until_complete(client.aclose())
+        loop.run_until_complete(main.aggregator.close())
+        main.producer.close()
+        loop.close()
+    return main, loop, stub, client, next_round, close
+
+
+@case("api.ingest_event")
+def ingest_event() -> Benchmark:
+    """100 concurrent POST /events/{type} requests, micro-batched into PutRecords."""
+    main, loop, stub, client, next_round, close = _api(linger_ms=1)
+    events = synthetic_events(1000)
+    paths = {"game_start": "game-start", "game_end": "game-end", "purchase": "purchase", "progress": "progress"}
+    requests = _cycle([(f"/events/{paths[e['event_type']]}", json.dumps(e).encode()) for e in events])
+    headers = {"Content-Type": "application/json"}
+
+    async def burst():
+        next_round()
+        responses = await asyncio.gather(*(
+            client.post(path, content=body, headers=headers) for path, body in (requests() for _ in range(100))
+        ))
+        assert all(response.status_code == 200 for response in responses)
+        stub.records.clear()
+
+    return Benchmark(lambda: loop.run_until_complete(burst()), items=100, close=close)
+
+
+@case("api.ingest_batch")
+def ingest_batch() -> Benchmark:
+    """POST /events/batch with 500 mixed events."""
+    main, loop, stub, client, next_round, close = _api(linger_ms=50)
+    body = json.dumps(synthetic_events(500)).encode()
+
+    async def post():
+        next_round()
+        response = await client.post("/events/batch", content=body, headers={"Content-Type": "application/json"})
+        assert response.status_code == 200 and response.json()["accepted"] == 500
+        stub.records.clear()
+
+    return Benchmark(lambda: loop.run_until_complete(post()), items=500, close=close)
+
+
+# Per-record Python in the Flink job
+
+def _stream_processor():
+    try:
+        from src.processors import stream_processor
+    except ImportError as e:
+        raise Skip(f"needs apache-flink ({e.name})")
+    return stream_processor
+
+
+def _decode_event(records: List[bytes]) -> Benchmark:
+    """DecodeEvent with its custom metrics, on records in event time order."""
+    try:
+        from pyflink.fn_execution.metrics.process.metric_impl import GenericMetricGroup
+    except ImportError:
+        # Before Flink 1.15
+        from pyflink.metrics.metricbase import GenericMetricGroup
+    from pyflink.table.udf import FunctionContext
+
+    function = _stream_processor().DecodeEvent()
+    function.open(FunctionContext(GenericMetricGroup(None, "benchmark"), {}))
+    start = datetime(2024, 1, 15, 12)
+    inputs = _cycle([(record, start + timedelta(milliseconds=i * 10)) for i, record in enumerate(records)])
+    return Benchmark(lambda: list(function.eval(*inputs())))
+
+
+@case("flink.decode_event.json")
+def decode_event_json() -> Benchmark:
+    _stream_processor()
+    return _decode_event([json.dumps(event).encode() for event in synthetic_events(256)])
+
+
+@case("flink.decode_event.compact")
+def decode_event_compact() -> Benchmark:
+    _stream_processor()
+    return _decode_event([codec.encode(game_event_adapter.validate_python(event)) for event in synthetic_events(256)])
+
+
+@case("flink.hll_sketch.accumulate")
+def hll_accumulate() -> Benchmark:
+    function = _stream_processor().HllSketch()
+    accumulator = function.create_accumulator()
+    sessions = _cycle([f"session_{i}" for i in range(10000)])
+    return Benchmark(lambda: function.accumulate(accumulator, sessions()))
+
+
+@case("flink.quantile_sketch.accumulate")
+def quantile_accumulate() -> Benchmark:
+    function = _stream_processor().QuantileSketch()
+    accumulator = function.create_accumulator()
+    durations = _cycle([random.Random(SEED).randint(60, 3600) for _ in range(10000)])
+    return Benchmark(lambda: function.accumulate(accumulator, durations()))
+
+
+@case("dedup.add")
+def dedup_add() -> Benchmark:
+    from src.api.dedup import EventDeduplicator
+
+    dedup = EventDeduplicator(bucket_capacity=100000)
+    event_ids = _cycle([uuid.UUID(event["event_id"]) for event in synthetic_events(10000)])
+    return Benchmark(lambda: dedup.add(event_ids()))
+
+
+@case("dedup.lookup")
+def dedup_lookup() -> Benchmark:
+    """Lookups of new event_ids, which check every live bucket."""
+    from src.api.dedup import EventDeduplicator
+
+    dedup = EventDeduplicator(bucket_capacity=100000)
+    events = synthetic_events(20000)
+    for event in events[:10000]:
+        dedup.add(uuid.UUID(event["event_id"]))
+    event_ids = _cycle([uuid.UUID(event["event_id"]) for event in events[10000:]])
+    return Benchmark(lambda: event_ids() in dedup)
+
+
+@case("sketch.hll_add")
+def hll_add() -> Benchmark:
+    sketch = HyperLogLog()
+    values = _cycle([f"player_{i}" for i in range(10000)])
+    return Benchmark(lambda: sketch.add(values()))
+
+
+@case("sketch.ddsketch_add")
+def ddsketch_add() -> Benchmark:
+    sketch = DDSketch()
+    rng = random.Random(SEED)
+    values = _cycle([rng.lognormvariate(6, 1) for _ in range(10000)])
+    return Benchmark(lambda: sketch.add(values()))
+
+
+@case("sketch.hll_merge_day")
+def hll_merge_day() -> Benchmark:
+    """Merge a day of 288 five-minute player sketches."""
+    rng = random.Random(SEED)
+    windows = []
+    for _ in range(288):
+        sketch = HyperLogLog()
+        sketch.update(f"player_{rng.randrange(50000)}" for _ in range(500))
+        windows.append(sketch.to_bytes())
+    return Benchmark(lambda: HyperLogLog.merge_all(windows).count(), items=288)
+
+
+# Player metrics lookups against a stub DynamoDB table with no latency
+
+def _player_store() -> PlayerMetricsStore:
+    store = PlayerMetricsStore(StubDynamoDBClient(latency=0, seed=SEED))
+    store.apply(synthetic_events(20000, event_type="game_end") + synthetic_events(5000, event_type="purchase"))
+    return store
+
+
+def _zipf_players(count: int) -> List[str]:
+    ranks = np.random.default_rng(SEED).zipf(1.2, count) % 10000
+    return [f"player_{rank:05d}" for rank in ranks]
+
+
+@case("lookup.player_store")
+def player_store_lookup() -> Benchmark:
+    store = _player_store()
+    players = _cycle(_zipf_players(10000))
+    return Benchmark(lambda: store.get(players()))
+
+
+@case("lookup.get_player_metrics")
+def get_player_metrics() -> Benchmark:
+    """The route handler, with the read-through cache (mostly hits for Zipf lookups)."""
+    from src.api import main
+    from src.api.cache import TTLCache
+
+    loop = asyncio.new_event_loop()
+    main.player_store = _player_store()
+    main.player_cache = TTLCache(max_size=100000, ttl=3600)
+    players = _zipf_players(1000)
+
+    async def lookups():
+        for player_id in players:
+            await main.get_player_metrics(player_id)
+
+    return Benchmark(lambda: loop.run_until_complete(lookups()), items=len(players), close=loop.close)
+
+
+def measure(benchmark: Benchmark, repeat: int, min_time: float) -> Dict[str, Any]:
+    """Seconds per item over `repeat` rounds of calibrated length."""
+    benchmark.run()  # warm up caches, lazy imports and connection setup
+    calls = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(calls):
+            benchmark.run()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / 10 or calls >= 1 << 20:
+            break
+        calls *= 4
+    calls = max(1, int(calls * min_time / max(elapsed, 1e-9)))
+
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(calls):
+            benchmark.run()
+        rounds.append((time.perf_counter() - started) / (calls * benchmark.items))
+    return {
+        "median": statistics.median(rounds),
+        "min": min(rounds),
+        "stdev": statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        "calls": calls,
+        "items": benchmark.items,
+    }
+
+
+def run_suite(names: List[str], repeat: int, min_time: float) -> Dict[str, Any]:
+    results, skipped = {}, {}
+    for name in names:
+        try:
+            benchmark = CASES[name]()
+        except Skip as e:
+            skipped[name] = str(e)
+            print(f"{name:<36} skipped: {e}")
+            continue
+        try:
+            results[name] = measure(benchmark, repeat, min_time)
+        finally:
+            benchmark.close()
+        result = results[name]
+        print(f"{name:<36} {_format(result['median']):>10} {_format(result['min']):>10} "
+              f"{result['stdev'] / result['median']:>6.1%}")
+    return {"results": results, "skipped": skipped}
+
+
+def _format(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    if seconds >= 1e-6:
+        return f"{seconds * 1e6:.2f} us"
+    return f"{seconds * 1e9:.0f} ns"
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "created": datetime.utcnow().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "node": platform.node(),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_slowdown: float,
+            statistic: str = "median") -> bool:
+    """Print a comparison table; returns True if no case regressed beyond max_slowdown."""
+    ok = True
+    print(f"\n{'case':<36} {'baseline':>10} {'current':>10} {'change':>8}   ({statistic} per item)")
+    for name in sorted(set(current["results"]) | set(current["skipped"])):
+        new, old = current["results"].get(name), baseline["results"].get(name)
+        if new is None or old is None:
+            print(f"{name:<36} {_format(old[statistic]) if old else '-':>10} "
+                  f"{_format(new[statistic]) if new else '-':>10} {'skipped' if new is None else 'new':>8}")
+            continue
+        change = new[statistic] / old[statistic] - 1
+        regressed = change > max_slowdown
+        ok = ok and not regressed
+        print(f"{name:<36} {_format(old[statistic]):>10} {_format(new[statistic]):>10} {change:>+8.1%}"
+              f"{'  SLOWER' if regressed else ''}")
+    if baseline["environment"].get("node") != current["environment"].get("node"):
+        print("\nwarning: the baseline was recorded on a different machine")
+    print(f"\n{'OK' if ok else 'FAILED'}: max allowed slowdown {max_slowdown:.0%} "
+          f"(baseline {baseline['environment'].get('commit')}, current {current['environment'].get('commit')})")
+    return ok
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="filters", action="append", default=[],
+                        help="Only run cases whose name contains this (repeatable)")
+    parser.add_argument("--list", action="store_true", help="List the cases and exit")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed rounds per case")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per round")
+    parser.add_argument("--baseline-dir", default=BASELINE_DIR)
+    parser.add_argument("--save", metavar="NAME", help="Save the results as baseline NAME")
+    parser.add_argument("--compare", metavar="NAME", help="Compare with baseline NAME")
+    parser.add_argument("--max-slowdown", type=float, default=0.2,
+                        help="Fail the comparison if a case is this much slower (0.2 = 20%%)")
+    parser.add_argument("--statistic", choices=["median", "min"], default="median",
+                        help="Per-case time compared with the baseline")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    names = [name for name in CASES if not args.filters or any(f in name for f in args.filters)]
+    if args.list:
+        print("\n".join(names))
+        return
+    baseline = None
+    if args.compare:
+        with open(os.path.join(args.baseline_dir, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+
+    print(f"{'case':<36} {'median':>10} {'min':>10} {'stdev':>6}   (per item)")
+    report = dict(run_suite(names, args.repeat, args.min_time), environment=environment(),
+                  settings={"repeat": args.repeat, "min_time": args.min_time})
+    for path in filter(None, [args.output, args.save and os.path.join(args.baseline_dir, f"{args.save}.json")]):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved {path}")
+    if baseline is not None and not compare(report, baseline, args.max_slowdown, args.statistic):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Bytes-per-event and encode/decode cost of the stream encodings.
+
+For each event type, compares the JSON the API writes today with the compact
+layout from src/models/codec.py. The gzip column is the per-event size of
+1000 distinct generated events compressed together, which approximates what
+lands in the S3 data lake.
+
+    python -m benchmarks.wire_format --seconds 0.5
+"""
+import argparse
+import gzip
+import time
+from datetime import datetime
+
+from benchmarks.event_validation import EVENTS
+from src.models import codec
+from src.models.base import game_event_adapter
+from tests.test_data_generator import (
+    generate_game_start_event,
+    generate_game_end_event,
+    generate_purchase_event,
+    generate_progress_event
+)
+
+GENERATORS = {
+    "game_start": lambda i: generate_game_start_event(f"player_{i % 97}", f"session_{i}"),
+    "game_end": lambda i: generate_game_end_event(f"player_{i % 97}", f"session_{i}", "game_1"),
+    "purchase": lambda i: generate_purchase_event(f"player_{i % 97}", f"session_{i}", "game_1"),
+    "progress": lambda i: generate_progress_event(f"player_{i % 97}", f"session_{i}", "game_1"),
+}
+
+
+def micros_per_call(func, arg, seconds: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(1000):
+            func(arg)
+        count += 1000
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def json_encode(event) -> bytes:
+    return event.__pydantic_serializer__.to_json(event)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=0.5, help="Measurement time per case")
+    args = parser.parse_args()
+
+    formats = (
+        ("json", json_encode, game_event_adapter.validate_json),
+        ("compact", codec.encode, codec.decode),
+        ("compact-raw", codec.encode, codec.decode_fields),
+    )
+    print(f"{'event_type':<12} {'format':<12} {'bytes':>6} {'gzip B':>7} {'enc us':>7} {'dec us':>7}")
+    for event_type, raw in EVENTS.items():
+        event = game_event_adapter.validate_python(raw)
+        event.server_timestamp = datetime.utcnow()
+        sample = []
+        for i in range(1000):
+            generated = game_event_adapter.validate_python(GENERATORS[event_type](i))
+            generated.server_timestamp = datetime.utcnow()
+            sample.append(generated)
+        for name, encode, decode in formats:
+            data = encode(event)
+            gzipped = len(gzip.compress(b"".join(encode(e) for e in sample))) / len(sample)
+            print(f"{event_type:<12} {name:<12} {len(data):>6} {gzipped:>7.1f} "
+                  f"{micros_per_call(encode, event, args.seconds):>7.2f} "
+                  f"{micros_per_call(decode, data, args.seconds):>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
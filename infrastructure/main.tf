@@ -36,7 +36,7 @@ resource "aws_subnet" "public" {
 # Kinesis Streams
 resource "aws_kinesis_stream" "game_events" {
   name             = "game-events-stream"
-  shard_count      = 2
+  shard_count      = var.game_events_shard_count
   retention_period = 24
   encryption_type  = "KMS"
   kms_key_id       = aws_kms_key.kinesis.id
@@ -55,7 +55,7 @@ resource "aws_kinesis_stream" "game_events" {
 
 resource "aws_kinesis_stream" "session_metrics" {
   name             = "session-metrics"
-  shard_count      = 1
+  shard_count      = var.metric_stream_shard_count
   retention_period = 24
   encryption_type  = "KMS"
   kms_key_id       = aws_kms_key.kinesis.id
@@ -67,6 +67,42 @@ resource "aws_kinesis_stream" "session_metrics" {
 
 resource "aws_kinesis_stream" "revenue_metrics" {
   name             = "revenue-metrics"
+  shard_count      = var.metric_stream_shard_count
+  retention_period = 24
+  encryption_type  = "KMS"
+  kms_key_id       = aws_kms_key.kinesis.id
+
+  tags = {
+    Environment = "production"
+  }
+}
+
+resource "aws_kinesis_stream" "player_activity" {
+  name             = "player-activity"
+  shard_count      = var.metric_stream_shard_count
+  retention_period = 24
+  encryption_type  = "KMS"
+  kms_key_id       = aws_kms_key.kinesis.id
+
+  tags = {
+    Environment = "production"
+  }
+}
+
+resource "aws_kinesis_stream" "player_sessions" {
+  name             = "player-sessions"
+  shard_count      = 1
+  retention_period = 24
+  encryption_type  = "KMS"
+  kms_key_id       = aws_kms_key.kinesis.id
+
+  tags = {
+    Environment = "production"
+  }
+}
+
+resource "aws_kinesis_stream" "event_lateness" {
+  name             = "event-lateness"
   shard_count      = 1
   retention_period = 24
   encryption_type  = "KMS"
@@ -141,6 +177,77 @@ resource "aws_s3_bucket_public_access_block" "processed_data" {
   restrict_public_buckets = true
 }
 
+# Per-player aggregates read by GET /metrics/player/{player_id}
+resource "aws_dynamodb_table" "player_metrics" {
+  name         = "player-metrics"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "p"
+
+  attribute {
+    name = "p"
+    type = "S"
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = {
+    Environment = "production"
+  }
+}
+
+resource "aws_dynamodb_table" "game_rollups" {
+  name         = "game-rollups"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "k"
+  range_key    = "b"
+
+  attribute {
+    name = "k"
+    type = "S"
+  }
+
+  attribute {
+    name = "b"
+    type = "S"
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = {
+    Environment = "production"
+  }
+}
+
+# Sequence number checkpoints of the stream consumers (src/utils/stream_consumer.py)
+resource "aws_dynamodb_table" "stream_checkpoints" {
+  name         = "stream-checkpoints"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "k"
+  range_key    = "shard_id"
+
+  attribute {
+    name = "k"
+    type = "S"
+  }
+
+  attribute {
+    name = "shard_id"
+    type = "S"
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = {
+    Environment = "production"
+  }
+}
+
 # Kinesis Firehose
 resource "aws_kinesis_firehose_delivery_stream" "raw_data" {
   name        = "game-events-to-s3"
@@ -227,6 +334,9 @@ resource "aws_cloudwatch_log_group" "api_logs" {
 resource "aws_api_gateway_rest_api" "game_analytics" {
   name        = "game-analytics-api"
   description = "Game Analytics API"
+
+  # Compact events reach the ingest Lambda base64-encoded
+  binary_media_types = ["application/vnd.game-event", "application/vnd.game-event-batch"]
 }
 
 resource "aws_api_gateway_resource" "events" {
@@ -235,6 +345,108 @@ resource "aws_api_gateway_resource" "events" {
   path_part   = "events"
 }
 
+# POST /events/{event_type} and /events/batch, served by the ingest Lambda
+resource "aws_api_gateway_resource" "event_type" {
+  rest_api_id = aws_api_gateway_rest_api.game_analytics.id
+  parent_id   = aws_api_gateway_resource.events.id
+  path_part   = "{event_type}"
+}
+
+resource "aws_api_gateway_method" "ingest" {
+  rest_api_id   = aws_api_gateway_rest_api.game_analytics.id
+  resource_id   = aws_api_gateway_resource.event_type.id
+  http_method   = "POST"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "ingest" {
+  rest_api_id             = aws_api_gateway_rest_api.game_analytics.id
+  resource_id             = aws_api_gateway_resource.event_type.id
+  http_method             = aws_api_gateway_method.ingest.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.ingest.invoke_arn
+}
+
+# Ingest Lambda (src/api/lambda_handler.py)
+resource "aws_cloudwatch_log_group" "ingest_lambda" {
+  name              = "/aws/lambda/game-analytics-ingest"
+  retention_in_days = 14
+}
+
+resource "aws_iam_role" "ingest_lambda_role" {
+  name = "game-analytics-ingest-lambda-role"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Action = "sts:AssumeRole"
+        Effect = "Allow"
+        Principal = {
+          Service = "lambda.amazonaws.com"
+        }
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "ingest_lambda" {
+  name = "game-analytics-ingest-lambda"
+  role = aws_iam_role.ingest_lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["kinesis:PutRecords", "kinesis:ListShards"]
+        Resource = aws_kinesis_stream.game_events.arn
+      },
+      {
+        Effect   = "Allow"
+        Action   = "kms:GenerateDataKey"
+        Resource = aws_kms_key.kinesis.arn
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["logs:CreateLogStream", "logs:PutLogEvents"]
+        Resource = "${aws_cloudwatch_log_group.ingest_lambda.arn}:*"
+      }
+    ]
+  })
+}
+
+resource "aws_lambda_function" "ingest" {
+  function_name    = "game-analytics-ingest"
+  role             = aws_iam_role.ingest_lambda_role.arn
+  runtime          = "python3.9"
+  handler          = "src.api.lambda_handler.handler"
+  filename         = var.ingest_lambda_package
+  source_code_hash = filebase64sha256(var.ingest_lambda_package)
+  # More memory is more CPU, which shortens the import and client creation of a cold start
+  memory_size = 512
+  # Under API Gateway's 29 s integration timeout
+  timeout = 25
+
+  environment {
+    variables = {
+      PARTITION_STRATEGY  = "player"
+      EVENT_STREAM_FORMAT = "json"
+    }
+  }
+
+  depends_on = [aws_cloudwatch_log_group.ingest_lambda]
+}
+
+resource "aws_lambda_permission" "ingest_api_gateway" {
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.ingest.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.game_analytics.execution_arn}/*/POST/events/*"
+}
+
 # Variables
 variable "aws_region" {
   description = "AWS region"
@@ -242,6 +454,24 @@ variable "aws_region" {
   default     = "us-east-1"
 }
 
+variable "game_events_shard_count" {
+  description = "Shard count of game-events-stream (each shard takes 1 MB/s or 1000 records/s)"
+  type        = number
+  default     = 2
+}
+
+variable "metric_stream_shard_count" {
+  description = "Shard count of the session-metrics, revenue-metrics and player-activity streams, whose records carry sketches (see Metric Stream Sizing in the README)"
+  type        = number
+  default     = 1
+}
+
+variable "ingest_lambda_package" {
+  description = "Zip of src/ and pydantic for the ingest Lambda (see the README)"
+  type        = string
+  default     = "../build/ingest-lambda.zip"
+}
+
 variable "environment" {
   description = "Environment name"
   type        = string
@@ -292,6 +522,27 @@ resource "aws_kinesis_stream_consumer" "revenue_metrics" {
   depends_on = [aws_kinesis_stream.revenue_metrics]
 }
 
+resource "aws_kinesis_stream_consumer" "player_activity" {
+  name       = "player-activity-consumer"
+  stream_arn = aws_kinesis_stream.player_activity.arn
+
+  depends_on = [aws_kinesis_stream.player_activity]
+}
+
+resource "aws_kinesis_stream_consumer" "player_sessions" {
+  name       = "player-sessions-consumer"
+  stream_arn = aws_kinesis_stream.player_sessions.arn
+
+  depends_on = [aws_kinesis_stream.player_sessions]
+}
+
+resource "aws_kinesis_stream_consumer" "event_lateness" {
+  name       = "event-lateness-consumer"
+  stream_arn = aws_kinesis_stream.event_lateness.arn
+
+  depends_on = [aws_kinesis_stream.event_lateness]
+}
+
 # Create KMS key for Kinesis encryption
 resource "aws_kms_key" "kinesis" {
   description             = "KMS key for Kinesis streams encryption"
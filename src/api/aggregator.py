@@ -0,0 +1,189 @@
+import asyncio
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.api.ingest import MAX_BYTES_PER_REQUEST, MAX_RECORDS_PER_REQUEST
+from src.api.metrics import AGGREGATOR_FLUSH_RECORDS
+from src.api.producer import KinesisProducer
+from src.utils import kpl
+
+# KPL default for the size of one aggregated record
+AGGREGATION_MAX_BYTES = 51200
+
+
+class BufferFullError(Exception):
+    """Raised when the aggregator cannot accept more records."""
+
+
+class PutRecordError(Exception):
+    """Raised to a submitter whose record Kinesis rejected."""
+
+    def __init__(self, error_code: str):
+        super().__init__(error_code)
+        self.error_code = error_code
+
+
+class RecordAggregator:
+    """
+    In-process micro-batcher in front of KinesisProducer.put_records.
+
+    Records are buffered per partition (and explicit hash) key and flushed when the buffer
+    reaches max_batch_records or max_batch_bytes, or every linger_ms
+    otherwise. Each submitter awaits the outcome of its own record, so
+    callers still see the sequence number or the error.
+
+    With aggregate=True, records sharing a partition key in one flush are
+    packed into KPL aggregated records (see src/utils/kpl.py), which the
+    Flink Kinesis connector de-aggregates on read.
+    """
+
+    def __init__(self, producer: KinesisProducer, stream_name: str,
+                 linger_ms: Optional[float] = None,
+                 max_batch_records: int = MAX_RECORDS_PER_REQUEST,
+                 max_batch_bytes: int = MAX_BYTES_PER_REQUEST,
+                 max_buffered_records: Optional[int] = None,
+                 aggregate: Optional[bool] = None):
+        self.producer = producer
+        self.stream_name = stream_name
+        linger_ms = linger_ms if linger_ms is not None else float(os.getenv("KINESIS_LINGER_MS", "50"))
+        self.linger = max(linger_ms, 1) / 1000
+        self.max_batch_records = max_batch_records
+        self.max_batch_bytes = max_batch_bytes
+        self.max_buffered_records = max_buffered_records or int(
+            os.getenv("KINESIS_MAX_BUFFERED_RECORDS", "20000"))
+        self.aggregate = (aggregate if aggregate is not None
+                          else os.getenv("KINESIS_AGGREGATE_RECORDS", "false").lower() == "true")
+
+        self._buffer: Dict[Tuple[str, Optional[str]], List[Tuple[bytes, asyncio.Future]]] = defaultdict(list)
+        self._buffer_records = 0
+        self._buffer_bytes = 0
+        # Buffered plus in-flight records, bounded by max_buffered_records
+        self._pending_records = 0
+        self._inflight = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def depth(self) -> int:
+        """Records buffered or in flight."""
+        return self._pending_records
+
+    async def start(self):
+        """Start the background flush loop on the running event loop."""
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._flusher = asyncio.create_task(self._run())
+
+    async def submit(self, data: bytes, partition_key: str,
+                     explicit_hash_key: Optional[str] = None) -> Dict[str, Any]:
+        """Buffer a record and wait until the batch holding it is written."""
+        if self._closing or self._flusher is None:
+            raise BufferFullError("Aggregator is not accepting records")
+        if self._pending_records >= self.max_buffered_records:
+            raise BufferFullError("Ingest buffer is full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._buffer[(partition_key, explicit_hash_key)].append((data, future))
+        self._buffer_records += 1
+        self._buffer_bytes += len(data) + len(partition_key)
+        self._pending_records += 1
+        if (self._buffer_records >= self.max_batch_records
+                or self._buffer_bytes >= self.max_batch_bytes):
+            self._wakeup.set()
+        return await future
+
+    async def close(self):
+        """Stop accepting records, flush what is buffered and wait for it."""
+        self._closing = True
+        if self._flusher is not None:
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        self._flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.linger)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer_records:
+            return
+        buffer = self._buffer
+        self._buffer = defaultdict(list)
+        self._buffer_records = 0
+        self._buffer_bytes = 0
+
+        task = asyncio.create_task(self._send(buffer))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    def _build_entries(self, buffer):
+        """Turn buffered records into PutRecords entries and their waiters."""
+        entries, waiters = [], []
+        for (partition_key, explicit_hash_key), records in buffer.items():
+            if not self.aggregate or len(records) == 1:
+                for data, future in records:
+                    entries.append(self._entry(len(entries), partition_key, explicit_hash_key, data))
+                    waiters.append([future])
+                continue
+
+            group, group_bytes = [], 0
+            for data, future in records:
+                size = kpl.record_overhead(partition_key, data)
+                if group and group_bytes + size > AGGREGATION_MAX_BYTES:
+                    entries.append(self._aggregated_entry(len(entries), partition_key, explicit_hash_key, group))
+                    waiters.append([f for _, f in group])
+                    group, group_bytes = [], 0
+                group.append((data, future))
+                group_bytes += size
+            entries.append(self._aggregated_entry(len(entries), partition_key, explicit_hash_key, group))
+            waiters.append([f for _, f in group])
+        return entries, waiters
+
+    @staticmethod
+    def _entry(index: int, partition_key: str, explicit_hash_key: Optional[str], data: bytes):
+        entry = {"Data": data, "PartitionKey": partition_key}
+        if explicit_hash_key is not None:
+            entry["ExplicitHashKey"] = explicit_hash_key
+        return index, entry
+
+    @classmethod
+    def _aggregated_entry(cls, index: int, partition_key: str, explicit_hash_key: Optional[str], group):
+        if len(group) == 1:
+            data = group[0][0]
+        else:
+            data = kpl.aggregate([(partition_key, data) for data, _ in group])
+        return cls._entry(index, partition_key, explicit_hash_key, data)
+
+    async def _send(self, buffer):
+        entries, waiters = self._build_entries(buffer)
+        count = sum(len(futures) for futures in waiters)
+        AGGREGATOR_FLUSH_RECORDS.observe(count)
+        try:
+            results = await self.producer.put_records(self.stream_name, entries)
+        except Exception as e:
+            results = {index: {"status": "error", "error": str(e)} for index, _ in entries}
+        finally:
+            self._pending_records -= count
+
+        for index, futures in enumerate(waiters):
+            result = results[index]
+            for future in futures:
+                if future.done():
+                    continue
+                if result["status"] == "success":
+                    future.set_result({
+                        "SequenceNumber": result["sequence_number"],
+                        "ShardId": result["shard_id"]
+                    })
+                else:
+                    future.set_exception(PutRecordError(result["error"]))
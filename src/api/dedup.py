@@ -0,0 +1,327 @@
+"""
+Bounded-memory duplicate detection on event_id at ingest.
+
+Clients resend events whose request failed or timed out, so the same
+event_id can reach the stream more than once. EventDeduplicator remembers
+the event_ids written over a time horizon in a ring of Bloom filters, one
+per bucket of arrival time: a lookup checks every live bucket, additions
+go to the current one, and the oldest bucket is cleared as a new one
+starts. Memory is fixed up front by the bucket capacity and the bits per
+event (from the target false positive rate), whatever the traffic.
+
+A false positive drops a new event as a duplicate, so the rate should be
+kept well below the duplicate rate it removes. An event_id is reserved
+before its write (reserve checks the filters and the reservations and
+takes one in a single step) and added to the filters once Kinesis has
+accepted it; a failed write releases it, so the event can be retried.
+A retry that arrives while the first write is in flight finds the
+reservation and is told to retry later, rather than being written twice
+or answered "duplicate" for a write that may still fail. Reservations live
+in a small open-addressing table of 64-bit digests that expire after
+reservation_seconds, so a worker that dies mid-write cannot block an
+event_id for good.
+
+The filters and reservations can live in a file (e.g. under /dev/shm) that
+all API workers on a host map, so a retry landing on another worker is
+still caught. Reservations are taken under the file lock; filter bit
+updates from concurrent workers can race, which can only cause a missed
+duplicate, never a false drop.
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Union
+from uuid import UUID
+
+MAGIC = b"EVDEDUP2"
+# magic, bits per filter, hashes, slots, bucket seconds
+HEADER = struct.Struct("<8sQIId")
+# bucket index and events added, per slot
+SLOT = struct.Struct("<qQ")
+# event_id digest (0 when free) and expiry time, per reservation
+RESERVATION = struct.Struct("<Qd")
+# Table entries an event_id's reservation may occupy, from its digest on
+RESERVATION_PROBES = 8
+
+# reserve() outcomes
+RESERVED = "reserved"
+DUPLICATE = "duplicate"
+IN_FLIGHT = "in_flight"
+
+# Positions are 32-bit slices of one 64-byte BLAKE2b digest
+MAX_HASHES = 16
+
+DEFAULT_HORIZON_SECONDS = 3600
+DEFAULT_BUCKETS = 6
+DEFAULT_BUCKET_CAPACITY = 1_000_000
+DEFAULT_FALSE_POSITIVE_RATE = 0.0001
+DEFAULT_RESERVATIONS = 65536
+DEFAULT_RESERVATION_SECONDS = 60.0
+
+
+def bits_per_item(false_positive_rate: float) -> float:
+    """Bloom filter bits per item for a false positive rate, with the optimal hash count."""
+    if not 0 < false_positive_rate < 1:
+        raise ValueError("false_positive_rate must be between 0 and 1")
+    return -math.log(false_positive_rate) / math.log(2) ** 2
+
+
+def false_positive_rate(bits: int, hashes: int, items: int) -> float:
+    """Expected false positive rate of a Bloom filter holding `items`."""
+    return (1 - math.exp(-hashes * items / bits)) ** hashes
+
+
+class EventDeduplicator:
+    """
+    Time-bucketed Bloom filters over event_ids.
+
+    Covers at least the last horizon_seconds of arrivals: the ring has one
+    slot more than `buckets`, so the bucket being overwritten is always
+    older than the horizon. false_positive_rate is that of a lookup with
+    every slot holding bucket_capacity events; buckets that take more
+    raise it, which estimated_false_positive_rate shows. bits_per_event
+    sizes the filters directly instead. `reservations` bounds the writes
+    in flight that reserve() can track; past it, an event_id whose table
+    entries are all taken is written without a reservation.
+    """
+
+    def __init__(self, horizon_seconds: float = DEFAULT_HORIZON_SECONDS, buckets: int = DEFAULT_BUCKETS,
+                 bucket_capacity: int = DEFAULT_BUCKET_CAPACITY,
+                 false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+                 bits_per_event: Optional[float] = None, path: Optional[str] = None,
+                 reservations: int = DEFAULT_RESERVATIONS,
+                 reservation_seconds: float = DEFAULT_RESERVATION_SECONDS,
+                 clock: Callable[[], float] = time.time):
+        self.bucket_seconds = horizon_seconds / buckets
+        self.buckets = buckets
+        self.slots = buckets + 1
+        if not bits_per_event:
+            # A lookup checks every live filter, so each gets a share of the rate
+            bits_per_event = bits_per_item(1 - (1 - false_positive_rate) ** (1 / self.slots))
+        self.bucket_capacity = bucket_capacity
+        # Whole bytes per filter, and the hash count that is optimal for it
+        self.bytes_per_filter = math.ceil(bucket_capacity * bits_per_event / 8)
+        self.bits = self.bytes_per_filter * 8
+        self.hashes = min(MAX_HASHES, max(1, round(self.bits / bucket_capacity * math.log(2))))
+        if self.bits >= 1 << 32:
+            raise ValueError("A bucket filter is limited to 2^32 bits; use more buckets")
+        self._hash = struct.Struct(f"<{self.hashes}I")
+        self.clock = clock
+        self.path = path
+        self._slots_offset = HEADER.size
+        self._filters_offset = HEADER.size + SLOT.size * self.slots
+        self._slot_table = struct.Struct("<" + "qQ" * self.slots)
+        self.reservations = reservations
+        self.reservation_seconds = reservation_seconds
+        self._reservations_offset = self._filters_offset + self.bytes_per_filter * self.slots
+        size = self._reservations_offset + RESERVATION.size * reservations
+        self._file = None
+        if path is None:
+            self._data: Union[bytearray, mmap.mmap] = bytearray(size)
+            self._write_header()
+        else:
+            self._data = self._map(path, size)
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._data)
+
+    @property
+    def bytes_per_million(self) -> float:
+        """Filter memory per million events the ring can hold at its false positive rate."""
+        return self.bytes_per_filter / self.bucket_capacity * 1_000_000
+
+    def _write_header(self):
+        HEADER.pack_into(self._data, 0, MAGIC, self.bits, self.hashes, self.slots, self.bucket_seconds)
+        for slot in range(self.slots):
+            SLOT.pack_into(self._data, self._slots_offset + slot * SLOT.size, -1, 0)
+
+    def _map(self, path: str, size: int) -> mmap.mmap:
+        self._file = open(path, "a+b")
+        with self._locked():
+            self._file.seek(0, os.SEEK_END)
+            existing = self._file.tell()
+            if existing == size:
+                data = mmap.mmap(self._file.fileno(), size)
+                if HEADER.unpack_from(data, 0) == (MAGIC, self.bits, self.hashes, self.slots, self.bucket_seconds):
+                    return data
+                data.close()
+            # A new store, or one another configuration wrote
+            self._file.truncate(0)
+            self._file.truncate(size)
+            self._data = data = mmap.mmap(self._file.fileno(), size)
+            self._write_header()
+            return data
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive across the processes sharing the store."""
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._file is not None:
+            self._data.close()
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def _key(event_id: Union[UUID, str, bytes]) -> bytes:
+        if isinstance(event_id, UUID):
+            return event_id.bytes
+        if isinstance(event_id, str):
+            return event_id.encode()
+        return event_id
+
+    def _positions(self, event_id: Union[UUID, str, bytes]) -> List[int]:
+        # One 32-bit hash per position, all from a single digest
+        bits = self.bits
+        digest = hashlib.blake2b(self._key(event_id), digest_size=self._hash.size).digest()
+        return [h % bits for h in self._hash.unpack(digest)]
+
+    def _live_offsets(self) -> List[int]:
+        """Filter offsets of the buckets within the horizon that hold events."""
+        current = int(self.clock() // self.bucket_seconds)
+        slots = self._slot_table.unpack_from(self._data, self._slots_offset)
+        return [
+            self._filters_offset + slot * self.bytes_per_filter
+            for slot in range(self.slots)
+            if slots[2 * slot + 1] and current - self.buckets <= slots[2 * slot] <= current
+        ]
+
+    def _contains(self, offset: int, positions: List[int]) -> bool:
+        data = self._data
+        for position in positions:
+            if not data[offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __contains__(self, event_id: Union[UUID, str, bytes]) -> bool:
+        """Whether the event_id was added within the horizon (or collides with one that was)."""
+        offsets = self._live_offsets()
+        if not offsets:
+            return False
+        positions = self._positions(event_id)
+        return any(self._contains(offset, positions) for offset in offsets)
+
+    def add(self, event_id: Union[UUID, str, bytes]):
+        """Remember an event_id in the current bucket."""
+        current = int(self.clock() // self.bucket_seconds)
+        slot = current % self.slots
+        slot_offset = self._slots_offset + slot * SLOT.size
+        bucket, count = SLOT.unpack_from(self._data, slot_offset)
+        if bucket != current:
+            count = self._rotate(slot, current)
+        offset = self._filters_offset + slot * self.bytes_per_filter
+        data = self._data
+        for position in self._positions(event_id):
+            data[offset + (position >> 3)] |= 1 << (position & 7)
+        SLOT.pack_into(data, slot_offset, current, count + 1)
+
+    def reserve(self, event_id: Union[UUID, str, bytes]) -> str:
+        """
+        Claim an event_id for a write: DUPLICATE if it was added within the
+        horizon, IN_FLIGHT if another write holds it, otherwise RESERVED.
+        Follow a reservation with commit() or release().
+        """
+        if self._file is None:
+            return self._reserve(event_id)
+        with self._locked():
+            return self._reserve(event_id)
+
+    def commit(self, event_id: Union[UUID, str, bytes]):
+        """Add a reserved event_id once its write succeeded, and drop the reservation."""
+        self.add(event_id)
+        self.release(event_id)
+
+    def release(self, event_id: Union[UUID, str, bytes]):
+        """Drop a reservation, so the event can be written again."""
+        digest = self._digest(event_id)
+        if self._file is None:
+            self._release(digest)
+            return
+        with self._locked():
+            self._release(digest)
+
+    def _digest(self, event_id: Union[UUID, str, bytes]) -> int:
+        digest = hashlib.blake2b(self._key(event_id), digest_size=8, person=b"reserve").digest()
+        return int.from_bytes(digest, "little") or 1
+
+    def _probes(self, digest: int) -> List[int]:
+        return [self._reservations_offset + (digest + i) % self.reservations * RESERVATION.size
+                for i in range(min(RESERVATION_PROBES, self.reservations))]
+
+    def _reserve(self, event_id: Union[UUID, str, bytes]) -> str:
+        if event_id in self:
+            return DUPLICATE
+        digest = self._digest(event_id)
+        now = self.clock()
+        free = None
+        for offset in self._probes(digest):
+            held, expires = RESERVATION.unpack_from(self._data, offset)
+            if held and expires > now:
+                if held == digest:
+                    return IN_FLIGHT
+            elif free is None:
+                free = offset
+        if free is not None:
+            RESERVATION.pack_into(self._data, free, digest, now + self.reservation_seconds)
+        return RESERVED
+
+    def _release(self, digest: int):
+        for offset in self._probes(digest):
+            if RESERVATION.unpack_from(self._data, offset)[0] == digest:
+                RESERVATION.pack_into(self._data, offset, 0, 0.0)
+
+    def _rotate(self, slot: int, current: int) -> int:
+        """Clear a slot for the current bucket; returns its count."""
+        slot_offset = self._slots_offset + slot * SLOT.size
+        if self._file is None:
+            self._clear(slot, slot_offset, current)
+            return 0
+        with self._locked():
+            # Another worker may have started the bucket already
+            bucket, count = SLOT.unpack_from(self._data, slot_offset)
+            if bucket == current:
+                return count
+            self._clear(slot, slot_offset, current)
+            return 0
+
+    def _clear(self, slot: int, slot_offset: int, current: int):
+        offset = self._filters_offset + slot * self.bytes_per_filter
+        self._data[offset:offset + self.bytes_per_filter] = bytes(self.bytes_per_filter)
+        SLOT.pack_into(self._data, slot_offset, current, 0)
+
+    def estimated_false_positive_rate(self) -> float:
+        """Chance that a new event_id is taken for a duplicate, from the live buckets' fill."""
+        current = int(self.clock() // self.bucket_seconds)
+        slots = self._slot_table.unpack_from(self._data, self._slots_offset)
+        miss = 1.0
+        for bucket, count in zip(slots[::2], slots[1::2]):
+            if count and current - self.buckets <= bucket <= current:
+                miss *= 1 - false_positive_rate(self.bits, self.hashes, count)
+        return 1 - miss
+
+
+def create_deduplicator() -> Optional[EventDeduplicator]:
+    """The API's deduplicator as configured by the DEDUP_* environment, or None if disabled."""
+    if os.getenv("DEDUP_ENABLED", "true").lower() != "true":
+        return None
+    bits_per_event = os.getenv("DEDUP_BITS_PER_EVENT")
+    return EventDeduplicator(
+        horizon_seconds=float(os.getenv("DEDUP_HORIZON_SECONDS", str(DEFAULT_HORIZON_SECONDS))),
+        buckets=int(os.getenv("DEDUP_BUCKETS", str(DEFAULT_BUCKETS))),
+        bucket_capacity=int(os.getenv("DEDUP_BUCKET_CAPACITY", str(DEFAULT_BUCKET_CAPACITY))),
+        false_positive_rate=float(os.getenv("DEDUP_FALSE_POSITIVE_RATE", str(DEFAULT_FALSE_POSITIVE_RATE))),
+        bits_per_event=float(bits_per_event) if bits_per_event else None,
+        path=os.getenv("DEDUP_STORE_PATH") or None,
+        reservations=int(os.getenv("DEDUP_RESERVATIONS", str(DEFAULT_RESERVATIONS)))
+    )
@@ -0,0 +1,273 @@
+"""
+The ingest path shared by the FastAPI app (src/api/main.py) and the Lambda
+handler (src/api/lambda_handler.py).
+
+Validates request bodies into event models, encodes events for the stream,
+turns them into PutRecords entries and reads the per-entry results back in
+the same shape on both. Only pydantic and the models are imported, so the
+Lambda's cold start does not pay for FastAPI, Prometheus or boto3;
+KinesisProducer (src/api/producer.py) builds its async puts on the same
+chunking and result handling.
+"""
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from src.models import codec
+from src.models.base import BaseEvent, game_event_adapter, game_event_list_adapter
+
+STREAM_NAME = "game-events-stream"
+
+# URL event type -> event_type carried in the body
+EVENT_TYPE_PATHS = {
+    "game-start": "game_start",
+    "game-end": "game_end",
+    "purchase": "purchase",
+    "progress": "progress"
+}
+
+MAX_BATCH_EVENTS = int(os.getenv("MAX_BATCH_EVENTS", "5000"))
+# API Gateway's payload limit
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", str(10 * 1024 * 1024)))
+
+# Encoding written to the stream: "json" or "compact" (src/models/codec.py)
+STREAM_FORMAT = os.getenv("EVENT_STREAM_FORMAT", "json")
+
+# Kinesis PutRecords limits
+MAX_RECORDS_PER_REQUEST = 500
+MAX_BYTES_PER_REQUEST = 5 * 1024 * 1024
+MAX_BYTES_PER_RECORD = 1024 * 1024
+
+MAX_PUT_ATTEMPTS = int(os.getenv("KINESIS_MAX_PUT_ATTEMPTS", "4"))
+RETRY_BACKOFF_SECONDS = 0.05
+RETRY_BACKOFF_CAP_SECONDS = 1.0
+
+THROTTLED = "ProvisionedThroughputExceededException"
+
+
+class RequestTooLargeError(Exception):
+    """Raised for a body over the size or event count limits; answered 413."""
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff, so throttled retries do not re-align."""
+    return random.uniform(0, min(RETRY_BACKOFF_CAP_SECONDS, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def serialize_event(event: BaseEvent, server_timestamp: datetime) -> bytes:
+    """Stamp an event with the ingest time and encode it for the stream."""
+    event.server_timestamp = server_timestamp
+    # Both formats carry naive UTC: the source's TIMESTAMP(3) column takes
+    # ISO-8601 without an offset, and the compact layout stores UTC micros
+    if event.timestamp.tzinfo is not None:
+        event.timestamp = event.timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    if STREAM_FORMAT == "compact" and codec.can_encode(event):
+        return codec.encode(event)
+    # The model's own pydantic-core serializer writes bytes directly and
+    # skips the union dispatch a TypeAdapter dump would do
+    return event.__pydantic_serializer__.to_json(event)
+
+
+def parse_event(body: bytes, content_type: str) -> BaseEvent:
+    """Validate a single JSON or compact event body into its model."""
+    if content_type == codec.CONTENT_TYPE:
+        return codec.decode(body)
+    return game_event_adapter.validate_json(body)
+
+
+def check_event_size(body: bytes):
+    """Reject a single event body that cannot fit in a record, before it is validated."""
+    if len(body) > MAX_BYTES_PER_RECORD:
+        raise RequestTooLargeError("Event exceeds 1 MB record limit")
+
+
+def check_batch_size(body: bytes, content_type: str):
+    """
+    Reject a batch over MAX_BATCH_BYTES or MAX_BATCH_EVENTS before it is
+    validated, so an oversized batch costs a scan of its bytes rather than
+    thousands of model validations.
+    """
+    if len(body) > MAX_BATCH_BYTES:
+        raise RequestTooLargeError(f"Batch exceeds {MAX_BATCH_BYTES} bytes")
+    if batch_event_count(body, content_type) > MAX_BATCH_EVENTS:
+        raise RequestTooLargeError(f"Batch exceeds {MAX_BATCH_EVENTS} events")
+
+
+def batch_event_count(body: bytes, content_type: str) -> int:
+    """
+    The number of events in a batch body, up to MAX_BATCH_EVENTS + 1.
+
+    Cheap upper bounds come first (every NDJSON event ends a line, every
+    JSON event opens a brace); only a body that could be over the limit is
+    counted exactly. Malformed bodies count what they can and are left to
+    validation to reject.
+    """
+    limit = MAX_BATCH_EVENTS + 1
+    if content_type == codec.BATCH_CONTENT_TYPE:
+        count = 0
+        try:
+            for _ in codec.iter_batch(body):
+                count += 1
+                if count >= limit:
+                    break
+        except codec.CodecError:
+            pass
+        return count
+
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        lines = body.count(b"\n") + 1
+        if lines < limit:
+            return lines
+        return sum(1 for line in body.splitlines() if line.strip())
+
+    braces = body.count(b"{")
+    if braces < limit:
+        return braces
+    try:
+        raw_items = json.loads(body)
+    except ValueError:
+        return 0
+    return len(raw_items) if isinstance(raw_items, list) else 0
+
+
+def validate_batch_body(body: bytes, content_type: str) -> List[Any]:
+    """
+    Validate a JSON array, NDJSON or compact batch body.
+
+    Returns one item per event: the validated model, or the validation
+    errors for that event.
+    """
+    if content_type == codec.BATCH_CONTENT_TYPE:
+        items = []
+        for record in codec.iter_batch(body):
+            try:
+                items.append(codec.decode(record))
+            except ValidationError as e:
+                items.append(e.errors(include_url=False))
+            except codec.CodecError as e:
+                items.append(str(e))
+        return items
+
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(game_event_adapter.validate_json(line))
+            except ValidationError as e:
+                items.append(e.errors(include_url=False))
+        return items
+
+    # Fast path: the whole array validates in one pass
+    try:
+        return game_event_list_adapter.validate_json(body)
+    except ValidationError:
+        pass
+
+    raw_items = json.loads(body)
+    if not isinstance(raw_items, list):
+        raise ValueError("Batch body must be a JSON array")
+    items = []
+    for raw_item in raw_items:
+        try:
+            items.append(game_event_adapter.validate_python(raw_item))
+        except ValidationError as e:
+            items.append(e.errors(include_url=False))
+    return items
+
+
+def event_entry(event: BaseEvent, partitioner, server_timestamp: datetime) -> Optional[Dict[str, Any]]:
+    """The PutRecords entry of an event, or None if it is over the record limit."""
+    data = serialize_event(event, server_timestamp)
+    partition_key, explicit_hash_key = partitioner.partition(event)
+    if len(data) + len(partition_key.encode()) > MAX_BYTES_PER_RECORD:
+        return None
+    entry = {"Data": data, "PartitionKey": partition_key}
+    if explicit_hash_key is not None:
+        entry["ExplicitHashKey"] = explicit_hash_key
+    return entry
+
+
+def chunk_records(entries: List[Tuple[int, Dict[str, Any]]]):
+    """Split PutRecords entries into chunks within the per-request limits."""
+    chunk, chunk_bytes = [], 0
+    for index, entry in entries:
+        size = len(entry["Data"]) + len(entry["PartitionKey"].encode())
+        if chunk and (len(chunk) >= MAX_RECORDS_PER_REQUEST
+                      or chunk_bytes + size > MAX_BYTES_PER_REQUEST):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append((index, entry))
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+def record_results(pending: List[Tuple[int, Dict[str, Any]]], records: List[Dict[str, Any]],
+                   results: Dict[int, Dict[str, Any]]) -> List[Tuple[int, Dict[str, Any]]]:
+    """Fill in the results of a PutRecords response; returns the entries that failed."""
+    failed = []
+    for (index, entry), record in zip(pending, records):
+        if "ErrorCode" in record:
+            results[index] = {
+                "index": index,
+                "status": "error",
+                "error": record["ErrorCode"],
+                "message": record.get("ErrorMessage")
+            }
+            failed.append((index, entry))
+        else:
+            results[index] = {
+                "index": index,
+                "status": "success",
+                "sequence_number": record["SequenceNumber"],
+                "shard_id": record["ShardId"]
+            }
+    return failed
+
+
+def put_records_blocking(client, stream_name: str, entries: List[Tuple[int, Dict[str, Any]]],
+                         sleep: Callable[[float], Any] = time.sleep) -> Dict[int, Dict[str, Any]]:
+    """
+    KinesisProducer.put_records for callers without an event loop.
+
+    Chunks are sent one after another from the calling thread, and failed
+    entries are retried with the same backoff. Returns a per-entry result
+    keyed on the caller's index.
+    """
+    results = {}
+    for chunk in chunk_records(entries):
+        pending = chunk
+        for attempt in range(MAX_PUT_ATTEMPTS):
+            if attempt:
+                sleep(backoff_delay(attempt - 1))
+            try:
+                response = client.put_records(StreamName=stream_name, Records=[entry for _, entry in pending])
+            except Exception as e:
+                for index, _ in pending:
+                    results[index] = {"index": index, "status": "error", "error": str(e)}
+                continue
+            pending = record_results(pending, response["Records"], results)
+            if not pending:
+                break
+    return results
+
+
+def batch_summary(results: List[Dict[str, Any]], spilled: int = 0) -> Dict[str, Any]:
+    """The response body of a batch, from one result per event in request order."""
+    failed = sum(1 for result in results if result["status"] == "error")
+    duplicates = sum(1 for result in results if result["status"] == "duplicate")
+    return {
+        "status": "success" if not failed else "partial" if failed < len(results) else "error",
+        "accepted": len(results) - failed - duplicates,
+        "duplicates": duplicates,
+        "spilled": spilled,
+        "failed": failed,
+        "results": results
+    }
@@ -0,0 +1,211 @@
+"""
+Ingest as a Lambda behind API Gateway, without the FastAPI app.
+
+`handler` takes API Gateway proxy events (REST APIs and HTTP APIs, payload
+format 1.0 or 2.0) for POST /events/{event_type} and POST /events/batch,
+with bodies as the API accepts them: JSON, NDJSON or compact batches,
+base64-encoded when API Gateway treats them as binary. Validation, encoding
+and the PutRecords results are those of the API (src/api/ingest.py), and
+so are the response bodies and status codes.
+
+What every invocation needs, the models and the validation, is imported
+when the module loads, in the Lambda init phase. Nothing else is: FastAPI,
+Starlette and Prometheus stay out, and botocore (not boto3) is imported
+with the Kinesis client on first use, after which the client is kept for
+the life of the execution environment.
+
+There is no spill log, deduplicator or hot key salting here: an execution
+environment is short-lived and sees a fraction of the traffic, so a
+failed event is reported for the client to resend, and resent copies are
+dropped downstream by event_id.
+"""
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from src.api.ingest import (
+    EVENT_TYPE_PATHS,
+    STREAM_NAME,
+    THROTTLED,
+    RequestTooLargeError,
+    batch_summary,
+    check_batch_size,
+    check_event_size,
+    event_entry,
+    parse_event,
+    put_records_blocking,
+    validate_batch_body
+)
+from src.api.partitioning import Partitioner, ShardMap, create_partitioner
+from src.models import codec
+from src.models.base import BaseEvent
+
+PARTITION_STRATEGY = os.getenv("PARTITION_STRATEGY", "player")
+
+# API Gateway gives up on the integration after 29 s; put_records_blocking
+# retries failed calls itself, so botocore makes a single attempt
+CONNECT_TIMEOUT_SECONDS = 2
+READ_TIMEOUT_SECONDS = 5
+
+_client = None
+_partitioner = None
+
+
+class HTTPError(Exception):
+    """An error response, as FastAPI's HTTPException would render it."""
+
+    def __init__(self, status_code: int, detail: Any, headers: Optional[Dict[str, str]] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.headers = headers or {}
+
+
+def create_kinesis_client():
+    """A Kinesis client from botocore alone, which imports faster than boto3."""
+    from botocore.config import Config
+    from botocore.session import get_session
+
+    return get_session().create_client(
+        "kinesis",
+        endpoint_url=os.getenv("AWS_ENDPOINT_URL") or None,
+        region_name=os.getenv("AWS_DEFAULT_REGION", "us-east-1"),
+        config=Config(
+            connect_timeout=CONNECT_TIMEOUT_SECONDS,
+            read_timeout=READ_TIMEOUT_SECONDS,
+            retries={"total_max_attempts": 1}
+        )
+    )
+
+
+def get_client():
+    """The Kinesis client, created on first use and reused by later invocations."""
+    global _client
+    if _client is None:
+        _client = create_kinesis_client()
+    return _client
+
+
+def get_partitioner() -> Partitioner:
+    """The partitioner of PARTITION_STRATEGY; explicit_hash reads the shard map once."""
+    global _partitioner
+    if _partitioner is None:
+        shard_map = None
+        if PARTITION_STRATEGY == "explicit_hash":
+            response = get_client().list_shards(StreamName=STREAM_NAME)
+            shards = response["Shards"]
+            while response.get("NextToken"):
+                response = get_client().list_shards(NextToken=response["NextToken"])
+                shards.extend(response["Shards"])
+            shard_map = ShardMap(shards)
+        _partitioner = create_partitioner(PARTITION_STRATEGY, shard_map=shard_map)
+    return _partitioner
+
+
+def request_line(event: Dict[str, Any]) -> Tuple[str, str]:
+    """Method and path of a payload format 1.0 or 2.0 proxy event."""
+    if event.get("version") == "2.0":
+        return event["requestContext"]["http"]["method"], event["rawPath"]
+    return event["httpMethod"], event["path"]
+
+
+def request_body(event: Dict[str, Any]) -> bytes:
+    body = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        return base64.b64decode(body)
+    return body.encode()
+
+
+def response(status_code: int, content: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return {
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json", **(headers or {})},
+        # Validation errors can carry values JSON has no type for
+        "body": json.dumps(content, default=str)
+    }
+
+
+def ingest_event(event_type: str, body: bytes, content_type: str) -> Dict[str, Any]:
+    """POST /events/{event_type}: validate one event and put it on the stream."""
+    if event_type not in EVENT_TYPE_PATHS:
+        raise HTTPError(400, "Invalid event type")
+    try:
+        check_event_size(body)
+        event = parse_event(body, content_type)
+    except RequestTooLargeError as e:
+        raise HTTPError(413, str(e))
+    except ValidationError as e:
+        raise HTTPError(422, e.errors(include_url=False))
+    except codec.CodecError as e:
+        raise HTTPError(400, str(e))
+    if event.event_type != EVENT_TYPE_PATHS[event_type]:
+        raise HTTPError(400, "Event type does not match the URL")
+
+    entry = event_entry(event, get_partitioner(), datetime.utcnow())
+    if entry is None:
+        raise HTTPError(413, "Event exceeds 1 MB record limit")
+    result = put_records_blocking(get_client(), STREAM_NAME, [(0, entry)])[0]
+    if result["status"] != "success":
+        if result["error"] == THROTTLED:
+            raise HTTPError(503, "Stream throughput exceeded", {"Retry-After": "1"})
+        raise HTTPError(500, result.get("message") or result["error"])
+    return {
+        "status": "success",
+        "sequence_number": result["sequence_number"],
+        "shard_id": result["shard_id"]
+    }
+
+
+def ingest_batch(body: bytes, content_type: str) -> Dict[str, Any]:
+    """POST /events/batch: a result for every event, in request order."""
+    try:
+        check_batch_size(body, content_type)
+        items = validate_batch_body(body, content_type)
+    except RequestTooLargeError as e:
+        raise HTTPError(413, str(e))
+    except ValueError as e:
+        raise HTTPError(400, f"Invalid batch body: {e}")
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    entries = []
+    partitioner = get_partitioner()
+    server_timestamp = datetime.utcnow()
+    for index, event in enumerate(items):
+        if not isinstance(event, BaseEvent):
+            results[index] = {"index": index, "status": "error", "error": event}
+            continue
+        entry = event_entry(event, partitioner, server_timestamp)
+        if entry is None:
+            results[index] = {"index": index, "status": "error", "error": "Event exceeds 1 MB record limit"}
+            continue
+        entries.append((index, entry))
+    if entries:
+        for index, result in put_records_blocking(get_client(), STREAM_NAME, entries).items():
+            results[index] = result
+    return batch_summary(results)
+
+
+def handler(event: Dict[str, Any], context: Any = None) -> Dict[str, Any]:
+    """Lambda entry point for an API Gateway proxy integration."""
+    try:
+        method, path = request_line(event)
+        # The path may carry a stage or base path in front of /events/...
+        parts = path.rstrip("/").split("/")
+        if len(parts) < 2 or parts[-2] != "events":
+            raise HTTPError(404, "Not Found")
+        if method != "POST":
+            raise HTTPError(405, "Method Not Allowed")
+        headers = {name.lower(): value for name, value in (event.get("headers") or {}).items()}
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        body = request_body(event)
+        if parts[-1] == "batch":
+            return response(200, ingest_batch(body, content_type))
+        return response(200, ingest_event(parts[-1], body, content_type))
+    except HTTPError as e:
+        return response(e.status_code, {"detail": e.detail}, e.headers)
+    except Exception as e:
+        return response(500, {"detail": str(e)})
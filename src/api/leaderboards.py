@@ -0,0 +1,288 @@
+"""
+Leaderboard service: per-game boards fed from game_end events.
+
+One consumer process (`python -m src.api.leaderboards`) reads every shard
+of game-events-stream and keeps each game's best scores in memory
+(src/utils/leaderboard.py). Boards and the per-shard positions they cover
+are snapshotted to S3 periodically, so a restart loads the snapshot and
+resumes after the recorded sequence numbers instead of replaying the stream.
+A snapshot rewrites only the boards changed since the last one, encoded
+from a copy while the consumer goes on applying events, and the manifest
+records which snapshot last wrote each board.
+
+API workers answer top-K and rank queries from boards they load from the
+latest snapshot, reloading whenever the consumer writes a new one only the
+boards it rewrote. They
+could consume the stream themselves (LEADERBOARD_CONSUMER=true), but
+every worker would then read every shard from its own position and write
+the same snapshot keys, so that is only for a single-worker API.
+"""
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import boto3
+
+from src.api.ingest import STREAM_NAME
+from src.models.codec import decode_record
+from src.utils.leaderboard import Leaderboard, decode_snapshot, encode_entries
+from src.utils.stream_consumer import MemoryCheckpointStore, RecordBatch, StreamConsumer
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_BUCKET = os.getenv("LEADERBOARD_SNAPSHOT_BUCKET", "game-analytics-processed-data-dev")
+SNAPSHOT_PREFIX = "leaderboards/"
+# API workers' boards lag the stream by up to the sum of the two
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("LEADERBOARD_SNAPSHOT_SECONDS", "10"))
+REFRESH_INTERVAL_SECONDS = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "5"))
+CONSUMER_NAME = "leaderboards"
+
+
+def _client(service: str):
+    return boto3.client(
+        service,
+        endpoint_url=os.getenv("AWS_ENDPOINT_URL", "http://localhost:4566"),
+        region_name=os.getenv("AWS_DEFAULT_REGION", "us-east-1"),
+        aws_access_key_id='test',
+        aws_secret_access_key='test'
+    )
+
+
+class LeaderboardService:
+    """Per-game leaderboards kept current from the event stream."""
+
+    def __init__(self, stream_name: str, kinesis_client=None, s3_client=None,
+                 bucket: str = SNAPSHOT_BUCKET, prefix: str = SNAPSHOT_PREFIX,
+                 snapshot_interval: float = SNAPSHOT_INTERVAL_SECONDS,
+                 refresh_interval: float = REFRESH_INTERVAL_SECONDS):
+        self.stream_name = stream_name
+        self.kinesis = kinesis_client or _client("kinesis")
+        self.s3 = s3_client or _client("s3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.snapshot_interval = snapshot_interval
+        self.refresh_interval = refresh_interval
+        self.boards: Dict[str, Leaderboard] = {}
+        # Shard ID -> sequence number of the last applied record, or SHARD_END
+        self.positions: Dict[str, str] = {}
+        # Game ID -> number of the snapshot that last wrote its board
+        self.versions: Dict[str, int] = {}
+        self._snapshot_number = 0
+        # Games whose boards changed since they were last captured
+        self._dirty: Set[str] = set()
+        # ETag of the manifest the boards were loaded from
+        self._manifest_etag: Optional[str] = None
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="leaderboards")
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def board(self, game_id: str) -> Optional[Leaderboard]:
+        return self.boards.get(game_id)
+
+    def apply(self, events: Iterable[Dict[str, Any]]) -> int:
+        """Submit the scores of game_end events; returns how many were applied."""
+        applied = 0
+        for event in events:
+            if event.get("event_type") != "game_end":
+                continue
+            board = self.boards.get(event["game_id"])
+            if board is None:
+                board = self.boards[event["game_id"]] = Leaderboard()
+            if board.submit(event["player_id"], event["score"]):
+                self._dirty.add(event["game_id"])
+            applied += 1
+        return applied
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def capture(self) -> Dict[str, Iterator[Tuple[str, int]]]:
+        """
+        The entries of the boards changed since the last capture, frozen
+        (Leaderboard.frozen_entries) so they can be written while the
+        boards go on changing.
+        """
+        changed = {game_id: self.boards[game_id].frozen_entries() for game_id in self._dirty}
+        self._dirty = set()
+        return changed
+
+    def snapshot(self, changed: Dict[str, Iterable[Tuple[str, int]]], positions: Dict[str, str]):
+        """
+        Write the boards in `changed` (game ID -> entries, see capture), then
+        the manifest naming the snapshot of every board and the positions.
+        """
+        number = self._snapshot_number + 1
+        versions = dict(self.versions)
+        for game_id, entries in changed.items():
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=f"{self.prefix}{game_id}.snapshot",
+                Body=encode_entries(entries)
+            )
+            versions[game_id] = number
+        manifest = {"snapshot": number, "games": versions, "positions": dict(positions)}
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}manifest.json",
+            Body=json.dumps(manifest).encode()
+        )
+        self.versions, self.positions, self._snapshot_number = versions, dict(positions), number
+
+    def restore(self) -> bool:
+        """
+        Load the latest snapshot; returns False if there is none. Boards
+        already loaded from the snapshot the manifest names for them are
+        kept rather than read again.
+        """
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}manifest.json")
+        except self.s3.exceptions.NoSuchKey:
+            return False
+        etag = response.get("ETag")
+        manifest = json.loads(response["Body"].read())
+        games = manifest["games"]
+        if isinstance(games, list):
+            # Written before boards had versions: read them all
+            games = dict.fromkeys(games)
+        boards = {}
+        for game_id, version in games.items():
+            if version is not None and self.versions.get(game_id) == version and game_id in self.boards:
+                boards[game_id] = self.boards[game_id]
+                continue
+            body = self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}{game_id}.snapshot")["Body"]
+            boards[game_id] = decode_snapshot(body.read())
+        self.boards = boards
+        self.versions = games
+        self.positions = manifest["positions"]
+        self._snapshot_number = manifest.get("snapshot", 0)
+        self._manifest_etag = etag
+        return True
+
+    def refresh(self) -> bool:
+        """Load the latest snapshot if it is not the one loaded; returns whether it was."""
+        try:
+            etag = self.s3.head_object(Bucket=self.bucket, Key=f"{self.prefix}manifest.json").get("ETag")
+        except self.s3.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return False
+            raise
+        if etag is not None and etag == self._manifest_etag:
+            return False
+        return self.restore()
+
+    def _decode(self, batch: RecordBatch) -> List[Dict[str, Any]]:
+        """The game_end events of a batch."""
+        events = []
+        for _, payload in batch.payloads():
+            try:
+                event = decode_record(payload)
+            except Exception:
+                logger.warning("Skipping undecodable record on %s", batch.shard_id)
+                continue
+            if event.get("event_type") == "game_end":
+                events.append(event)
+        return events
+
+    def _apply_batch(self, loop: asyncio.AbstractEventLoop, batch: RecordBatch):
+        # Runs on the shard's reader thread, so decoding up to 10k records
+        # does not hold up the event loop; the boards are only changed on
+        # the loop, so queries never see one mid-update
+        events = self._decode(batch)
+        asyncio.run_coroutine_threadsafe(self._apply_locked(events), loop).result()
+
+    async def _apply_locked(self, events: List[Dict[str, Any]]):
+        async with self._lock:
+            self.apply(events)
+
+    async def consume(self):
+        """Read all shards, apply game_end events and snapshot periodically."""
+        loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        # Boards left from a failed run may hold events past the snapshot's
+        # positions, which replaying them would not mark changed
+        self.boards, self.versions, self._dirty = {}, {}, set()
+        if await self._run(self.restore):
+            logger.info("Restored %d leaderboards from snapshot", len(self.boards))
+        # A batch is checkpointed once applied, so the checkpoints never run
+        # ahead of the boards; shards read to their end are kept as SHARD_END
+        checkpoints = MemoryCheckpointStore()
+        for shard_id, position in self.positions.items():
+            checkpoints.put(CONSUMER_NAME, self.stream_name, shard_id, position)
+        consumer = StreamConsumer(
+            self.stream_name, partial(self._apply_batch, loop), name=CONSUMER_NAME, client=self.kinesis,
+            checkpoints=checkpoints, initial_position="TRIM_HORIZON", mode="poll", batch_limit=10000,
+            checkpoint_interval=0
+        )
+        consumer.start()
+        try:
+            while True:
+                await asyncio.sleep(self.snapshot_interval)
+                # Only the copy is taken under the lock; the changed boards
+                # are encoded and written while events go on being applied
+                async with self._lock:
+                    positions = checkpoints.get_all(CONSUMER_NAME, self.stream_name)
+                    changed = self.capture()
+                if changed or positions != self.positions:
+                    await self._run(self.snapshot, changed, positions)
+        finally:
+            # Off the loop: readers finishing a batch still need it
+            await self._run(consumer.stop)
+
+    async def follow(self):
+        """Load each new snapshot the consumer writes."""
+        while True:
+            if await self._run(self.refresh):
+                logger.info("Loaded %d leaderboards from snapshot", len(self.boards))
+            await asyncio.sleep(self.refresh_interval)
+
+    async def _supervise(self, run):
+        while True:
+            try:
+                await run()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Leaderboard %s failed, restarting", run.__name__)
+                await asyncio.sleep(5)
+
+    async def start(self, consume: bool = True):
+        """Consume the stream, or only follow the snapshots another process writes."""
+        self._task = asyncio.create_task(self._supervise(self.consume if consume else self.follow))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=True)
+
+
+async def run_consumer(service: LeaderboardService):
+    try:
+        await service._supervise(service.consume)
+    finally:
+        await service.stop()
+
+
+def main():
+    """Run the leaderboard consumer: the one process that reads the stream and writes the snapshots."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    service = LeaderboardService(STREAM_NAME)
+    logger.info("Consuming %s into leaderboards, snapshots every %g s to s3://%s/%s",
+                STREAM_NAME, service.snapshot_interval, service.bucket, service.prefix)
+    try:
+        asyncio.run(run_consumer(service))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
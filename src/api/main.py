@@ -1,20 +1,55 @@
-import json
+import asyncio
+import time
 import uuid
-from typing import Union, Dict, Any, Optional
-from datetime import datetime
+from typing import Union, Dict, Any, Optional, List
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 import os
 
-import boto3
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from pydantic import ValidationError
 
-from src.models.base import (
-    GameStartEvent,
-    GameEndEvent,
-    InGamePurchaseEvent,
-    PlayerProgressEvent
+from src.api.aggregator import BufferFullError, PutRecordError, RecordAggregator
+from src.api.cache import TTLCache
+from src.api.dedup import DUPLICATE, IN_FLIGHT, create_deduplicator
+from src.api.ingest import (
+    EVENT_TYPE_PATHS,
+    MAX_BATCH_BYTES,
+    MAX_BYTES_PER_RECORD,
+    STREAM_NAME,
+    THROTTLED,
+    RequestTooLargeError,
+    batch_summary,
+    check_batch_size,
+    check_event_size,
+    event_entry,
+    parse_event,
+    serialize_event,
+    validate_batch_body
 )
+from src.api.leaderboards import LeaderboardService
+from src.api.metrics import (
+    AGGREGATOR_DEPTH,
+    BATCH_EVENTS,
+    DEDUP_FALSE_POSITIVE_RATE,
+    DUPLICATE_EVENTS,
+    REQUEST_ERRORS,
+    REQUEST_SECONDS,
+    SPILL_DISK_BYTES,
+    SPILL_PENDING_EVENTS,
+    SPILLED_EVENTS,
+    VALIDATION_SECONDS
+)
+from src.api.partitioning import ShardMap, ShardThroughput, create_partitioner
+from src.api.producer import KinesisProducer
+from src.api.spill import SpillDrainer, SpillFullError, SpillLog, create_spill_log
+from src.models import codec
+from src.models.base import BaseEvent
+from src.utils.game_rollups import GRANULARITIES, DynamoRollupTable, GameRollups, bucket_end, bucket_start
+from src.utils.player_metrics import PlayerMetricsStore, create_dynamodb_client
 
 app = FastAPI(
     title="Game Analytics API",
@@ -31,79 +66,375 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure AWS client for LocalStack
-endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost:4566")
-aws_region = os.getenv("AWS_DEFAULT_REGION", "us-east-1")
+# Per-shard write accounting, also used for hot key detection
+throughput = ShardThroughput()
+
+# Non-blocking Kinesis producer (LocalStack endpoint comes from AWS_ENDPOINT_URL)
+producer = KinesisProducer(throughput=throughput)
+
+PARTITION_STRATEGY = os.getenv("PARTITION_STRATEGY", "player")
+
+# Chooses partition keys; explicit_hash is built at startup from the shard map
+partitioner = None if PARTITION_STRATEGY == "explicit_hash" else create_partitioner(PARTITION_STRATEGY, throughput)
+
+# The shard map is reloaded every SHARD_MAP_REFRESH_SECONDS, or after
+# SHARD_MAP_MIN_REFRESH_SECONDS once puts are throttled, so explicit_hash
+# follows resharding and throttles are attributed to the right shards
+SHARD_MAP_REFRESH_SECONDS = float(os.getenv("SHARD_MAP_REFRESH_SECONDS", "300"))
+SHARD_MAP_MIN_REFRESH_SECONDS = float(os.getenv("SHARD_MAP_MIN_REFRESH_SECONDS", "10"))
+shard_map_task: Optional[asyncio.Task] = None
 
-kinesis = boto3.client(
-    'kinesis',
-    endpoint_url=endpoint_url,
-    region_name=aws_region,
-    aws_access_key_id='test',
-    aws_secret_access_key='test'
+# Single events are micro-batched into PutRecords calls
+aggregator = RecordAggregator(producer, STREAM_NAME)
+AGGREGATOR_DEPTH.set_function(lambda: aggregator.depth)
+
+# Drops resent events by event_id over DEDUP_HORIZON_SECONDS (see src/api/dedup.py)
+deduplicator = create_deduplicator()
+if deduplicator is not None:
+    DEDUP_FALSE_POSITIVE_RATE.set_function(lambda: deduplicator.estimated_false_positive_rate())
+# The answer, 409 for single events, to a copy sent while an earlier one is being written
+IN_FLIGHT_DETAIL = "Event is being written by an earlier request; retry"
+
+# Events Kinesis cannot take are written to a local log and answered with
+# 202; the drainer replays it to the stream (see src/api/spill.py). Both
+# are opened at startup, so importing the app takes no spill directory
+spill_log: Optional[SpillLog] = None
+drainer: Optional[SpillDrainer] = None
+
+# Per-player aggregates (DynamoDB) behind a read-through LRU/TTL cache
+PLAYER_METRICS_MAX_WORKERS = int(os.getenv("PLAYER_METRICS_MAX_WORKERS", "32"))
+player_store = PlayerMetricsStore(create_dynamodb_client(PLAYER_METRICS_MAX_WORKERS))
+dynamodb_executor = ThreadPoolExecutor(
+    max_workers=PLAYER_METRICS_MAX_WORKERS,
+    thread_name_prefix="dynamodb"
 )
+player_cache = TTLCache(
+    max_size=int(os.getenv("PLAYER_METRICS_CACHE_SIZE", "100000")),
+    ttl=float(os.getenv("PLAYER_METRICS_CACHE_TTL", "30"))
+)
+
+# In-memory leaderboards, loaded from the snapshots of the leaderboard
+# consumer (python -m src.api.leaderboards); a single-worker API can
+# consume the stream itself instead
+LEADERBOARD_CONSUMER = os.getenv("LEADERBOARD_CONSUMER", "false").lower() == "true"
+MAX_LEADERBOARD_LIMIT = 1000
+leaderboards = LeaderboardService(STREAM_NAME)
 
-class GameEvent(BaseModel):
-    event_id: str
-    timestamp: str
-    game_id: str
-    player_id: str
-    session_id: str
-    event_type: str
-    version: str
-    device_info: Optional[Dict[str, Any]] = None
-    client_version: Optional[str] = None
-    duration: Optional[int] = None
-    score: Optional[int] = None
-    level_reached: Optional[int] = None
-    coins_earned: Optional[int] = None
-    item_id: Optional[str] = None
-    item_name: Optional[str] = None
-    currency_type: Optional[str] = None
-    amount: Optional[float] = None
-    currency_code: Optional[str] = None
-    level: Optional[int] = None
-    xp_earned: Optional[int] = None
-    achievements: Optional[list] = None
-    current_state: Optional[Dict[str, Any]] = None
+# Per-game hourly/daily/monthly rollups, precomputed by src/processors/rollup_updater.py
+game_rollups = GameRollups(DynamoRollupTable(player_store.client))
+DEFAULT_ROLLUP_BUCKETS = {"hour": 24, "day": 30, "month": 12}
+MAX_ROLLUP_SPAN = {"hour": timedelta(days=45), "day": timedelta(days=1000), "month": timedelta(days=365 * 20)}
+
+@app.on_event("startup")
+async def start_aggregator():
+    """Start the micro-batching flush loop."""
+    await aggregator.start()
+
+async def refresh_shard_map():
+    """Reload the stream's shard map; explicit_hash repins players if shards were split or merged."""
+    global partitioner
+    shard_map = ShardMap(await producer.list_shards(STREAM_NAME))
+    changed = throughput.shard_map is None or shard_map.ranges != throughput.shard_map.ranges
+    throughput.shard_map = shard_map
+    if changed and PARTITION_STRATEGY == "explicit_hash":
+        partitioner = create_partitioner(PARTITION_STRATEGY, throughput, shard_map)
+
+async def follow_shard_map():
+    """Refresh the shard map every SHARD_MAP_REFRESH_SECONDS, and sooner once puts are throttled."""
+    refreshed, throttled = time.monotonic(), throughput.throttled_records
+    while True:
+        await asyncio.sleep(SHARD_MAP_MIN_REFRESH_SECONDS)
+        if (throughput.throttled_records == throttled
+                and time.monotonic() - refreshed < SHARD_MAP_REFRESH_SECONDS):
+            continue
+        refreshed, throttled = time.monotonic(), throughput.throttled_records
+        try:
+            await refresh_shard_map()
+        except Exception:
+            # Keep routing with the map we have until the next round
+            continue
+
+@app.on_event("startup")
+async def load_shard_map():
+    """Load the stream's shard map for throttle accounting and explicit hash keys, and keep it current."""
+    global shard_map_task
+    try:
+        await refresh_shard_map()
+    except Exception:
+        # Accounting still works from put results; only explicit_hash needs the map
+        if PARTITION_STRATEGY == "explicit_hash":
+            raise
+    shard_map_task = asyncio.create_task(follow_shard_map())
+
+@app.on_event("startup")
+async def start_drainer():
+    """Open this worker's spill log and replay it, including any events a previous worker left."""
+    global spill_log, drainer
+    spill_log = create_spill_log()
+    if spill_log is None:
+        return
+    SPILL_PENDING_EVENTS.set_function(lambda: spill_log.pending)
+    SPILL_DISK_BYTES.set_function(lambda: spill_log.disk_bytes)
+    drainer = SpillDrainer(spill_log, producer, STREAM_NAME)
+    await drainer.start()
+
+@app.on_event("startup")
+async def start_leaderboards():
+    """Start following the leaderboard snapshots, or consuming the stream into them."""
+    await leaderboards.start(consume=LEADERBOARD_CONSUMER)
+
+@app.on_event("shutdown")
+async def shutdown_producer():
+    """Drain buffered events and in-flight Kinesis calls before the worker exits."""
+    if shard_map_task is not None:
+        shard_map_task.cancel()
+    await aggregator.close()
+    if drainer is not None:
+        await drainer.close()
+        spill_log.close()
+    producer.close()
+    dynamodb_executor.shutdown(wait=True)
+    await leaderboards.stop()
 
 @app.get("/")
 async def root():
     """Health check endpoint."""
     return {"status": "healthy", "service": "game-analytics-api"}
 
+def media_type(request: Request) -> str:
+    """The request Content-Type without parameters."""
+    return request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+async def read_body(request: Request, limit: int) -> bytes:
+    """The request body; 413 without reading it when its Content-Length is over `limit`."""
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise HTTPException(status_code=413, detail=f"Request body exceeds {limit} bytes")
+    return await request.body()
+
+
+@app.post("/events/batch")
+async def ingest_batch(request: Request):
+    """
+    Ingest a batch of mixed game events with Kinesis PutRecords.
+
+    Accepts a JSON array, an NDJSON body (Content-Type: application/x-ndjson)
+    or framed compact events (Content-Type: application/vnd.game-event-batch)
+    and returns a result for every event, in request order. Events written
+    to the spill log instead of Kinesis are "accepted", and the response
+    is then a 202.
+    """
+    started = time.perf_counter()
+    try:
+        return await _ingest_batch(request)
+    except HTTPException as e:
+        REQUEST_ERRORS.labels("batch", str(e.status_code)).inc()
+        raise
+    finally:
+        REQUEST_SECONDS.labels("batch").observe(time.perf_counter() - started)
+
+
+async def _ingest_batch(request: Request):
+    body = await read_body(request, MAX_BATCH_BYTES)
+    started = time.perf_counter()
+    try:
+        check_batch_size(body, media_type(request))
+        items = validate_batch_body(body, media_type(request))
+    except RequestTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {e}")
+    VALIDATION_SECONDS.labels("batch").observe(time.perf_counter() - started)
+    BATCH_EVENTS.observe(len(items))
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    entries = []
+    server_timestamp = datetime.utcnow()
+    batch_ids = set()
+    reserved = []
+
+    for index, event in enumerate(items):
+        if not isinstance(event, BaseEvent):
+            results[index] = {"index": index, "status": "error", "error": event}
+            continue
+        if deduplicator is not None:
+            if event.event_id in batch_ids:
+                reservation = DUPLICATE
+            else:
+                reservation = deduplicator.reserve(event.event_id)
+            if reservation == DUPLICATE:
+                DUPLICATE_EVENTS.labels(event.event_type).inc()
+                results[index] = {"index": index, "status": "duplicate"}
+                continue
+            if reservation == IN_FLIGHT:
+                results[index] = {"index": index, "status": "error", "error": IN_FLIGHT_DETAIL}
+                continue
+            batch_ids.add(event.event_id)
+            reserved.append(index)
+
+        entry = event_entry(event, partitioner, server_timestamp)
+        if entry is None:
+            results[index] = {"index": index, "status": "error", "error": "Event exceeds 1 MB record limit"}
+            continue
+        entries.append((index, entry))
+
+    spilled = 0
+    try:
+        if spill_log is not None and spill_log.pending:
+            # Queue behind the spilled events, as single events do
+            spilled = spill_entries(entries, results, "backlog")
+        else:
+            failed_entries = []
+            put_results = await producer.put_records(STREAM_NAME, entries)
+            for index, entry in entries:
+                result = results[index] = put_results[index]
+                if result["status"] != "success":
+                    failed_entries.append((index, entry))
+            if failed_entries and spill_log is not None:
+                spilled = spill_entries(failed_entries, results, "put_records")
+    finally:
+        # Written or spilled events are remembered; the rest can be resent
+        for index in reserved:
+            if results[index] is not None and results[index]["status"] in ("success", "accepted"):
+                deduplicator.commit(items[index].event_id)
+            else:
+                deduplicator.release(items[index].event_id)
+
+    content = batch_summary(results, spilled)
+    return JSONResponse(status_code=202, content=content) if spilled else content
+
+
+def spill_entries(entries: List[Any], results: List[Optional[Dict[str, Any]]], reason: str) -> int:
+    """
+    Append batch entries to the spill log, in request order, until it is
+    full; entries that do not fit keep their error result. Returns the
+    number spilled.
+    """
+    spilled = 0
+    for index, entry in entries:
+        try:
+            spill_log.append(entry["Data"], entry["PartitionKey"], entry.get("ExplicitHashKey"))
+        except SpillFullError as e:
+            for index, _ in entries[spilled:]:
+                if results[index] is None:
+                    results[index] = {"index": index, "status": "error", "error": str(e)}
+            break
+        results[index] = {"index": index, "status": "accepted"}
+        spilled += 1
+    SPILLED_EVENTS.labels(reason).inc(spilled)
+    return spilled
+
 @app.post("/events/{event_type}")
-async def ingest_event(event_type: str, event: GameEvent):
+async def ingest_event(event_type: str, request: Request):
     """
     Ingest a game event into the appropriate Kinesis stream.
+
+    The body is validated straight from bytes into the model selected by its
+    event_type and re-encoded without an intermediate dict. Send
+    Content-Type: application/vnd.game-event for the compact encoding.
+    Answers 202 when the event is written to the spill log instead.
     """
+    started = time.perf_counter()
+    metric_type = EVENT_TYPE_PATHS.get(event_type, "unknown")
+    try:
+        return await _ingest_event(event_type, request, metric_type)
+    except HTTPException as e:
+        REQUEST_ERRORS.labels(metric_type, str(e.status_code)).inc()
+        raise
+    finally:
+        REQUEST_SECONDS.labels(metric_type).observe(time.perf_counter() - started)
+
+
+async def _ingest_event(event_type: str, request: Request, metric_type: str):
     try:
         # Validate event type
-        if event_type not in ["game-start", "game-end", "purchase", "progress"]:
+        if event_type not in EVENT_TYPE_PATHS:
             raise HTTPException(status_code=400, detail="Invalid event type")
 
-        # Add server timestamp
-        event_data = event.model_dump()
-        event_data["server_timestamp"] = datetime.utcnow().isoformat()
-
-        # Send to appropriate Kinesis stream
-        stream_name = "game-events-stream"
-        
-        response = kinesis.put_record(
-            StreamName=stream_name,
-            Data=json.dumps(event_data),
-            PartitionKey=event.player_id
-        )
-
-        return {
-            "status": "success",
-            "sequence_number": response["SequenceNumber"],
-            "shard_id": response["ShardId"]
-        }
+        body = await read_body(request, MAX_BYTES_PER_RECORD)
+        started = time.perf_counter()
+        try:
+            check_event_size(body)
+            event = parse_event(body, media_type(request))
+        except RequestTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+        except codec.CodecError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        VALIDATION_SECONDS.labels(metric_type).observe(time.perf_counter() - started)
+        if event.event_type != EVENT_TYPE_PATHS[event_type]:
+            raise HTTPException(status_code=400, detail="Event type does not match the URL")
+        if deduplicator is None:
+            return await write_event(event)
+        reservation = deduplicator.reserve(event.event_id)
+        if reservation == DUPLICATE:
+            # Already on the stream; the client is retrying a request it saw fail
+            DUPLICATE_EVENTS.labels(metric_type).inc()
+            return {"status": "duplicate", "event_id": str(event.event_id)}
+        if reservation == IN_FLIGHT:
+            # The first copy may still fail, so this one cannot be called a duplicate yet
+            raise HTTPException(status_code=409, detail=IN_FLIGHT_DETAIL, headers={"Retry-After": "1"})
+        try:
+            response = await write_event(event)
+        except BaseException:
+            deduplicator.release(event.event_id)
+            raise
+        deduplicator.commit(event.event_id)
+        return response
 
+    except HTTPException:
+        raise
+    except BufferFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except PutRecordError as e:
+        if e.error_code == THROTTLED:
+            raise HTTPException(status_code=503, detail="Stream throughput exceeded", headers={"Retry-After": "1"})
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+async def write_event(event: BaseEvent):
+    """Send an event to the Kinesis stream, or to the spill log when Kinesis cannot take it."""
+    # Add server timestamp and send to the Kinesis stream
+    data = serialize_event(event, datetime.utcnow())
+    partition_key, explicit_hash_key = partitioner.partition(event)
+    if spill_log is not None and spill_log.pending:
+        # Kinesis is failing or the drainer is catching up: queue behind
+        # the spilled events so each key's events stay in order
+        return spill_event(event, data, partition_key, explicit_hash_key, "backlog")
+    try:
+        response = await aggregator.submit(data, partition_key, explicit_hash_key)
+    except (BufferFullError, PutRecordError) as e:
+        if spill_log is None:
+            raise
+        reason = "buffer_full" if isinstance(e, BufferFullError) else e.error_code
+        return spill_event(event, data, partition_key, explicit_hash_key, reason, e)
+
+    return {
+        "status": "success",
+        "sequence_number": response["SequenceNumber"],
+        "shard_id": response["ShardId"]
+    }
+
+
+def spill_event(event: BaseEvent, data: bytes, partition_key: str, explicit_hash_key: Optional[str],
+                reason: str, error: Optional[Exception] = None) -> JSONResponse:
+    """
+    Append an event to the spill log and answer 202. With the log full,
+    re-raises the Kinesis error the event got, or answers 503 if it was
+    queued behind a backlog.
+    """
+    try:
+        spill_log.append(data, partition_key, explicit_hash_key)
+    except SpillFullError as e:
+        if error is not None:
+            raise error
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    SPILLED_EVENTS.labels(reason).inc()
+    return JSONResponse(status_code=202, content={"status": "accepted", "event_id": str(event.event_id)})
+
 @app.get("/health")
 async def health_check():
     """
@@ -111,22 +442,96 @@ async def health_check():
     """
     try:
         # Check Kinesis connection
-        kinesis.list_streams()
+        await producer.list_streams()
         return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
     except Exception as e:
         raise HTTPException(status_code=503, detail=str(e))
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics of this worker process (see src/api/metrics.py)."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/metrics/player/{player_id}")
 async def get_player_metrics(player_id: str):
-    """Get player metrics (placeholder for future implementation)."""
-    # This would typically query our data warehouse or real-time analytics
+    """
+    Get a player's lifetime metrics.
+
+    Served from the player-metrics table, kept current from game_end and
+    purchase events, so results may lag ingest by the cache TTL.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await player_cache.get_or_load(
+            player_id,
+            lambda: loop.run_in_executor(dynamodb_executor, player_store.get, player_id)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/metrics/game/{game_id}")
+async def get_game_metrics(game_id: str, granularity: str = "hour",
+                           start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """
+    A game's metrics per hour, day or month in [start, end).
+
+    Read from the precomputed rollups; by default the last 24 hours, 30
+    days or 12 months including the current one. Times are UTC.
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+    start, end = (
+        value.astimezone(timezone.utc).replace(tzinfo=None) if value and value.tzinfo else value
+        for value in (start, end)
+    )
+    if end is None:
+        end = bucket_end(bucket_start(datetime.utcnow(), granularity), granularity)
+    if start is None:
+        start = end
+        for _ in range(DEFAULT_ROLLUP_BUCKETS[granularity]):
+            start = bucket_start(start - timedelta(microseconds=1), granularity)
+    if not start < end or end - start > MAX_ROLLUP_SPAN[granularity]:
+        raise HTTPException(status_code=400, detail=f"start must be before end and the range at most "
+                                                    f"{MAX_ROLLUP_SPAN[granularity].days} days")
+    loop = asyncio.get_running_loop()
+    try:
+        buckets = await loop.run_in_executor(
+            dynamodb_executor, game_rollups.read, game_id, granularity, bucket_start(start, granularity), end
+        )
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"game_id": game_id, "granularity": granularity, "buckets": buckets}
+
+@app.get("/leaderboards/{game_id}")
+async def get_leaderboard(game_id: str, limit: int = 10, offset: int = 0):
+    """Top players of a game by best score."""
+    if not 1 <= limit <= MAX_LEADERBOARD_LIMIT or offset < 0:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{MAX_LEADERBOARD_LIMIT} and offset >= 0")
+    board = leaderboards.board(game_id)
+    if board is None:
+        raise HTTPException(status_code=404, detail=f"No leaderboard for game {game_id}")
+    return {
+        "game_id": game_id,
+        "total_players": len(board),
+        "entries": [
+            {"rank": rank, "player_id": player_id, "score": score}
+            for rank, player_id, score in board.top(limit, offset)
+        ]
+    }
+
+@app.get("/leaderboards/{game_id}/rank/{player_id}")
+async def get_leaderboard_rank(game_id: str, player_id: str):
+    """A player's rank and best score on a game's leaderboard."""
+    board = leaderboards.board(game_id)
+    rank = board.rank(player_id) if board is not None else None
+    if rank is None:
+        raise HTTPException(status_code=404, detail=f"Player {player_id} has no score on game {game_id}")
     return {
+        "game_id": game_id,
         "player_id": player_id,
-        "total_sessions": 0,
-        "total_playtime": 0,
-        "average_session_duration": 0,
-        "total_spend": 0,
-        "favorite_items": []
+        "rank": rank,
+        "score": board.score(player_id),
+        "total_players": len(board)
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,164 @@
+"""
+Prometheus metrics of the ingest API, exposed at GET /metrics.
+
+The per-request histograms sit on the hot path, where prometheus_client's
+Histogram costs about 2 us an observation (a lock per bucket and the sum).
+Histogram here keeps plain counts per labelled series instead: the event
+loop thread is the only writer, so no lock is needed, and observing is a
+bisect and two additions. Counters and gauges updated once per Kinesis
+call use prometheus_client directly.
+"""
+from bisect import bisect_left
+from typing import Dict, Iterable, Sequence, Tuple
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge
+from prometheus_client.core import HistogramMetricFamily
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+VALIDATION_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01, 0.05)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class HistogramSeries:
+    """Bucket counts and sum of one label combination."""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram:
+    """
+    A labelled histogram for metrics observed from the event loop thread.
+
+    Series are created on first use by labels(); callers on the hot path
+    keep the series. Observations from other threads are not lost-update
+    safe.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS, registry: CollectorRegistry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], HistogramSeries] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values: str) -> HistogramSeries:
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            series = self._series[values] = HistogramSeries(self.bounds)
+        return series
+
+    def observe(self, value: float):
+        """Observe on the unlabelled series."""
+        self.labels().observe(value)
+
+    def collect(self):
+        family = HistogramMetricFamily(self.name, self.documentation, labels=self.labelnames)
+        for values, series in list(self._series.items()):
+            cumulative, buckets = 0, []
+            for bound, count in zip(self.bounds + (float("inf"),), list(series.counts)):
+                cumulative += count
+                buckets.append((str(bound) if bound != float("inf") else "+Inf", cumulative))
+            family.add_metric(list(values), buckets, series.sum)
+        yield family
+
+    def describe(self):
+        yield HistogramMetricFamily(self.name, self.documentation, labels=self.labelnames)
+
+
+REQUEST_SECONDS = Histogram(
+    "game_api_request_seconds",
+    "Ingest request latency by event type ('batch' for /events/batch)",
+    ["event_type"]
+)
+VALIDATION_SECONDS = Histogram(
+    "game_api_validation_seconds",
+    "Body validation time by event type ('batch' is per request)",
+    ["event_type"],
+    buckets=VALIDATION_BUCKETS
+)
+REQUEST_ERRORS = Counter(
+    "game_api_request_errors",
+    "Ingest requests answered with an error, by event type and status code",
+    ["event_type", "status"]
+)
+BATCH_EVENTS = Histogram(
+    "game_api_batch_events",
+    "Events per /events/batch request",
+    buckets=SIZE_BUCKETS
+)
+
+KINESIS_PUT_SECONDS = Histogram(
+    "kinesis_put_records_seconds",
+    "PutRecords call latency, retries counted as separate calls"
+)
+KINESIS_PUT_RECORDS = Histogram(
+    "kinesis_put_records_batch_size",
+    "Records per PutRecords call",
+    buckets=SIZE_BUCKETS
+)
+KINESIS_RECORDS = Counter(
+    "kinesis_records",
+    "Records written to Kinesis, by shard",
+    ["shard_id"]
+)
+KINESIS_THROTTLES = Counter(
+    "kinesis_throttled_records",
+    "Records rejected with ProvisionedThroughputExceededException, by shard ('unknown' without a shard map)",
+    ["shard_id"]
+)
+KINESIS_ERRORS = Counter(
+    "kinesis_put_errors",
+    "Records or calls that failed, by error code (throttles included)",
+    ["error_code"]
+)
+AGGREGATOR_FLUSH_RECORDS = Histogram(
+    "ingest_aggregator_flush_records",
+    "Records per micro-batch flushed by the aggregator",
+    buckets=SIZE_BUCKETS
+)
+AGGREGATOR_DEPTH = Gauge(
+    "ingest_aggregator_depth",
+    "Records buffered or in flight in the aggregator"
+)
+
+DUPLICATE_EVENTS = Counter(
+    "game_api_duplicate_events",
+    "Events dropped because their event_id was ingested within the dedup horizon, by event type",
+    ["event_type"]
+)
+DEDUP_FALSE_POSITIVE_RATE = Gauge(
+    "game_api_dedup_false_positive_rate",
+    "Estimated chance that a new event is dropped as a duplicate, from the dedup filters' fill"
+)
+
+SPILLED_EVENTS = Counter(
+    "game_api_spilled_events",
+    "Events written to the local spill log instead of Kinesis, by reason",
+    ["reason"]
+)
+SPILL_DRAINED_EVENTS = Counter(
+    "game_api_spill_drained_events",
+    "Spilled events the drainer has written to Kinesis"
+)
+SPILL_PENDING_EVENTS = Gauge(
+    "game_api_spill_pending_events",
+    "Events in the spill log not yet written to Kinesis"
+)
+SPILL_DISK_BYTES = Gauge(
+    "game_api_spill_disk_bytes",
+    "Disk taken by the spill log's segments"
+)
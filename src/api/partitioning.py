@@ -0,0 +1,286 @@
+"""
+Partition key strategies and hot-shard mitigation for game-events-stream.
+
+Kinesis routes a record to the shard whose hash key range contains the MD5
+of its partition key (or its ExplicitHashKey). A single heavy key - a whale
+player or a bot flood - therefore pins one shard at its 1 MB/s / 1000
+records/s limit no matter how many shards the stream has. The partitioners
+here choose the key; AdaptivePartitioner salts keys that ShardThroughput's
+hot key detector flags, keeping each session's events in order but not a
+hot key's events across sessions.
+"""
+import bisect
+import hashlib
+import os
+import random
+import time
+import zlib
+from collections import defaultdict, deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.models.base import BaseEvent
+
+# Per-shard write limits
+SHARD_MAX_RECORDS_PER_SECOND = 1000
+SHARD_MAX_BYTES_PER_SECOND = 1024 * 1024
+
+HASH_KEY_SPACE = 2 ** 128
+
+
+def hash_key(partition_key: str) -> int:
+    """The 128-bit hash key Kinesis derives from a partition key."""
+    return int.from_bytes(hashlib.md5(partition_key.encode()).digest(), "big")
+
+
+class ShardMap:
+    """Open shards of a stream and their hash key ranges."""
+
+    def __init__(self, shards: List[Dict]):
+        ranges = sorted(
+            (int(s["HashKeyRange"]["StartingHashKey"]), int(s["HashKeyRange"]["EndingHashKey"]), s["ShardId"])
+            for s in shards
+            if "EndingSequenceNumber" not in s.get("SequenceNumberRange", {})
+        )
+        self._starts = [start for start, _, _ in ranges]
+        self.ranges = ranges
+        self.shard_ids = [shard_id for _, _, shard_id in ranges]
+
+    @classmethod
+    def uniform(cls, shard_count: int) -> "ShardMap":
+        """A map with evenly split ranges, as CreateStream produces."""
+        step = HASH_KEY_SPACE // shard_count
+        return cls([
+            {
+                "ShardId": f"shardId-{i:012d}",
+                "HashKeyRange": {
+                    "StartingHashKey": str(i * step),
+                    "EndingHashKey": str(HASH_KEY_SPACE - 1 if i == shard_count - 1 else (i + 1) * step - 1)
+                }
+            }
+            for i in range(shard_count)
+        ])
+
+    def shard_for_hash(self, value: int) -> str:
+        return self.ranges[bisect.bisect_right(self._starts, value) - 1][2]
+
+    def shard_for(self, partition_key: str, explicit_hash_key: Optional[str] = None) -> str:
+        """The shard a record is routed to."""
+        if explicit_hash_key is not None:
+            return self.shard_for_hash(int(explicit_hash_key))
+        return self.shard_for_hash(hash_key(partition_key))
+
+
+class ShardThroughput:
+    """
+    Sliding-window write accounting per shard and per partition key.
+
+    Counts are kept in one-second buckets over `window` seconds, and rates
+    are over the window, or the time since the tracker started if shorter,
+    whether or not every second had a record. Key counts are only kept for
+    the current and previous second, so memory is bounded by the number of
+    keys seen in two seconds.
+    """
+
+    def __init__(self, window: int = 10, clock: Callable[[], float] = time.monotonic,
+                 shard_map: Optional[ShardMap] = None):
+        self.window = window
+        self.clock = clock
+        # Used to attribute throttled records, which carry no ShardId
+        self.shard_map = shard_map
+        self._buckets: deque = deque()
+        self._started = clock()
+        self._key_counts: Dict[int, Dict[str, int]] = {}
+        # Every throttled record so far, for callers watching for new throttles
+        self.throttled_records = 0
+
+    def _bucket(self, now: float):
+        second = int(now)
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append((second, defaultdict(lambda: [0, 0, 0])))
+            while self._buckets[0][0] <= second - self.window:
+                self._buckets.popleft()
+            for stale in [s for s in self._key_counts if s < second - 1]:
+                del self._key_counts[stale]
+        return self._buckets[-1][1]
+
+    def observe_key(self, partition_key: str):
+        """Count a record for hot key detection, before it is sent."""
+        second = int(self.clock())
+        counts = self._key_counts.setdefault(second, defaultdict(int))
+        counts[partition_key] += 1
+        for stale in [s for s in self._key_counts if s < second - 1]:
+            del self._key_counts[stale]
+
+    def record(self, shard_id: str, size: int, throttled: bool = False):
+        """Account a put result against its shard."""
+        counters = self._bucket(self.clock())[shard_id]
+        if throttled:
+            counters[2] += 1
+            self.throttled_records += 1
+        else:
+            counters[0] += 1
+            counters[1] += size
+
+    def key_rate(self, partition_key: str) -> int:
+        """Records seen for a key in the last full second (or the current one)."""
+        second = int(self.clock())
+        current = self._key_counts.get(second, {}).get(partition_key, 0)
+        previous = self._key_counts.get(second - 1, {}).get(partition_key, 0)
+        return max(current, previous)
+
+    def shard_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-shard records/s, bytes/s, throttles/s and utilization over the window."""
+        now = self.clock()
+        # Buckets are otherwise only dropped as records arrive
+        while self._buckets and self._buckets[0][0] < now - self.window:
+            self._buckets.popleft()
+        totals = defaultdict(lambda: [0, 0, 0])
+        for _, shards in self._buckets:
+            for shard_id, (records, size, throttled) in shards.items():
+                total = totals[shard_id]
+                total[0] += records
+                total[1] += size
+                total[2] += throttled
+        span = min(self.window, max(now - self._started, 1))
+        return {
+            shard_id: {
+                "records_per_second": records / span,
+                "bytes_per_second": size / span,
+                "throttles_per_second": throttled / span,
+                "utilization": max(records / span / SHARD_MAX_RECORDS_PER_SECOND,
+                                   size / span / SHARD_MAX_BYTES_PER_SECOND)
+            }
+            for shard_id, (records, size, throttled) in totals.items()
+        }
+
+
+class Partitioner:
+    """Chooses the partition key (and optional explicit hash key) for an event."""
+
+    def partition(self, event: BaseEvent) -> Tuple[str, Optional[str]]:
+        raise NotImplementedError
+
+
+class PlayerPartitioner(Partitioner):
+    """One key per player: keeps each player's events in order."""
+
+    def partition(self, event: BaseEvent) -> Tuple[str, Optional[str]]:
+        return event.player_id, None
+
+
+class SessionPartitioner(Partitioner):
+    """One key per session: spreads a heavy player's sessions across shards."""
+
+    def partition(self, event: BaseEvent) -> Tuple[str, Optional[str]]:
+        return event.session_id, None
+
+
+class SaltedGamePartitioner(Partitioner):
+    """
+    game_id plus a stable salt derived from the player.
+
+    Bounds the number of distinct keys per game to `salt_buckets`, which
+    suits consumers that read per game, while a player still maps to one key.
+    """
+
+    def __init__(self, salt_buckets: int = 16):
+        self.salt_buckets = salt_buckets
+
+    def partition(self, event: BaseEvent) -> Tuple[str, Optional[str]]:
+        salt = zlib.crc32(event.player_id.encode()) % self.salt_buckets
+        return f"{event.game_id}#{salt}", None
+
+
+class ExplicitHashPartitioner(Partitioner):
+    """
+    Pins players to shards by explicit hash key instead of MD5.
+
+    Players are assigned to shards by CRC32 modulo the open shard count and
+    the record carries the midpoint of that shard's range as ExplicitHashKey,
+    so the spread stays even after uneven splits and merges.
+    """
+
+    def __init__(self, shard_map: ShardMap):
+        self.shard_map = shard_map
+        self._midpoints = [str((start + end) // 2) for start, end, _ in shard_map.ranges]
+
+    def partition(self, event: BaseEvent) -> Tuple[str, Optional[str]]:
+        index = zlib.crc32(event.player_id.encode()) % len(self._midpoints)
+        return event.player_id, self._midpoints[index]
+
+
+class AdaptivePartitioner(Partitioner):
+    """
+    Wraps a partitioner and salts keys that are running hot.
+
+    A key that exceeds `hot_key_threshold` records/s (by default half a
+    shard's record limit) is suffixed with one of `salt_buckets` salts,
+    spreading it over several shards. With salt="session" (the default)
+    the salt is a hash of the event's session, so each session of a hot
+    player stays on one key and in order, while its different sessions
+    lose their relative order; a hot key made of a single session, as with
+    the session strategy, is not spread. salt="random" spreads any hot key
+    evenly but drops the ordering of its events altogether. Consumers that
+    need a player's events in order across sessions sort by timestamp.
+    Keys below the threshold are unaffected.
+    """
+
+    def __init__(self, base: Partitioner, throughput: ShardThroughput,
+                 hot_key_threshold: Optional[int] = None, salt_buckets: int = 8,
+                 salt: str = "session", rng: Optional[random.Random] = None):
+        if salt not in SALTS:
+            raise ValueError(f"Unknown hot key salt {salt!r}, expected one of {SALTS}")
+        self.base = base
+        self.throughput = throughput
+        self.hot_key_threshold = hot_key_threshold or SHARD_MAX_RECORDS_PER_SECOND // 2
+        self.salt_buckets = salt_buckets
+        self.salt = salt
+        self.rng = rng or random.Random()
+
+    def is_hot(self, partition_key: str) -> bool:
+        return self.throughput.key_rate(partition_key) > self.hot_key_threshold
+
+    def partition(self, event: BaseEvent) -> Tuple[str, Optional[str]]:
+        partition_key, explicit_hash_key = self.base.partition(event)
+        hot = self.is_hot(partition_key)
+        self.throughput.observe_key(partition_key)
+        if not hot:
+            return partition_key, explicit_hash_key
+        if self.salt == "session":
+            salt = zlib.crc32(event.session_id.encode()) % self.salt_buckets
+        else:
+            salt = self.rng.randrange(self.salt_buckets)
+        return f"{partition_key}#{salt}", None
+
+
+STRATEGIES = ("player", "session", "game_salted", "explicit_hash")
+SALTS = ("session", "random")
+
+
+def create_partitioner(strategy: Optional[str] = None,
+                       throughput: Optional[ShardThroughput] = None,
+                       shard_map: Optional[ShardMap] = None) -> Partitioner:
+    """
+    Build the partitioner configured by PARTITION_STRATEGY.
+
+    Hot key salting is on unless HOT_KEY_SALT_BUCKETS is 0.
+    """
+    strategy = strategy or os.getenv("PARTITION_STRATEGY", "player")
+    if strategy == "player":
+        partitioner = PlayerPartitioner()
+    elif strategy == "session":
+        partitioner = SessionPartitioner()
+    elif strategy == "game_salted":
+        partitioner = SaltedGamePartitioner(int(os.getenv("PARTITION_SALT_BUCKETS", "16")))
+    elif strategy == "explicit_hash":
+        if shard_map is None:
+            raise ValueError("explicit_hash partitioning needs the stream's shard map")
+        partitioner = ExplicitHashPartitioner(shard_map)
+    else:
+        raise ValueError(f"Unknown partition strategy {strategy!r}, expected one of {STRATEGIES}")
+
+    salt_buckets = int(os.getenv("HOT_KEY_SALT_BUCKETS", "8"))
+    if throughput is None or salt_buckets <= 0:
+        return partitioner
+    threshold = int(os.getenv("HOT_KEY_THRESHOLD", str(SHARD_MAX_RECORDS_PER_SECOND // 2)))
+    return AdaptivePartitioner(partitioner, throughput, threshold, salt_buckets, os.getenv("HOT_KEY_SALT", "session"))
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+from src.api.ingest import MAX_PUT_ATTEMPTS, THROTTLED, backoff_delay, chunk_records, record_results
+from src.api.metrics import (
+    KINESIS_ERRORS,
+    KINESIS_PUT_RECORDS,
+    KINESIS_PUT_SECONDS,
+    KINESIS_RECORDS,
+    KINESIS_THROTTLES
+)
+
+
+def create_kinesis_client(max_pool_connections: int):
+    """Create a Kinesis client for LocalStack with a sized connection pool."""
+    return boto3.client(
+        'kinesis',
+        endpoint_url=os.getenv("AWS_ENDPOINT_URL", "http://localhost:4566"),
+        region_name=os.getenv("AWS_DEFAULT_REGION", "us-east-1"),
+        aws_access_key_id='test',
+        aws_secret_access_key='test',
+        config=Config(max_pool_connections=max_pool_connections)
+    )
+
+
+class KinesisProducer:
+    """
+    Non-blocking Kinesis producer for the async API.
+
+    boto3 is synchronous, so every call runs on a bounded thread pool whose
+    size matches the client's HTTP connection pool. The event loop only
+    awaits the result, letting one worker keep many puts in flight.
+    """
+
+    def __init__(self, client=None, max_workers: Optional[int] = None, throughput=None):
+        self.max_workers = max_workers or int(os.getenv("KINESIS_MAX_WORKERS", "128"))
+        self.client = client or create_kinesis_client(self.max_workers)
+        # Optional ShardThroughput (src/api/partitioning.py) fed with put results
+        self.throughput = throughput
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="kinesis-producer"
+        )
+
+    async def _call(self, method: str, **kwargs) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            partial(getattr(self.client, method), **kwargs)
+        )
+
+    async def put_record(self, stream_name: str, data: bytes, partition_key: str) -> Dict[str, Any]:
+        """Put a single record."""
+        return await self._call(
+            "put_record",
+            StreamName=stream_name,
+            Data=data,
+            PartitionKey=partition_key
+        )
+
+    async def put_records(self, stream_name: str,
+                          entries: List[Tuple[int, Dict[str, Any]]]) -> Dict[int, Dict[str, Any]]:
+        """
+        Send entries with PutRecords, retrying only the entries that failed.
+
+        Chunks are sent concurrently and failed entries are retried with
+        jittered exponential backoff. Returns a per-entry result keyed on the
+        caller's index.
+        """
+        results = {}
+        chunks = [
+            self._put_chunk(stream_name, chunk, results)
+            for chunk in chunk_records(entries)
+        ]
+        await asyncio.gather(*chunks)
+        return results
+
+    async def _put_chunk(self, stream_name: str, chunk: List[Tuple[int, Dict[str, Any]]],
+                         results: Dict[int, Dict[str, Any]]):
+        pending = chunk
+        for attempt in range(MAX_PUT_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(backoff_delay(attempt - 1))
+            started = time.perf_counter()
+            try:
+                response = await self._call(
+                    "put_records",
+                    StreamName=stream_name,
+                    Records=[entry for _, entry in pending]
+                )
+            except Exception as e:
+                KINESIS_ERRORS.labels(type(e).__name__).inc(len(pending))
+                for index, _ in pending:
+                    results[index] = {"index": index, "status": "error", "error": str(e)}
+                continue
+            finally:
+                KINESIS_PUT_SECONDS.observe(time.perf_counter() - started)
+                KINESIS_PUT_RECORDS.observe(len(pending))
+
+            failed = record_results(pending, response["Records"], results)
+            written = defaultdict(int)
+            for (_, entry), record in zip(pending, response["Records"]):
+                if self.throughput is not None:
+                    self._account(entry, record)
+                if "ErrorCode" not in record:
+                    written[record["ShardId"]] += 1
+            for shard_id, count in written.items():
+                KINESIS_RECORDS.labels(shard_id).inc(count)
+            if failed:
+                self._count_failures(failed, response["Records"])
+            pending = failed
+            if not pending:
+                break
+
+    def _count_failures(self, failed: List[Tuple[int, Dict[str, Any]]], records: List[Dict[str, Any]]):
+        """Error and per-shard throttle counts of the failed entries of a response."""
+        errors, throttled = defaultdict(int), defaultdict(int)
+        failed_records = (record for record in records if "ErrorCode" in record)
+        for (_, entry), record in zip(failed, failed_records):
+            errors[record["ErrorCode"]] += 1
+            if record["ErrorCode"] == THROTTLED:
+                throttled[self._shard_for(entry)] += 1
+        for error_code, count in errors.items():
+            KINESIS_ERRORS.labels(error_code).inc(count)
+        for shard_id, count in throttled.items():
+            KINESIS_THROTTLES.labels(shard_id).inc(count)
+
+    def _shard_for(self, entry: Dict[str, Any]) -> str:
+        shard_map = self.throughput.shard_map if self.throughput is not None else None
+        if shard_map is None:
+            return "unknown"
+        return shard_map.shard_for(entry["PartitionKey"], entry.get("ExplicitHashKey"))
+
+    def _account(self, entry: Dict[str, Any], record: Dict[str, Any]):
+        size = len(entry["Data"]) + len(entry["PartitionKey"])
+        if "ShardId" in record:
+            self.throughput.record(record["ShardId"], size)
+        elif record.get("ErrorCode") == THROTTLED and self.throughput.shard_map is not None:
+            self.throughput.record(self._shard_for(entry), size, throttled=True)
+
+    async def list_shards(self, stream_name: str) -> List[Dict[str, Any]]:
+        """All shards of a stream, following pagination."""
+        response = await self._call("list_shards", StreamName=stream_name)
+        shards = response["Shards"]
+        while response.get("NextToken"):
+            response = await self._call("list_shards", NextToken=response["NextToken"])
+            shards.extend(response["Shards"])
+        return shards
+
+    async def list_streams(self) -> Dict[str, Any]:
+        """List streams, used as a connectivity check."""
+        return await self._call("list_streams")
+
+    def close(self):
+        """Wait for in-flight calls and release the thread pool."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,444 @@
+"""
+Local write-ahead spill log for ingest while Kinesis is throttling or down.
+
+When a put fails or the aggregator is full, the API appends the event to
+an append-only log on local disk and answers 202 instead of an error.
+While the log holds events, new ones are appended behind them, so a
+partition key's events still reach the stream in the order they were
+accepted. SpillDrainer replays the log to Kinesis with PutRecords in the
+background and deletes segments once every record in them is written.
+
+The log is a directory of fixed-size segment files, each memory-mapped
+and appended to in place:
+
+    segment-<seq>.log   [data length, crc32, key lengths][partition key][explicit hash key][data]...
+    drained             (segment, offset) before which every record is on the stream
+    lock                held by the process that owns the log
+
+A record's header is written after its body, and a zero length ends a
+segment, so a torn record at the tail (its CRC does not match) is dropped
+on open. What a crash can lose depends on the fsync policy:
+
+    always    msync after every append; an accepted event survives power loss
+    interval  msync at most every fsync_interval seconds; a process crash
+              loses nothing, since the page cache outlives it
+    never     leave write-back to the OS
+
+Disk use is bounded by max_bytes in whole segments; a full log raises
+SpillFullError and the API answers 503 as it did without one. Delivery is
+at least once: records drained after the last saved drained position are
+sent again after a restart, and the stream processor drops the copies by
+event_id.
+"""
+import asyncio
+import fcntl
+import mmap
+import os
+import random
+import struct
+import time
+import zlib
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from src.api.aggregator import AGGREGATION_MAX_BYTES
+from src.api.ingest import MAX_BYTES_PER_RECORD
+from src.api.metrics import SPILL_DRAINED_EVENTS
+from src.api.producer import KinesisProducer
+from src.utils import kpl
+
+# data length, crc32 of keys and data, partition key length, explicit hash key length
+RECORD = struct.Struct("<IIHH")
+# segment, offset
+POSITION = struct.Struct("<QQ")
+SEGMENT_NAME = "segment-{:016d}.log"
+
+FSYNC_POLICIES = ("always", "interval", "never")
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_FSYNC_INTERVAL = 0.1
+
+DRAIN_BATCH_RECORDS = 2000
+DRAIN_WINDOW_RECORDS = 20000
+DRAIN_IDLE_SECONDS = 0.05
+DRAIN_BACKOFF_SECONDS = 0.1
+DRAIN_BACKOFF_CAP_SECONDS = 5.0
+
+Position = Tuple[int, int]
+
+
+class SpillFullError(Exception):
+    """Raised when an append would take the log past max_bytes."""
+
+
+class SpillRecord:
+    """A record read back from the log, and the position just past it."""
+
+    __slots__ = ("end", "partition_key", "explicit_hash_key", "data", "written")
+
+    def __init__(self, end: Position, partition_key: str, explicit_hash_key: Optional[str], data: bytes):
+        self.end = end
+        self.partition_key = partition_key
+        self.explicit_hash_key = explicit_hash_key
+        self.data = data
+        self.written = False
+
+
+class SpillLog:
+    """
+    Append-only segment log of PutRecords entries.
+
+    Not thread safe: the API appends and the drainer reads and commits from
+    the event loop thread. Segments are created on the first append, so an
+    idle log costs one lock file.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 max_bytes: int = DEFAULT_MAX_BYTES, fsync: str = "interval",
+                 fsync_interval: float = DEFAULT_FSYNC_INTERVAL, clock: Callable[[], float] = time.monotonic):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_POLICIES)}")
+        if segment_bytes < 2 * MAX_BYTES_PER_RECORD:
+            raise ValueError("A segment must hold at least two maximum-size records")
+        if max_bytes < segment_bytes:
+            raise ValueError("max_bytes must be at least one segment")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_bytes // segment_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.clock = clock
+        os.makedirs(directory, exist_ok=True)
+        self._lock = open(os.path.join(directory, "lock"), "a+b")
+        try:
+            # Another process appending to the same segments would corrupt them
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock.close()
+            raise
+
+        self._segments: Dict[int, mmap.mmap] = {}
+        self._synced: Position = (0, 0)
+        self._last_sync = clock()
+        self.pending = 0
+        self.drained = self._read_drained()
+        self._recover()
+
+    @property
+    def disk_bytes(self) -> int:
+        return len(self._segments) * self.segment_bytes
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, SEGMENT_NAME.format(segment))
+
+    def _read_drained(self) -> Position:
+        try:
+            with open(os.path.join(self.directory, "drained"), "rb") as f:
+                return POSITION.unpack(f.read(POSITION.size))
+        except (FileNotFoundError, struct.error):
+            return (0, 0)
+
+    def _map(self, segment: int) -> mmap.mmap:
+        with open(self._path(segment), "a+b") as f:
+            if os.fstat(f.fileno()).st_size != self.segment_bytes:
+                f.truncate(self.segment_bytes)
+            data = mmap.mmap(f.fileno(), self.segment_bytes)
+        self._segments[segment] = data
+        return data
+
+    def _recover(self):
+        """Map the undrained segments and find the end of the last complete record."""
+        segments = sorted(int(name[8:24]) for name in os.listdir(self.directory)
+                          if name.startswith("segment-") and name.endswith(".log"))
+        for segment in segments:
+            if segment < self.drained[0]:
+                os.remove(self._path(segment))
+            else:
+                self._map(segment)
+        self._tail, self._offset = self.drained[0], 0
+        for segment in sorted(self._segments):
+            offset = 0
+            while True:
+                record = self._parse(segment, offset)
+                if record is None:
+                    break
+                if (segment, offset) >= self.drained:
+                    self.pending += 1
+                offset = record.end[1]
+            self._tail, self._offset = segment, offset
+            # A torn record: clear it, so records appended over it are not
+            # followed by its leftovers
+            data = self._segments[segment]
+            if offset + RECORD.size <= self.segment_bytes and any(data[offset:offset + RECORD.size]):
+                length, _, key_length, hash_key_length = RECORD.unpack_from(data, offset)
+                end = min(self.segment_bytes, offset + RECORD.size + key_length + hash_key_length + length)
+                data[offset:end] = bytes(end - offset)
+        self._synced = (self._tail, self._offset)
+
+    def _parse(self, segment: int, offset: int) -> Optional[SpillRecord]:
+        """The record at a position, or None at the end of the segment's records."""
+        data = self._segments[segment]
+        if offset + RECORD.size > self.segment_bytes:
+            return None
+        length, crc, key_length, hash_key_length = RECORD.unpack_from(data, offset)
+        body = offset + RECORD.size
+        end = body + key_length + hash_key_length + length
+        if not length or end > self.segment_bytes:
+            return None
+        partition_key = data[body:body + key_length]
+        explicit_hash_key = data[body + key_length:body + key_length + hash_key_length]
+        payload = data[body + key_length + hash_key_length:end]
+        if zlib.crc32(payload, zlib.crc32(explicit_hash_key, zlib.crc32(partition_key))) != crc:
+            return None
+        return SpillRecord((segment, end), partition_key.decode(),
+                           explicit_hash_key.decode() or None, payload)
+
+    def append(self, data: bytes, partition_key: str, explicit_hash_key: Optional[str] = None):
+        """Write a record at the tail; raises SpillFullError if the log is at max_bytes."""
+        key = partition_key.encode()
+        hash_key = explicit_hash_key.encode() if explicit_hash_key else b""
+        size = RECORD.size + len(key) + len(hash_key) + len(data)
+        if not self._segments or self._offset + size > self.segment_bytes:
+            self._roll()
+        segment = self._segments[self._tail]
+        offset = self._offset
+        body = offset + RECORD.size
+        segment[body:body + len(key)] = key
+        segment[body + len(key):body + len(key) + len(hash_key)] = hash_key
+        segment[body + len(key) + len(hash_key):offset + size] = data
+        # The header last, so a record is complete once it has one
+        crc = zlib.crc32(data, zlib.crc32(hash_key, zlib.crc32(key)))
+        RECORD.pack_into(segment, offset, len(data), crc, len(key), len(hash_key))
+        self._offset += size
+        self.pending += 1
+        if self.fsync == "always":
+            self.sync()
+        elif self.fsync == "interval":
+            self.maybe_sync()
+
+    def _roll(self):
+        if self._segments:
+            if len(self._segments) >= self.max_segments:
+                raise SpillFullError(f"Spill log at {self.disk_bytes} bytes")
+            if self.fsync != "never":
+                self.sync()
+            self._tail += 1
+        else:
+            # Numbered after the drained position, whose segment may be gone
+            self._tail = self.drained[0] + 1
+        self._map(self._tail)
+        self._offset = 0
+        self._synced = (self._tail, 0)
+
+    def sync(self):
+        """Flush the records appended since the last sync to disk."""
+        segment, offset = self._synced
+        if segment in self._segments and (segment, offset) < (self._tail, self._offset):
+            # msync takes page-aligned ranges
+            start = offset - offset % mmap.PAGESIZE
+            if segment == self._tail:
+                self._segments[segment].flush(start, self._offset - start)
+            else:
+                # Rolled since: finish the old segment, then the tail
+                self._segments[segment].flush(start, self.segment_bytes - start)
+                self._segments[self._tail].flush(0, self._offset)
+            self._synced = (self._tail, self._offset)
+        self._last_sync = self.clock()
+
+    def maybe_sync(self):
+        """sync() if the fsync interval has passed; a no-op under other policies."""
+        if self.fsync == "interval" and self.clock() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def read(self, start: Position, limit: int) -> List[SpillRecord]:
+        """Up to `limit` records from a position, in append order."""
+        records = []
+        start = max(start, self.drained)
+        for segment in sorted(self._segments):
+            if segment < start[0]:
+                continue
+            offset = start[1] if segment == start[0] else 0
+            while len(records) < limit and (segment, offset) < (self._tail, self._offset):
+                record = self._parse(segment, offset)
+                if record is None:
+                    break
+                records.append(record)
+                offset = record.end[1]
+            if len(records) >= limit:
+                break
+        return records
+
+    def commit(self, position: Position, records: int):
+        """Mark every record before a position as written; drops whole segments behind it."""
+        self.drained = position
+        self.pending -= records
+        path = os.path.join(self.directory, "drained")
+        with open(path + ".tmp", "wb") as f:
+            f.write(POSITION.pack(*position))
+            if self.fsync == "always":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        for segment in [segment for segment in self._segments if segment < position[0]]:
+            self._segments.pop(segment).close()
+            os.remove(self._path(segment))
+
+    def close(self):
+        if self.fsync != "never" and self._segments:
+            self.sync()
+        for data in self._segments.values():
+            data.close()
+        self._segments.clear()
+        fcntl.flock(self._lock, fcntl.LOCK_UN)
+        self._lock.close()
+
+
+class SpillDrainer:
+    """
+    Replays a SpillLog to Kinesis in PutRecords batches.
+
+    Kinesis does not order the records of one PutRecords call, and a retry
+    lands after records that succeeded, so a batch holds at most one entry
+    per partition key. With aggregate=True that entry packs the key's
+    oldest unwritten records, in log order, into one KPL aggregated record
+    of up to AGGREGATION_MAX_BYTES (see src/utils/kpl.py), which is written
+    or fails as a whole, so a hot key drains a few hundred events per batch
+    instead of one; the Flink connector, Firehose and the stream consumers
+    de-aggregate on read. Without it the entry is the key's oldest record.
+    A key's next records go in a later batch, once those before them are
+    on the stream. Records written out of log order are remembered until
+    everything before them is written too, and only then committed, so the
+    log can be reclaimed without gaps. Failed batches back off
+    exponentially.
+    """
+
+    def __init__(self, log: SpillLog, producer: KinesisProducer, stream_name: str,
+                 batch_records: int = DRAIN_BATCH_RECORDS, window_records: int = DRAIN_WINDOW_RECORDS,
+                 idle_seconds: float = DRAIN_IDLE_SECONDS, aggregate: Optional[bool] = None):
+        self.log = log
+        self.producer = producer
+        self.stream_name = stream_name
+        self.batch_records = batch_records
+        self.window_records = window_records
+        self.idle_seconds = idle_seconds
+        self.aggregate = (aggregate if aggregate is not None
+                          else os.getenv("SPILL_AGGREGATE_RECORDS", "true").lower() == "true")
+        self._window: Deque[SpillRecord] = deque()
+        self._cursor = log.drained
+        self._failures = 0
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    async def start(self):
+        """Start draining on the running event loop."""
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop draining; what is left stays in the log for the next start."""
+        self._closing = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while not self._closing:
+            written, failed = await self.drain_once()
+            self.log.maybe_sync()
+            if failed and not written:
+                self._failures += 1
+                delay = random.uniform(0, min(DRAIN_BACKOFF_CAP_SECONDS,
+                                              DRAIN_BACKOFF_SECONDS * 2 ** (self._failures - 1)))
+            else:
+                self._failures = 0
+                delay = 0 if written else self.idle_seconds
+            await asyncio.sleep(delay)
+
+    def _batch(self) -> List[List[SpillRecord]]:
+        """The oldest unwritten records of each partition key in the window, in log order."""
+        if len(self._window) < self.window_records:
+            records = self.log.read(self._cursor, self.window_records - len(self._window))
+            if records:
+                self._window.extend(records)
+                self._cursor = records[-1].end
+        groups: Dict[Tuple[str, Optional[str]], List[SpillRecord]] = {}
+        sizes: Dict[Tuple[str, Optional[str]], int] = {}
+        full = set()
+        for record in self._window:
+            if record.written:
+                continue
+            key = (record.partition_key, record.explicit_hash_key)
+            if key in full:
+                continue
+            size = kpl.record_overhead(record.partition_key, record.data)
+            group = groups.get(key)
+            if group is None:
+                if len(groups) < self.batch_records:
+                    groups[key], sizes[key] = [record], size
+                continue
+            if not self.aggregate or sizes[key] + size > AGGREGATION_MAX_BYTES:
+                # The key's later records wait for a later batch
+                full.add(key)
+                continue
+            group.append(record)
+            sizes[key] += size
+        return list(groups.values())
+
+    async def drain_once(self) -> Tuple[int, int]:
+        """Send one batch; returns the records written and failed."""
+        batch = self._batch()
+        if not batch:
+            return 0, 0
+        entries = []
+        for index, group in enumerate(batch):
+            record = group[0]
+            data = record.data if len(group) == 1 else kpl.aggregate(
+                [(record.partition_key, grouped.data) for grouped in group])
+            entry = {"Data": data, "PartitionKey": record.partition_key}
+            if record.explicit_hash_key is not None:
+                entry["ExplicitHashKey"] = record.explicit_hash_key
+            entries.append((index, entry))
+        try:
+            results = await self.producer.put_records(self.stream_name, entries)
+        except Exception:
+            results = {}
+
+        written = 0
+        for index, group in enumerate(batch):
+            if results.get(index, {}).get("status") == "success":
+                for record in group:
+                    record.written = True
+                written += len(group)
+        SPILL_DRAINED_EVENTS.inc(written)
+
+        committed, end = 0, None
+        while self._window and self._window[0].written:
+            end = self._window.popleft().end
+            committed += 1
+        if committed:
+            self.log.commit(end, committed)
+        return written, sum(map(len, batch)) - written
+
+
+def create_spill_log() -> Optional[SpillLog]:
+    """
+    The API's spill log as configured by the SPILL_* environment, or None
+    if disabled. Each worker process takes the first worker-N directory
+    under SPILL_DIR that no live process holds, so a restarted worker
+    drains what a dead one left.
+    """
+    if os.getenv("SPILL_ENABLED", "true").lower() != "true":
+        return None
+    root = os.getenv("SPILL_DIR", "/tmp/game-api-spill")
+    for worker in range(int(os.getenv("SPILL_MAX_WORKERS", "64"))):
+        try:
+            return SpillLog(
+                os.path.join(root, f"worker-{worker}"),
+                segment_bytes=int(os.getenv("SPILL_SEGMENT_BYTES", str(DEFAULT_SEGMENT_BYTES))),
+                max_bytes=int(os.getenv("SPILL_MAX_BYTES", str(DEFAULT_MAX_BYTES))),
+                fsync=os.getenv("SPILL_FSYNC", "interval"),
+                fsync_interval=float(os.getenv("SPILL_FSYNC_INTERVAL_MS", "100")) / 1000
+            )
+        except BlockingIOError:
+            continue
+    raise RuntimeError(f"Every spill log under {root} is in use")
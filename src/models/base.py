@@ -1,8 +1,8 @@
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Literal, Union, Annotated
 from uuid import UUID
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 
 
 class BaseEvent(BaseModel):
@@ -14,6 +14,7 @@ class BaseEvent(BaseModel):
     session_id: str = Field(..., description="Game session identifier")
     event_type: str = Field(..., description="Type of the event")
     version: str = Field(..., description="Event schema version")
+    server_timestamp: Optional[datetime] = Field(None, description="Ingest timestamp set by the API")
     
     class Config:
         json_schema_extra = {
@@ -31,6 +32,7 @@ class BaseEvent(BaseModel):
 
 class GameStartEvent(BaseEvent):
     """Event generated when a player starts a game."""
+    event_type: Literal["game_start"] = Field(..., description="Type of the event")
     device_info: Dict[str, str] = Field(..., description="Information about the player's device")
     client_version: str = Field(..., description="Version of the game client")
     
@@ -56,6 +58,7 @@ class GameStartEvent(BaseEvent):
 
 class GameEndEvent(BaseEvent):
     """Event generated when a player ends a game."""
+    event_type: Literal["game_end"] = Field(..., description="Type of the event")
     duration: int = Field(..., description="Duration of the game session in seconds")
     score: int = Field(..., description="Final score")
     level_reached: int = Field(..., description="Highest level reached")
@@ -81,6 +84,7 @@ class GameEndEvent(BaseEvent):
 
 class InGamePurchaseEvent(BaseEvent):
     """Event generated when a player makes an in-game purchase."""
+    event_type: Literal["purchase"] = Field(..., description="Type of the event")
     item_id: str = Field(..., description="Identifier of the purchased item")
     item_name: str = Field(..., description="Name of the purchased item")
     currency_type: str = Field(..., description="Type of currency used (real/virtual)")
@@ -108,6 +112,7 @@ class InGamePurchaseEvent(BaseEvent):
 
 class PlayerProgressEvent(BaseEvent):
     """Event generated when a player makes progress in the game."""
+    event_type: Literal["progress"] = Field(..., description="Type of the event")
     level: int = Field(..., description="Current level")
     xp_earned: int = Field(..., description="Experience points earned")
     achievements: List[str] = Field(default_factory=list, description="Achievements unlocked")
@@ -132,4 +137,14 @@ class PlayerProgressEvent(BaseEvent):
                     "inventory": ["sword", "shield"]
                 }
             }
-        } 
\ No newline at end of file
+        }
+
+
+# Any game event, validated straight into its model by event_type
+AnyGameEvent = Annotated[
+    Union[GameStartEvent, GameEndEvent, InGamePurchaseEvent, PlayerProgressEvent],
+    Field(discriminator="event_type")
+]
+
+game_event_adapter = TypeAdapter(AnyGameEvent)
+game_event_list_adapter = TypeAdapter(List[AnyGameEvent])
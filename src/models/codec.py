@@ -0,0 +1,332 @@
+"""
+Compact binary encoding for game events.
+
+The layout of each event is derived from its model in src/models/base.py
+and keyed on (event_type, version). Each pair gets its own one-byte tag, so
+a new schema version gets a new layout while old records stay decodable:
+
+    magic (1) | layout version (1) | schema tag (1) | timestamp (8)
+    | event_id (16) | remaining model fields in declaration order
+
+Strings are varint length-prefixed UTF-8, ints are zigzag varints, floats
+are 8-byte doubles, UUIDs are 16 raw bytes and datetimes are big-endian
+int64 microseconds since the epoch in UTC (naive values are taken as UTC
+and decode as naive UTC, like the rest of the pipeline).
+Optional fields carry a one-byte presence flag, and free-form dicts fall
+back to embedded JSON. The timestamp sits at a fixed offset so consumers can
+read event time without decoding the whole record.
+"""
+import json
+import struct
+import typing
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Tuple, Type
+from uuid import UUID
+
+from src.models.base import (
+    BaseEvent,
+    GameStartEvent,
+    GameEndEvent,
+    InGamePurchaseEvent,
+    PlayerProgressEvent,
+    game_event_adapter
+)
+
+CONTENT_TYPE = "application/vnd.game-event"
+BATCH_CONTENT_TYPE = "application/vnd.game-event-batch"
+
+MAGIC = 0xC7
+LAYOUT_VERSION = 1
+TIMESTAMP_OFFSET = 3
+HEADER_SIZE = TIMESTAMP_OFFSET + 8
+
+_INT64 = struct.Struct(">q")
+_DOUBLE = struct.Struct(">d")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EPOCH_NAIVE = datetime(1970, 1, 1)
+
+# Header fields, written before the model-derived fields
+_HEADER_FIELDS = {"event_type", "timestamp", "version", "event_id"}
+
+Encoder = Callable[[bytearray, Any], None]
+Decoder = Callable[[bytes, int], Tuple[Any, int]]
+
+
+class CodecError(ValueError):
+    """Raised for records that are not valid compact events."""
+
+
+def _write_varint(buf: bytearray, value: int):
+    while value > 0x7F:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _enc_str(buf: bytearray, value: str):
+    raw = value.encode()
+    _write_varint(buf, len(raw))
+    buf += raw
+
+
+def _dec_str(data: bytes, pos: int) -> Tuple[str, int]:
+    size, pos = _read_varint(data, pos)
+    if pos + size > len(data):
+        raise IndexError("string runs past the end of the record")
+    return data[pos:pos + size].decode(), pos + size
+
+
+def _enc_int(buf: bytearray, value: int):
+    _write_varint(buf, (value << 1) ^ (value >> 63))
+
+
+def _dec_int(data: bytes, pos: int) -> Tuple[int, int]:
+    value, pos = _read_varint(data, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+
+def _enc_float(buf: bytearray, value: float):
+    buf += _DOUBLE.pack(value)
+
+
+def _dec_float(data: bytes, pos: int) -> Tuple[float, int]:
+    return _DOUBLE.unpack_from(data, pos)[0], pos + 8
+
+
+def _enc_uuid(buf: bytearray, value: UUID):
+    buf += value.bytes
+
+
+def _dec_uuid(data: bytes, pos: int) -> Tuple[UUID, int]:
+    return UUID(bytes=bytes(data[pos:pos + 16])), pos + 16
+
+
+def _micros(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _from_micros(value: int) -> datetime:
+    return _EPOCH_NAIVE + timedelta(microseconds=value)
+
+
+def _enc_datetime(buf: bytearray, value: datetime):
+    buf += _INT64.pack(_micros(value))
+
+
+def _dec_datetime(data: bytes, pos: int) -> Tuple[datetime, int]:
+    return _from_micros(_INT64.unpack_from(data, pos)[0]), pos + 8
+
+
+def _enc_str_list(buf: bytearray, value: List[str]):
+    _write_varint(buf, len(value))
+    for item in value:
+        _enc_str(buf, item)
+
+
+def _dec_str_list(data: bytes, pos: int) -> Tuple[List[str], int]:
+    count, pos = _read_varint(data, pos)
+    items = []
+    for _ in range(count):
+        item, pos = _dec_str(data, pos)
+        items.append(item)
+    return items, pos
+
+
+def _enc_str_dict(buf: bytearray, value: Dict[str, str]):
+    _write_varint(buf, len(value))
+    for key, item in value.items():
+        _enc_str(buf, key)
+        _enc_str(buf, item)
+
+
+def _dec_str_dict(data: bytes, pos: int) -> Tuple[Dict[str, str], int]:
+    count, pos = _read_varint(data, pos)
+    items = {}
+    for _ in range(count):
+        key, pos = _dec_str(data, pos)
+        items[key], pos = _dec_str(data, pos)
+    return items, pos
+
+
+def _enc_json(buf: bytearray, value: Any):
+    _enc_str(buf, json.dumps(value, separators=(",", ":")))
+
+
+def _dec_json(data: bytes, pos: int) -> Tuple[Any, int]:
+    raw, pos = _dec_str(data, pos)
+    return json.loads(raw), pos
+
+
+def _optional(encode: Encoder, decode: Decoder) -> Tuple[Encoder, Decoder]:
+    def enc(buf: bytearray, value: Any):
+        if value is None:
+            buf.append(0)
+        else:
+            buf.append(1)
+            encode(buf, value)
+
+    def dec(data: bytes, pos: int) -> Tuple[Any, int]:
+        if not data[pos]:
+            return None, pos + 1
+        return decode(data, pos + 1)
+
+    return enc, dec
+
+
+_SCALARS = {
+    str: (_enc_str, _dec_str),
+    int: (_enc_int, _dec_int),
+    float: (_enc_float, _dec_float),
+    UUID: (_enc_uuid, _dec_uuid),
+    datetime: (_enc_datetime, _dec_datetime),
+}
+
+
+def _field_codec(annotation: Any) -> Tuple[Encoder, Decoder]:
+    """Pick the encoder/decoder pair for a model field annotation."""
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin is typing.Union and type(None) in args:
+        inner = [arg for arg in args if arg is not type(None)]
+        return _optional(*_field_codec(inner[0]))
+    if annotation in _SCALARS:
+        return _SCALARS[annotation]
+    if origin is list and args == (str,):
+        return _enc_str_list, _dec_str_list
+    if origin is dict and args == (str, str):
+        return _enc_str_dict, _dec_str_dict
+    return _enc_json, _dec_json
+
+
+class Layout:
+    """Field order and codecs for one (event_type, version) schema."""
+
+    def __init__(self, tag: int, model: Type[BaseEvent]):
+        self.tag = tag
+        self.model = model
+        self.fields = [
+            (name, *_field_codec(field.annotation))
+            for name, field in model.model_fields.items()
+            if name not in _HEADER_FIELDS
+        ]
+
+
+# (event_type, version) -> layout. Tags are part of the wire format: never
+# reuse one, add a new tag when a model changes incompatibly.
+LAYOUTS: Dict[Tuple[str, str], Layout] = {
+    ("game_start", "1.0"): Layout(1, GameStartEvent),
+    ("game_end", "1.0"): Layout(2, GameEndEvent),
+    ("purchase", "1.0"): Layout(3, InGamePurchaseEvent),
+    ("progress", "1.0"): Layout(4, PlayerProgressEvent),
+}
+_LAYOUTS_BY_TAG = {layout.tag: (key, layout) for key, layout in LAYOUTS.items()}
+
+
+def can_encode(event: BaseEvent) -> bool:
+    """Whether a compact layout exists for the event's type and version."""
+    return (event.event_type, event.version) in LAYOUTS
+
+
+def encode(event: BaseEvent) -> bytes:
+    """Encode an event in the compact layout for its type and version."""
+    try:
+        layout = LAYOUTS[(event.event_type, event.version)]
+    except KeyError:
+        raise CodecError(f"No compact layout for {event.event_type} v{event.version}")
+
+    buf = bytearray((MAGIC, LAYOUT_VERSION, layout.tag))
+    _enc_datetime(buf, event.timestamp)
+    _enc_uuid(buf, event.event_id)
+    for name, enc, _ in layout.fields:
+        enc(buf, getattr(event, name))
+    return bytes(buf)
+
+
+def is_compact(data: bytes) -> bool:
+    """Whether a record is in the compact layout (JSON starts with '{')."""
+    return len(data) >= HEADER_SIZE and data[0] == MAGIC
+
+
+def read_timestamp(data: bytes) -> datetime:
+    """Read the event timestamp without decoding the rest of the record."""
+    return _from_micros(_INT64.unpack_from(data, TIMESTAMP_OFFSET)[0])
+
+
+def record_timestamp(data: bytes) -> datetime:
+    """Event time of a stream record in either format, as naive UTC."""
+    if is_compact(data):
+        return read_timestamp(data)
+    timestamp = game_event_adapter.validate_json(data).timestamp
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def decode_fields(data: bytes) -> Dict[str, Any]:
+    """Decode a compact record into a dict of field values."""
+    if not is_compact(data) or data[1] != LAYOUT_VERSION:
+        raise CodecError("Not a compact game event")
+    try:
+        (event_type, version), layout = _LAYOUTS_BY_TAG[data[2]]
+    except KeyError:
+        raise CodecError(f"Unknown compact event tag {data[2]}")
+
+    try:
+        values = {"event_type": event_type, "version": version, "timestamp": read_timestamp(data)}
+        values["event_id"], pos = _dec_uuid(data, HEADER_SIZE)
+        for name, _, dec in layout.fields:
+            values[name], pos = dec(data, pos)
+    except (IndexError, OverflowError, struct.error, UnicodeDecodeError, ValueError) as e:
+        raise CodecError(f"Truncated or corrupt compact event: {e}")
+    return values
+
+
+def decode(data: bytes) -> BaseEvent:
+    """Decode and validate a compact record into its event model."""
+    values = decode_fields(data)
+    _, layout = _LAYOUTS_BY_TAG[data[2]]
+    return layout.model.model_validate(values)
+
+
+def decode_record(data: bytes) -> Dict[str, Any]:
+    """Decode a stream record in either format into a JSON-compatible dict."""
+    if is_compact(data):
+        return decode(data).model_dump(mode="json")
+    return json.loads(data)
+
+
+def encode_batch(events: List[BaseEvent]) -> bytes:
+    """Frame compact events as a varint length-prefixed sequence."""
+    buf = bytearray()
+    for event in events:
+        record = encode(event)
+        _write_varint(buf, len(record))
+        buf += record
+    return bytes(buf)
+
+
+def iter_batch(data: bytes):
+    """Yield the compact records of a framed batch."""
+    pos = 0
+    while pos < len(data):
+        try:
+            size, pos = _read_varint(data, pos)
+        except IndexError:
+            raise CodecError("Truncated compact batch")
+        if pos + size > len(data):
+            raise CodecError("Truncated compact batch")
+        yield data[pos:pos + size]
+        pos += size
@@ -0,0 +1,84 @@
+"""
+Per-day summaries, the unit of work of the batch analytics.
+
+Each day's events are read once into a small summary (active players and
+real-money purchases aggregated per player and item). A day is the day of
+the events' timestamps, read from its partition and the ones late events
+arrive in (see read_event_day), so the days of a range are only final
+BATCH_LATE_HOURS after it ends. Days are independent, so they can be
+summarized in a process pool and the reports combine the summaries; total work grows linearly with the number of days. The pool is
+worth its start-up and the pickling of summaries when there are several
+cores, or when the lake is on S3 and a day's read mostly waits on the
+network; on one core with a local lake, use one worker.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Dict, Iterable, List, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from src.processors.batch.lake import EVENT_TYPES, read_event_day
+
+DEFAULT_CURRENCY = "USD"
+
+
+def active_players(location: str, day: date) -> pa.Array:
+    """Distinct players with any event on a day."""
+    players = [
+        read_event_day(location, event_type, day, ["player_id"]).column("player_id")
+        for event_type in EVENT_TYPES
+    ]
+    return pc.unique(pa.chunked_array(
+        [chunk for column in players for chunk in column.chunks], type=pa.string()
+    ))
+
+
+def summarize_day(location: str, day: date, currency: str = DEFAULT_CURRENCY) -> Dict:
+    """
+    Summary of one day:
+
+    - active: distinct active player IDs
+    - purchases: DataFrame of real-money purchases in `currency`, summed per
+      (game_id, item_id, item_name, player_id) into revenue and purchases
+    """
+    predicate = (ds.field("currency_type") == "real") & (ds.field("currency_code") == currency)
+    table = read_event_day(location, "purchase", day, ["game_id", "item_id", "item_name", "player_id", "amount"],
+                           predicate)
+    purchases = (
+        table.group_by(["game_id", "item_id", "item_name", "player_id"])
+        .aggregate([("amount", "sum"), ("amount", "count")])
+        .to_pandas()
+        .rename(columns={"amount_sum": "revenue", "amount_count": "purchases"})
+    )
+    return {
+        "day": day,
+        "active": active_players(location, day).to_numpy(zero_copy_only=False),
+        "purchases": purchases,
+    }
+
+
+def _summarize(args) -> Dict:
+    return summarize_day(*args)
+
+
+def map_days(location: str, days: Sequence[date], currency: str = DEFAULT_CURRENCY,
+             workers: int = 1) -> List[Dict]:
+    """Summaries of `days`, in order, computed in `workers` processes."""
+    tasks = [(location, day, currency) for day in days]
+    if workers <= 1:
+        return [_summarize(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_summarize, tasks))
+
+
+def concat_purchases(summaries: Iterable[Dict]) -> pd.DataFrame:
+    """Per-day purchase aggregates of several days, with a day column."""
+    frames = [summary["purchases"].assign(day=summary["day"]) for summary in summaries]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=["game_id", "item_id", "item_name", "player_id",
+                                     "revenue", "purchases", "day"])
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,57 @@
+"""
+In-game economy: ARPU, ARPPU and item revenue.
+
+ARPU is real-money revenue per active player and ARPPU revenue per paying
+player, per day and over the whole range (with players counted once).
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.processors.batch.daily import concat_purchases
+
+
+def arpu(summaries: List[Dict]) -> Tuple[pd.DataFrame, Dict]:
+    """Daily ARPU/ARPPU rows, and the totals over all days."""
+    purchases = concat_purchases(summaries)
+    by_day = purchases.groupby("day").agg(revenue=("revenue", "sum"), payers=("player_id", "nunique"))
+    rows = []
+    for summary in summaries:
+        found = summary["day"] in by_day.index
+        revenue = float(by_day.at[summary["day"], "revenue"]) if found else 0.0
+        payers = int(by_day.at[summary["day"], "payers"]) if found else 0
+        active = len(summary["active"])
+        rows.append({
+            "day": summary["day"],
+            "revenue": revenue,
+            "active_players": active,
+            "paying_players": payers,
+            "arpu": revenue / active if active else None,
+            "arppu": revenue / payers if payers else None,
+        })
+
+    revenue = float(purchases["revenue"].sum())
+    active = len(np.unique(np.concatenate([s["active"] for s in summaries]))) if summaries else 0
+    payers = purchases["player_id"].nunique()
+    totals = {
+        "revenue": revenue,
+        "active_players": active,
+        "paying_players": payers,
+        "arpu": revenue / active if active else None,
+        "arppu": revenue / payers if payers else None,
+    }
+    return pd.DataFrame(rows), totals
+
+
+def item_revenue(summaries: List[Dict]) -> pd.DataFrame:
+    """Revenue, purchases and distinct buyers per game and item, highest revenue first."""
+    purchases = concat_purchases(summaries)
+    items = purchases.groupby(["game_id", "item_id", "item_name"], as_index=False).agg(
+        revenue=("revenue", "sum"),
+        purchases=("purchases", "sum"),
+        buyers=("player_id", "nunique"),
+    )
+    total = items["revenue"].sum()
+    items["revenue_share"] = items["revenue"] / total if total else 0.0
+    return items.sort_values("revenue", ascending=False, ignore_index=True)
@@ -0,0 +1,108 @@
+"""
+Read access to the Parquet lake written by src/processors/compaction.py.
+
+Partitions are event_type=/year=/month=/day=/hour=/. Reads are scoped to one
+day directory, so only that day's files are listed (partition pruning), and
+predicates are pushed down to Parquet row-group statistics.
+
+The partitions are those of the hour compaction ran on, when the events
+arrived, so read_event_day reads the events of a day by their timestamp
+from its partition and those around it.
+"""
+import os
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+from src.processors.compaction import OUTPUT_PREFIX, SCHEMAS
+
+EVENT_TYPES = tuple(SCHEMAS)
+
+HOUR_PARTITIONING = ds.partitioning(pa.schema([("hour", pa.int8())]), flavor="hive")
+
+# How many hours after the end of its day an event may arrive and still be
+# counted on it, like the late hours of the replay and the rollup corrections
+LATE_HOURS = int(os.getenv("BATCH_LATE_HOURS", "24"))
+
+
+def open_lake(location: str) -> Tuple[fs.FileSystem, str]:
+    """Filesystem and base path of a lake: s3://bucket[/prefix] or a local directory."""
+    if location.startswith("s3://"):
+        filesystem = fs.S3FileSystem(
+            endpoint_override=os.getenv("AWS_ENDPOINT_URL", "http://localhost:4566"),
+            region=os.getenv("AWS_DEFAULT_REGION", "us-east-1"),
+            access_key='test',
+            secret_key='test'
+        )
+        return filesystem, location[len("s3://"):].rstrip("/")
+    return fs.LocalFileSystem(), os.path.abspath(location)
+
+
+def day_path(base: str, event_type: str, day: date) -> str:
+    return f"{base}/{OUTPUT_PREFIX}event_type={event_type}/year={day:%Y}/month={day:%m}/day={day:%d}"
+
+
+def read_day(location: str, event_type: str, day: date, columns: List[str],
+             predicate: Optional[ds.Expression] = None) -> pa.Table:
+    """Columns of one event type in one day partition, filtered by `predicate`."""
+    filesystem, base = open_lake(location)
+    path = day_path(base, event_type, day)
+    if filesystem.get_file_info(path).type != fs.FileType.Directory:
+        return SCHEMAS[event_type].empty_table().select(columns)
+    dataset = ds.dataset(path, filesystem=filesystem, format="parquet", partitioning=HOUR_PARTITIONING)
+    return dataset.to_table(columns=columns, filter=predicate)
+
+
+def read_event_day(location: str, event_type: str, day: date, columns: List[str],
+                   predicate: Optional[ds.Expression] = None, late_hours: int = LATE_HOURS) -> pa.Table:
+    """
+    Columns of one event type's events timestamped on `day`, filtered by
+    `predicate`: read from the partitions of the hour before the day (for
+    clients whose clocks run ahead) through late_hours after it.
+    """
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days=1)
+    on_day = (ds.field("timestamp") >= start) & (ds.field("timestamp") < end)
+    if predicate is not None:
+        on_day = on_day & predicate
+    first, last = start - timedelta(hours=1), end + timedelta(hours=late_hours)
+    tables = []
+    arrival = datetime.combine(first.date(), time.min)
+    while arrival < last:
+        hours = ((ds.field("hour") >= (first - arrival) // timedelta(hours=1))
+                 & (ds.field("hour") < (last - arrival) // timedelta(hours=1)))
+        table = read_day(location, event_type, arrival.date(), columns, on_day & hours)
+        if table.num_rows:
+            tables.append(table)
+        arrival += timedelta(days=1)
+    if not tables:
+        return SCHEMAS[event_type].empty_table().select(columns)
+    return pa.concat_tables(tables)
+
+
+def read_hour(location: str, event_type: str, hour: datetime, columns: List[str],
+              predicate: Optional[ds.Expression] = None) -> pa.Table:
+    """Columns of one event type in one hour partition."""
+    filesystem, base = open_lake(location)
+    path = f"{day_path(base, event_type, hour)}/hour={hour:%H}"
+    if filesystem.get_file_info(path).type != fs.FileType.Directory:
+        return SCHEMAS[event_type].empty_table().select(columns)
+    dataset = ds.dataset(path, filesystem=filesystem, format="parquet")
+    return dataset.to_table(columns=columns, filter=predicate)
+
+
+def list_days(location: str, event_type: str = "game_start") -> List[date]:
+    """Days that have a partition for an event type."""
+    filesystem, base = open_lake(location)
+    selector = fs.FileSelector(f"{base}/{OUTPUT_PREFIX}event_type={event_type}", recursive=True,
+                               allow_not_found=True)
+    days = set()
+    for info in filesystem.get_file_info(selector):
+        parts = dict(part.split("=", 1) for part in info.path.split("/") if "=" in part)
+        if info.type == fs.FileType.Directory and "day" in parts and "hour" not in parts:
+            days.add(datetime.strptime(f"{parts['year']}-{parts['month']}-{parts['day']}", "%Y-%m-%d").date())
+    return sorted(days)
+
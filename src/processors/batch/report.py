@@ -0,0 +1,75 @@
+"""
+Batch analytics over the Parquet lake.
+
+Summarizes each day partition (optionally in a process pool), then writes
+retention cohorts, daily ARPU/ARPPU and item revenue as CSV:
+
+    python -m src.processors.batch.report --lake ./lake/processed --start 2024-01-01 --end 2024-01-31 --workers 4
+    python -m src.processors.batch.report --lake s3://game-analytics-processed-data-dev --output ./reports
+"""
+import argparse
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from src.processors.batch.daily import DEFAULT_CURRENCY, map_days
+from src.processors.batch.economy import arpu, item_revenue
+from src.processors.batch.lake import list_days
+from src.processors.batch.retention import retention_cohorts
+
+
+def day_range(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def run_reports(location: str, days: List[date], currency: str = DEFAULT_CURRENCY,
+                workers: int = 1) -> Dict:
+    """Compute every report for `days`; returns DataFrames and totals."""
+    summaries = map_days(location, days, currency, workers)
+    daily_arpu, totals = arpu(summaries)
+    return {
+        "retention": retention_cohorts(summaries),
+        "arpu": daily_arpu,
+        "items": item_revenue(summaries),
+        "totals": totals,
+    }
+
+
+def _date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lake", default=f"s3://{os.getenv('PROCESSED_BUCKET', 'game-analytics-processed-data-dev')}",
+                        help="Processed store: s3://bucket or a local directory")
+    parser.add_argument("--start", type=_date, help="First day (default: first day in the lake)")
+    parser.add_argument("--end", type=_date, help="Last day (default: last day in the lake)")
+    parser.add_argument("--currency", default=DEFAULT_CURRENCY)
+    parser.add_argument("--workers", type=int, default=1, help="Processes summarizing day partitions")
+    parser.add_argument("--output", default="reports", help="Directory for the CSV reports")
+    args = parser.parse_args(argv)
+
+    available = list_days(args.lake)
+    if not available and not (args.start and args.end):
+        parser.error(f"No day partitions found in {args.lake}")
+    days = day_range(args.start or available[0], args.end or available[-1])
+
+    started = time.perf_counter()
+    reports = run_reports(args.lake, days, args.currency, args.workers)
+    elapsed = time.perf_counter() - started
+
+    os.makedirs(args.output, exist_ok=True)
+    for name in ("retention", "arpu", "items"):
+        reports[name].to_csv(os.path.join(args.output, f"{name}.csv"), index=False)
+    with open(os.path.join(args.output, "totals.json"), "w") as f:
+        json.dump(reports["totals"], f, indent=2)
+
+    print(f"{len(days)} days in {elapsed:.2f} s with {args.workers} worker(s), reports in {args.output}/")
+    print(json.dumps(reports["totals"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
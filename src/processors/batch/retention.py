@@ -0,0 +1,50 @@
+"""
+D1/D7/D30 retention cohorts.
+
+A player's cohort is the first day they are active within the analysed
+range, so the range should start early enough that returning players are not
+counted as new. Retention on day N is the share of a cohort active exactly N
+days after its cohort day; it is left empty when that day is past the range.
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+RETENTION_DAYS = (1, 7, 30)
+
+
+def activity_frame(summaries: List[Dict]) -> pd.DataFrame:
+    """(player_id, day) rows for every active player-day."""
+    frames = [
+        pd.DataFrame({"player_id": summary["active"], "day": np.datetime64(summary["day"], "D")})
+        for summary in summaries
+    ]
+    if not frames:
+        return pd.DataFrame({"player_id": pd.Series(dtype=object), "day": pd.Series(dtype="datetime64[ns]")})
+    return pd.concat(frames, ignore_index=True)
+
+
+def retention_cohorts(summaries: List[Dict], retention_days: Sequence[int] = RETENTION_DAYS) -> pd.DataFrame:
+    """One row per cohort day: cohort_size and d<N> retention rates."""
+    activity = activity_frame(summaries)
+    columns = ["cohort_day", "cohort_size"] + [f"d{n}" for n in retention_days]
+    if activity.empty:
+        return pd.DataFrame(columns=columns)
+
+    cohort = activity.groupby("player_id")["day"].transform("min")
+    offset = (activity["day"] - cohort).dt.days
+    activity = activity.assign(cohort_day=cohort, offset=offset)
+
+    sizes = activity.loc[activity["offset"] == 0].groupby("cohort_day").size()
+    result = pd.DataFrame({"cohort_size": sizes})
+    last_day = activity["day"].max()
+    for n in retention_days:
+        retained = activity.loc[activity["offset"] == n].groupby("cohort_day").size()
+        rate = retained.reindex(result.index, fill_value=0) / result["cohort_size"]
+        # Cohorts whose day N is not in the range yet have no value
+        observable = result.index + pd.Timedelta(days=n) <= last_day
+        result[f"d{n}"] = rate.where(observable)
+    result = result.reset_index()
+    result["cohort_day"] = result["cohort_day"].dt.date
+    return result[columns]
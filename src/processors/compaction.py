@@ -0,0 +1,280 @@
+"""
+Compacts an hour of raw Firehose output into Parquet.
+
+Firehose writes game-events-stream to the raw bucket as many small objects
+of concatenated JSON events under raw/year=/month=/day=/hour=/. This job
+reads one hour, validates each event against its model in
+src/models/base.py, and writes one set of Parquet files per event_type to
+the processed bucket:
+
+    events/event_type=<type>/year=YYYY/month=MM/day=DD/hour=HH/part-NNNNN.parquet
+
+Every typed field is a column. Rows are sorted by game_id, player_id and
+timestamp, identifiers are dictionary-encoded, and files are rolled at
+about --target-mb. A manifest per hour records the source objects it read
+and the files it wrote, so a rerun over unchanged input is a no-op, and a
+rerun after late objects arrive rewrites the hour and removes stale files.
+
+    python -m src.processors.compaction --hour 2024-01-15T13
+    python -m src.processors.compaction --hour 2024-01-15T13 --raw ./lake/raw --processed ./lake/processed
+
+Records in the compact binary encoding cannot be split out of Firehose
+objects (they carry no delimiter), so the raw stream is expected to be JSON.
+"""
+import argparse
+import gzip
+import json
+import os
+import typing
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pydantic import ValidationError
+
+from src.models.base import (
+    BaseEvent,
+    GameStartEvent,
+    GameEndEvent,
+    InGamePurchaseEvent,
+    PlayerProgressEvent,
+    game_event_adapter
+)
+from src.utils.storage import Storage, open_storage
+
+RAW_PREFIX = "raw/"
+OUTPUT_PREFIX = "events/"
+MANIFEST_PREFIX = "manifests/compaction/"
+MANIFEST_VERSION = 1
+
+TARGET_FILE_BYTES = int(os.getenv("COMPACTION_TARGET_FILE_MB", "128")) * 1024 * 1024
+ROW_GROUP_ROWS = 100_000
+COMPRESSION = "zstd"
+SORT_KEYS = [("game_id", "ascending"), ("player_id", "ascending"), ("timestamp", "ascending")]
+
+EVENT_MODELS = {
+    "game_start": GameStartEvent,
+    "game_end": GameEndEvent,
+    "purchase": InGamePurchaseEvent,
+    "progress": PlayerProgressEvent,
+}
+
+# Low-cardinality or heavily repeated strings
+DICTIONARY_COLUMNS = {
+    "game_id", "player_id", "session_id", "event_type", "version",
+    "client_version", "item_id", "item_name", "currency_type", "currency_code"
+}
+
+
+def _arrow_type(annotation: Any) -> Tuple[pa.DataType, bool]:
+    """Arrow type of a model field annotation, and whether it is nullable."""
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin is typing.Union and type(None) in args:
+        inner = [arg for arg in args if arg is not type(None)]
+        return _arrow_type(inner[0])[0], True
+    if annotation is str or annotation is UUID:
+        return pa.string(), False
+    if annotation is int:
+        return pa.int64(), False
+    if annotation is float:
+        return pa.float64(), False
+    if annotation is datetime:
+        return pa.timestamp("us"), False
+    if origin is list and args == (str,):
+        return pa.list_(pa.string()), False
+    if origin is dict and args == (str, str):
+        return pa.map_(pa.string(), pa.string()), False
+    # Free-form values are stored as JSON text
+    return pa.string(), False
+
+
+def event_schema(model: typing.Type[BaseEvent]) -> pa.Schema:
+    """Parquet schema with one column per model field."""
+    fields = []
+    for name, field in model.model_fields.items():
+        arrow_type, nullable = _arrow_type(field.annotation)
+        fields.append(pa.field(name, arrow_type, nullable=nullable))
+    return pa.schema(fields)
+
+
+SCHEMAS = {event_type: event_schema(model) for event_type, model in EVENT_MODELS.items()}
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def to_row(event: BaseEvent, schema: pa.Schema) -> Dict[str, Any]:
+    row = {}
+    for field in schema:
+        value = getattr(event, field.name)
+        if isinstance(value, UUID):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = _naive_utc(value)
+        elif isinstance(value, dict) and not pa.types.is_map(field.type):
+            value = json.dumps(value, separators=(",", ":"))
+        row[field.name] = value
+    return row
+
+
+def iter_json_records(data: bytes) -> Iterator[Any]:
+    """Parse concatenated (or newline-delimited) JSON values from an object."""
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    text = data.decode()
+    decoder = json.JSONDecoder()
+    pos, end = 0, len(text)
+    while True:
+        while pos < end and text[pos].isspace():
+            pos += 1
+        if pos >= end:
+            return
+        value, pos = decoder.raw_decode(text, pos)
+        yield value
+
+
+def partition_path(hour: datetime) -> str:
+    return f"year={hour:%Y}/month={hour:%m}/day={hour:%d}/hour={hour:%H}/"
+
+
+def parquet_files(table: pa.Table, target_file_bytes: int) -> Iterator[Tuple[bytes, int]]:
+    """Write a table as Parquet files of about target_file_bytes; yields (data, rows)."""
+    dictionary = [name for name in table.column_names if name in DICTIONARY_COLUMNS]
+    sink, writer, rows = None, None, 0
+    for offset in range(0, table.num_rows, ROW_GROUP_ROWS):
+        if writer is None:
+            sink = pa.BufferOutputStream()
+            writer = pq.ParquetWriter(sink, table.schema, compression=COMPRESSION,
+                                      use_dictionary=dictionary, write_statistics=True)
+        chunk = table.slice(offset, ROW_GROUP_ROWS)
+        writer.write_table(chunk, row_group_size=ROW_GROUP_ROWS)
+        rows += chunk.num_rows
+        if sink.tell() >= target_file_bytes:
+            writer.close()
+            yield sink.getvalue().to_pybytes(), rows
+            writer, rows = None, 0
+    if writer is not None:
+        writer.close()
+        yield sink.getvalue().to_pybytes(), rows
+
+
+class CompactionJob:
+    """Compacts hour partitions from a raw store into a processed store."""
+
+    def __init__(self, raw: Storage, processed: Storage, target_file_bytes: int = TARGET_FILE_BYTES):
+        self.raw = raw
+        self.processed = processed
+        self.target_file_bytes = target_file_bytes
+
+    def manifest_key(self, hour: datetime) -> str:
+        return f"{MANIFEST_PREFIX}{partition_path(hour)}manifest.json"
+
+    def load_manifest(self, hour: datetime) -> Optional[Dict[str, Any]]:
+        key = self.manifest_key(hour)
+        if not self.processed.exists(key):
+            return None
+        return json.loads(self.processed.read(key))
+
+    def _up_to_date(self, manifest: Optional[Dict[str, Any]], sources: List[Dict]) -> bool:
+        return (
+            manifest is not None
+            and manifest.get("manifest_version") == MANIFEST_VERSION
+            and manifest["sources"] == sources
+            and all(self.processed.exists(output["key"]) for output in manifest["outputs"])
+        )
+
+    def read_events(self, sources: List[Dict]) -> Tuple[Dict[str, List[Dict[str, Any]]], int]:
+        """Validated rows per event type, and the number of rejected records."""
+        rows: Dict[str, List[Dict[str, Any]]] = {event_type: [] for event_type in EVENT_MODELS}
+        rejected = 0
+        for source in sources:
+            records = iter_json_records(self.raw.read(source["key"]))
+            while True:
+                try:
+                    record = next(records)
+                except StopIteration:
+                    break
+                except (ValueError, UnicodeDecodeError):
+                    # The rest of a corrupt object cannot be re-synchronised
+                    rejected += 1
+                    break
+                try:
+                    event = game_event_adapter.validate_python(record)
+                except ValidationError:
+                    rejected += 1
+                    continue
+                rows[event.event_type].append(to_row(event, SCHEMAS[event.event_type]))
+        return rows, rejected
+
+    def compact_hour(self, hour: datetime, force: bool = False) -> Dict[str, Any]:
+        """Compact one hour partition; returns its manifest."""
+        partition = partition_path(hour)
+        sources = list(self.raw.list(f"{RAW_PREFIX}{partition}"))
+        previous = self.load_manifest(hour)
+        if not force and self._up_to_date(previous, sources):
+            return dict(previous, skipped=True)
+
+        rows, rejected = self.read_events(sources)
+        outputs = []
+        for event_type, event_rows in rows.items():
+            if not event_rows:
+                continue
+            table = pa.Table.from_pylist(event_rows, schema=SCHEMAS[event_type]).sort_by(SORT_KEYS)
+            for part, (data, row_count) in enumerate(parquet_files(table, self.target_file_bytes)):
+                key = f"{OUTPUT_PREFIX}event_type={event_type}/{partition}part-{part:05d}.parquet"
+                self.processed.write(key, data)
+                outputs.append({"key": key, "event_type": event_type, "rows": row_count, "bytes": len(data)})
+
+        # Files of an earlier run that this run did not rewrite
+        written = {output["key"] for output in outputs}
+        for output in (previous or {}).get("outputs", []):
+            if output["key"] not in written:
+                self.processed.delete(output["key"])
+
+        manifest = {
+            "manifest_version": MANIFEST_VERSION,
+            "partition": partition,
+            "compacted_at": datetime.utcnow().isoformat(),
+            "sources": sources,
+            "source_bytes": sum(source["size"] for source in sources),
+            "records": sum(output["rows"] for output in outputs),
+            "rejected": rejected,
+            "outputs": outputs,
+            "output_bytes": sum(output["bytes"] for output in outputs),
+        }
+        # Written last: a manifest only ever describes complete output
+        self.processed.write(self.manifest_key(hour), json.dumps(manifest, indent=2).encode())
+        return dict(manifest, skipped=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hour", required=True, type=lambda v: datetime.strptime(v, "%Y-%m-%dT%H"),
+                        help="Hour partition to compact, e.g. 2024-01-15T13")
+    parser.add_argument("--raw", default=f"s3://{os.getenv('RAW_BUCKET', 'game-analytics-raw-data-dev')}",
+                        help="Raw store: s3://bucket or a local directory")
+    parser.add_argument("--processed",
+                        default=f"s3://{os.getenv('PROCESSED_BUCKET', 'game-analytics-processed-data-dev')}",
+                        help="Processed store: s3://bucket or a local directory")
+    parser.add_argument("--target-mb", type=int, default=TARGET_FILE_BYTES // (1024 * 1024))
+    parser.add_argument("--force", action="store_true", help="Recompact even if the manifest is current")
+    args = parser.parse_args()
+
+    job = CompactionJob(open_storage(args.raw), open_storage(args.processed), args.target_mb * 1024 * 1024)
+    manifest = job.compact_hour(args.hour, force=args.force)
+    if manifest["skipped"]:
+        print(f"{manifest['partition']} is up to date ({len(manifest['outputs'])} files)")
+        return
+    ratio = manifest["source_bytes"] / max(manifest["output_bytes"], 1)
+    print(f"{manifest['partition']}: {len(manifest['sources'])} objects, {manifest['records']} events "
+          f"({manifest['rejected']} rejected) -> {len(manifest['outputs'])} files, "
+          f"{manifest['source_bytes']} -> {manifest['output_bytes']} bytes ({ratio:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Keeps the player-metrics table up to date from game-events-stream.
+
+Deployed as a Lambda on the stream, `handler` receives batches of Kinesis
+records; locally, `main` reads every shard from LATEST with StreamConsumer
+(src/utils/stream_consumer.py), following the children of shards closed by
+a reshard. Either way, game_end and purchase events are folded into one
+DynamoDB update per player per batch (see src/utils/player_metrics.py).
+"""
+import base64
+import logging
+from typing import Any, Dict, Iterable, List, Tuple
+
+from src.models.codec import decode_record
+from src.utils.kpl import deaggregate
+from src.utils.player_metrics import PlayerMetricsStore
+from src.utils.stream_consumer import RecordBatch, StreamConsumer
+
+STREAM_NAME = "game-events-stream"
+
+logger = logging.getLogger(__name__)
+
+_store = None
+
+
+def get_store() -> PlayerMetricsStore:
+    global _store
+    if _store is None:
+        _store = PlayerMetricsStore()
+    return _store
+
+
+def decode_records(records: Iterable[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Decode Kinesis records (possibly KPL-aggregated) into event dicts;
+    returns the events and the number of undecodable records skipped.
+    """
+    events, skipped = [], 0
+    for record in records:
+        for _, payload in deaggregate(record["Data"], record.get("PartitionKey", "")):
+            try:
+                event = decode_record(payload)
+            except Exception:
+                event = None
+            if not isinstance(event, dict):
+                skipped += 1
+                continue
+            events.append(event)
+    if skipped:
+        logger.warning("Skipping %d undecodable records", skipped)
+    return events, skipped
+
+
+def handler(event: Dict[str, Any], context: Any = None) -> Dict[str, int]:
+    """Lambda entry point for a Kinesis event source mapping."""
+    records = [
+        {"Data": base64.b64decode(r["kinesis"]["data"]), "PartitionKey": r["kinesis"]["partitionKey"]}
+        for r in event["Records"]
+    ]
+    events, skipped = decode_records(records)
+    players = get_store().apply(events)
+    return {"events": len(events), "skipped": skipped, "players": players}
+
+
+def main():
+    """Read every shard of the stream and apply new events."""
+    store = get_store()
+
+    def apply_batch(batch: RecordBatch):
+        events, skipped = decode_records(batch.records)
+        players = store.apply(events)
+        print(f"{batch.shard_id}: applied {len(events)} events to {players} players ({skipped} skipped)")
+
+    # Deltas are added, not replaced, so a restart starts at LATEST rather
+    # than redelivering what was applied
+    consumer = StreamConsumer(STREAM_NAME, apply_batch, name="player-metrics", mode="poll")
+    print(f"Updating player metrics from {STREAM_NAME}")
+    consumer.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Bounded, time-ordered event source for backfilling the stream metrics.
+
+Reads the archived events of [start, end) and writes them as
+newline-delimited JSON in the game_events layout, one file per chunk of
+hours in event time order, for the filesystem source of
+`stream_processor.py --replay`. Events come from:
+
+- "processed": the Parquet lake written by src/processors/compaction.py
+- "raw": the Firehose archive under raw/ (what compaction reads)
+- "file": one local file of JSON events, e.g. tests/load_generator.py
+  --output
+
+The archives are partitioned by arrival time, so the events of an hour are
+read from its partition and the LATE_HOURS after it. Chunks are written as
+soon as no later partition can add to them, so memory holds a few chunks
+at a time however long the range is.
+
+    python -m src.processors.replay --source processed --location ./lake/processed \\
+        --start 2024-01-01T00 --end 2024-02-01T00 --output ./replay
+"""
+import argparse
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pyarrow.dataset as ds
+from pydantic import ValidationError
+
+from src.models.base import game_event_adapter
+from src.processors.batch.lake import EVENT_TYPES, read_day
+from src.processors.compaction import (
+    RAW_PREFIX,
+    SCHEMAS,
+    CompactionJob,
+    iter_json_records,
+    partition_path,
+    to_row
+)
+from src.utils.storage import open_storage
+
+SOURCES = ("processed", "raw", "file")
+LATE_HOURS = int(os.getenv("REPLAY_LATE_HOURS", "24"))
+CHUNK_HOURS = 24
+
+MAP_COLUMNS = {field.name for schema in SCHEMAS.values() for field in schema if str(field.type).startswith("map")}
+
+
+def _hours(start: datetime, end: datetime) -> Iterator[datetime]:
+    hour = start
+    while hour < end:
+        yield hour
+        hour += timedelta(hours=1)
+
+
+def _days(start: datetime, end: datetime) -> List[date]:
+    days, day = [], start.date()
+    while datetime.combine(day, datetime.min.time()) < end:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def processed_rows(location: str, start: datetime, end: datetime,
+                   late_hours: int = LATE_HOURS) -> Iterator[Tuple[datetime, List[Dict[str, Any]]]]:
+    """(end of the arrival span read, rows) per arrival day of the lake, in order."""
+    predicate = (ds.field("timestamp") >= start) & (ds.field("timestamp") < end)
+    for day in _days(start - timedelta(hours=1), end + timedelta(hours=late_hours)):
+        rows = []
+        for event_type in EVENT_TYPES:
+            rows += read_day(location, event_type, day, SCHEMAS[event_type].names, predicate).to_pylist()
+        yield datetime.combine(day, datetime.min.time()) + timedelta(days=1), rows
+
+
+def raw_rows(location: str, start: datetime, end: datetime,
+             late_hours: int = LATE_HOURS) -> Iterator[Tuple[datetime, List[Dict[str, Any]]]]:
+    """(end of the arrival span read, rows) per arrival hour of the raw archive, in order."""
+    job = CompactionJob(open_storage(location), None)
+    for hour in _hours(start - timedelta(hours=1), end + timedelta(hours=late_hours)):
+        sources = list(job.raw.list(f"{RAW_PREFIX}{partition_path(hour)}"))
+        by_type, _ = job.read_events(sources)
+        rows = [row for type_rows in by_type.values() for row in type_rows if start <= row["timestamp"] < end]
+        yield hour + timedelta(hours=1), rows
+
+
+def file_rows(path: str, start: datetime, end: datetime) -> Iterator[Tuple[datetime, List[Dict[str, Any]]]]:
+    """All the events of a JSON file, as one span."""
+    with open(path, "rb") as f:
+        data = f.read()
+    rows = []
+    for record in iter_json_records(data):
+        try:
+            event = game_event_adapter.validate_python(record)
+        except ValidationError:
+            continue
+        row = to_row(event, SCHEMAS[event.event_type])
+        if start <= row["timestamp"] < end:
+            rows.append(row)
+    yield datetime.max, rows
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def to_json_line(row: Dict[str, Any]) -> str:
+    for name in MAP_COLUMNS:
+        # Arrow reads maps back as lists of pairs
+        if isinstance(row.get(name), list):
+            row[name] = dict(row[name])
+    return json.dumps(row, default=_json_default, separators=(",", ":"))
+
+
+def write_replay(location: str, source: str, start: datetime, end: datetime, output: str,
+                 chunk_hours: int = CHUNK_HOURS, late_hours: int = LATE_HOURS) -> Dict[str, Any]:
+    """
+    Write the events of [start, end) from `location` to `output` as time
+    ordered JSON lines files, one per chunk; returns the files and counts.
+    """
+    if source == "processed":
+        spans = processed_rows(location, start, end, late_hours)
+    elif source == "raw":
+        spans = raw_rows(location, start, end, late_hours)
+    elif source == "file":
+        spans = file_rows(location, start, end)
+    else:
+        raise ValueError(f"Unknown replay source {source!r}")
+
+    os.makedirs(output, exist_ok=True)
+    chunk = timedelta(hours=chunk_hours)
+    chunks: Dict[datetime, List[Dict[str, Any]]] = {}
+    files, events = [], 0
+
+    def flush(chunk_start: datetime):
+        nonlocal events
+        rows = sorted(chunks.pop(chunk_start), key=lambda row: row["timestamp"])
+        path = os.path.join(output, f"events-{chunk_start:%Y%m%dT%H}.json")
+        with open(path, "w") as f:
+            for row in rows:
+                f.write(to_json_line(row))
+                f.write("\n")
+        files.append(path)
+        events += len(rows)
+
+    for read_until, rows in spans:
+        for row in rows:
+            chunk_start = start + (row["timestamp"] - start) // chunk * chunk
+            chunks.setdefault(chunk_start, []).append(row)
+        # Chunks no later arrival partition can add to
+        for chunk_start in sorted(chunks):
+            if chunk_start + chunk + timedelta(hours=late_hours) <= read_until:
+                flush(chunk_start)
+    for chunk_start in sorted(chunks):
+        flush(chunk_start)
+    return {"files": sorted(files), "events": events}
+
+
+def _hour(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%dT%H")
+
+
+def replay_arguments(parser: argparse.ArgumentParser, required: bool = True):
+    """Arguments shared with stream_processor.py --replay."""
+    parser.add_argument("--source", choices=SOURCES, default="processed")
+    parser.add_argument("--location", help="s3://bucket or a local directory (a file for --source file); "
+                                           "defaults to the processed or raw bucket")
+    parser.add_argument("--start", type=_hour, required=required, help="First event hour, e.g. 2024-01-01T00")
+    parser.add_argument("--end", type=_hour, required=required, help="Event hour to stop before")
+    parser.add_argument("--chunk-hours", type=int, default=CHUNK_HOURS)
+    parser.add_argument("--late-hours", type=int, default=LATE_HOURS,
+                        help="Arrival partitions read after each event hour")
+
+
+def default_location(source: str) -> str:
+    if source == "raw":
+        return f"s3://{os.getenv('RAW_BUCKET', 'game-analytics-raw-data-dev')}"
+    return f"s3://{os.getenv('PROCESSED_BUCKET', 'game-analytics-processed-data-dev')}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    replay_arguments(parser)
+    parser.add_argument("--output", required=True, help="Directory for the JSON lines files")
+    args = parser.parse_args()
+    result = write_replay(args.location or default_location(args.source), args.source, args.start, args.end,
+                          args.output, args.chunk_hours, args.late_hours)
+    print(f"Wrote {result['events']} events of {args.start} to {args.end} in {len(result['files'])} files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Keeps the game-rollups table current (see src/utils/game_rollups.py).
+
+Two inputs feed the rollups:
+
+- The session-metrics, revenue-metrics and player-activity streams, whose
+  5-minute window records are applied as they arrive. Records are upserts
+  of whole windows, so replaying them is harmless and every shard is read
+  from TRIM_HORIZON (src/utils/stream_consumer.py, which follows reshards).
+- The Parquet lake, for events that arrived after Flink closed their
+  window. Firehose partitions by arrival time, so a recompacted hour can
+  hold events of earlier hours; every event hour it touches is recomputed
+  from the partitions that can contain its events (one hour early to
+  ROLLUP_LATE_HOURS late) and its windows replace the streamed ones. A
+  marker per hour records which compaction was synced, so only new or
+  recompacted hours are read.
+- The late-events output of the stream processor: events that arrived
+  more than ALLOWED_LATENESS_MINUTES behind the watermark, which Flink
+  drops from their windows, written to late-events/ in the processed
+  bucket by event hour. The correction pass recomputes every window they
+  touch from the lake plus those events, once the arrival hours holding
+  the window's other events are compacted, and records the files it has
+  applied. Lake syncs fold them in too, so a recompacted hour never
+  loses a correction.
+
+    python -m src.processors.rollup_updater
+    python -m src.processors.rollup_updater --sync-lake --lake ./lake/processed --since 2024-01-15T00
+    python -m src.processors.rollup_updater --correct-late --lake ./lake/processed
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import pyarrow.dataset as ds
+
+from src.processors.batch.lake import EVENT_TYPES, read_hour
+from src.processors.compaction import MANIFEST_PREFIX, iter_json_records, partition_path
+from src.processors.sketches import DDSketch, HyperLogLog
+from src.utils.game_rollups import WINDOW, GameRollups, bucket_start
+from src.utils.storage import Storage, open_storage
+from src.utils.stream_consumer import RecordBatch, StreamConsumer
+
+# Metric stream -> the sink table its records come from
+METRIC_STREAMS = {
+    "session-metrics": "session_metrics",
+    "revenue-metrics": "revenue_metrics",
+    "player-activity": "player_activity",
+}
+
+LATE_HOURS = int(os.getenv("ROLLUP_LATE_HOURS", "24"))
+SYNC_PREFIX = "manifests/rollups/"
+
+# Written by the stream processor's late_events sink, partitioned by event hour
+LATE_EVENTS_PREFIX = "late-events/"
+LATE_PARTITION = re.compile(r"event_date=(\d{4}-\d{2}-\d{2})/event_hour=(\d{2})/")
+CORRECTIONS_PREFIX = "manifests/late-corrections/"
+
+
+def touched_hours(location: str, arrival_hour: datetime, late_hours: int = LATE_HOURS) -> Set[datetime]:
+    """Event hours with events in an arrival-hour partition, within the lateness bound."""
+    hours = set()
+    for event_type in EVENT_TYPES:
+        for value in read_hour(location, event_type, arrival_hour, ["timestamp"]).column("timestamp").unique():
+            hour = bucket_start(value.as_py(), "hour")
+            if arrival_hour - timedelta(hours=late_hours) <= hour <= arrival_hour + timedelta(hours=1):
+                hours.add(hour)
+    return hours
+
+
+def lake_windows(location: str, hours: Iterable[datetime], late_hours: int = LATE_HOURS,
+                 extra_events: Optional[Iterable[Dict[str, Any]]] = None) -> Dict[Tuple[str, datetime], Dict[str, Any]]:
+    """
+    The windows of some event hours recomputed from the lake, with the same
+    fields and sketches the Flink metrics emit. Each arrival partition that
+    can hold their events is read once. `extra_events` (rows with the lake's
+    columns, e.g. from the late-events output) are added to them; resent
+    copies of an event_id are counted once, as the stream processor does.
+    """
+    hours = set(hours)
+    if not hours:
+        return {}
+    first, last = min(hours), max(hours)
+    predicate = (ds.field("timestamp") >= first) & (ds.field("timestamp") < last + timedelta(hours=1))
+    arrivals = int((last - first).total_seconds() // 3600) + late_hours + 2
+    windows: Dict[Tuple[str, datetime], Dict[str, Any]] = defaultdict(dict)
+    seen = set()
+
+    def sketch(fields, name, sketch_type):
+        if name not in fields:
+            fields[name] = sketch_type()
+        return fields[name]
+
+    def add(event_type, row):
+        fields = windows[(row["game_id"], bucket_start(row["timestamp"], WINDOW))]
+        fields["event_count"] = fields.get("event_count", 0) + 1
+        sketch(fields, "player_sketch", HyperLogLog).add(row["player_id"])
+        if event_type == "game_end":
+            sketch(fields, "session_sketch", HyperLogLog).add(row["session_id"])
+            sketch(fields, "duration_sketch", DDSketch).add(float(row["duration"]))
+            sketch(fields, "score_sketch", DDSketch).add(float(row["score"]))
+        elif event_type == "purchase":
+            fields["total_revenue"] = fields.get("total_revenue", 0.0) + row["amount"]
+            fields["transaction_count"] = fields.get("transaction_count", 0) + 1
+            sketch(fields, "amount_sketch", DDSketch).add(float(row["amount"]))
+
+    for offset in range(arrivals):
+        arrival = first + timedelta(hours=offset - 1)
+        for event_type in EVENT_TYPES:
+            columns = ["event_id", "game_id", "player_id", "timestamp"]
+            if event_type == "game_end":
+                columns += ["session_id", "duration", "score"]
+            elif event_type == "purchase":
+                columns += ["amount"]
+            for row in read_hour(location, event_type, arrival, columns, predicate).to_pylist():
+                if bucket_start(row["timestamp"], "hour") not in hours or row["event_id"] in seen:
+                    continue
+                seen.add(row["event_id"])
+                add(event_type, row)
+
+    for row in extra_events or ():
+        if row["event_id"] not in seen and bucket_start(row["timestamp"], "hour") in hours:
+            seen.add(row["event_id"])
+            add(row["event_type"], row)
+
+    return {
+        key: {name: value.to_bytes() if isinstance(value, (HyperLogLog, DDSketch)) else value
+              for name, value in fields.items()}
+        for key, fields in windows.items()
+    }
+
+
+def late_events_path(hour: datetime) -> str:
+    return f"{LATE_EVENTS_PREFIX}event_date={hour:%Y-%m-%d}/event_hour={hour:%H}/"
+
+
+def late_event_files(storage: Storage, hour: Optional[datetime] = None) -> List[str]:
+    """Keys of the finished late-events files, of one event hour or all of them."""
+    prefix = late_events_path(hour) if hour else LATE_EVENTS_PREFIX
+    # Flink keeps files it is still writing hidden until a checkpoint commits them
+    return [obj["key"] for obj in storage.list(prefix)
+            if not obj["key"].rsplit("/", 1)[-1].startswith((".", "_"))]
+
+
+def parse_timestamp(value: str) -> datetime:
+    """A TIMESTAMP(3) as the Flink JSON format writes it."""
+    value = value.rstrip("Z").replace("T", " ")
+    if "." in value:
+        # fromisoformat before Python 3.11 takes only 3 or 6 fraction digits
+        value, fraction = value.split(".")
+        value = f"{value}.{fraction[:6]:0<6}"
+    return datetime.fromisoformat(value)
+
+
+def read_late_events(storage: Storage, hours: Iterable[datetime]) -> List[Dict[str, Any]]:
+    """The late-events rows of some event hours, with the columns lake_windows reads."""
+    rows = []
+    for hour in sorted(set(hours)):
+        for key in late_event_files(storage, hour):
+            for record in iter_json_records(storage.read(key)):
+                rows.append(dict(record, timestamp=parse_timestamp(record["timestamp"])))
+    return rows
+
+
+def sync_lake(location: str, rollups: GameRollups, hours: Iterable[datetime],
+              late_hours: int = LATE_HOURS, storage: Optional[Storage] = None) -> int:
+    """
+    Apply compacted hours among `hours` that are new or recompacted since
+    their last sync; returns the number of event hours recomputed.
+    """
+    storage = storage or open_storage(location)
+    pending = {}
+    for arrival in sorted(hours):
+        manifest_key = f"{MANIFEST_PREFIX}{partition_path(arrival)}manifest.json"
+        marker_key = f"{SYNC_PREFIX}{partition_path(arrival)}synced.json"
+        if not storage.exists(manifest_key):
+            continue
+        compacted_at = json.loads(storage.read(manifest_key))["compacted_at"]
+        if storage.exists(marker_key) and json.loads(storage.read(marker_key))["compacted_at"] == compacted_at:
+            continue
+        pending[marker_key] = (arrival, compacted_at)
+
+    event_hours = set()
+    for arrival, _ in pending.values():
+        event_hours |= touched_hours(location, arrival, late_hours)
+    late_events = read_late_events(storage, event_hours)
+    for (game_id, window_start), fields in lake_windows(location, event_hours, late_hours, late_events).items():
+        rollups.apply_window(game_id, window_start, fields, replace=True)
+    rollups.flush()
+    # Markers last: a failed sync is retried in full
+    for marker_key, (_, compacted_at) in pending.items():
+        storage.write(marker_key, json.dumps({"compacted_at": compacted_at}).encode())
+    return len(event_hours)
+
+
+def correct_late_events(location: str, rollups: GameRollups, late_hours: int = LATE_HOURS,
+                        storage: Optional[Storage] = None, now: Optional[datetime] = None) -> Tuple[int, int]:
+    """
+    Fold late-events files not yet applied into their windows; returns the
+    event hours recomputed and the late events among them. An hour waits
+    until every past arrival hour lake_windows reads for it is compacted,
+    so a correction never replaces a window with part of its events.
+    """
+    storage = storage or open_storage(location)
+    current = bucket_start(now or datetime.utcnow(), "hour")
+    pending: Dict[datetime, List[str]] = defaultdict(list)
+    for key in late_event_files(storage):
+        match = LATE_PARTITION.search(key)
+        if match:
+            pending[datetime.strptime(" ".join(match.groups()), "%Y-%m-%d %H")].append(key)
+
+    applied = {}
+    for hour, keys in pending.items():
+        marker_key = f"{CORRECTIONS_PREFIX}{partition_path(hour)}applied.json"
+        done = set(json.loads(storage.read(marker_key))["files"]) if storage.exists(marker_key) else set()
+        if set(keys) <= done:
+            continue
+        arrivals = [hour + timedelta(hours=offset) for offset in range(-1, late_hours + 1)]
+        if all(storage.exists(f"{MANIFEST_PREFIX}{partition_path(arrival)}manifest.json")
+               for arrival in arrivals if arrival < current):
+            applied[marker_key] = (hour, sorted(done | set(keys)))
+
+    hours = [hour for hour, _ in applied.values()]
+    late_events = read_late_events(storage, hours)
+    for (game_id, window_start), fields in lake_windows(location, hours, late_hours, late_events).items():
+        rollups.apply_window(game_id, window_start, fields, replace=True)
+    rollups.flush()
+    # Markers last: a failed correction is retried in full
+    for marker_key, (_, keys) in applied.items():
+        storage.write(marker_key, json.dumps({"files": keys}).encode())
+    return len(hours), len(late_events)
+
+
+def _hour(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%dT%H")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lake", default=f"s3://{os.getenv('PROCESSED_BUCKET', 'game-analytics-processed-data-dev')}",
+                        help="Processed store: s3://bucket or a local directory")
+    parser.add_argument("--sync-lake", action="store_true", help="Sync late data from the lake once and exit")
+    parser.add_argument("--correct-late", action="store_true",
+                        help="Fold in new late-events files once and exit")
+    parser.add_argument("--since", type=_hour, help="First arrival hour to sync (default: --lookback hours ago)")
+    parser.add_argument("--lookback", type=int, default=48, help="Arrival hours checked on each lake sync")
+    parser.add_argument("--lake-interval", type=int, default=600,
+                        help="Seconds between lake syncs and late event corrections")
+    args = parser.parse_args()
+
+    rollups = GameRollups()
+
+    def recent_hours():
+        now = bucket_start(datetime.utcnow(), "hour")
+        since = args.since or now - timedelta(hours=args.lookback)
+        return [since + timedelta(hours=i) for i in range(int((now - since).total_seconds() // 3600) + 1)]
+
+    if args.sync_lake:
+        print(f"Recomputed {sync_lake(args.lake, rollups, recent_hours())} event hours from {args.lake}")
+        return
+    if args.correct_late:
+        hours, late_events = correct_late_events(args.lake, rollups)
+        print(f"Corrected {hours} event hours with {late_events} late events from {args.lake}")
+        return
+
+    # Readers apply windows from their own threads; the lock also keeps
+    # them out while the rollups are flushed or recomputed from the lake
+    lock = threading.Lock()
+    applied = 0
+
+    def apply_batch(batch: RecordBatch):
+        nonlocal applied
+        with lock:
+            for _, payload in batch.payloads():
+                rollups.apply_record(METRIC_STREAMS[batch.stream_name], json.loads(payload))
+                applied += 1
+
+    consumers = [
+        StreamConsumer(stream_name, apply_batch, name="rollups", initial_position="TRIM_HORIZON", mode="poll")
+        for stream_name in METRIC_STREAMS
+    ]
+    for consumer in consumers:
+        consumer.start()
+    print(f"Rolling up {', '.join(METRIC_STREAMS)}")
+
+    last_sync = 0.0
+    try:
+        while True:
+            time.sleep(1)
+            with lock:
+                if applied:
+                    print(f"Applied {applied} windows, rewrote {rollups.flush()} rollup rows")
+                    applied = 0
+                if time.monotonic() - last_sync >= args.lake_interval:
+                    sync_lake(args.lake, rollups, recent_hours())
+                    correct_late_events(args.lake, rollups)
+                    last_sync = time.monotonic()
+    finally:
+        for consumer in consumers:
+            consumer.stop(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,99 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+import argparse
 import json
 import datetime
+import os
+import re
+import tempfile
 
+import pandas as pd
+from pyflink.common import Row
 from pyflink.table import (
     StreamTableEnvironment,
+    TableEnvironment,
     EnvironmentSettings,
     DataTypes
 )
-from pyflink.table.udf import udf
-from pyflink.common import Row
+from pyflink.table.udf import AggregateFunction, FunctionContext, ScalarFunction, TableFunction, udaf, udf, udtf
+
+from src.models import codec
+from src.processors.replay import default_location, replay_arguments, write_replay
+from src.processors.rollup_updater import LATE_EVENTS_PREFIX
+from src.processors.sketches import DDSketch, HyperLogLog
+
+# Encoding of game-events-stream: "json" or "compact" (src/models/codec.py)
+EVENT_STREAM_FORMAT = os.getenv("EVENT_STREAM_FORMAT", "json")
+
+# Bounded out-of-orderness of the event-time watermark, and the size of the
+# tumbling windows of the metric queries
+WATERMARK_DELAY_SECONDS = 5
+METRIC_WINDOW = datetime.timedelta(minutes=5)
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# How long an event_id is remembered to drop resent copies of it; the API
+# deduplicates over the same horizon (src/api/dedup.py)
+DEDUP_HORIZON_SECONDS = int(os.getenv("DEDUP_HORIZON_SECONDS", "3600"))
+
+# Inactivity after which a session's window closes and its record is
+# emitted, and how long a shard without records may hold the watermark back
+SESSION_GAP_MINUTES = int(os.getenv("SESSION_GAP_MINUTES", "30"))
+SOURCE_IDLE_TIMEOUT_SECONDS = int(os.getenv("SOURCE_IDLE_TIMEOUT_SECONDS", "60"))
+
+# How far behind the watermark an event may be and still update its metric
+# window. The windows are regular aggregations keyed on the window start
+# (see create_metric_events_view), so the upsert sinks get each window's
+# record again as late events change it. Events later than that go to
+# LATE_EVENTS_PATH, by event hour, for the corrections of
+# src/processors/rollup_updater.py.
+ALLOWED_LATENESS_MINUTES = int(os.getenv("ALLOWED_LATENESS_MINUTES", "60"))
+LATE_EVENTS_PATH = os.getenv(
+    "LATE_EVENTS_PATH",
+    f"s3://{os.getenv('PROCESSED_BUCKET', 'game-analytics-processed-data-dev')}/{LATE_EVENTS_PREFIX.rstrip('/')}"
+)
+# How often at most a metric window's record is emitted while its events
+# arrive; see create_table_environment
+METRIC_EMIT_INTERVAL_SECONDS = int(os.getenv("METRIC_EMIT_INTERVAL_SECONDS", "10"))
+# The filesystem sink commits its files on checkpoints
+CHECKPOINT_INTERVAL_SECONDS = int(os.getenv("CHECKPOINT_INTERVAL_SECONDS", "60"))
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Columns of game_events besides the event timestamp. The API writes events
+# flat, so the JSON format maps every typed field straight to a column and
+# the payload is parsed once, in the JVM.
+EVENT_COLUMNS = [
+    ("event_id", "STRING", DataTypes.STRING()),
+    ("game_id", "STRING", DataTypes.STRING()),
+    ("player_id", "STRING", DataTypes.STRING()),
+    ("session_id", "STRING", DataTypes.STRING()),
+    ("event_type", "STRING", DataTypes.STRING()),
+    ("version", "STRING", DataTypes.STRING()),
+    ("server_timestamp", "TIMESTAMP(3)", DataTypes.TIMESTAMP(3)),
+    # game_start
+    ("device_info", "MAP<STRING, STRING>", DataTypes.MAP(DataTypes.STRING(), DataTypes.STRING())),
+    ("client_version", "STRING", DataTypes.STRING()),
+    # game_end
+    ("duration", "INT", DataTypes.INT()),
+    ("score", "INT", DataTypes.INT()),
+    ("level_reached", "INT", DataTypes.INT()),
+    ("coins_earned", "INT", DataTypes.INT()),
+    # purchase
+    ("item_id", "STRING", DataTypes.STRING()),
+    ("item_name", "STRING", DataTypes.STRING()),
+    ("currency_type", "STRING", DataTypes.STRING()),
+    ("amount", "DOUBLE", DataTypes.DOUBLE()),
+    ("currency_code", "STRING", DataTypes.STRING()),
+    # progress
+    ("level", "INT", DataTypes.INT()),
+    ("xp_earned", "INT", DataTypes.INT()),
+    ("achievements", "ARRAY<STRING>", DataTypes.ARRAY(DataTypes.STRING())),
+    ("current_state", "STRING", DataTypes.STRING()),
+]
+
+
+def event_columns_ddl() -> str:
+    """Column definitions for EVENT_COLUMNS."""
+    return ",\n".join(f"`{name}` {sql_type}" for name, sql_type, _ in EVENT_COLUMNS)
 
 
 def create_table_environment():
@@ -17,43 +102,558 @@ def create_table_environment():
         .in_streaming_mode() \
         .build()
     
-    return StreamTableEnvironment.create(environment_settings=settings)
+    t_env = StreamTableEnvironment.create(environment_settings=settings)
+    # Let every metric in the StatementSet share one source scan
+    config = t_env.get_config()
+    config.set("table.optimizer.reuse-source-enabled", "true")
+    config.set("table.optimizer.reuse-sub-plan-enabled", "true")
+    # Expires the per-event_id state of the deduplication in create_dedup_view
+    # and that of the metric windows, which must outlive the allowed lateness.
+    # There is no EMIT strategy (table.exec.emit.*): Flink supports none for
+    # session windows or for Python aggregate functions in group windows.
+    state_ttl = max(DEDUP_HORIZON_SECONDS, ALLOWED_LATENESS_MINUTES * 60 + METRIC_WINDOW.seconds
+                    + WATERMARK_DELAY_SECONDS)
+    config.set("table.exec.state.ttl", f"{state_ttl} s")
+    # The metric aggregations run in Python, which buffers its input for a
+    # bundle and emits each changed window's record once per bundle, not
+    # once per event; the bundle time bounds how often a window's record,
+    # sketches and all, reaches its sink. Mini-batch (table.exec.mini-batch.*)
+    # does not apply to Python aggregations, and its processing-time markers
+    # would replace the event-time watermark the windows are judged against.
+    config.set("python.fn-execution.bundle.time", str(METRIC_EMIT_INTERVAL_SECONDS * 1000))
+    config.set("execution.checkpointing.interval", f"{CHECKPOINT_INTERVAL_SECONDS} s")
+    # Event-time windows close, and free their state, only as the watermark
+    # passes them; idle shards must not stall it
+    config.set("table.exec.source.idle-timeout", f"{SOURCE_IDLE_TIMEOUT_SECONDS} s")
+    return t_env
 
 
 def create_source_table(t_env: StreamTableEnvironment):
-    """Create the source table reading from Kinesis."""
-    source_ddl = """
-        CREATE TABLE game_events (
-            event_id STRING,
-            timestamp TIMESTAMP(3),
-            game_id STRING,
-            player_id STRING,
-            session_id STRING,
-            event_type STRING,
-            version STRING,
-            payload STRING,
-            WATERMARK FOR timestamp AS timestamp - INTERVAL '5' SECOND
+    """
+    Create the game_events_source view over a stream carrying JSON records.
+
+    The JSON format parses the records in the JVM, skipping those that are
+    not JSON and nulling fields of the wrong type rather than failing the
+    job. check_event then counts every record into the EventMetrics and
+    drops those without an event_id or event time; event time is the
+    epoch for those, as for compact records, so they cannot hold the
+    watermark back.
+    """
+    t_env.create_temporary_system_function("check_event", check_event)
+
+    raw_source_ddl = f"""
+        CREATE TABLE game_events_json (
+            `timestamp` TIMESTAMP(3),
+            {event_columns_ddl()},
+            event_time AS COALESCE(`timestamp`, TIMESTAMP '1970-01-01 00:00:00'),
+            proc_time AS PROCTIME(),
+            WATERMARK FOR event_time AS event_time - INTERVAL '{WATERMARK_DELAY_SECONDS}' SECOND
         ) WITH (
             'connector' = 'kinesis',
             'stream' = 'game-events-stream',
             'aws.region' = 'us-east-1',
             'scan.stream.initpos' = 'LATEST',
-            'format' = 'json'
+            'format' = 'json',
+            'json.timestamp-format.standard' = 'ISO-8601',
+            'json.ignore-parse-errors' = 'true'
+        )
+    """
+    t_env.execute_sql(raw_source_ddl)
+
+    names = ", ".join(f"`{name}`" for name, _, _ in EVENT_COLUMNS)
+    view_ddl = f"""
+        CREATE TEMPORARY VIEW game_events_source AS
+        SELECT event_time AS `timestamp`, {names}, proc_time
+        FROM game_events_json
+        WHERE check_event(event_id, `timestamp`)
+    """
+    t_env.execute_sql(view_ddl)
+
+
+def create_batch_table_environment():
+    """Create a batch Table Environment for replaying archived events."""
+    settings = EnvironmentSettings.new_instance() \
+        .in_batch_mode() \
+        .build()
+    t_env = TableEnvironment.create(settings)
+    config = t_env.get_config()
+    config.set("table.optimizer.reuse-source-enabled", "true")
+    config.set("table.optimizer.reuse-sub-plan-enabled", "true")
+    return t_env
+
+
+def create_replay_source_table(t_env: TableEnvironment, path: str):
+    """
+    Create game_events_source over the JSON lines files written by
+    src/processors/replay.py. The source is bounded, so it has no watermark;
+    batch window aggregations close every window at the end of the input.
+    """
+    source_ddl = f"""
+        CREATE TABLE game_events_source (
+            `timestamp` TIMESTAMP(3),
+            {event_columns_ddl()}
+        ) WITH (
+            'connector' = 'filesystem',
+            'path' = '{path}',
+            'format' = 'json',
+            'json.timestamp-format.standard' = 'ISO-8601'
         )
     """
     t_env.execute_sql(source_ddl)
 
 
-def create_sink_tables(t_env: StreamTableEnvironment):
-    """Create sink tables for different analytics."""
-    # Session metrics sink
-    session_metrics_ddl = """
+@udf(result_type=DataTypes.TIMESTAMP(3))
+def compact_event_time(data: bytes) -> datetime.datetime:
+    """
+    Read event time from a raw record, without a full decode for compact ones.
+
+    Unreadable records get the epoch, so they cannot hold the watermark
+    back; decode_event counts and drops them.
+    """
+    try:
+        return codec.record_timestamp(data)
+    except ValueError:
+        return EPOCH
+
+
+class EventMetrics:
+    """
+    Custom metrics in the job's game_events group, reported by the function
+    every record of the source passes through: records_parsed,
+    parse_failures (records that cannot be decoded, which are dropped),
+    late_events, events whose window the watermark has already passed, so
+    its record is emitted again, and late_events_dropped, those more than
+    ALLOWED_LATENESS_MINUTES behind the watermark, which the metric windows
+    leave out (the late_events output keeps them). Lateness is
+    judged against this subtask's own watermark, the highest event time
+    seen less the watermark delay, which is at least the job's watermark.
+    """
+
+    def open(self, function_context: FunctionContext):
+        group = function_context.get_metric_group().add_group("game_events")
+        self.records_parsed = group.counter("records_parsed")
+        self.parse_failures = group.counter("parse_failures")
+        self.late_events = group.counter("late_events")
+        self.dropped_events = group.counter("late_events_dropped")
+        self.max_event_time = EPOCH
+        # Events before the start of the watermark's window are late, and
+        # dropped before the watermark less the allowed lateness
+        self.late_before = EPOCH
+        self.dropped_before = EPOCH
+
+    def count_event(self, event_time: datetime.datetime):
+        """Count a decoded record and whether it is late."""
+        self.records_parsed.inc()
+        if event_time > self.max_event_time:
+            self.max_event_time = event_time
+            watermark = event_time - datetime.timedelta(seconds=WATERMARK_DELAY_SECONDS)
+            self.late_before = watermark - (watermark - EPOCH) % METRIC_WINDOW
+            self.dropped_before = watermark - datetime.timedelta(minutes=ALLOWED_LATENESS_MINUTES)
+        elif event_time < self.late_before:
+            self.late_events.inc()
+            if event_time < self.dropped_before:
+                self.dropped_events.inc()
+
+
+class CheckEvent(EventMetrics, ScalarFunction):
+    """
+    Counts a record of the JSON source into the EventMetrics; false for
+    records without the event_id and event time every query needs. Records
+    that are not JSON at all are skipped by the format before this sees
+    them, so they are not counted.
+    """
+
+    def eval(self, event_id: str, event_time: datetime.datetime) -> bool:
+        if event_id is None or event_time is None:
+            self.parse_failures.inc()
+            return False
+        self.count_event(event_time)
+        return True
+
+
+check_event = udf(CheckEvent(), result_type=DataTypes.BOOLEAN())
+
+
+class DecodeEvent(EventMetrics, TableFunction):
+    """Decodes a raw JSON or compact record into the game_events columns, reporting the EventMetrics."""
+
+    def eval(self, data: bytes, event_time: datetime.datetime):
+        try:
+            if codec.is_compact(data):
+                record = codec.decode_fields(data)
+            else:
+                record = json.loads(data)
+                if record.get("server_timestamp"):
+                    record["server_timestamp"] = datetime.datetime.fromisoformat(record["server_timestamp"])
+            record["event_id"] = str(record["event_id"])
+        except (ValueError, KeyError, TypeError):
+            self.parse_failures.inc()
+            return
+        if record.get("current_state") is not None:
+            record["current_state"] = json.dumps(record["current_state"])
+        self.count_event(event_time)
+        yield tuple(record.get(name) for name, _, _ in EVENT_COLUMNS)
+
+
+decode_event = udtf(DecodeEvent(), result_types=[data_type for _, _, data_type in EVENT_COLUMNS])
+
+
+def create_compact_source_table(t_env: StreamTableEnvironment):
+    """
+    Create the game_events_source view over a stream carrying compact records.
+
+    The raw table reads record bytes; event time comes from the fixed-offset
+    timestamp, and the view decodes the rest into the same columns as the
+    JSON source so the analytics queries are shared. Decoding in Python
+    also reports the EventMetrics.
+    """
+    t_env.create_temporary_system_function("compact_event_time", compact_event_time)
+    t_env.create_temporary_system_function("decode_event", decode_event)
+
+    raw_source_ddl = f"""
+        CREATE TABLE game_events_raw (
+            data BYTES,
+            event_time AS compact_event_time(data),
+            proc_time AS PROCTIME(),
+            WATERMARK FOR event_time AS event_time - INTERVAL '{WATERMARK_DELAY_SECONDS}' SECOND
+        ) WITH (
+            'connector' = 'kinesis',
+            'stream' = 'game-events-stream',
+            'aws.region' = 'us-east-1',
+            'scan.stream.initpos' = 'LATEST',
+            'format' = 'raw'
+        )
+    """
+    t_env.execute_sql(raw_source_ddl)
+
+    names = ", ".join(f"`{name}`" for name, _, _ in EVENT_COLUMNS)
+    view_ddl = f"""
+        CREATE TEMPORARY VIEW game_events_source AS
+        SELECT r.event_time AS `timestamp`, {names}, r.proc_time
+        FROM game_events_raw AS r,
+            LATERAL TABLE(decode_event(r.data, r.event_time)) AS e({names})
+    """
+    t_env.execute_sql(view_ddl)
+
+
+def create_dedup_view(t_env: TableEnvironment, order_by: str = "proc_time"):
+    """
+    Create game_events, the source with resent copies of an event dropped.
+
+    Keeps the first arrival of each event_id: Flink's keyed deduplication,
+    which for the first row by processing time holds one flag per event_id
+    and emits append-only rows that keep the event-time attribute, so the
+    window queries run on it unchanged. The flags expire with the
+    table.exec.state.ttl set in create_table_environment. Replays order by
+    event time instead and deduplicate over the whole range.
+    """
+    names = ", ".join(f"`{name}`" for name, _, _ in EVENT_COLUMNS)
+    view_ddl = f"""
+        CREATE TEMPORARY VIEW game_events AS
+        SELECT `timestamp`, {names}
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY event_id ORDER BY {order_by} ASC) AS row_num
+            FROM game_events_source
+        )
+        WHERE row_num = 1
+    """
+    t_env.execute_sql(view_ddl)
+
+
+def create_metric_events_view(t_env: TableEnvironment, streaming: bool = True):
+    """
+    Create metric_events, the events of game_events the metric windows
+    count, with the start and end of the tumbling window each falls in.
+
+    The metric queries group by window_start rather than by a TUMBLE group
+    window: Flink fires group windows with Python aggregate functions (the
+    sketches) only once, when the watermark passes them. Grouped this way
+    a window's record is emitted again whenever its events change it, at
+    most once per METRIC_EMIT_INTERVAL_SECONDS, and the upsert sinks
+    replace it. Events more than ALLOWED_LATENESS_MINUTES
+    behind the watermark are left out, so a window whose state has expired
+    is not emitted again with only its late events; the late_events output
+    archives exactly those. Replays have no watermark and keep every event.
+    """
+    minutes = METRIC_WINDOW.seconds // 60
+    on_time = f"""
+        WHERE CURRENT_WATERMARK(`timestamp`) IS NULL
+            OR `timestamp` >= CURRENT_WATERMARK(`timestamp`) - INTERVAL '{ALLOWED_LATENESS_MINUTES}' MINUTE
+    """ if streaming else ""
+    view_ddl = f"""
+        CREATE TEMPORARY VIEW metric_events AS
+        SELECT *, window_start + INTERVAL '{minutes}' MINUTE AS window_end
+        FROM (
+            SELECT *,
+                FLOOR(`timestamp` TO MINUTE) - MOD(MINUTE(`timestamp`), {minutes}) * INTERVAL '1' MINUTE
+                    AS window_start
+            FROM game_events
+            {on_time}
+        )
+    """
+    t_env.execute_sql(view_ddl)
+
+
+class HllSketch(AggregateFunction):
+    """
+    Builds a HyperLogLog sketch of a column's distinct values.
+
+    The accumulator is a fixed 4 KiB register array however many values the
+    window sees, unlike COUNT(DISTINCT), which keeps every value in state.
+    The result is the serialized sketch; hll_estimate turns it into a count.
+    """
+
+    def create_accumulator(self):
+        return Row(bytearray(HyperLogLog().m))
+
+    def _registers(self, accumulator) -> bytearray:
+        # Accumulators restored from state come back as bytes
+        registers = accumulator[0]
+        if not isinstance(registers, bytearray):
+            registers = accumulator[0] = bytearray(registers)
+        return registers
+
+    def accumulate(self, accumulator, value):
+        if value is not None:
+            HyperLogLog(registers=self._registers(accumulator)).add(value)
+
+    def merge(self, accumulator, accumulators):
+        sketch = HyperLogLog(registers=self._registers(accumulator))
+        for other in accumulators:
+            sketch.merge(HyperLogLog(registers=bytearray(other[0])))
+        accumulator[0] = sketch.registers
+
+    def get_value(self, accumulator) -> bytes:
+        return HyperLogLog(registers=bytearray(accumulator[0])).to_bytes()
+
+    def get_accumulator_type(self):
+        return DataTypes.ROW([DataTypes.FIELD("registers", DataTypes.BYTES())])
+
+    def get_result_type(self):
+        return DataTypes.BYTES()
+
+
+class HllMerge(HllSketch):
+    """Merges serialized HyperLogLog sketches, e.g. 5-minute windows into hours."""
+
+    def accumulate(self, accumulator, value):
+        if value is not None:
+            sketch = HyperLogLog(registers=self._registers(accumulator))
+            sketch.merge(HyperLogLog.from_bytes(value))
+            accumulator[0] = sketch.registers
+
+
+@udf(result_type=DataTypes.BIGINT())
+def hll_estimate(sketch: bytes) -> int:
+    """Estimated distinct count of a serialized HyperLogLog sketch."""
+    if sketch is None:
+        return None
+    return HyperLogLog.from_bytes(sketch).count()
+
+
+class QuantileSketch(AggregateFunction):
+    """
+    Builds a DDSketch of a numeric column for p50/p95/p99.
+
+    The accumulator holds the sketch's bin maps, bounded to 2048 bins per
+    sign (see DDSketch for the memory bound), plus its count, sum, min and
+    max. The result is the serialized sketch; sketch_quantile reads it.
+    """
+
+    def create_accumulator(self):
+        sketch = DDSketch()
+        return Row(sketch.positive, sketch.negative, 0, 0, 0.0, sketch.min, sketch.max)
+
+    @staticmethod
+    def _sketch(accumulator) -> DDSketch:
+        sketch = DDSketch()
+        sketch.positive, sketch.negative = accumulator[0], accumulator[1]
+        sketch.zero_count, sketch.count = accumulator[2], accumulator[3]
+        sketch.sum, sketch.min, sketch.max = accumulator[4], accumulator[5], accumulator[6]
+        return sketch
+
+    @staticmethod
+    def _store(accumulator, sketch: DDSketch):
+        accumulator[0], accumulator[1] = sketch.positive, sketch.negative
+        accumulator[2], accumulator[3] = sketch.zero_count, sketch.count
+        accumulator[4], accumulator[5], accumulator[6] = sketch.sum, sketch.min, sketch.max
+
+    def accumulate(self, accumulator, value):
+        if value is not None:
+            sketch = self._sketch(accumulator)
+            sketch.add(float(value))
+            self._store(accumulator, sketch)
+
+    def merge(self, accumulator, accumulators):
+        sketch = self._sketch(accumulator)
+        for other in accumulators:
+            sketch.merge(self._sketch(other))
+        self._store(accumulator, sketch)
+
+    def get_value(self, accumulator) -> bytes:
+        return self._sketch(accumulator).to_bytes()
+
+    def get_accumulator_type(self):
+        bins = DataTypes.MAP(DataTypes.INT(), DataTypes.BIGINT())
+        return DataTypes.ROW([
+            DataTypes.FIELD("positive", bins),
+            DataTypes.FIELD("negative", bins),
+            DataTypes.FIELD("zero_count", DataTypes.BIGINT()),
+            DataTypes.FIELD("count", DataTypes.BIGINT()),
+            DataTypes.FIELD("sum", DataTypes.DOUBLE()),
+            DataTypes.FIELD("min", DataTypes.DOUBLE()),
+            DataTypes.FIELD("max", DataTypes.DOUBLE())
+        ])
+
+    def get_result_type(self):
+        return DataTypes.BYTES()
+
+
+class QuantileMerge(QuantileSketch):
+    """Merges serialized DDSketches, e.g. 5-minute windows into hours."""
+
+    def accumulate(self, accumulator, value):
+        if value is not None:
+            sketch = self._sketch(accumulator)
+            sketch.merge(DDSketch.from_bytes(value))
+            self._store(accumulator, sketch)
+
+
+@udf(result_type=DataTypes.DOUBLE())
+def sketch_quantile(sketch: bytes, q: float) -> float:
+    """Value at quantile q of a serialized DDSketch."""
+    if sketch is None:
+        return None
+    return DDSketch.from_bytes(sketch).quantile(q)
+
+
+def register_functions(t_env: StreamTableEnvironment):
+    """Register the sketch functions used by the metric queries."""
+    # The functions import src.models and src.processors on the Python workers
+    t_env.add_python_file(REPO_ROOT)
+    t_env.create_temporary_system_function("hll_sketch", udaf(HllSketch()))
+    t_env.create_temporary_system_function("hll_merge", udaf(HllMerge()))
+    t_env.create_temporary_system_function("hll_estimate", hll_estimate)
+    t_env.create_temporary_system_function("quantile_sketch", udaf(QuantileSketch()))
+    t_env.create_temporary_system_function("quantile_merge", udaf(QuantileMerge()))
+    t_env.create_temporary_system_function("sketch_quantile", sketch_quantile)
+
+
+# Batch mode runs only vectorized Python aggregate functions, so replays
+# register these under the same names as the sketch functions above. Each
+# call gets a window's column as a Series and returns the same bytes.
+@udaf(result_type=DataTypes.BYTES(), func_type="pandas")
+def hll_sketch_batch(values: pd.Series) -> bytes:
+    sketch = HyperLogLog()
+    sketch.update(values.dropna())
+    return sketch.to_bytes()
+
+
+@udaf(result_type=DataTypes.BYTES(), func_type="pandas")
+def hll_merge_batch(sketches: pd.Series) -> bytes:
+    return (HyperLogLog.merge_all(sketches.dropna()) or HyperLogLog()).to_bytes()
+
+
+@udaf(result_type=DataTypes.BYTES(), func_type="pandas")
+def quantile_sketch_batch(values: pd.Series) -> bytes:
+    sketch = DDSketch()
+    sketch.update(values.dropna().astype(float))
+    return sketch.to_bytes()
+
+
+@udaf(result_type=DataTypes.BYTES(), func_type="pandas")
+def quantile_merge_batch(sketches: pd.Series) -> bytes:
+    return (DDSketch.merge_all(sketches.dropna()) or DDSketch()).to_bytes()
+
+
+def register_batch_functions(t_env: TableEnvironment):
+    """Register the sketch functions for batch execution."""
+    t_env.add_python_file(REPO_ROOT)
+    t_env.create_temporary_system_function("hll_sketch", hll_sketch_batch)
+    t_env.create_temporary_system_function("hll_merge", hll_merge_batch)
+    t_env.create_temporary_system_function("hll_estimate", hll_estimate)
+    t_env.create_temporary_system_function("quantile_sketch", quantile_sketch_batch)
+    t_env.create_temporary_system_function("quantile_merge", quantile_merge_batch)
+    t_env.create_temporary_system_function("sketch_quantile", sketch_quantile)
+
+
+# Metric registry: sink table -> (sink DDL, INSERT INTO query). All registered
+# metrics run as one StatementSet, so game_events is consumed once and fanned
+# out to every aggregation instead of each query being its own Kinesis reader.
+# STREAMING_OUTPUTS are about the live stream's arrival (lateness against the
+# watermark), so replays, which have no watermark, leave them out.
+# BATCH_QUERIES holds the form a replay runs of metrics whose streaming query
+# batch mode cannot plan.
+METRICS: Dict[str, Tuple[str, str]] = {}
+STREAMING_OUTPUTS: Dict[str, Tuple[str, str]] = {}
+BATCH_QUERIES: Dict[str, str] = {}
+
+
+def register_metric(sink_table: str, sink_ddl: str, query: str, streaming_only: bool = False,
+                    batch_query: Optional[str] = None):
+    """Register a metric query and the sink table it writes to."""
+    if sink_table in METRICS or sink_table in STREAMING_OUTPUTS:
+        raise ValueError(f"Metric {sink_table} is already registered")
+    (STREAMING_OUTPUTS if streaming_only else METRICS)[sink_table] = (sink_ddl, query)
+    if batch_query:
+        BATCH_QUERIES[sink_table] = batch_query
+
+
+def window_metric_query(sink_table: str, columns: str, aggregates: str, sketches: str, where: str = "",
+                        streaming: bool = True) -> str:
+    """
+    The INSERT INTO query of a metric per window_start, window_end and
+    game_id of metric_events: `aggregates` (built-in aggregate functions)
+    and `sketches` (the Python sketch functions) are computed per window,
+    then `columns` are selected from them after the keys.
+
+    Streaming runs both in one Python aggregation, which emits a window's
+    record at most once per bundle (see create_table_environment). Batch mode cannot plan Python
+    and built-in aggregate functions in the same aggregation, so replays
+    compute each on its own and join them on the window and game.
+    """
+    keys = "window_start, window_end, game_id"
+    where = f"WHERE {where}" if where else ""
+
+    def aggregation(functions: str) -> str:
+        return f"(SELECT {keys}, {functions} FROM metric_events {where} GROUP BY {keys})"
+
+    if streaming:
+        source = aggregation(f"{aggregates}, {sketches}")
+    else:
+        source = f"{aggregation(aggregates)} JOIN {aggregation(sketches)} USING ({keys})"
+    return f"""
+        INSERT INTO {sink_table}
+        SELECT {keys}, {columns}
+        FROM {source}
+    """
+
+
+def register_window_metric(sink_table: str, sink_ddl: str, columns: str, aggregates: str, sketches: str,
+                           where: str = ""):
+    """Register a metric per 5-minute window and game; see window_metric_query."""
+    register_metric(sink_table, sink_ddl, window_metric_query(sink_table, columns, aggregates, sketches, where),
+                    batch_query=window_metric_query(sink_table, columns, aggregates, sketches, where, streaming=False))
+
+
+# Session metrics. Distinct counts are HyperLogLog estimates and percentiles
+# come from DDSketches; the sketches are emitted (base64 in the JSON records)
+# so windows can be merged later.
+register_window_metric(
+    "session_metrics",
+    """
         CREATE TABLE session_metrics (
             window_start TIMESTAMP(3),
             window_end TIMESTAMP(3),
             game_id STRING,
             total_sessions BIGINT,
             avg_duration DOUBLE,
+            duration_p50 DOUBLE,
+            duration_p95 DOUBLE,
+            duration_p99 DOUBLE,
+            session_sketch BYTES,
+            duration_sketch BYTES,
+            score_sketch BYTES,
             PRIMARY KEY (window_start, window_end, game_id) NOT ENFORCED
         ) WITH (
             'connector' = 'upsert-kinesis',
@@ -61,10 +661,149 @@ def create_sink_tables(t_env: StreamTableEnvironment):
             'aws.region' = 'us-east-1',
             'format' = 'json'
         )
+    """,
+    columns="""
+        hll_estimate(session_sketch) as total_sessions,
+        avg_duration,
+        sketch_quantile(duration_sketch, 0.5) as duration_p50,
+        sketch_quantile(duration_sketch, 0.95) as duration_p95,
+        sketch_quantile(duration_sketch, 0.99) as duration_p99,
+        session_sketch,
+        duration_sketch,
+        score_sketch
+    """,
+    aggregates="AVG(CAST(duration AS DOUBLE)) as avg_duration",
+    sketches="""
+        hll_sketch(session_id) as session_sketch,
+        quantile_sketch(duration) as duration_sketch,
+        quantile_sketch(score) as score_sketch
+    """,
+    where="event_type = 'game_end'"
+)
+
+# Active players, the basis of DAU: the daily figure is the merge of a day's
+# player sketches (see rollup_sketches in src/processors/sketches.py).
+register_window_metric(
+    "player_activity",
+    """
+        CREATE TABLE player_activity (
+            window_start TIMESTAMP(3),
+            window_end TIMESTAMP(3),
+            game_id STRING,
+            active_players BIGINT,
+            event_count BIGINT,
+            player_sketch BYTES,
+            PRIMARY KEY (window_start, window_end, game_id) NOT ENFORCED
+        ) WITH (
+            'connector' = 'upsert-kinesis',
+            'stream' = 'player-activity',
+            'aws.region' = 'us-east-1',
+            'format' = 'json'
+        )
+    """,
+    columns="""
+        hll_estimate(player_sketch) as active_players,
+        event_count,
+        player_sketch
+    """,
+    aggregates="COUNT(*) as event_count",
+    sketches="hll_sketch(player_id) as player_sketch"
+)
+
+# Server-side sessions: each session_id's events grouped by an event-time
+# session window, so sessions without a game_end (abandoned) are emitted
+# too, once SESSION_GAP_MINUTES pass without an event. The aggregates are
+# fixed-size, so an open session's state does not grow with its events,
+# and the window's state is dropped when it fires; state per open session
+# is bounded regardless of how many players are online. A session window
+# fires once: events arriving after the watermark has closed it are not
+# counted in its record. Batch mode has no session windows, so a replay
+# numbers each session_id's sessions instead, starting a new one at every
+# event more than the gap after the one before (Flink merges windows that
+# touch), and groups by that number.
+SESSION_AGGREGATES = """
+    MIN(`timestamp`) as session_start,
+    MAX(`timestamp`) as session_end,
+    TIMESTAMPDIFF(SECOND, MIN(`timestamp`), MAX(`timestamp`)) as duration_seconds,
+    MAX(duration) as client_duration,
+    COUNT(*) as event_count,
+    MAX(CASE WHEN event_type = 'game_start' THEN 1 ELSE 0 END) = 1 as started,
+    MAX(CASE WHEN event_type = 'game_end' THEN 1 ELSE 0 END) = 1 as completed,
+    COUNT(CASE WHEN event_type = 'purchase' THEN 1 END) as purchase_count,
+    COALESCE(SUM(CASE WHEN event_type = 'purchase' THEN amount END), 0) as revenue,
+    COUNT(CASE WHEN event_type = 'progress' THEN 1 END) as progress_events,
+    MAX(COALESCE(`level`, level_reached)) as max_level,
+    COALESCE(SUM(xp_earned), 0) as xp_earned,
+    MAX(score) as score
+"""
+SESSION_KEYS = "session_id, game_id, player_id"
+
+register_metric(
+    "player_sessions",
+    """
+        CREATE TABLE player_sessions (
+            session_id STRING,
+            game_id STRING,
+            player_id STRING,
+            session_start TIMESTAMP(3),
+            session_end TIMESTAMP(3),
+            duration_seconds INT,
+            client_duration INT,
+            event_count BIGINT,
+            started BOOLEAN,
+            completed BOOLEAN,
+            purchase_count BIGINT,
+            revenue DOUBLE,
+            progress_events BIGINT,
+            max_level INT,
+            xp_earned INT,
+            score INT,
+            closed_at TIMESTAMP(3),
+            PRIMARY KEY (session_id, session_start) NOT ENFORCED
+        ) WITH (
+            'connector' = 'upsert-kinesis',
+            'stream' = 'player-sessions',
+            'aws.region' = 'us-east-1',
+            'format' = 'json'
+        )
+    """,
+    f"""
+        INSERT INTO player_sessions
+        SELECT
+            {SESSION_KEYS},
+            {SESSION_AGGREGATES},
+            SESSION_END(`timestamp`, INTERVAL '{SESSION_GAP_MINUTES}' MINUTE) as closed_at
+        FROM game_events
+        GROUP BY
+            SESSION(`timestamp`, INTERVAL '{SESSION_GAP_MINUTES}' MINUTE),
+            {SESSION_KEYS}
+    """,
+    batch_query=f"""
+        INSERT INTO player_sessions
+        SELECT
+            {SESSION_KEYS},
+            {SESSION_AGGREGATES},
+            MAX(`timestamp`) + INTERVAL '{SESSION_GAP_MINUTES}' MINUTE as closed_at
+        FROM (
+            SELECT *, SUM(new_session) OVER (
+                PARTITION BY {SESSION_KEYS} ORDER BY `timestamp`
+                ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+            ) as session_number
+            FROM (
+                SELECT *,
+                    CASE WHEN `timestamp` <= LAG(`timestamp`) OVER (PARTITION BY {SESSION_KEYS} ORDER BY `timestamp`)
+                        + INTERVAL '{SESSION_GAP_MINUTES}' MINUTE THEN 0 ELSE 1 END as new_session
+                FROM game_events
+            )
+        )
+        GROUP BY {SESSION_KEYS}, session_number
+    """
+)
+
+# Revenue metrics
+register_window_metric(
+    "revenue_metrics",
     """
-    
-    # Revenue metrics sink
-    revenue_metrics_ddl = """
         CREATE TABLE revenue_metrics (
             window_start TIMESTAMP(3),
             window_end TIMESTAMP(3),
@@ -72,6 +811,10 @@ def create_sink_tables(t_env: StreamTableEnvironment):
             total_revenue DOUBLE,
             transaction_count BIGINT,
             avg_transaction DOUBLE,
+            amount_p50 DOUBLE,
+            amount_p95 DOUBLE,
+            amount_p99 DOUBLE,
+            amount_sketch BYTES,
             PRIMARY KEY (window_start, window_end, game_id) NOT ENFORCED
         ) WITH (
             'connector' = 'upsert-kinesis',
@@ -79,104 +822,230 @@ def create_sink_tables(t_env: StreamTableEnvironment):
             'aws.region' = 'us-east-1',
             'format' = 'json'
         )
+    """,
+    columns="""
+        total_revenue,
+        transaction_count,
+        avg_transaction,
+        sketch_quantile(amount_sketch, 0.5) as amount_p50,
+        sketch_quantile(amount_sketch, 0.95) as amount_p95,
+        sketch_quantile(amount_sketch, 0.99) as amount_p99,
+        amount_sketch
+    """,
+    aggregates="""
+        SUM(amount) as total_revenue,
+        COUNT(*) as transaction_count,
+        AVG(amount) as avg_transaction
+    """,
+    sketches="quantile_sketch(amount) as amount_sketch",
+    where="event_type = 'purchase'"
+)
+
+
+# Events too late for the windows (see ALLOWED_LATENESS_MINUTES), archived as
+# JSON lines by event hour. Read before deduplication, with the watermark
+# each was judged against. The deduplicated events reach metric_events after
+# a shuffle, whose watermark can only be behind this one, so every event is
+# in a window or here; one in both is recomputed to the same result by the
+# corrections.
+register_metric(
+    "late_events",
+    f"""
+        CREATE TABLE late_events (
+            `timestamp` TIMESTAMP(3),
+            {event_columns_ddl()},
+            event_watermark TIMESTAMP(3),
+            event_date STRING,
+            event_hour STRING
+        ) PARTITIONED BY (event_date, event_hour) WITH (
+            'connector' = 'filesystem',
+            'path' = '{LATE_EVENTS_PATH}',
+            'format' = 'json',
+            'json.timestamp-format.standard' = 'ISO-8601',
+            'sink.rolling-policy.rollover-interval' = '15 min',
+            'sink.rolling-policy.check-interval' = '1 min'
+        )
+    """,
+    f"""
+        INSERT INTO late_events
+        SELECT
+            `timestamp`,
+            {", ".join(f"`{name}`" for name, _, _ in EVENT_COLUMNS)},
+            event_watermark,
+            DATE_FORMAT(`timestamp`, 'yyyy-MM-dd') as event_date,
+            DATE_FORMAT(`timestamp`, 'HH') as event_hour
+        FROM (
+            SELECT *, CURRENT_WATERMARK(`timestamp`) as event_watermark
+            FROM game_events_source
+        )
+        WHERE event_watermark IS NOT NULL
+            AND `timestamp` < event_watermark - INTERVAL '{ALLOWED_LATENESS_MINUTES}' MINUTE
+    """,
+    streaming_only=True
+)
+
+# How many events per game arrive behind the watermark and how far behind,
+# per 5 minutes of arrival: the lateness sketch shows what share of late
+# events a given ALLOWED_LATENESS_MINUTES would keep, against the window
+# state it costs. Counts include resent copies, which are dropped later.
+register_metric(
+    "event_lateness",
     """
-    
-    t_env.execute_sql(session_metrics_ddl)
-    t_env.execute_sql(revenue_metrics_ddl)
-
-
-@udf(result_type=DataTypes.ROW([
-    DataTypes.FIELD("duration", DataTypes.INT()),
-    DataTypes.FIELD("score", DataTypes.INT()),
-    DataTypes.FIELD("level", DataTypes.INT())
-]))
-def extract_game_end_data(payload: str) -> Row:
-    """Extract relevant fields from game end events."""
-    data = json.loads(payload)
-    return Row(
-        duration=data.get('duration', 0),
-        score=data.get('score', 0),
-        level=data.get('level_reached', 0)
-    )
-
-
-@udf(result_type=DataTypes.ROW([
-    DataTypes.FIELD("amount", DataTypes.DOUBLE()),
-    DataTypes.FIELD("currency_code", DataTypes.STRING())
-]))
-def extract_purchase_data(payload: str) -> Row:
-    """Extract relevant fields from purchase events."""
-    data = json.loads(payload)
-    return Row(
-        amount=float(data.get('amount', 0.0)),
-        currency_code=data.get('currency_code', 'USD')
-    )
-
-
-def create_session_analytics(t_env: StreamTableEnvironment):
-    """Create session analytics processing logic."""
-    # Register UDFs
-    t_env.create_temporary_function("extract_game_end_data", extract_game_end_data)
-    
-    # Session analytics query
-    session_query = """
-        INSERT INTO session_metrics
+        CREATE TABLE event_lateness (
+            window_start TIMESTAMP_LTZ(3),
+            window_end TIMESTAMP_LTZ(3),
+            game_id STRING,
+            events BIGINT,
+            late_events BIGINT,
+            dropped_events BIGINT,
+            lateness_p50 DOUBLE,
+            lateness_p95 DOUBLE,
+            lateness_p99 DOUBLE,
+            max_lateness DOUBLE,
+            lateness_sketch BYTES,
+            PRIMARY KEY (window_start, window_end, game_id) NOT ENFORCED
+        ) WITH (
+            'connector' = 'upsert-kinesis',
+            'stream' = 'event-lateness',
+            'aws.region' = 'us-east-1',
+            'format' = 'json'
+        )
+    """,
+    f"""
+        INSERT INTO event_lateness
         SELECT
-            TUMBLE_START(timestamp, INTERVAL '5' MINUTE) as window_start,
-            TUMBLE_END(timestamp, INTERVAL '5' MINUTE) as window_end,
+            window_start,
+            window_end,
             game_id,
-            COUNT(DISTINCT session_id) as total_sessions,
-            AVG(extract_game_end_data(payload).duration) as avg_duration
-        FROM game_events
-        WHERE event_type = 'game_end'
-        GROUP BY
-            TUMBLE(timestamp, INTERVAL '5' MINUTE),
-            game_id
+            events,
+            late_events,
+            dropped_events,
+            sketch_quantile(lateness_sketch, 0.5) as lateness_p50,
+            sketch_quantile(lateness_sketch, 0.95) as lateness_p95,
+            sketch_quantile(lateness_sketch, 0.99) as lateness_p99,
+            max_lateness,
+            lateness_sketch
+        FROM (
+            SELECT
+                TUMBLE_START(proc_time, INTERVAL '5' MINUTE) as window_start,
+                TUMBLE_END(proc_time, INTERVAL '5' MINUTE) as window_end,
+                game_id,
+                COUNT(*) as events,
+                COUNT(lateness_seconds) as late_events,
+                SUM(CASE WHEN lateness_seconds > {ALLOWED_LATENESS_MINUTES * 60} THEN 1 ELSE 0 END)
+                    as dropped_events,
+                MAX(lateness_seconds) as max_lateness,
+                quantile_sketch(lateness_seconds) as lateness_sketch
+            FROM (
+                SELECT
+                    proc_time,
+                    game_id,
+                    -- Seconds behind the watermark; NULL for events ahead of it
+                    CASE WHEN `timestamp` < CURRENT_WATERMARK(`timestamp`)
+                        THEN CAST(TIMESTAMPDIFF(SECOND, `timestamp`, CURRENT_WATERMARK(`timestamp`)) AS DOUBLE)
+                    END as lateness_seconds
+                FROM game_events_source
+            )
+            GROUP BY
+                TUMBLE(proc_time, INTERVAL '5' MINUTE),
+                game_id
+        )
+    """,
+    streaming_only=True
+)
+
+
+def create_sink_tables(t_env: StreamTableEnvironment):
+    """Create the sink table of every registered metric."""
+    for sink_ddl, _ in list(METRICS.values()) + list(STREAMING_OUTPUTS.values()):
+        t_env.execute_sql(sink_ddl)
+
+
+def filesystem_sink_ddl(sink_ddl: str, path: str) -> str:
     """
-    
-    t_env.execute_sql(session_query)
+    A metric's sink DDL rewritten to write JSON files under path/<table>,
+    e.g. to check a replay before it goes to the metric streams. Filesystem
+    sinks are append-only, so the primary key is dropped.
+    """
+    table = re.search(r"CREATE TABLE (\w+)", sink_ddl).group(1)
+    sink_ddl = re.sub(r",\s*PRIMARY KEY \([^)]*\) NOT ENFORCED", "", sink_ddl)
+    return re.sub(r"WITH \((.|\n)*\)", f"""WITH (
+            'connector' = 'filesystem',
+            'path' = '{os.path.join(path, table)}',
+            'format' = 'json'
+        )""", sink_ddl)
 
 
-def create_revenue_analytics(t_env: StreamTableEnvironment):
-    """Create revenue analytics processing logic."""
-    # Register UDFs
-    t_env.create_temporary_function("extract_purchase_data", extract_purchase_data)
-    
-    # Revenue analytics query
-    revenue_query = """
-        INSERT INTO revenue_metrics
-        SELECT
-            TUMBLE_START(timestamp, INTERVAL '5' MINUTE) as window_start,
-            TUMBLE_END(timestamp, INTERVAL '5' MINUTE) as window_end,
-            game_id,
-            SUM(extract_purchase_data(payload).amount) as total_revenue,
-            COUNT(*) as transaction_count,
-            AVG(extract_purchase_data(payload).amount) as avg_transaction
-        FROM game_events
-        WHERE event_type = 'purchase'
-        GROUP BY
-            TUMBLE(timestamp, INTERVAL '5' MINUTE),
-            game_id
+def create_analytics(t_env: StreamTableEnvironment, streaming: bool = True):
+    """Add every registered metric query, or its batch form, to a single StatementSet."""
+    statement_set = t_env.create_statement_set()
+    if streaming:
+        queries = [query for _, query in list(METRICS.values()) + list(STREAMING_OUTPUTS.values())]
+    else:
+        queries = [BATCH_QUERIES.get(sink_table, query) for sink_table, (_, query) in METRICS.items()]
+    for query in queries:
+        statement_set.add_insert_sql(query)
+    return statement_set
+
+
+def replay(args):
     """
-    
-    t_env.execute_sql(revenue_query)
+    Recompute the metrics of archived events: stage [start, end) as time
+    ordered JSON files and run every registered metric over them as one
+    batch job, writing to the metric sinks (or files under --sink-dir).
+    """
+    staging = args.staging or tempfile.mkdtemp(prefix="replay-")
+    staged = write_replay(args.location or default_location(args.source), args.source, args.start, args.end,
+                          staging, args.chunk_hours, args.late_hours)
+    print(f"Replaying {staged['events']} events of {args.start} to {args.end} from {staging}")
+
+    t_env = create_batch_table_environment()
+    register_batch_functions(t_env)
+    create_replay_source_table(t_env, staging)
+    create_dedup_view(t_env, order_by="`timestamp`")
+    create_metric_events_view(t_env, streaming=False)
+    for sink_ddl, _ in METRICS.values():
+        t_env.execute_sql(filesystem_sink_ddl(sink_ddl, args.sink_dir) if args.sink_dir else sink_ddl)
+
+    statement_set = create_analytics(t_env, streaming=False)
+    t_env.get_config().set("pipeline.name", f"Game Analytics Replay {args.start:%Y-%m-%dT%H} to {args.end:%Y-%m-%dT%H}")
+    statement_set.execute().wait()
 
 
 def main():
     """Main entry point for the stream processor."""
+    parser = argparse.ArgumentParser(description="Game analytics stream processor")
+    parser.add_argument("--replay", action="store_true",
+                        help="Backfill the metrics of archived events as a batch job instead of reading Kinesis")
+    replay_arguments(parser, required=False)
+    parser.add_argument("--staging", help="Directory for the replayed events (default: a temporary directory)")
+    parser.add_argument("--sink-dir", help="Write replayed metrics as JSON files here instead of to the streams")
+    args = parser.parse_args()
+    if args.replay:
+        if not (args.start and args.end):
+            parser.error("--replay needs --start and --end")
+        replay(args)
+        return
+
     # Create Table Environment
     t_env = create_table_environment()
     
     # Create source and sink tables
-    create_source_table(t_env)
+    register_functions(t_env)
+    if EVENT_STREAM_FORMAT == "compact":
+        create_compact_source_table(t_env)
+    else:
+        create_source_table(t_env)
+    create_dedup_view(t_env)
+    create_metric_events_view(t_env)
     create_sink_tables(t_env)
     
     # Create analytics
-    create_session_analytics(t_env)
-    create_revenue_analytics(t_env)
+    statement_set = create_analytics(t_env)
     
-    # Execute the job
-    t_env.execute("Game Analytics Processor")
+    # Execute all metrics as one job over a shared source
+    t_env.get_config().set("pipeline.name", "Game Analytics Processor")
+    statement_set.execute().wait()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,271 @@
+"""
+Per-game rollups of the 5-minute metric windows.
+
+Rows live at four granularities in one DynamoDB table, keyed on
+"<game_id>#<granularity>" (k) and the bucket start as ISO-8601 (b):
+
+    window  one 5-minute window: the fields of its session_metrics,
+            revenue_metrics and player_activity records
+    hour    merge of the hour's windows
+    day     merge of the day's hours
+    month   merge of the month's days
+
+Each row holds the mergeable parts (sums and serialized sketches); hour,
+day and month rows also hold the metrics derived from them, so reads are a
+range query over precomputed rows. A changed window marks its hour dirty; `flush` then rebuilds only
+that hour, its day and its month, each from at most 31 child rows, so the
+cost of an update does not grow with history.
+"""
+import base64
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from src.processors.sketches import GRANULARITIES, DDSketch, HyperLogLog, truncate
+from src.utils.player_metrics import create_dynamodb_client
+
+TABLE_NAME = os.getenv("GAME_ROLLUPS_TABLE", "game-rollups")
+
+WINDOW = "window"
+WINDOW_MINUTES = 5
+CHILD = {"hour": WINDOW, "day": "hour", "month": "day"}
+
+SUM_FIELDS = ("total_revenue", "transaction_count", "event_count")
+HLL_FIELDS = ("session_sketch", "player_sketch")
+DDSKETCH_FIELDS = ("duration_sketch", "score_sketch", "amount_sketch")
+MERGE_FIELDS = SUM_FIELDS + HLL_FIELDS + DDSKETCH_FIELDS
+SKETCH_TYPES = dict([(name, HyperLogLog) for name in HLL_FIELDS] + [(name, DDSketch) for name in DDSKETCH_FIELDS])
+
+# Fields each metric stream contributes to a window
+SOURCE_FIELDS = {
+    "session_metrics": ("session_sketch", "duration_sketch", "score_sketch"),
+    "revenue_metrics": ("total_revenue", "transaction_count", "amount_sketch"),
+    "player_activity": ("event_count", "player_sketch"),
+}
+
+METRIC_FIELDS = (
+    "total_sessions", "avg_duration", "duration_p50", "duration_p95", "duration_p99",
+    "total_revenue", "transaction_count", "avg_transaction", "amount_p50", "amount_p95", "amount_p99",
+    "active_players", "event_count"
+)
+INTEGER_FIELDS = {"transaction_count", "event_count", "total_sessions", "active_players"}
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Start of the window, hour, day or month a timestamp falls in."""
+    if granularity == WINDOW:
+        return timestamp.replace(minute=timestamp.minute - timestamp.minute % WINDOW_MINUTES,
+                                 second=0, microsecond=0)
+    return truncate(timestamp, granularity)
+
+
+def bucket_end(start: datetime, granularity: str) -> datetime:
+    if granularity == WINDOW:
+        return start + timedelta(minutes=WINDOW_MINUTES)
+    if granularity == "hour":
+        return start + timedelta(hours=1)
+    if granularity == "day":
+        return start + timedelta(days=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def merge_rows(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum the counters and merge the sketches of several rows."""
+    rows = list(rows)
+    merged: Dict[str, Any] = {}
+    for name in SUM_FIELDS:
+        values = [row[name] for row in rows if name in row]
+        if values:
+            merged[name] = sum(values)
+    for name, sketch_type in SKETCH_TYPES.items():
+        sketch = sketch_type.merge_all(row[name] for row in rows if name in row)
+        if sketch is not None:
+            merged[name] = sketch.to_bytes()
+    return merged
+
+
+def derive(row: Dict[str, Any]) -> Dict[str, Any]:
+    """The reported metrics of a row, from its sums and sketches."""
+    metrics: Dict[str, Any] = {
+        "total_revenue": row.get("total_revenue", 0.0),
+        "transaction_count": row.get("transaction_count", 0),
+        "event_count": row.get("event_count", 0),
+    }
+    metrics["avg_transaction"] = (
+        metrics["total_revenue"] / metrics["transaction_count"] if metrics["transaction_count"] else None
+    )
+    for name, field in (("total_sessions", "session_sketch"), ("active_players", "player_sketch")):
+        metrics[name] = HyperLogLog.from_bytes(row[field]).count() if field in row else 0
+
+    duration = DDSketch.from_bytes(row["duration_sketch"]) if "duration_sketch" in row else None
+    amount = DDSketch.from_bytes(row["amount_sketch"]) if "amount_sketch" in row else None
+    metrics["avg_duration"] = duration.mean if duration else None
+    for prefix, sketch in (("duration", duration), ("amount", amount)):
+        for q, suffix in ((0.5, "p50"), (0.95, "p95"), (0.99, "p99")):
+            metrics[f"{prefix}_{suffix}"] = sketch.quantile(q) if sketch else None
+    return metrics
+
+
+def parse_record(source: str, record: Dict[str, Any]) -> Tuple[str, datetime, Dict[str, Any]]:
+    """(game_id, window_start, fields) of a metric stream record."""
+    fields = {}
+    for name in SOURCE_FIELDS[source]:
+        value = record.get(name)
+        if value is None:
+            continue
+        if name in SUM_FIELDS:
+            fields[name] = value
+        else:
+            # BYTES columns are base64 in the JSON sink format
+            fields[name] = base64.b64decode(value)
+    window_start = datetime.fromisoformat(str(record["window_start"]).replace("T", " "))
+    return record["game_id"], bucket_start(window_start, WINDOW), fields
+
+
+class RollupTable:
+    """Rows keyed by game, granularity and bucket start."""
+
+    def get(self, game_id: str, granularity: str, start: datetime) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, game_id: str, granularity: str, start: datetime, row: Dict[str, Any]):
+        raise NotImplementedError
+
+    def query(self, game_id: str, granularity: str, start: datetime, end: datetime,
+              fields: Optional[Sequence[str]] = None) -> List[Tuple[datetime, Dict[str, Any]]]:
+        """(bucket start, row) for buckets in [start, end), in order; `fields` limits the attributes read."""
+        raise NotImplementedError
+
+
+class MemoryRollupTable(RollupTable):
+    """In-process table for development, benchmarks and checks."""
+
+    def __init__(self):
+        self.rows: Dict[Tuple[str, str], Dict[datetime, Dict[str, Any]]] = defaultdict(dict)
+
+    def get(self, game_id, granularity, start):
+        return self.rows[(game_id, granularity)].get(start)
+
+    def put(self, game_id, granularity, start, row):
+        self.rows[(game_id, granularity)][start] = row
+
+    def query(self, game_id, granularity, start, end, fields=None):
+        rows = self.rows[(game_id, granularity)]
+        return [(bucket, rows[bucket]) for bucket in sorted(rows) if start <= bucket < end]
+
+
+def _attribute(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bytes):
+        return {"B": value}
+    if isinstance(value, str):
+        return {"S": value}
+    return {"N": repr(value) if isinstance(value, float) else str(value)}
+
+
+def _value(name: str, attribute: Dict[str, Any]) -> Any:
+    if "B" in attribute:
+        return bytes(attribute["B"])
+    if "S" in attribute:
+        return attribute["S"]
+    return int(attribute["N"]) if name in INTEGER_FIELDS else float(attribute["N"])
+
+
+class DynamoRollupTable(RollupTable):
+    """The game-rollups DynamoDB table."""
+
+    def __init__(self, client=None, table_name: str = TABLE_NAME):
+        self.client = client or create_dynamodb_client()
+        self.table_name = table_name
+
+    @staticmethod
+    def _key(game_id: str, granularity: str, start: datetime) -> Dict[str, Dict[str, str]]:
+        return {"k": {"S": f"{game_id}#{granularity}"}, "b": {"S": start.isoformat()}}
+
+    def get(self, game_id, granularity, start):
+        response = self.client.get_item(TableName=self.table_name, Key=self._key(game_id, granularity, start))
+        if "Item" not in response:
+            return None
+        return {name: _value(name, value) for name, value in response["Item"].items() if name not in ("k", "b")}
+
+    def put(self, game_id, granularity, start, row):
+        item = self._key(game_id, granularity, start)
+        # DynamoDB has no null numbers; missing metrics are simply absent
+        item.update({name: _attribute(value) for name, value in row.items() if value is not None})
+        self.client.put_item(TableName=self.table_name, Item=item)
+
+    def query(self, game_id, granularity, start, end, fields=None):
+        kwargs = {
+            "TableName": self.table_name,
+            # BETWEEN is inclusive; the last microsecond before `end` sorts after every bucket start
+            "KeyConditionExpression": "k = :k AND b BETWEEN :start AND :end",
+            "ExpressionAttributeValues": {
+                ":k": {"S": f"{game_id}#{granularity}"},
+                ":start": {"S": start.isoformat()},
+                ":end": {"S": (end - timedelta(microseconds=1)).isoformat()},
+            },
+        }
+        if fields:
+            names = {f"#f{i}": name for i, name in enumerate(("b",) + tuple(fields))}
+            kwargs["ProjectionExpression"] = ", ".join(names)
+            kwargs["ExpressionAttributeNames"] = names
+        rows = []
+        while True:
+            response = self.client.query(**kwargs)
+            for item in response["Items"]:
+                bucket = datetime.fromisoformat(item.pop("b")["S"])
+                item.pop("k", None)
+                rows.append((bucket, {name: _value(name, value) for name, value in item.items()}))
+            if "LastEvaluatedKey" not in response:
+                return rows
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+class GameRollups:
+    """Maintains the rollup rows as windows arrive or are corrected."""
+
+    def __init__(self, table: Optional[RollupTable] = None):
+        self.table = table if table is not None else DynamoRollupTable()
+        self._dirty: Set[Tuple[str, datetime]] = set()
+
+    def apply_window(self, game_id: str, window_start: datetime, fields: Dict[str, Any],
+                     replace: bool = False):
+        """
+        Set fields of a window. Metric streams each carry part of a window,
+        so by default the fields are merged into the stored row; with
+        `replace` they are the whole window (a recomputation from the lake).
+        """
+        window_start = bucket_start(window_start, WINDOW)
+        row = {} if replace else self.table.get(game_id, WINDOW, window_start) or {}
+        row = {name: row[name] for name in MERGE_FIELDS if name in row}
+        row.update(fields)
+        self.table.put(game_id, WINDOW, window_start, row)
+        self._dirty.add((game_id, bucket_start(window_start, "hour")))
+
+    def apply_record(self, source: str, record: Dict[str, Any]):
+        """Apply a session_metrics, revenue_metrics or player_activity record."""
+        game_id, window_start, fields = parse_record(source, record)
+        self.apply_window(game_id, window_start, fields)
+
+    def flush(self) -> int:
+        """Rebuild the hours, days and months of windows changed since the last flush."""
+        dirty, written = self._dirty, 0
+        self._dirty = set()
+        for position, granularity in enumerate(GRANULARITIES):
+            parents = set()
+            for game_id, start in sorted(dirty):
+                children = self.table.query(game_id, CHILD[granularity], start, bucket_end(start, granularity))
+                row = merge_rows(row for _, row in children)
+                self.table.put(game_id, granularity, start, dict(row, **derive(row)))
+                written += 1
+                if position + 1 < len(GRANULARITIES):
+                    parents.add((game_id, bucket_start(start, GRANULARITIES[position + 1])))
+            dirty = parents
+        return written
+
+    def read(self, game_id: str, granularity: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Reported metrics of a game's buckets in [start, end)."""
+        return [
+            dict({"bucket_start": bucket.isoformat()}, **{name: row.get(name) for name in METRIC_FIELDS})
+            for bucket, row in self.table.query(game_id, granularity, start, end, fields=METRIC_FIELDS)
+        ]
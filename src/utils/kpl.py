@@ -0,0 +1,120 @@
+"""
+KPL aggregated record format.
+
+An aggregated record packs several user records into one Kinesis record:
+
+    magic (4 bytes) | protobuf AggregatedRecord | md5(protobuf) (16 bytes)
+
+This is the format written by the Kinesis Producer Library, so the Flink
+Kinesis connector and the KCL de-aggregate it transparently. Only the fields
+we write are encoded (partition key table and records); unknown fields are
+skipped when decoding.
+"""
+import hashlib
+from typing import List, Tuple
+
+MAGIC = b"\xf3\x89\x9a\xc2"
+DIGEST_SIZE = 16
+
+# Protobuf wire types
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+FIXED32 = 5
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    result, shift = 0, 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    return _varint(number << 3 | LENGTH_DELIMITED) + _varint(len(payload)) + payload
+
+
+def _iter_fields(buf: bytes):
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == VARINT:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == LENGTH_DELIMITED:
+            size, pos = _read_varint(buf, pos)
+            value, pos = buf[pos:pos + size], pos + size
+        elif wire_type == FIXED64:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire_type == FIXED32:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield number, value
+
+
+def record_overhead(partition_key: str, data: bytes) -> int:
+    """Upper bound on the bytes one user record adds to an aggregated record."""
+    key = partition_key.encode()
+    return len(data) + len(key) + 24
+
+
+def aggregate(records: List[Tuple[str, bytes]]) -> bytes:
+    """Pack (partition_key, data) pairs into one aggregated record."""
+    keys = {}
+    key_table = bytearray()
+    body = bytearray()
+    for partition_key, data in records:
+        if partition_key not in keys:
+            keys[partition_key] = len(keys)
+            key_table += _field(1, partition_key.encode())
+        record = _varint(1 << 3 | VARINT) + _varint(keys[partition_key]) + _field(3, data)
+        body += _field(3, record)
+    message = bytes(key_table + body)
+    return MAGIC + message + hashlib.md5(message).digest()
+
+
+def is_aggregated(data: bytes) -> bool:
+    """Whether a Kinesis record is in the aggregated format."""
+    return len(data) > len(MAGIC) + DIGEST_SIZE and data[:len(MAGIC)] == MAGIC
+
+
+def deaggregate(data: bytes, partition_key: str = "") -> List[Tuple[str, bytes]]:
+    """
+    Unpack a Kinesis record into (partition_key, data) user records.
+
+    Records that are not aggregated (or fail the checksum, as the KCL does)
+    are returned unchanged as a single user record.
+    """
+    if not is_aggregated(data):
+        return [(partition_key, data)]
+    message, digest = data[len(MAGIC):-DIGEST_SIZE], data[-DIGEST_SIZE:]
+    if hashlib.md5(message).digest() != digest:
+        return [(partition_key, data)]
+
+    key_table, records = [], []
+    for number, value in _iter_fields(message):
+        if number == 1:
+            key_table.append(value.decode())
+        elif number == 3:
+            key_index, payload = 0, b""
+            for inner_number, inner_value in _iter_fields(value):
+                if inner_number == 1:
+                    key_index = inner_value
+                elif inner_number == 3:
+                    payload = inner_value
+            records.append((key_index, payload))
+    return [(key_table[key_index], payload) for key_index, payload in records]
@@ -0,0 +1,280 @@
+"""
+In-memory leaderboards with O(log n) rank queries.
+
+Each game's board keeps every player's best score in a RankedList: a sorted
+list split into blocks of about LOAD values, with a Fenwick tree over the
+block sizes. Inserts and removals touch one block, and the rank of a value is
+a bisect over block maxima, a Fenwick prefix sum and a bisect in one block.
+
+Entries are single ints rather than tuples to keep 10M players in a few
+hundred MB: the key packs the score and the player's index on the board, so
+ties rank the player who joined the board first higher.
+"""
+import bisect
+import struct
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+LOAD = 1000
+
+# Player indexes occupy the low 32 bits of a key
+INDEX_BITS = 32
+INDEX_MASK = (1 << INDEX_BITS) - 1
+
+SNAPSHOT_MAGIC = b"LB"
+SNAPSHOT_VERSION = 1
+
+
+class RankedList:
+    """Sorted list of ints with O(log n) insert, remove and position lookup."""
+
+    def __init__(self, values: Iterable[int] = ()):
+        values = sorted(values)
+        self._blocks: List[List[int]] = [values[i:i + LOAD] for i in range(0, len(values), LOAD)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(values)
+        self._build_tree()
+
+    def _build_tree(self):
+        tree = [0] + [len(block) for block in self._blocks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, block: int, delta: int):
+        i = block + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _tree_prefix(self, block: int) -> int:
+        """Values in the blocks before `block`."""
+        total, i = 0, block
+        while i:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, position: int) -> Tuple[int, int]:
+        """Block holding `position` and the offset within it."""
+        block, step = 0, 1 << (len(self._tree).bit_length())
+        while step:
+            nxt = block + step
+            if nxt < len(self._tree) and self._tree[nxt] <= position:
+                block = nxt
+                position -= self._tree[nxt]
+            step >>= 1
+        return block, position
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, value: int):
+        self._len += 1
+        if not self._blocks:
+            self._blocks.append([value])
+            self._maxes.append(value)
+            self._build_tree()
+            return
+        b = bisect.bisect_left(self._maxes, value)
+        if b == len(self._maxes):
+            b -= 1
+        block = self._blocks[b]
+        bisect.insort(block, value)
+        self._maxes[b] = block[-1]
+        if len(block) > 2 * LOAD:
+            self._blocks.insert(b + 1, block[LOAD:])
+            del block[LOAD:]
+            self._maxes.insert(b, block[-1])
+            self._build_tree()
+        else:
+            self._tree_add(b, 1)
+
+    def remove(self, value: int):
+        b = bisect.bisect_left(self._maxes, value)
+        if b == len(self._maxes):
+            raise ValueError(f"{value} is not in the list")
+        block = self._blocks[b]
+        i = bisect.bisect_left(block, value)
+        if block[i] != value:
+            raise ValueError(f"{value} is not in the list")
+        del block[i]
+        self._len -= 1
+        if block:
+            self._maxes[b] = block[-1]
+            self._tree_add(b, -1)
+        else:
+            del self._blocks[b]
+            del self._maxes[b]
+            self._build_tree()
+
+    def index(self, value: int) -> int:
+        """Number of values smaller than `value`."""
+        b = bisect.bisect_left(self._maxes, value)
+        if b == len(self._maxes):
+            return self._len
+        return self._tree_prefix(b) + bisect.bisect_left(self._blocks[b], value)
+
+    def slice(self, start: int, stop: int) -> Iterator[int]:
+        """Values at positions start..stop-1."""
+        if start >= min(stop, self._len):
+            return
+        b, offset = self._locate(start)
+        remaining = min(stop, self._len) - start
+        while remaining > 0:
+            taken = self._blocks[b][offset:offset + remaining]
+            yield from taken
+            remaining -= len(taken)
+            b, offset = b + 1, 0
+
+    def __iter__(self) -> Iterator[int]:
+        for block in self._blocks:
+            yield from block
+
+
+class Leaderboard:
+    """Best score per player on one game, ranked highest first."""
+
+    def __init__(self):
+        self._players: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._scores: List[int] = []
+        self._ranked = RankedList()
+
+    @staticmethod
+    def _key(index: int, score: int) -> int:
+        # Negated so ascending order is best first
+        return -((score << INDEX_BITS) | (INDEX_MASK - index))
+
+    def _entry(self, key: int) -> Tuple[str, int]:
+        key = -key
+        return self._players[INDEX_MASK - (key & INDEX_MASK)], key >> INDEX_BITS
+
+    def __len__(self) -> int:
+        return len(self._ranked)
+
+    def submit(self, player_id: str, score: int) -> bool:
+        """Record a score; returns whether it improved the player's best."""
+        index = self._index.get(player_id)
+        if index is None:
+            index = self._index[player_id] = len(self._players)
+            self._players.append(player_id)
+            self._scores.append(score)
+            self._ranked.add(self._key(index, score))
+            return True
+        current = self._scores[index]
+        if score <= current:
+            return False
+        self._ranked.remove(self._key(index, current))
+        self._scores[index] = score
+        self._ranked.add(self._key(index, score))
+        return True
+
+    def score(self, player_id: str) -> Optional[int]:
+        index = self._index.get(player_id)
+        return None if index is None else self._scores[index]
+
+    def rank(self, player_id: str) -> Optional[int]:
+        """1-based rank of a player, or None if they have no score."""
+        index = self._index.get(player_id)
+        if index is None:
+            return None
+        return self._ranked.index(self._key(index, self._scores[index])) + 1
+
+    def top(self, limit: int, offset: int = 0) -> List[Tuple[int, str, int]]:
+        """(rank, player_id, score) for ranks offset+1 .. offset+limit."""
+        return [
+            (offset + position + 1, *self._entry(key))
+            for position, key in enumerate(self._ranked.slice(offset, offset + limit))
+        ]
+
+    def entries(self) -> Iterator[Tuple[str, int]]:
+        """(player_id, best score) in join order."""
+        return zip(self._players, self._scores)
+
+    def frozen_entries(self) -> Iterator[Tuple[str, int]]:
+        """
+        entries() as of now, which later submits do not change: the scores
+        are copied and players are only ever appended, so it can be read on
+        another thread while the board is updated.
+        """
+        return zip(self._players, self._scores[:])
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Tuple[str, int]]) -> "Leaderboard":
+        """Build a board in one sort, e.g. from a snapshot."""
+        board = cls()
+        for player_id, score in entries:
+            index = board._index.get(player_id)
+            if index is None:
+                board._index[player_id] = len(board._players)
+                board._players.append(player_id)
+                board._scores.append(score)
+            elif score > board._scores[index]:
+                board._scores[index] = score
+        board._ranked = RankedList(
+            cls._key(index, score) for index, score in enumerate(board._scores)
+        )
+        return board
+
+
+def _write_varint(buf: bytearray, value: int):
+    while value > 0x7F:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_snapshot(board: Leaderboard) -> bytes:
+    """Serialize a board as zlib-compressed (player_id, score) pairs."""
+    return encode_entries(board.entries())
+
+
+def encode_entries(entries: Iterable[Tuple[str, int]]) -> bytes:
+    """encode_snapshot of a board's entries, e.g. its frozen_entries()."""
+    buf = bytearray(SNAPSHOT_MAGIC)
+    buf.append(SNAPSHOT_VERSION)
+    buf += bytes(4)
+    count = 0
+    for player_id, score in entries:
+        raw = player_id.encode()
+        _write_varint(buf, len(raw))
+        buf += raw
+        _write_varint(buf, (score << 1) ^ (score >> 63))
+        count += 1
+    struct.pack_into(">I", buf, 3, count)
+    return zlib.compress(bytes(buf), 1)
+
+
+def decode_snapshot(data: bytes) -> Leaderboard:
+    try:
+        data = zlib.decompress(data)
+    except zlib.error:
+        raise ValueError("Not a leaderboard snapshot")
+    if data[:2] != SNAPSHOT_MAGIC or data[2:3] != bytes((SNAPSHOT_VERSION,)):
+        raise ValueError("Not a leaderboard snapshot")
+    count = struct.unpack_from(">I", data, 3)[0]
+
+    def entries():
+        pos = 7
+        for _ in range(count):
+            size, pos = _read_varint(data, pos)
+            player_id = data[pos:pos + size].decode()
+            pos += size
+            score, pos = _read_varint(data, pos)
+            yield player_id, (score >> 1) ^ -(score & 1)
+
+    return Leaderboard.from_entries(entries())
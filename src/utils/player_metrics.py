@@ -0,0 +1,155 @@
+"""
+Per-player aggregates in DynamoDB.
+
+One item per player, keyed on the player ID, with short attribute names so
+a lookup reads a single small item:
+
+    p     player_id (hash key)
+    s     sessions played (game_end events)
+    t     total playtime in seconds
+    m     real-money spend
+    n     purchase count
+    i:ID  purchases of item ID, one numeric attribute per item
+    u     latest event time in the most recent update (ISO-8601)
+
+Updates are atomic ADDs, one UpdateItem per player per batch of events.
+Delivery from the stream is at-least-once, so a replayed batch is counted
+again.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable
+
+import boto3
+from botocore.config import Config
+
+TABLE_NAME = os.getenv("PLAYER_METRICS_TABLE", "player-metrics")
+FAVORITE_ITEMS = 5
+
+ITEM_PREFIX = "i:"
+
+
+def create_dynamodb_client(max_pool_connections: int = 10):
+    """Create a DynamoDB client for LocalStack."""
+    return boto3.client(
+        'dynamodb',
+        endpoint_url=os.getenv("AWS_ENDPOINT_URL", "http://localhost:4566"),
+        region_name=os.getenv("AWS_DEFAULT_REGION", "us-east-1"),
+        aws_access_key_id='test',
+        aws_secret_access_key='test',
+        config=Config(max_pool_connections=max_pool_connections)
+    )
+
+
+def _number(value: float) -> Dict[str, str]:
+    # Amounts are rounded to cents so float noise does not reach the table
+    return {"N": str(round(value, 2)) if isinstance(value, float) else str(value)}
+
+
+def player_metrics(player_id: str, item: Dict[str, Dict[str, str]]) -> Dict[str, Any]:
+    """The API representation of a stored item (all zeros if missing)."""
+    sessions = int(item["s"]["N"]) if "s" in item else 0
+    playtime = int(item["t"]["N"]) if "t" in item else 0
+    items = sorted(
+        ((int(value["N"]), name[len(ITEM_PREFIX):]) for name, value in item.items()
+         if name.startswith(ITEM_PREFIX)),
+        reverse=True
+    )
+    return {
+        "player_id": player_id,
+        "total_sessions": sessions,
+        "total_playtime": playtime,
+        "average_session_duration": playtime / sessions if sessions else 0,
+        "total_spend": float(item["m"]["N"]) if "m" in item else 0,
+        "total_purchases": int(item["n"]["N"]) if "n" in item else 0,
+        "favorite_items": [item_id for _, item_id in items[:FAVORITE_ITEMS]],
+        "last_event": item["u"]["S"] if "u" in item else None
+    }
+
+
+class PlayerDelta:
+    """Increments for one player accumulated from a batch of events."""
+
+    def __init__(self):
+        self.sessions = 0
+        self.playtime = 0
+        self.spend = 0.0
+        self.purchases = 0
+        self.items: Dict[str, int] = defaultdict(int)
+        self.last_event = ""
+
+    def add(self, event: Dict[str, Any]):
+        event_type = event["event_type"]
+        if event_type == "game_end":
+            self.sessions += 1
+            self.playtime += event["duration"]
+        elif event_type == "purchase":
+            self.purchases += 1
+            self.items[event["item_id"]] += 1
+            if event["currency_type"] == "real":
+                self.spend += event["amount"]
+        else:
+            return
+        timestamp = event["timestamp"]
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.isoformat()
+        self.last_event = max(self.last_event, timestamp)
+
+    def update_kwargs(self) -> Dict[str, Any]:
+        """UpdateItem arguments applying this delta."""
+        adds, names, values = [], {}, {}
+        counters = (("s", self.sessions), ("t", self.playtime), ("m", self.spend), ("n", self.purchases))
+        for name, value in counters:
+            if value:
+                adds.append(f"{name} :{name}")
+                values[f":{name}"] = _number(value)
+        for position, (item_id, count) in enumerate(sorted(self.items.items())):
+            names[f"#i{position}"] = ITEM_PREFIX + item_id
+            values[f":i{position}"] = _number(count)
+            adds.append(f"#i{position} :i{position}")
+        values[":u"] = {"S": self.last_event}
+
+        kwargs = {
+            "UpdateExpression": f"ADD {', '.join(adds)} SET u = :u",
+            "ExpressionAttributeValues": values
+        }
+        if names:
+            kwargs["ExpressionAttributeNames"] = names
+        return kwargs
+
+
+def player_deltas(events: Iterable[Dict[str, Any]]) -> Dict[str, PlayerDelta]:
+    """Fold game_end and purchase events into one delta per player."""
+    deltas: Dict[str, PlayerDelta] = defaultdict(PlayerDelta)
+    for event in events:
+        if event.get("event_type") in ("game_end", "purchase"):
+            deltas[event["player_id"]].add(event)
+    return deltas
+
+
+class PlayerMetricsStore:
+    """Reads and incrementally updates the player-metrics table."""
+
+    def __init__(self, client=None, table_name: str = TABLE_NAME):
+        self.client = client or create_dynamodb_client()
+        self.table_name = table_name
+
+    def get(self, player_id: str) -> Dict[str, Any]:
+        """Metrics of one player, from a single key read."""
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"p": {"S": player_id}}
+        )
+        return player_metrics(player_id, response.get("Item", {}))
+
+    def apply(self, events: Iterable[Dict[str, Any]]) -> int:
+        """Apply a batch of events; returns the number of players updated."""
+        deltas = player_deltas(events)
+        for player_id, delta in deltas.items():
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"p": {"S": player_id}},
+                **delta.update_kwargs()
+            )
+        return len(deltas)
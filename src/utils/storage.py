@@ -0,0 +1,118 @@
+"""
+Object storage used by the batch jobs: an S3 bucket, or a local directory
+laid out the same way for development and benchmarks.
+"""
+import os
+from typing import Dict, Iterator
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+def create_s3_client():
+    """Create an S3 client for LocalStack."""
+    return boto3.client(
+        's3',
+        endpoint_url=os.getenv("AWS_ENDPOINT_URL", "http://localhost:4566"),
+        region_name=os.getenv("AWS_DEFAULT_REGION", "us-east-1"),
+        aws_access_key_id='test',
+        aws_secret_access_key='test'
+    )
+
+
+class Storage:
+    """Flat key -> bytes store with prefix listing."""
+
+    def list(self, prefix: str) -> Iterator[Dict]:
+        """Yield {"key", "size", "version"} for objects under a prefix, in key order."""
+        raise NotImplementedError
+
+    def read(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def write(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+
+class S3Storage(Storage):
+    def __init__(self, bucket: str, client=None):
+        self.bucket = bucket
+        self.client = client or create_s3_client()
+
+    def list(self, prefix: str) -> Iterator[Dict]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield {"key": obj["Key"], "size": obj["Size"], "version": obj["ETag"].strip('"')}
+
+    def read(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def write(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+
+class LocalStorage(Storage):
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def list(self, prefix: str) -> Iterator[Dict]:
+        keys = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if key.startswith(prefix) and not name.endswith(".tmp"):
+                    keys.append((key, path))
+        for key, path in sorted(keys):
+            stat = os.stat(path)
+            yield {"key": key, "size": stat.st_size, "version": str(stat.st_mtime_ns)}
+
+    def read(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def write(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so readers never see a partial object
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+
+def open_storage(location: str) -> Storage:
+    """s3://bucket or a local directory."""
+    if location.startswith("s3://"):
+        return S3Storage(location[len("s3://"):].rstrip("/"))
+    return LocalStorage(location)
@@ -0,0 +1,492 @@
+"""
+Kinesis stream consumer: every shard, read concurrently, with checkpoints.
+
+StreamConsumer lists a stream's shards and reads each one on its own
+thread, handing records to a callback in batches. Shard lineage is
+followed: after a split or merge, a child shard is only read once its
+parents have been read to their end, so records of a partition key are
+delivered in order across a reshard. New shards are picked up when a
+parent ends and on a periodic shard sync.
+
+Shards are read with enhanced fan-out (SubscribeToShard, pushed over a
+dedicated 2 MB/s per shard) when the stream has a registered consumer,
+and otherwise by polling GetRecords at an interval that adapts to traffic:
+back to back while a shard is behind, slowing down to max_poll_interval
+while it is idle.
+
+After the callback returns, the batch's last sequence number is
+checkpointed (at most every checkpoint_interval seconds, and always at a
+shard's end and on stop) to a CheckpointStore, so a restarted consumer
+resumes where it stopped. Delivery is at least once: records after the
+last checkpoint are delivered again after a crash. There are no leases, so
+run one consumer per name and stream.
+
+    consumer = StreamConsumer("game-events-stream", handle_batch, name="monitor",
+                              checkpoints=FileCheckpointStore("monitor.json"))
+    consumer.start()
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+import boto3
+from botocore.exceptions import ClientError
+
+from src.utils.kpl import deaggregate
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_TABLE = os.getenv("STREAM_CHECKPOINT_TABLE", "stream-checkpoints")
+
+# Checkpoint of a shard read to its end
+SHARD_END = "SHARD_END"
+
+# GetRecords is limited to 5 calls per second per shard, shared by all pollers
+MIN_POLL_INTERVAL = 0.2
+MAX_POLL_INTERVAL = 2.0
+SHARD_SYNC_INTERVAL = 30.0
+
+
+def create_kinesis_client():
+    """Create a Kinesis client for LocalStack."""
+    return boto3.client(
+        'kinesis',
+        endpoint_url=os.getenv("AWS_ENDPOINT_URL", "http://localhost:4566"),
+        region_name=os.getenv("AWS_DEFAULT_REGION", "us-east-1"),
+        aws_access_key_id='test',
+        aws_secret_access_key='test'
+    )
+
+
+def _error_code(error: Exception) -> Optional[str]:
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code")
+    return getattr(error, "error_code", None)
+
+
+class CheckpointStore:
+    """Sequence number of the last processed record, per consumer, stream and shard."""
+
+    def get_all(self, name: str, stream_name: str) -> Dict[str, str]:
+        """Shard ID -> checkpoint of every shard with one."""
+        raise NotImplementedError
+
+    def put(self, name: str, stream_name: str, shard_id: str, sequence_number: str):
+        raise NotImplementedError
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    """Checkpoints kept for the life of the process."""
+
+    def __init__(self):
+        self.checkpoints: Dict[Tuple[str, str], Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def get_all(self, name: str, stream_name: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self.checkpoints.get((name, stream_name), {}))
+
+    def put(self, name: str, stream_name: str, shard_id: str, sequence_number: str):
+        with self._lock:
+            self.checkpoints.setdefault((name, stream_name), {})[shard_id] = sequence_number
+
+
+class FileCheckpointStore(MemoryCheckpointStore):
+    """Checkpoints in a local JSON file, rewritten atomically on every put."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        if os.path.exists(path):
+            with open(path) as f:
+                for key, shards in json.load(f).items():
+                    name, _, stream_name = key.partition("/")
+                    self.checkpoints[(name, stream_name)] = shards
+
+    def put(self, name: str, stream_name: str, shard_id: str, sequence_number: str):
+        with self._lock:
+            self.checkpoints.setdefault((name, stream_name), {})[shard_id] = sequence_number
+            data = {f"{name}/{stream_name}": shards for (name, stream_name), shards in self.checkpoints.items()}
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w") as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(temporary, self.path)
+
+
+class DynamoCheckpointStore(CheckpointStore):
+    """
+    Checkpoints in a DynamoDB table keyed on k = "{name}#{stream}" and the
+    shard ID (see infrastructure/main.tf).
+    """
+
+    def __init__(self, client=None, table_name: str = CHECKPOINT_TABLE):
+        if client is None:
+            from src.utils.player_metrics import create_dynamodb_client
+            client = create_dynamodb_client(10)
+        self.client = client
+        self.table_name = table_name
+
+    def get_all(self, name: str, stream_name: str) -> Dict[str, str]:
+        checkpoints, kwargs = {}, {}
+        while True:
+            response = self.client.query(
+                TableName=self.table_name,
+                KeyConditionExpression="k = :k",
+                ExpressionAttributeValues={":k": {"S": f"{name}#{stream_name}"}},
+                **kwargs
+            )
+            for item in response["Items"]:
+                checkpoints[item["shard_id"]["S"]] = item["sequence_number"]["S"]
+            if "LastEvaluatedKey" not in response:
+                return checkpoints
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def put(self, name: str, stream_name: str, shard_id: str, sequence_number: str):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "k": {"S": f"{name}#{stream_name}"},
+                "shard_id": {"S": shard_id},
+                "sequence_number": {"S": sequence_number},
+                "updated_at": {"S": datetime.utcnow().isoformat()}
+            }
+        )
+
+
+class RecordBatch:
+    """Records read from one shard in one GetRecords call or subscription event."""
+
+    def __init__(self, stream_name: str, shard_id: str, records: List[Dict[str, Any]],
+                 millis_behind_latest: Optional[int]):
+        self.stream_name = stream_name
+        self.shard_id = shard_id
+        self.records = records
+        self.millis_behind_latest = millis_behind_latest
+
+    def payloads(self) -> Iterator[Tuple[str, bytes]]:
+        """(partition key, data) of every user record, KPL aggregates unpacked."""
+        for record in self.records:
+            yield from deaggregate(record["Data"], record["PartitionKey"])
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+class StreamConsumer:
+    """
+    Reads every shard of a stream into `callback(batch: RecordBatch)`.
+
+    The callback runs on the shard's reader thread, so batches of different
+    shards are processed concurrently; it must be thread safe. An exception
+    from the callback stops that shard's reader without checkpointing the
+    batch, and the shard is retried on the next shard sync.
+
+    initial_position applies to shards without a checkpoint: "LATEST",
+    "TRIM_HORIZON" or a datetime (AT_TIMESTAMP). Children of shards read to
+    their end always start at TRIM_HORIZON. mode is "poll", "subscribe"
+    (enhanced fan-out through efo_consumer_name, registered if missing) or
+    "auto", which subscribes if the consumer can be set up and polls
+    otherwise.
+    """
+
+    def __init__(self, stream_name: str, callback: Callable[[RecordBatch], Any],
+                 name: str = "consumer", client=None, checkpoints: Optional[CheckpointStore] = None,
+                 initial_position: Union[str, datetime] = "LATEST", mode: str = "auto",
+                 efo_consumer_name: Optional[str] = None, batch_limit: int = 1000,
+                 min_poll_interval: float = MIN_POLL_INTERVAL, max_poll_interval: float = MAX_POLL_INTERVAL,
+                 checkpoint_interval: float = 5.0, shard_sync_interval: float = SHARD_SYNC_INTERVAL):
+        if mode not in ("auto", "poll", "subscribe"):
+            raise ValueError(f"Unknown consumer mode {mode!r}")
+        self.stream_name = stream_name
+        self.callback = callback
+        self.name = name
+        self.client = client or create_kinesis_client()
+        self.checkpoints = checkpoints or MemoryCheckpointStore()
+        self.initial_position = initial_position
+        self.mode = mode
+        self.efo_consumer_name = efo_consumer_name or f"{stream_name}-consumer"
+        self.batch_limit = batch_limit
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.shard_sync_interval = shard_sync_interval
+
+        self.consumer_arn: Optional[str] = None
+        # Shard ID -> sequence number of the last delivered record
+        self.positions: Dict[str, str] = {}
+        # Shard ID -> MillisBehindLatest of its last read
+        self.lag: Dict[str, int] = {}
+        self._finished: Set[str] = set()
+        # Finished by reading to the end, as opposed to skipped at LATEST
+        self._read_to_end: Set[str] = set()
+        self._readers: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sync = threading.Event()
+        self._coordinator: Optional[threading.Thread] = None
+
+    # Lifecycle
+
+    def start(self):
+        """Set up the read mode and start reading in background threads."""
+        if self.mode != "poll":
+            try:
+                self.consumer_arn = self._register_consumer()
+            except Exception as e:
+                if self.mode == "subscribe":
+                    raise
+                logger.info("Enhanced fan-out unavailable for %s (%s), polling", self.stream_name, e)
+        self._stop.clear()
+        self._coordinator = threading.Thread(target=self._coordinate, name=f"{self.stream_name}-shards",
+                                             daemon=True)
+        self._coordinator.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop reading and checkpoint what was delivered."""
+        self._stop.set()
+        self._sync.set()
+        if self._coordinator is not None:
+            self._coordinator.join(timeout)
+        for reader in list(self._readers.values()):
+            reader.join(timeout)
+
+    def run_forever(self):
+        self.start()
+        try:
+            while self._coordinator.is_alive():
+                self._coordinator.join(1)
+        finally:
+            self.stop()
+
+    @property
+    def reading(self) -> List[str]:
+        """IDs of the shards being read."""
+        with self._lock:
+            return sorted(self._readers)
+
+    def _register_consumer(self) -> str:
+        stream_arn = self.client.describe_stream_summary(
+            StreamName=self.stream_name)["StreamDescriptionSummary"]["StreamARN"]
+        try:
+            consumer = self.client.describe_stream_consumer(
+                StreamARN=stream_arn, ConsumerName=self.efo_consumer_name)["ConsumerDescription"]
+        except ClientError as e:
+            if _error_code(e) != "ResourceNotFoundException":
+                raise
+            consumer = self.client.register_stream_consumer(
+                StreamARN=stream_arn, ConsumerName=self.efo_consumer_name)["Consumer"]
+        for _ in range(60):
+            if consumer["ConsumerStatus"] == "ACTIVE":
+                return consumer["ConsumerARN"]
+            time.sleep(1)
+            consumer = self.client.describe_stream_consumer(ConsumerARN=consumer["ConsumerARN"])["ConsumerDescription"]
+        raise TimeoutError(f"Consumer {self.efo_consumer_name} did not become active")
+
+    # Shard discovery and lineage
+
+    def _list_shards(self) -> List[Dict[str, Any]]:
+        response = self.client.list_shards(StreamName=self.stream_name)
+        shards = response["Shards"]
+        while response.get("NextToken"):
+            response = self.client.list_shards(NextToken=response["NextToken"])
+            shards.extend(response["Shards"])
+        return shards
+
+    def _coordinate(self):
+        while not self._stop.is_set():
+            try:
+                self._sync_shards()
+            except Exception:
+                logger.exception("Shard sync of %s failed", self.stream_name)
+            self._sync.wait(self.shard_sync_interval)
+            self._sync.clear()
+
+    def _sync_shards(self):
+        """Start readers for shards that can be read and are not."""
+        shards = self._list_shards()
+        checkpoints = self.checkpoints.get_all(self.name, self.stream_name)
+        listed = {shard["ShardId"] for shard in shards}
+        with self._lock:
+            for shard_id, sequence_number in checkpoints.items():
+                if sequence_number == SHARD_END:
+                    self._finished.add(shard_id)
+                    self._read_to_end.add(shard_id)
+
+            # Skipping a closed shard can make its children readable, so
+            # repeat until a pass skips nothing
+            skipped = True
+            while skipped:
+                skipped = False
+                for shard in shards:
+                    shard_id = shard["ShardId"]
+                    if shard_id in self._finished or shard_id in self._readers:
+                        continue
+                    parents = [shard.get(key) for key in ("ParentShardId", "AdjacentParentShardId")]
+                    # Parents past the retention period are no longer listed
+                    parents = [parent for parent in parents if parent in listed]
+                    if any(parent not in self._finished for parent in parents):
+                        continue
+
+                    position = self.positions.get(shard_id) or checkpoints.get(shard_id)
+                    if position is not None:
+                        start = ("AFTER_SEQUENCE_NUMBER", position)
+                    elif any(parent in self._read_to_end for parent in parents):
+                        start = ("TRIM_HORIZON", None)
+                    elif (self.initial_position == "LATEST"
+                          and "EndingSequenceNumber" in shard["SequenceNumberRange"]):
+                        # A closed shard has nothing after LATEST
+                        self._finished.add(shard_id)
+                        skipped = True
+                        continue
+                    elif isinstance(self.initial_position, datetime):
+                        start = ("AT_TIMESTAMP", self.initial_position)
+                    else:
+                        start = (self.initial_position, None)
+
+                    reader = threading.Thread(target=self._read_shard, args=(shard_id, start),
+                                              name=f"{self.stream_name}-{shard_id}", daemon=True)
+                    self._readers[shard_id] = reader
+                    reader.start()
+
+    # Reading
+
+    def _read_shard(self, shard_id: str, start: Tuple[str, Any]):
+        finished = False
+        try:
+            if self.consumer_arn is not None:
+                finished = self._subscribe(shard_id, start)
+            else:
+                finished = self._poll(shard_id, start)
+        except Exception:
+            logger.exception("Reader of %s/%s failed", self.stream_name, shard_id)
+        finally:
+            # Checkpoint while still listed as a reader, so stop() waits for it
+            if finished:
+                self._checkpoint(shard_id, SHARD_END)
+            elif shard_id in self.positions:
+                self._checkpoint(shard_id, self.positions[shard_id])
+            with self._lock:
+                del self._readers[shard_id]
+                if finished:
+                    self._finished.add(shard_id)
+                    self._read_to_end.add(shard_id)
+            if finished:
+                # Start the children now rather than on the next sync
+                self._sync.set()
+
+    def _deliver(self, shard_id: str, records: List[Dict[str, Any]], millis_behind: Optional[int]):
+        if millis_behind is not None:
+            self.lag[shard_id] = millis_behind
+        position = self.positions.get(shard_id)
+        if records and position is not None and int(records[0]["SequenceNumber"]) <= int(position):
+            # A renewed subscription can start at the last delivered record
+            records = [record for record in records if int(record["SequenceNumber"]) > int(position)]
+        if not records:
+            return
+        self.callback(RecordBatch(self.stream_name, shard_id, records, millis_behind))
+        self.positions[shard_id] = records[-1]["SequenceNumber"]
+
+    def _checkpoint(self, shard_id: str, sequence_number: str):
+        try:
+            self.checkpoints.put(self.name, self.stream_name, shard_id, sequence_number)
+        except Exception:
+            logger.exception("Checkpoint of %s/%s failed", self.stream_name, shard_id)
+
+    def _iterator(self, shard_id: str, start: Tuple[str, Any]) -> str:
+        kind, value = start
+        kwargs = {"StreamName": self.stream_name, "ShardId": shard_id, "ShardIteratorType": kind}
+        if kind == "AT_TIMESTAMP":
+            kwargs["Timestamp"] = value
+        elif value is not None:
+            kwargs["StartingSequenceNumber"] = value
+        return self.client.get_shard_iterator(**kwargs)["ShardIterator"]
+
+    def _poll(self, shard_id: str, start: Tuple[str, Any]) -> bool:
+        """Read a shard with GetRecords; returns True at the shard's end."""
+        iterator = self._iterator(shard_id, start)
+        interval = self.min_poll_interval
+        last_checkpoint = time.monotonic()
+        while not self._stop.is_set():
+            called = time.monotonic()
+            try:
+                response = self.client.get_records(ShardIterator=iterator, Limit=self.batch_limit)
+            except Exception as e:
+                code = _error_code(e)
+                if code == "ExpiredIteratorException":
+                    position = self.positions.get(shard_id)
+                    iterator = self._iterator(shard_id, ("AFTER_SEQUENCE_NUMBER", position) if position else start)
+                    continue
+                if code != "ProvisionedThroughputExceededException":
+                    raise
+                interval = min(interval * 2, self.max_poll_interval)
+                self._stop.wait(interval)
+                continue
+
+            records = response["Records"]
+            self._deliver(shard_id, records, response.get("MillisBehindLatest"))
+            if records and time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                self._checkpoint(shard_id, self.positions[shard_id])
+                last_checkpoint = time.monotonic()
+            iterator = response.get("NextShardIterator")
+            if iterator is None:
+                return True
+
+            if records:
+                interval = self.min_poll_interval
+            else:
+                interval = min(interval * 2, self.max_poll_interval)
+            if records and response.get("MillisBehindLatest"):
+                # Behind: read again as soon as the per-shard rate allows
+                delay = self.min_poll_interval - (time.monotonic() - called)
+            else:
+                delay = interval - (time.monotonic() - called)
+            if delay > 0:
+                self._stop.wait(delay)
+        return False
+
+    def _subscribe(self, shard_id: str, start: Tuple[str, Any]) -> bool:
+        """Read a shard with SubscribeToShard; returns True at the shard's end."""
+        kind, value = start
+        position = {"Type": kind}
+        if kind == "AT_TIMESTAMP":
+            position["Timestamp"] = value
+        elif value is not None:
+            position["SequenceNumber"] = value
+        last_checkpoint = time.monotonic()
+        while not self._stop.is_set():
+            # A subscription lasts 5 minutes; renew it where the last one left off
+            try:
+                response = self.client.subscribe_to_shard(
+                    ConsumerARN=self.consumer_arn, ShardId=shard_id, StartingPosition=position)
+            except Exception as e:
+                if _error_code(e) not in ("ResourceInUseException", "LimitExceededException"):
+                    raise
+                # The previous subscription has not been released yet
+                self._stop.wait(1)
+                continue
+            stream = response["EventStream"]
+            try:
+                for event in stream:
+                    shard_event = event.get("SubscribeToShardEvent")
+                    if shard_event is None:
+                        continue
+                    records = shard_event["Records"]
+                    self._deliver(shard_id, records, shard_event.get("MillisBehindLatest"))
+                    if records and time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                        self._checkpoint(shard_id, self.positions[shard_id])
+                        last_checkpoint = time.monotonic()
+                    continuation = shard_event.get("ContinuationSequenceNumber")
+                    if continuation is None:
+                        return True
+                    position = {"Type": "AT_SEQUENCE_NUMBER", "SequenceNumber": continuation}
+                    if self._stop.is_set():
+                        break
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+        return False
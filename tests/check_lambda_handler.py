@@ -0,0 +1,200 @@
+"""
+Checks the Lambda ingest handler of src/api/lambda_handler.py.
+
+First its responses: API Gateway proxy events in payload formats 1.0 and
+2.0, some with a stage in the path, carrying single events, JSON, NDJSON
+and base64-encoded compact batches and bad requests, must get the status
+codes and bodies the FastAPI app gives for the same requests, and put the
+same records on the stream, also while every put is throttled. The Kinesis
+client must be created once and reused.
+
+Then its cold start, in fresh interpreters (benchmarks/cold_start.py):
+importing the handler must not load FastAPI, Prometheus or botocore,
+creating the client must not load boto3, and the import, the first
+invocation and the whole cold start must stay within their budgets, the
+import also relative to that of the FastAPI app on the same machine.
+
+    python -m tests.check_lambda_handler
+    python -m tests.check_lambda_handler --runs 5 --cold-start-budget-ms 500
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.cold_start import APP, cold_start, import_seconds
+from benchmarks.stubs import StubKinesisClient
+from benchmarks.suite import synthetic_events
+from src.models import codec
+from src.models.base import game_event_adapter
+
+# Budgets for a fresh interpreter on a developer machine or CI runner
+IMPORT_BUDGET_MS = 400
+FIRST_INVOCATION_BUDGET_MS = 50
+COLD_START_BUDGET_MS = 800
+# The handler's import as a share of the FastAPI app's
+MAX_IMPORT_SHARE = 0.5
+
+NOT_IMPORTED = ("fastapi", "starlette", "prometheus_client", "uvicorn", "boto3", "botocore",
+                "src.api.main", "src.api.metrics", "src.api.producer", "src.api.aggregator")
+
+
+def proxy_event(version: str, path: str, body: bytes, content_type: str, method: str = "POST") -> Dict[str, Any]:
+    """An API Gateway proxy event; binary content types arrive base64-encoded."""
+    binary = content_type.startswith("application/vnd.")
+    payload = base64.b64encode(body).decode() if binary else body.decode()
+    if version == "2.0":
+        return {"version": "2.0", "rawPath": path, "requestContext": {"http": {"method": method, "path": path}},
+                "headers": {"content-type": content_type}, "body": payload, "isBase64Encoded": binary}
+    return {"httpMethod": method, "path": path, "headers": {"Content-Type": content_type},
+            "body": payload, "isBase64Encoded": binary}
+
+
+def requests() -> List[Tuple[str, str, bytes, str]]:
+    """(payload version, path as API Gateway passes it, body, content type)."""
+    events = synthetic_events(40)
+    by_type = {event["event_type"]: event for event in events}
+    invalid = dict(by_type["progress"], player_id=None)
+    models = [game_event_adapter.validate_python(event) for event in events[:10]]
+    return [
+        ("1.0", "/events/game-start", json.dumps(by_type["game_start"]).encode(), "application/json"),
+        ("2.0", "/prod/events/purchase", json.dumps(by_type["purchase"]).encode(), "application/json; charset=utf-8"),
+        ("1.0", "/events/progress", json.dumps(invalid).encode(), "application/json"),
+        ("1.0", "/events/game-end", json.dumps(by_type["game_start"]).encode(), "application/json"),
+        ("1.0", "/events/level-up", json.dumps(by_type["game_start"]).encode(), "application/json"),
+        ("1.0", "/events/game-end", codec.encode(game_event_adapter.validate_python(by_type["game_end"])),
+         codec.CONTENT_TYPE),
+        ("2.0", "/prod/events/batch", json.dumps(events[:20] + [invalid]).encode(), "application/json"),
+        ("1.0", "/events/batch", "\n".join(json.dumps(event) for event in events[20:]).encode(),
+         "application/x-ndjson"),
+        ("2.0", "/events/batch", codec.encode_batch(models), codec.BATCH_CONTENT_TYPE),
+        ("1.0", "/events/batch", b'{"events": []}', "application/json"),
+    ]
+
+
+def written(stub: StubKinesisClient) -> List[Tuple[str, Dict[str, Any]]]:
+    """The stub's records without the ingest time, which differs between the two."""
+    records = []
+    for record in stub.records:
+        data = record["Data"]
+        event = codec.decode_fields(data) if codec.is_compact(data) else json.loads(data)
+        event.pop("server_timestamp", None)
+        records.append((record["PartitionKey"], event))
+    return records
+
+
+async def app_responses(cases, stub: StubKinesisClient) -> List[Tuple[int, Any, Any]]:
+    from src.api import main
+    from src.api.aggregator import RecordAggregator
+    from src.api.producer import KinesisProducer
+
+    main.producer = KinesisProducer(client=stub, max_workers=4)
+    main.aggregator = RecordAggregator(main.producer, main.STREAM_NAME, linger_ms=1)
+    await main.aggregator.start()
+    responses = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://check") as client:
+        for _, path, body, content_type in cases:
+            response = await client.post(path[path.index("/events/"):], content=body,
+                                         headers={"Content-Type": content_type})
+            responses.append((response.status_code, response.json(), response.headers.get("retry-after")))
+    await main.aggregator.close()
+    main.producer.close()
+    return responses
+
+
+def handler_responses(cases, stub: StubKinesisClient) -> List[Tuple[int, Any, Any]]:
+    from src.api import lambda_handler
+
+    lambda_handler._client = stub
+    responses = []
+    for version, path, body, content_type in cases:
+        response = lambda_handler.handler(proxy_event(version, path, body, content_type))
+        responses.append((response["statusCode"], json.loads(response["body"]), response["headers"].get("Retry-After")))
+    return responses
+
+
+def check_responses() -> List[str]:
+    from src.api import lambda_handler
+
+    failures = []
+    cases = requests()
+    for failure_rate in (0.0, 1.0):
+        app_stub = StubKinesisClient(latency=0, failure_rate=failure_rate, seed=1)
+        handler_stub = StubKinesisClient(latency=0, failure_rate=failure_rate, seed=1)
+        expected = asyncio.run(app_responses(cases, app_stub))
+        actual = handler_responses(cases, handler_stub)
+        for (version, path, _, content_type), app, handler in zip(cases, expected, actual):
+            if app != handler:
+                failures.append(f"{path} ({content_type}, payload {version}, failure rate {failure_rate}): "
+                                f"app {str(app)[:300]} != handler {str(handler)[:300]}")
+        if written(app_stub) != written(handler_stub):
+            failures.append(f"records on the stream differ at failure rate {failure_rate}: "
+                            f"{len(app_stub.records)} from the app, {len(handler_stub.records)} from the handler")
+        if failure_rate == 0 and not handler_stub.records:
+            failures.append("the handler put no records")
+
+    for event, status in ((proxy_event("1.0", "/events/batch", b"[]", "application/json", method="GET"), 405),
+                          (proxy_event("2.0", "/prod/health", b"", "application/json"), 404)):
+        response = lambda_handler.handler(event)
+        if response["statusCode"] != status:
+            failures.append(f"{event.get('path') or event['rawPath']}: {response['statusCode']} instead of {status}")
+
+    lambda_handler._client = None
+    client = lambda_handler.get_client()
+    if lambda_handler.get_client() is not client:
+        failures.append("the Kinesis client is not reused")
+    if not failures:
+        print(f"responses: {len(cases)} requests match the FastAPI app, with and without throttling; "
+              f"client reused: OK")
+    return failures
+
+
+def check_cold_start(args) -> List[str]:
+    failures = []
+    timings, run = cold_start(args.runs)
+    app_seconds = import_seconds(APP, args.runs)
+    loaded = [module for module in NOT_IMPORTED if module in run["after_import"]]
+    if loaded:
+        failures.append(f"importing the handler loads {', '.join(loaded)}")
+    if "boto3" in run["after_client"]:
+        failures.append("creating the Kinesis client loads boto3")
+    budgets = (("import", args.import_budget_ms), ("first_event", args.first_invocation_budget_ms),
+               ("cold_start", args.cold_start_budget_ms))
+    for name, budget_ms in budgets:
+        if timings[name] * 1000 > budget_ms:
+            failures.append(f"{name} takes {timings[name] * 1000:.0f} ms, over its {budget_ms:g} ms budget")
+    share = timings["import"] / app_seconds
+    if share > MAX_IMPORT_SHARE:
+        failures.append(f"the handler's import takes {share:.0%} of the FastAPI app's, over {MAX_IMPORT_SHARE:.0%}")
+    print(f"cold start: import {timings['import'] * 1000:.0f} ms ({share:.0%} of the app's "
+          f"{app_seconds * 1000:.0f} ms), client {timings['client'] * 1000:.0f} ms, first invocation "
+          f"{timings['first_event'] * 1000:.1f} ms, {timings['cold_start'] * 1000:.0f} ms in all "
+          f"(budget {args.cold_start_budget_ms:g} ms): {'OK' if not failures else 'FAILED'}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per cold start measurement")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--first-invocation-budget-ms", type=float, default=FIRST_INVOCATION_BUDGET_MS)
+    parser.add_argument("--cold-start-budget-ms", type=float, default=COLD_START_BUDGET_MS)
+    args = parser.parse_args()
+
+    # The app in this process must not drop the resent requests of the second pass
+    os.environ["DEDUP_ENABLED"] = "false"
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    failures = check_responses()
+    failures += check_cold_start(args)
+    for failure in failures[:20]:
+        print(f"  {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Checks the late event corrections of src/processors/rollup_updater.py.
+
+Generates sessions where most events are on time, some arrive hours late
+and some a day or more late, past the arrival partitions a lake sync reads.
+Events within the allowed lateness reach the rollups as the 5-minute
+records the Flink metrics emit; the rest are written as the late-events
+output (JSON lines per event hour, with a hidden in-progress file that
+must be ignored). All events also go to the lake by arrival hour. One
+correction pass must then make every rollup row equal the metrics computed
+from all events, a second must find nothing to do, and a lake sync of
+every arrival hour afterwards must keep the corrections. A late file in an
+hour whose arrivals are not all compacted must wait.
+
+    python -m tests.check_late_events
+    python -m tests.check_late_events --sessions 5000 --very-late 0.05
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from src.processors.compaction import MANIFEST_PREFIX, partition_path
+from src.processors.rollup_updater import correct_late_events, late_events_path, sync_lake
+from src.utils.game_rollups import GameRollups, MemoryRollupTable, bucket_start
+from src.utils.storage import LocalStorage
+from tests.check_rollups import differences, expected_rollups, generate, metric_records, write_lake
+
+ALLOWED_LATENESS = timedelta(minutes=60)
+
+
+def write_late_events(storage: LocalStorage, events):
+    """Write events as the stream processor's late_events sink does, one file per event hour."""
+    hours = defaultdict(list)
+    for event, arrival in events:
+        hours[bucket_start(datetime.fromisoformat(event["timestamp"]), "hour")].append(
+            json.dumps(dict(event, event_watermark=(arrival - timedelta(seconds=5)).isoformat(timespec="milliseconds"))))
+    for hour, lines in hours.items():
+        storage.write(f"{late_events_path(hour)}part-{uuid.uuid4()}-0", "\n".join(lines).encode())
+        # Not yet committed by a checkpoint; a copy would double count
+        storage.write(f"{late_events_path(hour)}.part-{uuid.uuid4()}-1.inprogress", lines[0].encode())
+
+
+def compare(rollups: GameRollups, expected) -> int:
+    failures = 0
+    for (game_id, granularity, bucket), metrics in sorted(expected.items()):
+        actual = rollups.table.get(game_id, granularity, bucket)
+        if actual is None:
+            print(f"missing {game_id} {granularity} {bucket}")
+            failures += 1
+            continue
+        for name, a, e in differences(actual, metrics):
+            print(f"{game_id} {granularity} {bucket:%Y-%m-%d %H}: {name} {a} != {e}")
+            failures += 1
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=3000)
+    parser.add_argument("--late", type=float, default=0.05, help="Fraction of events arriving hours late")
+    parser.add_argument("--very-late", type=float, default=0.02, help="Fraction arriving 26 to 40 hours late")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+
+    events = []
+    for event, arrival in generate(args.sessions, args.late, rng):
+        if rng.random() < args.very_late:
+            arrival = datetime.fromisoformat(event["timestamp"]) + timedelta(hours=rng.uniform(26, 40))
+        events.append((event, arrival))
+    within = [(event, arrival) for event, arrival in events
+              if arrival - datetime.fromisoformat(event["timestamp"]) < ALLOWED_LATENESS]
+    beyond = [(event, arrival) for event, arrival in events
+              if arrival - datetime.fromisoformat(event["timestamp"]) >= ALLOWED_LATENESS]
+
+    rollups = GameRollups(MemoryRollupTable())
+    for source, record in metric_records([event for event, _ in within]):
+        rollups.apply_record(source, record)
+    rollups.flush()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as root:
+        storage = write_lake(root, events)
+        first = min(bucket_start(arrival, "hour") for _, arrival in events) - timedelta(hours=1)
+        last = max(bucket_start(arrival, "hour") for _, arrival in events)
+        arrivals = [first + timedelta(hours=i) for i in range(int((last - first).total_seconds() // 3600) + 1)]
+        # Compaction writes a manifest for every hour, with events or not
+        for hour in arrivals:
+            storage.write(f"{MANIFEST_PREFIX}{partition_path(hour)}manifest.json",
+                          b'{"compacted_at": "2024-02-03T00:00:00"}')
+        write_late_events(storage, beyond)
+        now = last + timedelta(hours=1)
+
+        started = time.perf_counter()
+        hours, late_events = correct_late_events(root, rollups, storage=storage, now=now)
+        elapsed = time.perf_counter() - started
+        failures += compare(rollups, expected_rollups([event for event, _ in events]))
+        if correct_late_events(root, rollups, storage=storage, now=now) != (0, 0):
+            print("a second correction found files to apply")
+            failures += 1
+
+        sync_lake(root, rollups, arrivals, storage=storage)
+        after_sync = compare(rollups, expected_rollups([event for event, _ in events]))
+        if after_sync:
+            print("the lake sync lost corrections")
+        failures += after_sync
+
+        # A new late file for an hour one of whose arrival hours is not compacted
+        event, _ = beyond[0]
+        hour = bucket_start(datetime.fromisoformat(event["timestamp"]), "hour")
+        storage.delete(f"{MANIFEST_PREFIX}{partition_path(hour + timedelta(hours=3))}manifest.json")
+        storage.write(f"{late_events_path(hour)}part-{uuid.uuid4()}-0", json.dumps(event).encode())
+        if correct_late_events(root, rollups, storage=storage, now=now) != (0, 0):
+            print("an hour was corrected before its arrivals were compacted")
+            failures += 1
+
+    very_late = sum(1 for event, arrival in beyond
+                    if arrival - datetime.fromisoformat(event["timestamp"]) > timedelta(hours=25))
+    print(f"{len(events):,} events, {len(beyond):,} beyond the allowed lateness ({very_late:,} past the lake sync): "
+          f"corrected {hours} event hours with {late_events:,} late events in {elapsed:.2f} s: "
+          f"{'OK' if not failures else f'{failures} mismatches'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Checks the bounded replay source of src/processors/replay.py.
+
+Generates sessions of events with some arriving hours late, archives them
+as the pipeline does (raw Firehose objects and the compacted Parquet lake,
+both partitioned by arrival hour, plus a local JSON lines file) and replays
+a range of event hours from each. Every event of the range must be written
+exactly once, in event time order within its chunk file, and as the JSON
+row the compaction job archives for it (nested state as a JSON string, as
+the STRING column of game_events reads it).
+
+    python -m tests.check_replay
+    python -m tests.check_replay --sessions 20000 --chunk-hours 6
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from src.models.base import game_event_adapter
+from src.processors.compaction import RAW_PREFIX, SCHEMAS, partition_path, to_row
+from src.processors.replay import to_json_line, write_replay
+from src.utils.game_rollups import bucket_start
+from src.utils.storage import LocalStorage
+from tests.check_rollups import START, generate, write_lake
+
+
+def write_raw(root: str, events):
+    """Write events as gzipped Firehose objects, one per arrival hour."""
+    storage = LocalStorage(root)
+    hours = defaultdict(list)
+    for event, arrival in events:
+        hours[bucket_start(arrival, "hour")].append(json.dumps(event))
+    for hour, lines in hours.items():
+        storage.write(f"{RAW_PREFIX}{partition_path(hour)}game-events-{hour:%Y%m%d%H}.gz",
+                      gzip.compress("\n".join(lines).encode()))
+
+
+def archived_row(event):
+    """The JSON line the replay should write for an event."""
+    model = game_event_adapter.validate_python(event)
+    return json.loads(to_json_line(to_row(model, SCHEMAS[model.event_type])))
+
+
+def check(source: str, location: str, events, start: datetime, end: datetime, chunk_hours: int):
+    expected = {event["event_id"]: event for event, _ in events
+                if start <= datetime.fromisoformat(event["timestamp"]) < end}
+    with tempfile.TemporaryDirectory() as output:
+        started = time.perf_counter()
+        result = write_replay(location, source, start, end, output, chunk_hours=chunk_hours)
+        elapsed = time.perf_counter() - started
+
+        failures, seen = [], defaultdict(int)
+        for path in result["files"]:
+            chunk_start = datetime.strptime(os.path.basename(path), "events-%Y%m%dT%H.json")
+            previous = None
+            with open(path) as f:
+                for line in f:
+                    row = json.loads(line)
+                    timestamp = datetime.fromisoformat(row["timestamp"])
+                    if not chunk_start <= timestamp < chunk_start + timedelta(hours=chunk_hours):
+                        failures.append(f"{row['event_id']} at {timestamp} in {os.path.basename(path)}")
+                    if previous is not None and timestamp < previous:
+                        failures.append(f"{os.path.basename(path)} out of order at {row['event_id']}")
+                    previous = timestamp
+                    seen[row["event_id"]] += 1
+                    original = expected.get(row["event_id"])
+                    if original is None:
+                        failures.append(f"{row['event_id']} at {timestamp} is outside the range")
+                    elif row != archived_row(original):
+                        failures.append(f"{row['event_id']} differs from the archived event")
+
+    missing = set(expected) - set(seen)
+    if missing:
+        failures.append(f"{len(missing)} events missing, e.g. {sorted(missing)[:3]}")
+    duplicated = [event_id for event_id, count in seen.items() if count > 1]
+    if duplicated:
+        failures.append(f"{len(duplicated)} events written more than once")
+
+    print(f"{source:<10} {result['events']:,} of {len(expected):,} events in {len(result['files'])} files, "
+          f"{elapsed:.2f} s: {'OK' if not failures else 'FAILED'}")
+    for failure in failures[:10]:
+        print(f"  {failure}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=3000)
+    parser.add_argument("--late", type=float, default=0.05, help="Fraction of events arriving hours late")
+    parser.add_argument("--chunk-hours", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+
+    events = generate(args.sessions, args.late, rng)
+    # A range that starts and ends inside the archive, so late arrivals
+    # into and out of it are both exercised
+    start, end = START + timedelta(hours=13), START + timedelta(days=2, hours=7)
+    with tempfile.TemporaryDirectory() as root:
+        write_lake(os.path.join(root, "processed"), events)
+        write_raw(os.path.join(root, "raw"), events)
+        path = os.path.join(root, "events.jsonl")
+        with open(path, "w") as f:
+            f.writelines(json.dumps(event) + "\n" for event, _ in events)
+
+        ok = all([
+            check("processed", os.path.join(root, "processed"), events, start, end, args.chunk_hours),
+            check("raw", os.path.join(root, "raw"), events, start, end, args.chunk_hours),
+            check("file", path, events, start, end, args.chunk_hours),
+        ])
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Runs a replay of src/processors/stream_processor.py and checks its metrics.
+
+Generates sessions of events, some resent and some resumed after more than
+SESSION_GAP_MINUTES (or exactly that, which Flink still counts as the same
+session), writes them to a local JSON lines file and replays the range
+with --source file and --sink-dir, so the batch job runs on a local Flink
+mini cluster. Every window record of session_metrics, player_activity and
+revenue_metrics must equal the one computed in Python from the events
+without their resent copies, sketches byte for byte, and every
+player_sessions record the session the gap rule gives. Needs apache-flink
+and a JVM.
+
+    python -m tests.check_replay_job
+    python -m tests.check_replay_job --sessions 2000 --resumed 0.2
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from src.processors import stream_processor as sp
+from src.processors.sketches import DDSketch
+from tests.check_rollups import DAYS, START, generate, metric_records
+from tests.test_data_generator import generate_progress_event
+
+WINDOW_METRICS = ("session_metrics", "player_activity", "revenue_metrics")
+GAP = timedelta(minutes=sp.SESSION_GAP_MINUTES)
+
+
+def resume(events, share: float, rng: random.Random):
+    """A progress event after some sessions' last one: most past the gap, some exactly at it."""
+    last = {}
+    for event, _ in events:
+        key = (event["session_id"], event["game_id"], event["player_id"])
+        last[key] = max(last.get(key, event["timestamp"]), event["timestamp"])
+    resumed = []
+    for (session_id, game_id, player_id), timestamp in sorted(last.items()):
+        if rng.random() < share:
+            event = generate_progress_event(player_id, session_id, game_id)
+            after = GAP if rng.random() < 0.25 else GAP + timedelta(minutes=rng.randint(1, 90))
+            event["timestamp"] = (datetime.fromisoformat(timestamp) + after).isoformat()
+            resumed.append(event)
+    return resumed
+
+
+def expected_sessions(events):
+    """player_sessions records by (session_id, session_start), by the gap rule of the batch query."""
+    by_key = defaultdict(list)
+    for event in events:
+        by_key[(event["session_id"], event["game_id"], event["player_id"])].append(event)
+    sessions = {}
+    for (session_id, game_id, player_id), key_events in by_key.items():
+        key_events.sort(key=lambda event: event["timestamp"])
+        groups = []
+        for event in key_events:
+            timestamp = datetime.fromisoformat(event["timestamp"])
+            if groups and timestamp <= groups[-1][-1][0] + GAP:
+                groups[-1].append((timestamp, event))
+            else:
+                groups.append([(timestamp, event)])
+        for group in groups:
+            types = [event["event_type"] for _, event in group]
+            start, end = group[0][0], group[-1][0]
+            sessions[(session_id, start)] = {
+                "game_id": game_id, "player_id": player_id, "session_end": end, "event_count": len(group),
+                "started": "game_start" in types, "completed": "game_end" in types,
+                "purchase_count": types.count("purchase"),
+                "revenue": sum(event["amount"] for _, event in group if event["event_type"] == "purchase"),
+                "progress_events": types.count("progress"), "closed_at": end + GAP
+            }
+    return sessions
+
+
+def read_sink(sink_dir: str, table: str):
+    """The JSON records the replay wrote for a table."""
+    records = []
+    for root, _, names in os.walk(os.path.join(sink_dir, table)):
+        for name in names:
+            if name.startswith((".", "_")):
+                continue
+            with open(os.path.join(root, name)) as f:
+                records += [json.loads(line) for line in f if line.strip()]
+    return records
+
+
+def sink_time(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def differs(actual, expected) -> bool:
+    if isinstance(expected, float):
+        return actual is None or abs(actual - expected) > 1e-9 * max(1.0, abs(expected))
+    return actual != expected
+
+
+def check_windows(sink_dir: str, events):
+    failures = []
+    expected = {(source, record["game_id"], sink_time(record["window_start"])): record
+                for source, record in metric_records(events)}
+    for table in WINDOW_METRICS:
+        actual = {(table, record["game_id"], sink_time(record["window_start"])): record
+                  for record in read_sink(sink_dir, table)}
+        keys = {key for key in expected if key[0] == table}
+        failures += [f"{table}: no record for {key[1]} {key[2]}" for key in sorted(keys - actual.keys())]
+        failures += [f"{table}: unexpected record for {key[1]} {key[2]}" for key in sorted(actual.keys() - keys)]
+        for key in sorted(keys & actual.keys()):
+            record = actual[key]
+            for name, value in expected[key].items():
+                if name in ("window_start", "window_end"):
+                    value, record_value = sink_time(value), sink_time(record[name])
+                else:
+                    record_value = record.get(name)
+                if differs(record_value, value):
+                    failures.append(f"{table} {key[1]} {key[2]}: {name} {str(record_value)[:60]} != {str(value)[:60]}")
+            for name in ("duration_sketch", "amount_sketch"):
+                if name in expected[key]:
+                    sketch = DDSketch.from_bytes(base64.b64decode(expected[key][name]))
+                    p50 = record.get(name.replace("sketch", "p50"))
+                    if differs(p50, sketch.quantile(0.5)):
+                        failures.append(f"{table} {key[1]} {key[2]}: p50 {p50} != {sketch.quantile(0.5)}")
+    return failures, len(expected)
+
+
+def check_sessions(sink_dir: str, events):
+    failures = []
+    expected = expected_sessions(events)
+    actual = {(record["session_id"], sink_time(record["session_start"])): record
+              for record in read_sink(sink_dir, "player_sessions")}
+    failures += [f"player_sessions: no record for {key[0]} {key[1]}" for key in sorted(expected.keys() - actual.keys())]
+    failures += [f"player_sessions: unexpected record for {key[0]} {key[1]}"
+                 for key in sorted(actual.keys() - expected.keys())]
+    for key in sorted(expected.keys() & actual.keys()):
+        for name, value in expected[key].items():
+            record_value = actual[key][name]
+            if isinstance(value, datetime):
+                record_value = sink_time(record_value)
+            if differs(record_value, value):
+                failures.append(f"player_sessions {key[0]} {key[1]}: {name} {record_value} != {value}")
+    return failures, len(expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--resent", type=float, default=0.05, help="Fraction of events sent twice")
+    parser.add_argument("--resumed", type=float, default=0.1, help="Fraction of sessions resumed after the gap")
+    parser.add_argument("--seed", type=int, default=17)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+
+    start, end = START, START + timedelta(days=DAYS)
+    generated = generate(args.sessions, 0.0, rng)
+    sent = [event for event, _ in generated] + resume(generated, args.resumed, rng)
+    sent += [dict(event) for event in sent if rng.random() < args.resent]
+    rng.shuffle(sent)
+    # Resumed sessions can run past the end of the range, which the replay leaves out
+    events = list({event["event_id"]: event for event in sent
+                   if start <= datetime.fromisoformat(event["timestamp"]) < end}.values())
+
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "events.jsonl")
+        with open(path, "w") as f:
+            f.writelines(json.dumps(event) + "\n" for event in sent)
+        replay_args = argparse.Namespace(
+            source="file", location=path, start=start, end=end, chunk_hours=24,
+            late_hours=0, staging=os.path.join(root, "staging"), sink_dir=os.path.join(root, "metrics")
+        )
+        started = time.perf_counter()
+        sp.replay(replay_args)
+        elapsed = time.perf_counter() - started
+        failures, windows = check_windows(replay_args.sink_dir, events)
+        session_failures, sessions = check_sessions(replay_args.sink_dir, events)
+        failures += session_failures
+
+    print(f"replayed {len(sent):,} events ({len(sent) - len(events):,} resent or out of range) in {elapsed:.1f} s: "
+          f"{windows:,} window records and {sessions:,} sessions {'match' if not failures else 'FAILED'}")
+    for failure in failures[:20]:
+        print(f"  {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Checks the ingest spill log of src/api/spill.py against injected faults.
+
+First the log on its own: records survive a close and reopen, a torn
+record at the tail is dropped without losing those before it, and disk use
+stays within max_bytes, with segments reclaimed as they drain. Then the
+drainer under throttling: a hot key's records reach the stream in order,
+many to a PutRecords batch.
+
+Then the API in process, against a Kinesis stand-in (benchmarks/stubs.py)
+that goes down, then throttles, and writes the records of each PutRecords
+call in random order. Players send their events one after another while
+this happens, each slowly enough that its partition key is not salted.
+Every request must be answered 200 or 202, and once the drainer has
+emptied the log every accepted event must be on the stream, each player's
+in the order the API accepted them. The API is restarted halfway through
+the outage, so its successor drains what it left.
+
+    python -m tests.check_spill
+    python -m tests.check_spill --players 200 --outage 3 --fsync always
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.stubs import FaultyKinesisClient
+from src.api.spill import RECORD, SpillDrainer, SpillFullError, SpillLog
+from src.utils import kpl
+from tests.test_data_generator import generate_game_start_event, generate_progress_event
+
+SEGMENT_BYTES = 2 * 1024 * 1024 + 4096
+PATHS = {"game_start": "game-start", "progress": "progress"}
+
+
+def check_log(directory: str) -> list:
+    failures = []
+    records = [(json.dumps({"n": i}).encode(), f"player_{i % 7}", str(i) if i % 3 == 0 else None)
+               for i in range(5000)]
+    log = SpillLog(directory, segment_bytes=SEGMENT_BYTES, max_bytes=3 * SEGMENT_BYTES, fsync="never")
+    for data, key, hash_key in records:
+        log.append(data, key, hash_key)
+    log.close()
+
+    log = SpillLog(directory, segment_bytes=SEGMENT_BYTES, max_bytes=3 * SEGMENT_BYTES)
+    read = [(r.data, r.partition_key, r.explicit_hash_key) for r in log.read(log.drained, 10000)]
+    if log.pending != len(records) or read != records:
+        failures.append(f"reopened log has {log.pending} pending, read {len(read)} of {len(records)}")
+
+    # A torn record: the body without its header, then a header whose CRC does not match
+    end = log.read(log.drained, 10000)[-1].end
+    segment = log._segments[end[0]]
+    segment[end[1] + RECORD.size:end[1] + RECORD.size + 10] = b"x" * 10
+    RECORD.pack_into(segment, end[1], 10, 12345, 0, 0)
+    log.close()
+    log = SpillLog(directory, segment_bytes=SEGMENT_BYTES, max_bytes=3 * SEGMENT_BYTES)
+    if log.pending != len(records):
+        failures.append(f"torn tail: {log.pending} pending instead of {len(records)}")
+    log.append(b"after", "player_0")
+    log.close()
+    log = SpillLog(directory, segment_bytes=SEGMENT_BYTES, max_bytes=3 * SEGMENT_BYTES)
+    tail = log.read(log.drained, 10000)[-1]
+    if log.pending != len(records) + 1 or tail.data != b"after":
+        failures.append("records appended over a torn one are not read back")
+
+    # Bounded disk: fill to max_bytes, then drain and reuse
+    big = b"x" * 100000
+    try:
+        for _ in range(100):
+            log.append(big, "player_0")
+        failures.append("a full log accepted more records")
+    except SpillFullError:
+        pass
+    if log.disk_bytes > 3 * SEGMENT_BYTES:
+        failures.append(f"log takes {log.disk_bytes} bytes, over its bound")
+    pending = log.read(log.drained, 100000)
+    log.commit(pending[-1].end, len(pending))
+    if log.pending or len(log._segments) != 1:
+        failures.append(f"drained log has {log.pending} pending in {len(log._segments)} segments")
+    log.append(big, "player_0")
+    log.close()
+    if not failures:
+        print("log: reopen, torn tail and disk bound OK")
+    return failures
+
+
+async def check_drain(directory: str) -> list:
+    """A hot key drains in order, many records per batch, through throttling and reordering."""
+    from src.api.producer import KinesisProducer
+
+    failures = []
+    log = SpillLog(directory, segment_bytes=SEGMENT_BYTES, max_bytes=3 * SEGMENT_BYTES, fsync="never")
+    sent = defaultdict(list)
+    for i in range(6000):
+        key = "player_hot" if i % 3 else f"player_{i % 50}"
+        data = json.dumps({"n": i, "key": key, "pad": "x" * 200}).encode()
+        log.append(data, key)
+        sent[key].append(i)
+    stub = FaultyKinesisClient(seed=3)
+    stub.throttle(3600, 0.3)
+    producer = KinesisProducer(client=stub, max_workers=4)
+    drainer = SpillDrainer(log, producer, "spill-check")
+    batches = 0
+    while log.pending and batches < 1000:
+        await drainer.drain_once()
+        batches += 1
+    producer.close()
+    log.close()
+
+    written = defaultdict(list)
+    for record in stub.records:
+        for key, data in kpl.deaggregate(record["Data"], record["PartitionKey"]):
+            written[key].append(json.loads(data)["n"])
+    for key, numbers in sent.items():
+        if list(dict.fromkeys(written[key])) != numbers:
+            failures.append(f"{key}: drained {len(written[key])} of {len(numbers)} or out of order")
+    if log.pending:
+        failures.append(f"{log.pending} records left after {batches} batches")
+    # 4,000 hot records at about 200 per aggregated record, each failing 30% of the time
+    if batches > 40:
+        failures.append(f"drained in {batches} batches; a hot key is still sent one record at a time")
+    if not failures:
+        print(f"drain: a hot key's 4,000 records in order in {batches} batches under throttling OK")
+    return failures
+
+
+def start_api(stub: FaultyKinesisClient, directory: str, fsync: str):
+    from src.api import main
+    from src.api.aggregator import RecordAggregator
+    from src.api.producer import KinesisProducer
+
+    main.producer = KinesisProducer(client=stub, max_workers=8)
+    main.aggregator = RecordAggregator(main.producer, main.STREAM_NAME, linger_ms=2)
+    main.spill_log = SpillLog(directory, fsync=fsync)
+    main.drainer = SpillDrainer(main.spill_log, main.producer, main.STREAM_NAME)
+    return main
+
+
+async def stop_api(main):
+    await main.aggregator.close()
+    await main.drainer.close()
+    main.spill_log.close()
+    main.producer.close()
+
+
+async def run_api(args, directory: str) -> list:
+    stub = FaultyKinesisClient(latency=0.002, seed=args.seed)
+    main = start_api(stub, directory, args.fsync)
+    await main.aggregator.start()
+    await main.drainer.start()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://check")
+
+    accepted = defaultdict(list)
+    statuses = defaultdict(int)
+    latencies = defaultdict(list)
+    deadline = time.monotonic() + args.seconds
+
+    async def player(number: int):
+        player_id, session_id = f"player_{number:05d}", f"session_{number:05d}"
+        event = generate_game_start_event(player_id, session_id)
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = await client.post(f"/events/{PATHS[event['event_type']]}", json=event)
+            latencies[response.status_code].append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+            if response.status_code in (200, 202):
+                accepted[player_id].append(event["event_id"])
+            event = generate_progress_event(player_id, session_id, event["game_id"])
+            await asyncio.sleep(args.interval)
+
+    async def faults():
+        await asyncio.sleep(0.5)
+        stub.outage(args.outage)
+        await asyncio.sleep(args.outage / 2)
+        # Restart the API mid-outage: its successor takes over the log
+        await main.drainer.close()
+        main.spill_log.close()
+        main.spill_log = SpillLog(directory, fsync=args.fsync)
+        main.drainer = SpillDrainer(main.spill_log, main.producer, main.STREAM_NAME)
+        await main.drainer.start()
+        await asyncio.sleep(args.outage / 2)
+        stub.throttle(1.0, 0.5)
+
+    await asyncio.gather(faults(), *(player(i) for i in range(args.players)))
+    spilled = main.spill_log.pending
+    started = time.monotonic()
+    while main.spill_log.pending and time.monotonic() - started < 30:
+        await asyncio.sleep(0.05)
+    drain_seconds = time.monotonic() - started
+    await client.aclose()
+    disk_bytes = main.spill_log.disk_bytes
+    await stop_api(main)
+
+    failures = []
+    if set(statuses) - {200, 202}:
+        failures.append(f"responses other than 200/202: {dict(statuses)}")
+    if not statuses[202]:
+        failures.append("no event was spilled")
+    if main.spill_log.pending:
+        failures.append(f"{main.spill_log.pending} events left in the log")
+    if disk_bytes > main.spill_log.segment_bytes:
+        failures.append(f"drained log still takes {disk_bytes} bytes")
+
+    written = defaultdict(list)
+    for record in stub.records:
+        for _, data in kpl.deaggregate(record["Data"], record["PartitionKey"]):
+            event = json.loads(data)
+            written[event["player_id"]].append(event["event_id"])
+    copies = 0
+    for player_id, event_ids in accepted.items():
+        first_seen = list(dict.fromkeys(written[player_id]))
+        copies += len(written[player_id]) - len(first_seen)
+        if first_seen != event_ids:
+            missing = len(set(event_ids) - set(first_seen))
+            failures.append(f"{player_id}: {missing} missing or out of order of {len(event_ids)}")
+
+    quantiles = {status: sorted(values) for status, values in latencies.items()}
+    summary = ", ".join(f"{statuses[s]:,} x {s} (p50 {q[len(q) // 2] * 1000:.1f} ms, "
+                        f"p99 {q[int(len(q) * 0.99)] * 1000:.1f} ms)" for s, q in sorted(quantiles.items()))
+    print(f"api: {summary}; {spilled:,} left to drain after the run, drained in {drain_seconds:.2f} s; "
+          f"{sum(map(len, accepted.values())):,} events on the stream in per-player order "
+          f"({copies} resent copies): {'OK' if not failures else 'FAILED'}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=4.0, help="How long players send events")
+    parser.add_argument("--outage", type=float, default=2.0, help="Seconds Kinesis is down")
+    parser.add_argument("--interval", type=float, default=0.01, help="Seconds between a player's events")
+    parser.add_argument("--fsync", choices=("always", "interval", "never"), default="interval")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        failures = check_log(os.path.join(directory, "log"))
+        failures += asyncio.run(check_drain(os.path.join(directory, "drain")))
+        failures += asyncio.run(run_api(args, os.path.join(directory, "api")))
+    for failure in failures[:20]:
+        print(f"  {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Checks StreamConsumer against an in-memory stream that is resharded while
+it is read.
+
+Writes numbered records for a set of partition keys to a two-shard stream
+(benchmarks/stubs.py) while a consumer reads it, splits one shard and
+merges the other with a child of the split, and restarts the consumer
+halfway from its checkpoint file. Every record must be delivered, and the
+records of each partition key in the order they were written. Runs once
+with polling and once with enhanced fan-out subscriptions.
+
+    python -m tests.check_stream_consumer
+    python -m tests.check_stream_consumer --records 20000 --keys 500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.stubs import StubKinesisStream
+from src.api.partitioning import HASH_KEY_SPACE
+from src.utils.stream_consumer import SHARD_END, FileCheckpointStore, StreamConsumer
+
+
+def produce(stream: StubKinesisStream, records: int, keys: int, batch: int, halfway: threading.Event):
+    """Write records in batches, resharding at a third and two thirds of the way."""
+    counters = defaultdict(int)
+    for start in range(0, records, batch):
+        entries = []
+        for i in range(start, min(start + batch, records)):
+            key = f"player_{i * 7919 % keys}"
+            entries.append({"PartitionKey": key, "Data": json.dumps({"key": key, "n": counters[key]}).encode()})
+            counters[key] += 1
+        stream.put_records(StreamName=stream.stream_name, Records=entries)
+        if start <= records // 3 < start + batch:
+            first, second = sorted(stream.open_shards())
+            stream.split_shard(StreamName=stream.stream_name, ShardToSplit=first,
+                               NewStartingHashKey=str(HASH_KEY_SPACE // 4))
+        if start <= 2 * records // 3 < start + batch:
+            # The upper child of the split is adjacent to the second shard
+            ranges = {shard["ShardId"]: shard["HashKeyRange"] for shard in stream.list_shards()["Shards"]
+                      if shard["ShardId"] in stream.open_shards()}
+            upper = next(shard_id for shard_id, hash_range in ranges.items()
+                         if int(hash_range["EndingHashKey"]) + 1 == int(ranges[second]["StartingHashKey"]))
+            stream.merge_shards(StreamName=stream.stream_name, ShardToMerge=upper, AdjacentShardToMerge=second)
+        if start <= records // 2 < start + batch:
+            halfway.set()
+        time.sleep(0.002)
+    return counters
+
+
+def run(mode: str, records: int, keys: int, batch: int):
+    stream = StubKinesisStream(subscription_events=20, heartbeat=0.05)
+    delivered = defaultdict(list)
+    lock = threading.Lock()
+
+    def handle(batch):
+        with lock:
+            for _, data in batch.payloads():
+                record = json.loads(data)
+                delivered[record["key"]].append(record["n"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "checkpoints.json")
+
+        def consumer():
+            return StreamConsumer(stream.stream_name, handle, name="check", client=stream, mode=mode,
+                                  checkpoints=FileCheckpointStore(path), initial_position="TRIM_HORIZON",
+                                  min_poll_interval=0.01, max_poll_interval=0.05, checkpoint_interval=0.1,
+                                  shard_sync_interval=0.5)
+
+        halfway = threading.Event()
+        started = time.perf_counter()
+        first = consumer()
+        first.start()
+        result = {}
+        producer = threading.Thread(target=lambda: result.update(produce(stream, records, keys, batch, halfway)))
+        producer.start()
+        halfway.wait()
+        first.stop()
+        second = consumer()
+        second.start()
+        producer.join()
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            with lock:
+                if sum(len(set(values)) for values in delivered.values()) >= records:
+                    break
+            time.sleep(0.05)
+        second.stop()
+        elapsed = time.perf_counter() - started
+        checkpoints = FileCheckpointStore(path).get_all("check", stream.stream_name)
+
+    failures = []
+    for key, count in result.items():
+        values = delivered.get(key, [])
+        firsts = list(dict.fromkeys(values))
+        if sorted(set(values)) != list(range(count)):
+            failures.append(f"{key}: delivered {len(set(values))} of {count} records")
+        elif firsts != list(range(count)):
+            failures.append(f"{key}: out of order {firsts[:10]}...")
+    shards = stream.list_shards()["Shards"]
+    closed = [shard["ShardId"] for shard in shards if "EndingSequenceNumber" in shard["SequenceNumberRange"]]
+    if any(checkpoints.get(shard_id) != SHARD_END for shard_id in closed):
+        failures.append(f"closed shards not checkpointed at their end: {checkpoints}")
+
+    duplicates = sum(len(values) - len(set(values)) for values in delivered.values())
+    print(f"{mode:<10} {records:,} records, {len(shards)} shards ({len(closed)} closed), "
+          f"{duplicates} redelivered, {elapsed:.1f} s: {'OK' if not failures else 'FAILED'}")
+    for failure in failures[:10]:
+        print(f"  {failure}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=6000)
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+    ok = all([run(mode, args.records, args.keys, args.batch) for mode in ("poll", "subscribe")])
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
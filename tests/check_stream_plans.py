@@ -0,0 +1,137 @@
+"""
+Checks that Flink can plan every metric of src/processors/stream_processor.py.
+
+Builds the streaming job as main() does, for JSON and compact streams, with
+the Kinesis source read from a datagen table and every sink written to a
+blackhole, and EXPLAINs each registered metric on its own and then the
+whole StatementSet, which must read game-events-stream once. Then builds
+the batch job of a replay over an empty staging directory and EXPLAINs the
+batch form of every metric the same way. Nothing is executed, so a query
+Flink cannot plan (an unsupported window, EMIT setting or aggregate
+function mix) fails here rather than on submit; tests/check_replay_job.py
+runs the replay. Needs apache-flink and a JVM.
+
+    python -m tests.check_stream_plans
+    python -m tests.check_stream_plans --verbose
+"""
+import argparse
+import re
+import sys
+import tempfile
+from typing import List
+
+from src.processors import stream_processor as sp
+
+
+def datagen_ddl(ddl: str) -> str:
+    """A Kinesis source DDL rewritten to generate its rows."""
+    return re.sub(r"WITH \((.|\n)*\)", "WITH ('connector' = 'datagen')", ddl)
+
+
+def blackhole_ddl(ddl: str) -> str:
+    """A sink DDL rewritten to discard its rows."""
+    ddl = re.sub(r"PARTITIONED BY \([^)]*\)", "", ddl)
+    return re.sub(r"WITH \((.|\n)*\)", "WITH ('connector' = 'blackhole')", ddl)
+
+
+class OfflineTableEnvironment:
+    """Passes everything to a table environment, with Kinesis tables replaced."""
+
+    def __init__(self, t_env):
+        self.t_env = t_env
+
+    def __getattr__(self, name):
+        return getattr(self.t_env, name)
+
+    def execute_sql(self, statement: str):
+        if "'kinesis'" in statement:
+            statement = datagen_ddl(statement)
+        elif "'upsert-kinesis'" in statement or "'filesystem'" in statement:
+            statement = blackhole_ddl(statement)
+        return self.t_env.execute_sql(statement)
+
+
+def error_summary(error: Exception) -> str:
+    """The innermost cause of a Flink error, which names what is unsupported."""
+    causes = [line.strip() for line in str(error).splitlines() if "Exception:" in line]
+    return causes[-1] if causes else str(error).splitlines()[0]
+
+
+def check_streaming(stream_format: str, verbose: bool) -> List[str]:
+    failures = []
+    t_env = OfflineTableEnvironment(sp.create_table_environment())
+    sp.register_functions(t_env)
+    if stream_format == "compact":
+        sp.create_compact_source_table(t_env)
+    else:
+        sp.create_source_table(t_env)
+    sp.create_dedup_view(t_env)
+    sp.create_metric_events_view(t_env)
+    sp.create_sink_tables(t_env)
+
+    outputs = list(sp.METRICS.items()) + list(sp.STREAMING_OUTPUTS.items())
+    for sink_table, (_, query) in outputs:
+        try:
+            plan = t_env.explain_sql(query)
+        except Exception as e:
+            failures.append(f"{stream_format}: {sink_table}: {error_summary(e)}")
+            continue
+        if verbose:
+            print(f"-- {stream_format}: {sink_table}\n{plan}")
+
+    if not failures:
+        plan = sp.create_analytics(t_env).explain()
+        optimized = plan.split("== Optimized Execution Plan ==")[-1]
+        scans = len(re.findall(r"TableSourceScan\(table=\[\[[^\]]*game_events_(?:json|raw)\]", optimized))
+        if scans != 1:
+            failures.append(f"{stream_format}: the job reads game-events-stream {scans} times")
+    print(f"streaming, {stream_format} records: {len(outputs)} outputs "
+          f"{'planned as one job' if not failures else 'FAILED'}")
+    return failures
+
+
+def check_batch(verbose: bool) -> List[str]:
+    failures = []
+    t_env = sp.create_batch_table_environment()
+    sp.register_batch_functions(t_env)
+    with tempfile.TemporaryDirectory() as staging:
+        sp.create_replay_source_table(t_env, staging)
+        sp.create_dedup_view(t_env, order_by="`timestamp`")
+        sp.create_metric_events_view(t_env, streaming=False)
+        for sink_ddl, _ in sp.METRICS.values():
+            t_env.execute_sql(blackhole_ddl(sink_ddl))
+
+        for sink_table, (_, query) in sp.METRICS.items():
+            try:
+                plan = t_env.explain_sql(sp.BATCH_QUERIES.get(sink_table, query))
+            except Exception as e:
+                failures.append(f"batch: {sink_table}: {error_summary(e)}")
+                continue
+            if verbose:
+                print(f"-- batch: {sink_table}\n{plan}")
+
+        if not failures:
+            try:
+                sp.create_analytics(t_env, streaming=False).explain()
+            except Exception as e:
+                failures.append(f"batch: {error_summary(e)}")
+    print(f"batch replay: {len(sp.METRICS)} metrics {'planned as one job' if not failures else 'FAILED'}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="Print the plan of every metric")
+    args = parser.parse_args()
+
+    failures = []
+    for stream_format in ("json", "compact"):
+        failures += check_streaming(stream_format, args.verbose)
+    failures += check_batch(args.verbose)
+    for failure in failures:
+        print(f"  {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -28,7 +28,10 @@ def create_localstack_resources():
     streams = [
         "game-events-stream",
         "session-metrics",
-        "revenue-metrics"
+        "revenue-metrics",
+        "player-activity",
+        "player-sessions",
+        "event-lateness"
     ]
     
     for stream_name in streams:
@@ -54,6 +57,57 @@ def create_localstack_resources():
         except s3.exceptions.BucketAlreadyExists:
             print(f"Bucket {bucket_name} already exists")
     
+    print("\nCreating DynamoDB tables...")
+    dynamodb = boto3.client(
+        'dynamodb',
+        endpoint_url=endpoint_url,
+        region_name='us-east-1',
+        aws_access_key_id='test',
+        aws_secret_access_key='test'
+    )
+    try:
+        dynamodb.create_table(
+            TableName="player-metrics",
+            KeySchema=[{"AttributeName": "p", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "p", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        print("Created DynamoDB table: player-metrics")
+    except dynamodb.exceptions.ResourceInUseException:
+        print("Table player-metrics already exists")
+    try:
+        dynamodb.create_table(
+            TableName="game-rollups",
+            KeySchema=[
+                {"AttributeName": "k", "KeyType": "HASH"},
+                {"AttributeName": "b", "KeyType": "RANGE"}
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "k", "AttributeType": "S"},
+                {"AttributeName": "b", "AttributeType": "S"}
+            ],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        print("Created DynamoDB table: game-rollups")
+    except dynamodb.exceptions.ResourceInUseException:
+        print("Table game-rollups already exists")
+    try:
+        dynamodb.create_table(
+            TableName="stream-checkpoints",
+            KeySchema=[
+                {"AttributeName": "k", "KeyType": "HASH"},
+                {"AttributeName": "shard_id", "KeyType": "RANGE"}
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "k", "AttributeType": "S"},
+                {"AttributeName": "shard_id", "AttributeType": "S"}
+            ],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        print("Created DynamoDB table: stream-checkpoints")
+    except dynamodb.exceptions.ResourceInUseException:
+        print("Table stream-checkpoints already exists")
+    
     print("\nWaiting for streams to become active...")
     time.sleep(3)
     
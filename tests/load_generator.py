@@ -0,0 +1,409 @@
+"""
+Load generator for the ingest API.
+
+Replaces the sequential session simulation in tests/test_data_generator.py
+for capacity planning. Each worker process runs an asyncio loop posting over
+a set of keep-alive HTTP/1.1 connections on an open-loop schedule: request i is due
+at start + i / rate whether or not earlier requests have finished, and its
+latency is measured from that due time, so a slow server shows up as
+latency instead of quietly lowering the offered load (coordinated
+omission). Players are drawn from a population with Zipf skew, and event
+types from a weighted mix; each player's events share a session between its
+game_start and game_end.
+
+Latencies go into a DDSketch per worker (1% relative error), merged for the
+report of achieved throughput, status codes, percentiles and a histogram.
+
+    python -m tests.load_generator --url http://localhost:8000 --rate 2000 --duration 60
+    python -m tests.load_generator --rate 20000 --processes 4 --batch-size 50 --players 1000000 --zipf 1.2
+    python -m tests.load_generator --output events.jsonl.gz --events 1000000
+
+With --output, events are written as JSON lines (gzip for .gz) as fast as
+they can be generated, for offline benchmarks of the processing code.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from src.processors.sketches import DDSketch
+from tests.test_data_generator import (
+    generate_game_start_event,
+    generate_game_end_event,
+    generate_purchase_event,
+    generate_progress_event
+)
+
+DEFAULT_MIX = {"game_start": 1.0, "progress": 4.0, "purchase": 0.3, "game_end": 1.0}
+
+# event_type -> path of POST /events/{event_type}
+EVENT_PATHS = {
+    "game_start": "game-start",
+    "game_end": "game-end",
+    "purchase": "purchase",
+    "progress": "progress"
+}
+
+SAMPLE_BLOCK = 4096
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class ZipfPopulation:
+    """
+    Player ranks 0..size-1 drawn with probability proportional to
+    1 / (rank + 1) ** exponent; exponent 0 is uniform.
+    """
+
+    def __init__(self, size: int, exponent: float, rng: np.random.Generator):
+        weights = 1.0 / np.arange(1, size + 1, dtype=np.float64) ** exponent
+        self.cdf = np.cumsum(weights)
+        self.cdf /= self.cdf[-1]
+        self.rng = rng
+
+    def sample(self, n: int) -> np.ndarray:
+        return np.searchsorted(self.cdf, self.rng.random(n), side="right")
+
+
+class EventSource:
+    """
+    Endless stream of events for a slice of the player population.
+
+    Worker w of n owns players whose ID is rank * n + w, so sessions stay
+    consistent within one process and the slices together keep the skew.
+    """
+
+    def __init__(self, players: int, zipf: float, mix: Dict[str, float], seed: int,
+                 worker: int = 0, workers: int = 1):
+        rng = np.random.default_rng(seed)
+        random.seed(seed)
+        self.population = ZipfPopulation(max(players // workers, 1), zipf, rng)
+        self.event_types = list(mix)
+        weights = np.array([mix[event_type] for event_type in self.event_types], dtype=np.float64)
+        self.type_cdf = np.cumsum(weights / weights.sum())
+        self.rng = rng
+        self.worker, self.workers = worker, workers
+        self.sessions: Dict[str, tuple] = {}
+        self._players: List[int] = []
+        self._types: List[int] = []
+
+    def _refill(self):
+        self._players = self.population.sample(SAMPLE_BLOCK).tolist()
+        self._types = np.searchsorted(self.type_cdf, self.rng.random(SAMPLE_BLOCK), side="right").tolist()
+
+    def next_event(self) -> Dict[str, Any]:
+        if not self._players:
+            self._refill()
+        player_id = f"player_{self._players.pop() * self.workers + self.worker:08d}"
+        event_type = self.event_types[min(self._types.pop(), len(self.event_types) - 1)]
+
+        # A player without a session is taken to be mid-session already
+        session = self.sessions.get(player_id)
+        if event_type == "game_start" or session is None:
+            start = generate_game_start_event(player_id, f"session_{uuid.uuid4().hex[:12]}")
+            session = self.sessions[player_id] = (start["session_id"], start["game_id"])
+            if event_type == "game_start":
+                return start
+        session_id, game_id = session
+        if event_type == "game_end":
+            del self.sessions[player_id]
+            return generate_game_end_event(player_id, session_id, game_id)
+        if event_type == "purchase":
+            return generate_purchase_event(player_id, session_id, game_id)
+        return generate_progress_event(player_id, session_id, game_id)
+
+
+def write_events(path: str, count: int, source: EventSource) -> float:
+    """Write `count` events as JSON lines; returns the seconds taken."""
+    started = time.perf_counter()
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wt") as f:
+        for _ in range(count):
+            f.write(json.dumps(source.next_event(), separators=(",", ":")))
+            f.write("\n")
+    return time.perf_counter() - started
+
+
+class HTTPConnection:
+    """
+    A minimal HTTP/1.1 keep-alive connection.
+
+    The load generator's own overhead has to stay well below the server's,
+    and a general-purpose client's pool bookkeeping costs more per request
+    than a small API call; this writes the request and reads the status and
+    body, reconnecting after errors or Connection: close.
+    """
+
+    def __init__(self, url: str, timeout: float):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl = parts.scheme == "https"
+        self.host_header = parts.netloc.encode()
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def post(self, path: str, body: bytes) -> int:
+        try:
+            return await asyncio.wait_for(self._post(path, body), self.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _post(self, path: str, body: bytes) -> int:
+        if self.writer is None:
+            await self._connect()
+        self.writer.write(
+            b"POST " + path.encode() + b" HTTP/1.1\r\nHost: " + self.host_header +
+            b"\r\nContent-Type: application/json\r\nContent-Length: " + str(len(body)).encode() +
+            b"\r\n\r\n" + body
+        )
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by server")
+        status = int(status_line.split(b" ", 2)[1])
+        length, chunked, close = 0, False, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.partition(b":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == b"content-length":
+                length = int(value)
+            elif name == b"transfer-encoding":
+                chunked = b"chunked" in value
+            elif name == b"connection":
+                close = value == b"close"
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length:
+            await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status
+
+
+async def run_worker(url: str, rate: float, duration: float, batch_size: int, connections: int,
+                     max_in_flight: int, timeout: float, source: EventSource) -> Dict[str, Any]:
+    """
+    Send `rate` events/s for `duration` seconds on an open-loop schedule.
+    With batch_size > 1 events go to /events/batch, rate / batch_size
+    requests per second.
+    """
+    request_rate = rate / batch_size
+    total = int(request_rate * duration)
+    latency = DDSketch()
+    statuses: Counter = Counter()
+    errors: Counter = Counter()
+    state = {"dropped": 0, "events_ok": 0, "max_lag": 0.0}
+    # Due requests wait here for a free connection; the wait counts as latency
+    queue: asyncio.Queue = asyncio.Queue()
+    in_flight = [0]
+
+    async def connection_loop():
+        connection = HTTPConnection(url, timeout)
+        while True:
+            request = await queue.get()
+            if request is None:
+                connection.close()
+                return
+            due, path, body, events = request
+            try:
+                status = await connection.post(path, body)
+                statuses[status] += 1
+                if status < 300:
+                    state["events_ok"] += events
+            except (OSError, asyncio.TimeoutError, ValueError, asyncio.IncompleteReadError) as e:
+                errors[type(e).__name__] += 1
+            # Measured from when the request was due, not when it was sent
+            latency.add((time.perf_counter() - due) * 1000)
+            in_flight[0] -= 1
+
+    workers = [asyncio.create_task(connection_loop()) for _ in range(connections)]
+    started = time.perf_counter()
+    for i in range(total):
+        due = started + i / request_rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            state["max_lag"] = max(state["max_lag"], -delay)
+            # Behind schedule: still let responses be processed
+            await asyncio.sleep(0)
+        if in_flight[0] >= max_in_flight:
+            # Still counted as offered load, never silently postponed
+            state["dropped"] += 1
+            continue
+        if batch_size > 1:
+            events = [source.next_event() for _ in range(batch_size)]
+            path, body = "/events/batch", json.dumps(events).encode()
+        else:
+            event = source.next_event()
+            path, body = f"/events/{EVENT_PATHS[event['event_type']]}", json.dumps(event).encode()
+        in_flight[0] += 1
+        queue.put_nowait((due, path, body, batch_size))
+    for _ in workers:
+        queue.put_nowait(None)
+    await asyncio.gather(*workers)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "dropped": state["dropped"],
+        "events_ok": state["events_ok"],
+        "elapsed": elapsed,
+        "max_lag": state["max_lag"],
+        "statuses": dict(statuses),
+        "errors": dict(errors),
+        "latency": latency.to_bytes(),
+    }
+
+
+def _worker(args: Dict[str, Any]) -> Dict[str, Any]:
+    source = EventSource(args["players"], args["zipf"], args["mix"], args["seed"] + args["worker"],
+                         args["worker"], args["workers"])
+    return asyncio.run(run_worker(args["url"], args["rate"], args["duration"], args["batch_size"],
+                                  args["connections"], args["max_in_flight"], args["timeout"], source))
+
+
+def histogram(sketch: DDSketch) -> List[tuple]:
+    """(upper bound ms, count) in power-of-two bands."""
+    bands: Counter = Counter()
+    for value, count in sketch.bins():
+        bands[2 ** max(math.ceil(math.log2(max(value, 1e-3))), -3)] += count
+    return sorted(bands.items())
+
+
+def summarize(results: List[Dict[str, Any]], rate: float, batch_size: int) -> Dict[str, Any]:
+    latency = DDSketch.merge_all(result["latency"] for result in results) or DDSketch()
+    elapsed = max(result["elapsed"] for result in results)
+    statuses: Counter = Counter()
+    errors: Counter = Counter()
+    for result in results:
+        statuses.update(result["statuses"])
+        errors.update(result["errors"])
+    requests = sum(result["requests"] for result in results)
+    return {
+        "target_events_per_second": rate,
+        "batch_size": batch_size,
+        "requests": requests,
+        "dropped": sum(result["dropped"] for result in results),
+        "events_accepted": sum(result["events_ok"] for result in results),
+        "achieved_events_per_second": sum(result["events_ok"] for result in results) / elapsed,
+        "achieved_requests_per_second": (requests - sum(r["dropped"] for r in results)) / elapsed,
+        "elapsed_seconds": elapsed,
+        "max_schedule_lag_ms": max(result["max_lag"] for result in results) * 1000,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "errors": dict(errors),
+        "latency_ms": dict(
+            {f"p{q * 100:g}": latency.quantile(q) for q in PERCENTILES},
+            mean=latency.mean, max=latency.max if latency.count else None
+        ),
+        "histogram_ms": histogram(latency),
+    }
+
+
+def print_summary(summary: Dict[str, Any]):
+    print(f"offered {summary['target_events_per_second']:,.0f} events/s "
+          f"({summary['requests']:,} requests of {summary['batch_size']}), "
+          f"accepted {summary['achieved_events_per_second']:,.0f} events/s over {summary['elapsed_seconds']:.1f} s")
+    print(f"statuses {summary['statuses']}  errors {summary['errors'] or 0}  "
+          f"dropped at the in-flight limit {summary['dropped']:,}")
+    if summary["max_schedule_lag_ms"] > 10:
+        print(f"warning: the generator fell up to {summary['max_schedule_lag_ms']:.0f} ms behind schedule; "
+              f"add --processes for this rate")
+    latency = summary["latency_ms"]
+    print("latency ms: " + "  ".join(f"{name} {value:.1f}" for name, value in latency.items() if value is not None))
+    total = sum(count for _, count in summary["histogram_ms"]) or 1
+    for bound, count in summary["histogram_ms"]:
+        print(f"  <= {bound:>8g} ms {count:>10,} {'#' * max(1, round(50 * count / total))}")
+
+
+def _mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        event_type, _, weight = part.partition("=")
+        if event_type not in EVENT_PATHS:
+            raise argparse.ArgumentTypeError(f"unknown event type {event_type!r}")
+        mix[event_type] = float(weight)
+    return mix
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rate", type=float, default=1000, help="Target events per second (all processes)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to send for")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--connections", type=int, default=64, help="Keep-alive connections per process")
+    parser.add_argument("--max-in-flight", type=int, default=10000, help="Per process; more are counted as dropped")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--batch-size", type=int, default=1, help="Events per POST /events/batch (1: single events)")
+    parser.add_argument("--players", type=int, default=100000, help="Player population")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of player activity (0: uniform)")
+    parser.add_argument("--mix", type=_mix, default=DEFAULT_MIX,
+                        help="Event type weights, e.g. game_start=1,progress=4,purchase=0.3,game_end=1")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write events to this file (JSON lines) instead of sending them")
+    parser.add_argument("--events", type=int, default=100000, help="Events to write with --output")
+    parser.add_argument("--report", help="Also write the summary as JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.output:
+        source = EventSource(args.players, args.zipf, args.mix, args.seed)
+        elapsed = write_events(args.output, args.events, source)
+        print(f"wrote {args.events:,} events to {args.output} in {elapsed:.1f} s "
+              f"({args.events / elapsed:,.0f} events/s)")
+        return
+
+    worker_args = [
+        dict(url=args.url, rate=args.rate / args.processes, duration=args.duration, batch_size=args.batch_size,
+             connections=args.connections, max_in_flight=args.max_in_flight, timeout=args.timeout,
+             players=args.players, zipf=args.zipf, mix=args.mix, seed=args.seed,
+             worker=worker, workers=args.processes)
+        for worker in range(args.processes)
+    ]
+    print(f"{datetime.utcnow():%H:%M:%S} sending {args.rate:,.0f} events/s to {args.url} "
+          f"for {args.duration:g} s from {args.processes} process(es)")
+    if args.processes == 1:
+        results = [_worker(worker_args[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=args.processes) as executor:
+            results = list(executor.map(_worker, worker_args))
+
+    summary = summarize(results, args.rate, args.batch_size)
+    print_summary(summary)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(summary, f, indent=2)
+    if not summary["events_accepted"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,117 @@
-import boto3
+"""
+Prints the records arriving on the Kinesis streams.
+
+Every shard of each stream is read concurrently with StreamConsumer
+(src/utils/stream_consumer.py), through the stream's enhanced fan-out
+consumer where it can be set up and by adaptive polling otherwise, and
+shards created by a reshard are picked up as their parents end.
+
+    python -m tests.monitor_streams
+    python -m tests.monitor_streams --streams game-events-stream --summary
+    python -m tests.monitor_streams --from-start --checkpoints monitor-checkpoints.json
+"""
+import argparse
 import json
+import threading
 import time
 from datetime import datetime
-from threading import Thread
-
-def get_kinesis_client():
-    """Create a Kinesis client for LocalStack."""
-    return boto3.client(
-        'kinesis',
-        endpoint_url='http://localhost:4566',
-        region_name='us-east-1',
-        aws_access_key_id='test',
-        aws_secret_access_key='test'
-    )
-
-def monitor_stream(stream_name):
-    """Monitor a Kinesis stream and print received records."""
-    kinesis = get_kinesis_client()
-    
-    try:
-        # Get shard iterator
-        response = kinesis.describe_stream(StreamName=stream_name)
-        shard_id = response['StreamDescription']['Shards'][0]['ShardId']
-        
-        iterator_response = kinesis.get_shard_iterator(
-            StreamName=stream_name,
-            ShardId=shard_id,
-            ShardIteratorType='LATEST'
-        )
-        shard_iterator = iterator_response['ShardIterator']
-        
-        print(f"\nStarted monitoring {stream_name}")
-        
-        while True:
-            response = kinesis.get_records(
-                ShardIterator=shard_iterator,
-                Limit=100
-            )
-            
-            for record in response['Records']:
-                try:
-                    data = json.loads(record['Data'].decode())
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    print(f"\n[{timestamp}] {stream_name} received:")
-                    print(json.dumps(data, indent=2))
-                except Exception as e:
-                    print(f"Error processing record: {e}")
-            
-            shard_iterator = response['NextShardIterator']
-            time.sleep(1)  # Avoid hitting rate limits
-            
-    except Exception as e:
-        print(f"Error monitoring {stream_name}: {e}")
+
+from src.models.codec import decode_record
+from src.utils.stream_consumer import (
+    DynamoCheckpointStore,
+    FileCheckpointStore,
+    MemoryCheckpointStore,
+    RecordBatch,
+    StreamConsumer
+)
+
+STREAMS = [
+    "game-events-stream",
+    "session-metrics",
+    "revenue-metrics",
+    "player-activity",
+    "player-sessions",
+    "event-lateness"
+]
+
+# Enhanced fan-out consumers created by infrastructure/main.tf
+EFO_CONSUMERS = {
+    "game-events-stream": "game-events-consumer",
+    "session-metrics": "session-metrics-consumer",
+    "revenue-metrics": "revenue-metrics-consumer",
+    "player-activity": "player-activity-consumer",
+    "player-sessions": "player-sessions-consumer",
+    "event-lateness": "event-lateness-consumer"
+}
+
+print_lock = threading.Lock()
+
+
+def print_records(batch: RecordBatch):
+    """Print every record of a batch."""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    lines = []
+    for _, payload in batch.payloads():
+        try:
+            data = decode_record(payload)
+        except Exception as e:
+            lines.append(f"Error processing record: {e}")
+            continue
+        lines.append(f"\n[{timestamp}] {batch.stream_name} {batch.shard_id} received:\n{json.dumps(data, indent=2)}")
+    with print_lock:
+        print("\n".join(lines))
+
+
+def print_summary(batch: RecordBatch):
+    """Print one line per batch."""
+    events = sum(1 for _ in batch.payloads())
+    with print_lock:
+        print(f"[{datetime.now():%H:%M:%S}] {batch.stream_name} {batch.shard_id}: {len(batch)} records, "
+              f"{events} events, {batch.millis_behind_latest} ms behind")
+
 
 def main():
-    """Monitor all Kinesis streams."""
-    streams = [
-        "game-events-stream",
-        "session-metrics",
-        "revenue-metrics"
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", nargs="+", default=STREAMS)
+    parser.add_argument("--from-start", action="store_true", help="Read from TRIM_HORIZON instead of LATEST")
+    parser.add_argument("--mode", choices=["auto", "poll", "subscribe"], default="auto")
+    parser.add_argument("--checkpoints", help="Resume from checkpoints: a JSON file path, or 'dynamodb'")
+    parser.add_argument("--summary", action="store_true", help="Print a line per batch instead of every record")
+    args = parser.parse_args()
+
+    if args.checkpoints == "dynamodb":
+        checkpoints = DynamoCheckpointStore()
+    elif args.checkpoints:
+        checkpoints = FileCheckpointStore(args.checkpoints)
+    else:
+        checkpoints = MemoryCheckpointStore()
+
+    consumers = [
+        StreamConsumer(
+            stream_name,
+            print_summary if args.summary else print_records,
+            name="monitor",
+            checkpoints=checkpoints,
+            initial_position="TRIM_HORIZON" if args.from_start else "LATEST",
+            mode=args.mode,
+            efo_consumer_name=EFO_CONSUMERS.get(stream_name)
+        )
+        for stream_name in args.streams
     ]
-    
-    # Create threads for each stream
-    threads = []
-    for stream_name in streams:
-        thread = Thread(target=monitor_stream, args=(stream_name,))
-        thread.daemon = True
-        threads.append(thread)
-    
-    # Start all threads
-    for thread in threads:
-        thread.start()
-    
+    for consumer in consumers:
+        consumer.start()
+        print(f"Started monitoring {consumer.stream_name} "
+              f"({'enhanced fan-out' if consumer.consumer_arn else 'polling'})")
+
     print("Monitoring all streams. Press Ctrl+C to stop...")
-    
     try:
-        # Keep main thread alive
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         print("\nStopping stream monitoring...")
+        for consumer in consumers:
+            consumer.stop(timeout=10)
+
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,83 @@
+"""Tests for the day reads of the batch analytics, src/processors/batch/."""
+from datetime import date, datetime, timedelta
+
+import pyarrow as pa
+import pytest
+
+from src.models.base import game_event_adapter
+from src.processors.batch.daily import summarize_day
+from src.processors.batch.lake import read_event_day
+from src.processors.batch.report import run_reports
+from src.processors.compaction import OUTPUT_PREFIX, SCHEMAS, parquet_files, partition_path, to_row
+from src.utils.storage import LocalStorage
+from tests.test_data_generator import generate_game_start_event, generate_purchase_event
+
+DAY = date(2024, 1, 15)
+MIDNIGHT = datetime(2024, 1, 16)
+
+
+def write_hour(storage: LocalStorage, arrival: datetime, events):
+    """Compacted events in the partition of the hour they arrived in."""
+    rows = {}
+    for event in events:
+        model = game_event_adapter.validate_python(event)
+        rows.setdefault(event["event_type"], []).append(to_row(model, SCHEMAS[event["event_type"]]))
+    for event_type, event_rows in rows.items():
+        table = pa.Table.from_pylist(event_rows, schema=SCHEMAS[event_type])
+        for part, (data, _) in enumerate(parquet_files(table, 128 * 1024 * 1024)):
+            storage.write(f"{OUTPUT_PREFIX}event_type={event_type}/{partition_path(arrival)}part-{part:05d}.parquet",
+                          data)
+
+
+def start(player_id: str, at: datetime):
+    return dict(generate_game_start_event(player_id, f"{player_id}-{at:%d%H}"), timestamp=at.isoformat())
+
+
+def purchase(player_id: str, at: datetime, amount: float):
+    event = generate_purchase_event(player_id, f"{player_id}-{at:%d%H}", "game_1")
+    return dict(event, timestamp=at.isoformat(), amount=amount)
+
+
+@pytest.fixture
+def lake(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    write_hour(storage, MIDNIGHT - timedelta(hours=12), [start("on-time", MIDNIGHT - timedelta(hours=12))])
+    # Played just before midnight, delivered after it
+    write_hour(storage, MIDNIGHT + timedelta(hours=1), [
+        start("late", MIDNIGHT - timedelta(minutes=20)),
+        purchase("late", MIDNIGHT - timedelta(minutes=10), 4.99),
+        start("next-day", MIDNIGHT + timedelta(hours=1)),
+    ])
+    # Hours late, in the next afternoon's partition
+    write_hour(storage, MIDNIGHT + timedelta(hours=15), [purchase("on-time", MIDNIGHT - timedelta(hours=3), 9.99)])
+    # A client clock ahead: the next day's event arrives before midnight
+    write_hour(storage, MIDNIGHT - timedelta(hours=1), [start("ahead", MIDNIGHT + timedelta(minutes=5))])
+    # Too late to count
+    write_hour(storage, MIDNIGHT + timedelta(hours=30), [start("too-late", MIDNIGHT - timedelta(hours=2))])
+    return str(tmp_path)
+
+
+def test_days_are_read_by_event_time_across_arrival_partitions(lake):
+    players = read_event_day(lake, "game_start", DAY, ["player_id"]).column("player_id").to_pylist()
+    assert sorted(players) == ["late", "on-time"]
+    next_day = read_event_day(lake, "game_start", DAY + timedelta(days=1), ["player_id"]).column("player_id")
+    assert sorted(next_day.to_pylist()) == ["ahead", "next-day"]
+    assert read_event_day(lake, "game_start", DAY, ["player_id"], late_hours=0).num_rows == 1
+    assert read_event_day(lake, "game_start", DAY - timedelta(days=3), ["player_id"]).num_rows == 0
+
+
+def test_summaries_count_late_events_on_their_day(lake):
+    summary = summarize_day(lake, DAY)
+    assert sorted(summary["active"]) == ["late", "on-time"]
+    purchases = summary["purchases"].set_index("player_id")
+    assert purchases.loc["late", "revenue"] == pytest.approx(4.99)
+    assert purchases.loc["on-time", "revenue"] == pytest.approx(9.99)
+
+
+def test_retention_follows_event_days(lake):
+    reports = run_reports(lake, [DAY, DAY + timedelta(days=1)])
+    cohorts = reports["retention"].set_index("cohort_day")
+    # Both of the day's players are new that day and neither is back the next
+    assert cohorts.loc[DAY, "cohort_size"] == 2 and cohorts.loc[DAY, "d1"] == 0
+    assert cohorts.loc[DAY + timedelta(days=1), "cohort_size"] == 2
+    assert reports["totals"]["revenue"] == pytest.approx(4.99 + 9.99)
@@ -0,0 +1,109 @@
+"""Tests for the read-through TTL cache of src/api/cache.py."""
+import asyncio
+
+import pytest
+
+from src.api.cache import TTLCache
+
+
+class Clock:
+    def __init__(self, now: float = 100.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Backend:
+    """A load that waits until released, counting its calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.error = None
+
+    async def load(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return f"value-{self.calls}"
+
+
+def test_entries_expire_and_the_least_recent_is_evicted():
+    clock = Clock()
+    cache = TTLCache(max_size=2, ttl=30, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and len(cache) == 2
+    clock.now += 30
+    assert cache.get("a") is None and len(cache) == 1
+    cache.invalidate("c")
+    assert len(cache) == 0
+
+
+def test_concurrent_misses_share_one_load():
+    async def run():
+        cache, backend = TTLCache(max_size=10, ttl=30), Backend()
+        waiters = [asyncio.create_task(cache.get_or_load("key", backend.load)) for _ in range(5)]
+        await asyncio.sleep(0)
+        backend.release.set()
+        assert await asyncio.gather(*waiters) == ["value-1"] * 5
+        assert await cache.get_or_load("key", backend.load) == "value-1"
+        assert backend.calls == 1 and (cache.hits, cache.misses) == (1, 5)
+
+    asyncio.run(run())
+
+
+def test_a_failed_load_reaches_every_waiter_and_is_not_cached():
+    async def run():
+        cache, backend = TTLCache(max_size=10, ttl=30), Backend()
+        backend.error = RuntimeError("backend down")
+        waiters = [asyncio.create_task(cache.get_or_load("key", backend.load)) for _ in range(3)]
+        await asyncio.sleep(0)
+        backend.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        backend.error = None
+        assert await cache.get_or_load("key", backend.load) == "value-2"
+
+    asyncio.run(run())
+
+
+def test_waiters_load_again_when_the_shared_load_is_cancelled():
+    async def run():
+        cache, backend = TTLCache(max_size=10, ttl=30), Backend()
+        loader = asyncio.create_task(cache.get_or_load("key", backend.load))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.get_or_load("key", backend.load)) for _ in range(3)]
+        await asyncio.sleep(0)
+        # The request that started the load goes away
+        loader.cancel()
+        await asyncio.sleep(0)
+        backend.release.set()
+        assert await asyncio.wait_for(asyncio.gather(*waiters), timeout=1) == ["value-2"] * 3
+        with pytest.raises(asyncio.CancelledError):
+            await loader
+        assert backend.calls == 2 and not cache._loading
+
+    asyncio.run(run())
+
+
+def test_a_cancelled_waiter_leaves_the_load_running():
+    async def run():
+        cache, backend = TTLCache(max_size=10, ttl=30), Backend()
+        loader = asyncio.create_task(cache.get_or_load("key", backend.load))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_load("key", backend.load))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        backend.release.set()
+        assert await loader == "value-1"
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert backend.calls == 1 and cache.get("key") == "value-1"
+
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+"""Tests for the compact event encoding of src/models/codec.py."""
+import json
+import random
+from datetime import datetime
+
+import pytest
+
+from benchmarks.suite import synthetic_events
+from src.models import codec
+from src.models.base import game_event_adapter
+
+EVENT_TYPES = ["game_start", "game_end", "purchase", "progress"]
+
+
+def models(count: int = 40, event_type=None):
+    return [game_event_adapter.validate_python(event) for event in synthetic_events(count, event_type=event_type)]
+
+
+@pytest.mark.parametrize("event_type", EVENT_TYPES)
+def test_round_trip(event_type):
+    for event in models(event_type=event_type):
+        data = codec.encode(event)
+        assert codec.is_compact(data)
+        assert codec.decode(data) == event
+        assert codec.decode_record(data) == event.model_dump(mode="json")
+
+
+def test_edge_values_round_trip():
+    progress = dict(synthetic_events(1, event_type="progress")[0], level=-(2 ** 40), xp_earned=0, achievements=[],
+                    current_state={"nested": {"ü": [1, 2.5, None]}, "ok": True}, player_id="спортсмен 🎮")
+    end = dict(synthetic_events(1, event_type="game_end")[0], score=2 ** 62, duration=0)
+    purchase = dict(synthetic_events(1, event_type="purchase")[0], amount=-0.0, item_name="")
+    for event in (progress, end, purchase):
+        model = game_event_adapter.validate_python(event)
+        assert codec.decode(codec.encode(model)) == model
+
+
+def test_optional_fields_keep_none_and_values():
+    event = models(1)[0]
+    assert codec.decode(codec.encode(event)).server_timestamp is None
+    stamped = event.model_copy(update={"server_timestamp": datetime(2024, 1, 15, 12, 0, 5, 250)})
+    assert codec.decode(codec.encode(stamped)).server_timestamp == datetime(2024, 1, 15, 12, 0, 5, 250)
+
+
+def test_timestamp_is_readable_without_decoding():
+    for event in models():
+        data = codec.encode(event)
+        assert codec.read_timestamp(data) == event.timestamp
+        assert codec.record_timestamp(data) == codec.record_timestamp(event.model_dump_json().encode())
+
+
+def test_batch_round_trip():
+    events = models(100)
+    records = list(codec.iter_batch(codec.encode_batch(events)))
+    assert [codec.decode(record) for record in records] == events
+    assert list(codec.iter_batch(b"")) == []
+
+
+def test_json_records_are_not_compact():
+    data = models(1)[0].model_dump_json().encode()
+    assert not codec.is_compact(data)
+    assert codec.decode_record(data) == json.loads(data)
+    with pytest.raises(codec.CodecError):
+        codec.decode_fields(data)
+
+
+def test_unknown_versions_cannot_be_encoded():
+    event = models(1)[0].model_copy(update={"version": "9.9"})
+    assert not codec.can_encode(event)
+    with pytest.raises(codec.CodecError):
+        codec.encode(event)
+
+
+@pytest.mark.parametrize("offset, value", [(0, 0x00), (1, codec.LAYOUT_VERSION + 1), (2, 0xFF)])
+def test_bad_headers_are_rejected(offset, value):
+    data = bytearray(codec.encode(models(1)[0]))
+    data[offset] = value
+    with pytest.raises(codec.CodecError):
+        codec.decode_fields(bytes(data))
+
+
+@pytest.mark.parametrize("event_type", EVENT_TYPES)
+def test_every_truncation_is_rejected(event_type):
+    data = codec.encode(models(1, event_type=event_type)[0])
+    for size in range(len(data)):
+        with pytest.raises(codec.CodecError):
+            codec.decode_fields(data[:size])
+
+
+def test_truncated_batches_are_rejected():
+    data = codec.encode_batch(models(3))
+    with pytest.raises(codec.CodecError):
+        list(codec.iter_batch(data[:-1]))
+    with pytest.raises(codec.CodecError):
+        list(codec.iter_batch(b"\xff"))
+
+
+def test_corrupt_bodies_raise_only_codec_errors():
+    rng = random.Random(5)
+    encoded = [codec.encode(event) for event in models(20)]
+    for _ in range(2000):
+        data = bytearray(rng.choice(encoded))
+        for _ in range(rng.randint(1, 4)):
+            data[rng.randrange(codec.HEADER_SIZE, len(data))] = rng.randrange(256)
+        try:
+            codec.decode_fields(bytes(data))
+        except codec.CodecError:
+            pass
@@ -0,0 +1,152 @@
+"""Tests for the hourly compaction of src/processors/compaction.py against LocalStorage."""
+import gzip
+import json
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.processors import compaction
+from src.processors.compaction import OUTPUT_PREFIX, RAW_PREFIX, CompactionJob, partition_path
+from src.utils.storage import LocalStorage
+from tests.test_data_generator import (
+    generate_game_start_event,
+    generate_purchase_event,
+    generate_progress_event
+)
+
+HOUR = datetime(2024, 1, 15, 13)
+PARTITION = partition_path(HOUR)
+
+
+@pytest.fixture
+def job(tmp_path):
+    return CompactionJob(LocalStorage(str(tmp_path / "raw")), LocalStorage(str(tmp_path / "processed")))
+
+
+def put_raw(job: CompactionJob, name: str, records, separator: str = "", compress: bool = False):
+    """A Firehose object of concatenated JSON records in the hour's raw partition."""
+    data = separator.join(record if isinstance(record, str) else json.dumps(record) for record in records).encode()
+    job.raw.write(f"{RAW_PREFIX}{PARTITION}{name}", gzip.compress(data) if compress else data)
+
+
+def at(event, minute: int):
+    return dict(event, timestamp=HOUR.replace(minute=minute).isoformat())
+
+
+def output_file(job: CompactionJob, event_type: str) -> pq.ParquetFile:
+    key = f"{OUTPUT_PREFIX}event_type={event_type}/{PARTITION}part-00000.parquet"
+    return pq.ParquetFile(pa.BufferReader(job.processed.read(key)))
+
+
+def output(job: CompactionJob, event_type: str) -> pa.Table:
+    return output_file(job, event_type).read()
+
+
+def output_keys(job: CompactionJob):
+    return [obj["key"] for obj in job.processed.list(OUTPUT_PREFIX)]
+
+
+def test_events_are_flattened_into_typed_sorted_columns(job):
+    start = dict(at(generate_game_start_event("p2", "s2"), 5),
+                 game_id="game_1", device_info={"os": "iOS", "model": "iPhone 12", "os_version": "14.5"})
+    progress = at(generate_progress_event("p1", "s1", "game_1"), 7)
+    progress.update(achievements=["first_win"], current_state={"health": 80, "inventory": ["map"]})
+    # An offset timestamp is stored as naive UTC
+    early = dict(at(generate_game_start_event("p1", "s1"), 0), game_id="game_1",
+                 timestamp="2024-01-15T14:02:00+01:00")
+    put_raw(job, "a", [start, progress], separator="\n")
+    put_raw(job, "b", [early], compress=True)
+
+    manifest = job.compact_hour(HOUR)
+    assert not manifest["skipped"] and manifest["records"] == 3 and manifest["rejected"] == 0
+    assert output_keys(job) == [
+        f"{OUTPUT_PREFIX}event_type=game_start/{PARTITION}part-00000.parquet",
+        f"{OUTPUT_PREFIX}event_type=progress/{PARTITION}part-00000.parquet",
+    ]
+
+    starts = output(job, "game_start")
+    assert starts.schema.field("device_info").type == pa.map_(pa.string(), pa.string())
+    columns = output_file(job, "game_start").metadata.row_group(0)
+    encodings = {columns.column(i).path_in_schema: columns.column(i).encodings for i in range(columns.num_columns)}
+    assert "RLE_DICTIONARY" in encodings["player_id"] and "RLE_DICTIONARY" not in encodings["event_id"]
+    assert starts.column("player_id").to_pylist() == ["p1", "p2"]
+    assert starts.column("timestamp").to_pylist() == [datetime(2024, 1, 15, 13, 2), HOUR.replace(minute=5)]
+    assert dict(starts.column("device_info")[1].as_py()) == start["device_info"]
+
+    row = output(job, "progress").to_pylist()[0]
+    assert row["achievements"] == ["first_win"]
+    assert json.loads(row["current_state"]) == {"health": 80, "inventory": ["map"]}
+    assert row["server_timestamp"] is None
+
+
+def test_a_rerun_over_the_same_hour_changes_nothing(job):
+    put_raw(job, "a", [at(generate_purchase_event(f"p{i}", "s", "game_1"), i) for i in range(5)])
+    first = job.compact_hour(HOUR)
+    files = {key: job.processed.read(key) for key in output_keys(job)}
+    versions = [obj["version"] for obj in job.processed.list("")]
+
+    again = job.compact_hour(HOUR)
+    assert again["skipped"] and again["outputs"] == first["outputs"]
+    assert [obj["version"] for obj in job.processed.list("")] == versions
+
+    # A forced rerun rewrites the same rows
+    forced = job.compact_hour(HOUR, force=True)
+    assert not forced["skipped"] and forced["outputs"] == first["outputs"]
+    for key, data in files.items():
+        assert pq.read_table(pa.BufferReader(job.processed.read(key))).equals(pq.read_table(pa.BufferReader(data)))
+
+    # A missing output makes the hour out of date
+    job.processed.delete(first["outputs"][0]["key"])
+    assert not job.compact_hour(HOUR)["skipped"]
+    assert output_keys(job) == list(files)
+
+
+def test_late_objects_rewrite_the_hour_and_remove_stale_files(job, monkeypatch):
+    monkeypatch.setattr(compaction, "ROW_GROUP_ROWS", 2)
+    job.target_file_bytes = 1
+    put_raw(job, "a", [at(generate_progress_event(f"p{i}", "s", "game_1"), i) for i in range(5)])
+    put_raw(job, "b", [at(generate_purchase_event("p1", "s", "game_1"), 9)])
+    first = job.compact_hour(HOUR)
+    assert [(output["event_type"], output["rows"]) for output in first["outputs"]] == [
+        ("purchase", 1), ("progress", 2), ("progress", 2), ("progress", 1)
+    ]
+
+    # The purchases' object is replaced by a later one without them, and the
+    # progress events now fit in one file
+    job.raw.delete(f"{RAW_PREFIX}{PARTITION}b")
+    put_raw(job, "c", [at(generate_game_start_event("p9", "s"), 30)])
+    job.target_file_bytes = compaction.TARGET_FILE_BYTES
+    manifest = job.compact_hour(HOUR)
+    assert [source["key"] for source in manifest["sources"]] == [
+        f"{RAW_PREFIX}{PARTITION}a", f"{RAW_PREFIX}{PARTITION}c"
+    ]
+    assert output_keys(job) == [
+        f"{OUTPUT_PREFIX}event_type=game_start/{PARTITION}part-00000.parquet",
+        f"{OUTPUT_PREFIX}event_type=progress/{PARTITION}part-00000.parquet",
+    ]
+    assert output(job, "progress").num_rows == 5
+    assert job.load_manifest(HOUR)["outputs"] == manifest["outputs"]
+
+
+def test_rejected_records_are_counted_and_skipped(job):
+    valid = at(generate_purchase_event("p1", "s", "game_1"), 1)
+    missing = {key: value for key, value in valid.items() if key != "amount"}
+    unknown = dict(valid, event_type="level_up")
+    put_raw(job, "a", [missing, valid, unknown, {"not": "an event"}, [1, 2]])
+    # The rest of a corrupt object is lost, the objects after it are read
+    put_raw(job, "b", [at(generate_purchase_event("p2", "s", "game_1"), 2), '{"event_type": "purch',
+                       at(generate_purchase_event("p3", "s", "game_1"), 3)])
+    put_raw(job, "c", [at(generate_purchase_event("p4", "s", "game_1"), 4)])
+    job.raw.write(f"{RAW_PREFIX}{PARTITION}d", b"\xff\xfe not text")
+
+    manifest = job.compact_hour(HOUR)
+    assert manifest["records"] == 3 and manifest["rejected"] == 6
+    assert output(job, "purchase").column("player_id").to_pylist() == ["p1", "p2", "p4"]
+
+    # An hour of nothing but bad records writes no files
+    for name in ("a", "b", "c"):
+        job.raw.delete(f"{RAW_PREFIX}{PARTITION}{name}")
+    manifest = job.compact_hour(HOUR)
+    assert manifest["outputs"] == [] and manifest["rejected"] == 1 and output_keys(job) == []
@@ -0,0 +1,226 @@
+"""Tests for the Bloom filter ring and write reservations of src/api/dedup.py."""
+import uuid
+
+import pytest
+
+from src.api import dedup
+from src.api.dedup import EventDeduplicator
+
+
+class Clock:
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def ids(count: int, prefix: str = "e"):
+    return [f"{prefix}-{i}" for i in range(count)]
+
+
+def ring(clock: Clock, **kwargs) -> EventDeduplicator:
+    options = dict(horizon_seconds=600, buckets=6, bucket_capacity=2000, false_positive_rate=0.001, clock=clock)
+    options.update(kwargs)
+    return EventDeduplicator(**options)
+
+
+def test_added_ids_are_found_and_new_ones_mostly_not():
+    clock = Clock()
+    dedup_ring = ring(clock)
+    added = ids(2000)
+    for event_id in added:
+        dedup_ring.add(event_id)
+    assert all(event_id in dedup_ring for event_id in added)
+    false_positives = sum(event_id in dedup_ring for event_id in ids(20000, "new"))
+    # Only one of the seven filters is filled, so well under the configured rate
+    assert false_positives / 20000 <= 0.001
+
+
+def test_id_types_are_interchangeable_only_by_their_bytes():
+    clock = Clock()
+    dedup_ring = ring(clock)
+    event_id = uuid.UUID(int=12345)
+    dedup_ring.add(event_id)
+    assert event_id in dedup_ring and event_id.bytes in dedup_ring
+    dedup_ring.add("player-resend")
+    assert b"player-resend" in dedup_ring
+
+
+def test_ids_live_for_at_least_the_horizon():
+    clock = Clock()
+    dedup_ring = ring(clock)
+    bucket_seconds = dedup_ring.bucket_seconds
+    # Added at the very end of a bucket, the shortest lifetime
+    clock.now = (clock.now // bucket_seconds + 1) * bucket_seconds - 0.001
+    dedup_ring.add("late-in-bucket")
+    added_at = clock.now
+    clock.now = added_at + 600
+    assert "late-in-bucket" in dedup_ring
+    clock.now = added_at + 600 + bucket_seconds
+    assert "late-in-bucket" not in dedup_ring
+
+
+def test_rotation_clears_the_reused_slot():
+    clock = Clock()
+    dedup_ring = ring(clock)
+    old = ids(1500, "old")
+    for event_id in old:
+        dedup_ring.add(event_id)
+    fill = dedup_ring.estimated_false_positive_rate()
+    assert fill > 0
+
+    # One full turn of the ring later the old ids' slot is reused
+    clock.now += dedup_ring.slots * dedup_ring.bucket_seconds
+    assert dedup_ring.estimated_false_positive_rate() == 0
+    for event_id in ids(10, "new"):
+        dedup_ring.add(event_id)
+    assert sum(event_id in dedup_ring for event_id in old) <= 1
+    assert dedup_ring.estimated_false_positive_rate() < fill
+
+
+def test_every_bucket_of_the_horizon_is_checked():
+    clock = Clock()
+    dedup_ring = ring(clock)
+    per_bucket = []
+    for bucket in range(dedup_ring.buckets + 1):
+        batch = ids(200, f"bucket{bucket}")
+        for event_id in batch:
+            dedup_ring.add(event_id)
+        per_bucket.append(batch)
+        clock.now += dedup_ring.bucket_seconds
+    clock.now -= dedup_ring.bucket_seconds
+    assert all(event_id in dedup_ring for batch in per_bucket for event_id in batch)
+    # The next bucket overwrites the first one's slot
+    clock.now += dedup_ring.bucket_seconds
+    dedup_ring.add("next")
+    assert not any(event_id in dedup_ring for event_id in per_bucket[0])
+    assert all(event_id in dedup_ring for batch in per_bucket[1:] for event_id in batch)
+
+
+def test_an_idle_ring_forgets_everything():
+    clock = Clock()
+    dedup_ring = ring(clock)
+    dedup_ring.add("before")
+    clock.now += 10 * 600
+    assert "before" not in dedup_ring
+    dedup_ring.add("after")
+    assert "after" in dedup_ring and "before" not in dedup_ring
+
+
+def test_estimated_false_positive_rate_tracks_the_fill():
+    clock = Clock()
+    dedup_ring = ring(clock)
+    assert dedup_ring.estimated_false_positive_rate() == 0
+    for bucket in range(dedup_ring.slots):
+        for event_id in ids(2000, f"b{bucket}"):
+            dedup_ring.add(event_id)
+        clock.now += dedup_ring.bucket_seconds
+    clock.now -= dedup_ring.bucket_seconds
+    # Every slot at capacity is the configured rate
+    assert dedup_ring.estimated_false_positive_rate() == pytest.approx(0.001, rel=0.25)
+
+
+def test_sizing():
+    assert dedup.bits_per_item(0.01) == pytest.approx(9.585, abs=0.01)
+    with pytest.raises(ValueError):
+        dedup.bits_per_item(1.5)
+    dedup_ring = ring(Clock(), bits_per_event=8)
+    assert dedup_ring.bits == 2000 * 8 and dedup_ring.hashes == 6
+    with pytest.raises(ValueError):
+        ring(Clock(), bucket_capacity=10 ** 9, bits_per_event=8)
+
+
+def test_workers_share_a_file(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / "dedup.bin")
+    first, second = ring(clock, path=path), ring(clock, path=path)
+    try:
+        first.add("from-first")
+        assert "from-first" in second
+        # Either worker may rotate a slot; the other sees the new bucket
+        clock.now += first.slots * first.bucket_seconds
+        second.add("from-second")
+        assert "from-second" in first and "from-first" not in first
+        first.add("again")
+        assert "from-second" in second and "again" in second
+    finally:
+        first.close()
+        second.close()
+
+    reopened = ring(clock, path=path)
+    assert "again" in reopened
+    reopened.close()
+    # Another configuration starts the file over
+    resized = ring(clock, path=path, bucket_capacity=4000)
+    assert "again" not in resized
+    resized.close()
+
+
+def test_reservations_hold_an_event_id_while_it_is_written():
+    clock = Clock()
+    dedup_ring = ring(clock)
+    assert dedup_ring.reserve("first") == dedup.RESERVED
+    # A copy sent while the first is in flight
+    assert dedup_ring.reserve("first") == dedup.IN_FLIGHT
+    assert "first" not in dedup_ring
+    dedup_ring.commit("first")
+    assert "first" in dedup_ring and dedup_ring.reserve("first") == dedup.DUPLICATE
+
+    # A failed write releases the id for the retry
+    assert dedup_ring.reserve("failed") == dedup.RESERVED
+    dedup_ring.release("failed")
+    assert "failed" not in dedup_ring and dedup_ring.reserve("failed") == dedup.RESERVED
+
+
+def test_reservations_expire():
+    clock = Clock()
+    dedup_ring = ring(clock, reservation_seconds=30)
+    assert dedup_ring.reserve("orphaned") == dedup.RESERVED
+    clock.now += 29
+    assert dedup_ring.reserve("orphaned") == dedup.IN_FLIGHT
+    clock.now += 2
+    assert dedup_ring.reserve("orphaned") == dedup.RESERVED
+
+
+def test_a_full_reservation_table_writes_without_one():
+    clock = Clock()
+    dedup_ring = ring(clock, reservations=4)
+    assert all(dedup_ring.reserve(event_id) == dedup.RESERVED for event_id in ids(4))
+    # Every entry is taken, so the next id is written untracked
+    assert dedup_ring.reserve("untracked") == dedup.RESERVED
+    assert dedup_ring.reserve("untracked") == dedup.RESERVED
+    assert all(dedup_ring.reserve(event_id) == dedup.IN_FLIGHT for event_id in ids(4))
+    for event_id in ids(4):
+        dedup_ring.release(event_id)
+    assert dedup_ring.reserve("untracked") == dedup.RESERVED
+    assert dedup_ring.reserve("untracked") == dedup.IN_FLIGHT
+
+
+def test_workers_share_reservations(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / "dedup.bin")
+    first, second = ring(clock, path=path), ring(clock, path=path)
+    try:
+        assert first.reserve("retried") == dedup.RESERVED
+        assert second.reserve("retried") == dedup.IN_FLIGHT
+        first.commit("retried")
+        assert second.reserve("retried") == dedup.DUPLICATE
+        assert second.reserve("failed") == dedup.RESERVED
+        second.release("failed")
+        assert first.reserve("failed") == dedup.RESERVED
+    finally:
+        first.close()
+        second.close()
+
+
+def test_create_deduplicator(monkeypatch):
+    monkeypatch.setenv("DEDUP_ENABLED", "false")
+    assert dedup.create_deduplicator() is None
+    monkeypatch.setenv("DEDUP_ENABLED", "true")
+    monkeypatch.setenv("DEDUP_BUCKET_CAPACITY", "1000")
+    monkeypatch.setenv("DEDUP_BITS_PER_EVENT", "10")
+    monkeypatch.setenv("DEDUP_RESERVATIONS", "128")
+    monkeypatch.delenv("DEDUP_STORE_PATH", raising=False)
+    created = dedup.create_deduplicator()
+    assert created.bucket_capacity == 1000 and created.bits == 10000 and created.reservations == 128
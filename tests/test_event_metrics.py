@@ -0,0 +1,68 @@
+"""Tests for the game_events metrics of src/processors/stream_processor.py. Needs apache-flink."""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pyflink")
+
+from pyflink.table.udf import FunctionContext  # noqa: E402
+
+from src.processors import stream_processor as sp  # noqa: E402
+
+START = datetime(2024, 1, 15, 12)
+
+
+class Counter:
+    def __init__(self):
+        self.count = 0
+
+    def inc(self, n: int = 1):
+        self.count += n
+
+
+class MetricGroup:
+    def __init__(self):
+        self.counters = {}
+
+    def add_group(self, name: str) -> "MetricGroup":
+        return self
+
+    def counter(self, name: str) -> Counter:
+        return self.counters.setdefault(name, Counter())
+
+
+def opened(function) -> dict:
+    group = MetricGroup()
+    function.open(FunctionContext(group, {}))
+    return {name: counter for name, counter in group.counters.items()}
+
+
+def counts(counters: dict) -> dict:
+    return {name: counter.count for name, counter in counters.items()}
+
+
+def test_json_records_are_counted_and_those_missing_keys_dropped():
+    function = sp.CheckEvent()
+    counters = opened(function)
+    assert function.eval("e1", START + timedelta(minutes=10))
+    # In the watermark's window, behind it, and beyond the allowed lateness
+    assert function.eval("e2", START + timedelta(minutes=9))
+    assert function.eval("e3", START)
+    assert function.eval("e4", START - timedelta(minutes=sp.ALLOWED_LATENESS_MINUTES))
+    assert not function.eval(None, START + timedelta(minutes=10))
+    assert not function.eval("e5", None)
+    assert counts(counters) == {"records_parsed": 4, "parse_failures": 2, "late_events": 2,
+                                "late_events_dropped": 1}
+
+
+def test_decoded_records_report_the_same_metrics():
+    function = sp.DecodeEvent()
+    counters = opened(function)
+    event = {"event_id": "e1", "game_id": "g", "player_id": "p", "session_id": "s", "event_type": "progress",
+             "version": "1.0", "level": 2}
+    assert len(list(function.eval(json.dumps(event).encode(), START))) == 1
+    assert list(function.eval(b"not json", START)) == []
+    assert list(function.eval(json.dumps({"game_id": "g"}).encode(), START)) == []
+    assert counts(counters) == {"records_parsed": 1, "parse_failures": 2, "late_events": 0,
+                                "late_events_dropped": 0}
@@ -0,0 +1,92 @@
+"""Tests for the shared ingest path of src/api/ingest.py."""
+import json
+from datetime import datetime
+
+import pytest
+
+from benchmarks.suite import synthetic_events
+from src.api import ingest
+from src.models import codec
+from src.models.base import game_event_adapter
+
+SERVER_TIMESTAMP = datetime(2024, 1, 15, 12, 0, 5)
+
+
+def stream_timestamp(data: bytes) -> datetime:
+    """The event time a record carries, read as the stream processor's source reads it."""
+    if codec.is_compact(data):
+        return codec.read_timestamp(data)
+    return datetime.fromisoformat(json.loads(data)["timestamp"])
+
+
+@pytest.mark.parametrize("timestamp", [
+    "2024-01-15T10:30:00.123",
+    "2024-01-15T10:30:00.123Z",
+    "2024-01-15T12:30:00.123+02:00",
+    "2024-01-15T05:30:00.123-05:00"
+])
+@pytest.mark.parametrize("event_type", ["game_start", "game_end", "purchase", "progress"])
+def test_both_formats_carry_naive_utc(monkeypatch, timestamp, event_type):
+    event = dict(synthetic_events(1, event_type=event_type)[0], timestamp=timestamp)
+    written = {}
+    for stream_format in ("json", "compact"):
+        monkeypatch.setattr(ingest, "STREAM_FORMAT", stream_format)
+        data = ingest.serialize_event(game_event_adapter.validate_python(event), SERVER_TIMESTAMP)
+        assert codec.is_compact(data) == (stream_format == "compact")
+        written[stream_format] = stream_timestamp(data)
+
+    assert written["json"] == written["compact"] == datetime(2024, 1, 15, 10, 30, 0, 123000)
+    assert written["json"].tzinfo is None
+
+
+def test_json_records_have_no_offset(monkeypatch):
+    monkeypatch.setattr(ingest, "STREAM_FORMAT", "json")
+    event = dict(synthetic_events(1)[0], timestamp="2024-01-15T12:30:00+02:00")
+    record = json.loads(ingest.serialize_event(game_event_adapter.validate_python(event), SERVER_TIMESTAMP))
+    assert record["timestamp"] == "2024-01-15T10:30:00"
+    assert record["server_timestamp"] == "2024-01-15T12:00:05"
+
+
+def batch_bodies(count: int):
+    """The same events as a JSON array, NDJSON and a compact batch."""
+    events = synthetic_events(count)
+    models = [game_event_adapter.validate_python(event) for event in events]
+    return {
+        "application/json": json.dumps(events).encode(),
+        "application/x-ndjson": "\n".join(json.dumps(event) for event in events).encode() + b"\n",
+        codec.BATCH_CONTENT_TYPE: codec.encode_batch(models),
+    }
+
+
+@pytest.mark.parametrize("count", [0, 1, 9, 10, 11, 40])
+def test_batch_event_count_is_exact_near_the_limit(monkeypatch, count):
+    monkeypatch.setattr(ingest, "MAX_BATCH_EVENTS", 10)
+    for content_type, body in batch_bodies(count).items():
+        counted = ingest.batch_event_count(body, content_type)
+        # Upper bounds below the limit, exact (capped at limit + 1) above it
+        if count > 10:
+            assert counted == (11 if content_type == codec.BATCH_CONTENT_TYPE else count), content_type
+        else:
+            assert count <= counted <= 10, content_type
+
+
+def test_oversized_batches_are_rejected_before_validation(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_BATCH_EVENTS", 10)
+    for content_type, body in batch_bodies(11).items():
+        with pytest.raises(ingest.RequestTooLargeError, match="10 events"):
+            ingest.check_batch_size(body, content_type)
+    for content_type, body in batch_bodies(10).items():
+        ingest.check_batch_size(body, content_type)
+
+    monkeypatch.setattr(ingest, "MAX_BATCH_BYTES", 1000)
+    with pytest.raises(ingest.RequestTooLargeError, match="1000 bytes"):
+        ingest.check_batch_size(b"[" + b" " * 1000 + b"]", "application/json")
+    # Malformed bodies are left for validation to reject
+    ingest.check_batch_size(b"{" * 500, "application/json")
+    ingest.check_batch_size(b"\xff" * 20, codec.BATCH_CONTENT_TYPE)
+
+
+def test_oversized_events_are_rejected_before_validation():
+    ingest.check_event_size(b"x" * ingest.MAX_BYTES_PER_RECORD)
+    with pytest.raises(ingest.RequestTooLargeError):
+        ingest.check_event_size(b"x" * (ingest.MAX_BYTES_PER_RECORD + 1))
@@ -0,0 +1,68 @@
+"""Tests for the KPL aggregated record format of src/utils/kpl.py."""
+import hashlib
+import random
+
+import pytest
+
+from src.utils import kpl
+
+
+def test_matches_the_kpl_wire_format():
+    message = (
+        b"\x0a\x01a"                              # partition_key_table: "a"
+        b"\x1a\x05" b"\x08\x00" b"\x1a\x01x"      # records: {partition_key_index: 0, data: "x"}
+    )
+    assert kpl.aggregate([("a", b"x")]) == kpl.MAGIC + message + hashlib.md5(message).digest()
+
+
+@pytest.mark.parametrize("sizes", [[0], [1, 2, 3], [127, 128, 16383, 16384], [300] * 500])
+def test_round_trip(sizes):
+    rng = random.Random(len(sizes))
+    records = [(f"player_{rng.randrange(20)}", rng.randbytes(size)) for size in sizes]
+    data = kpl.aggregate(records)
+    assert kpl.is_aggregated(data)
+    assert kpl.deaggregate(data) == records
+
+
+def test_partition_keys_are_stored_once_and_keep_their_records_order():
+    records = [("é-player", b"1"), ("b", b"2"), ("é-player", b"3"), ("b", b"4")]
+    data = kpl.aggregate(records)
+    assert data.count("é-player".encode()) == 1
+    assert kpl.deaggregate(data) == records
+
+
+def test_plain_records_are_returned_unchanged():
+    data = b'{"event_id": "e1"}'
+    assert not kpl.is_aggregated(data)
+    assert kpl.deaggregate(data, "player_1") == [("player_1", data)]
+    # Too short to hold a message and its digest
+    assert kpl.deaggregate(kpl.MAGIC + b"\x00" * 4, "player_1") == [("player_1", kpl.MAGIC + b"\x00" * 4)]
+
+
+def test_a_bad_checksum_leaves_the_record_whole():
+    data = bytearray(kpl.aggregate([("a", b"x"), ("b", b"y")]))
+    data[-1] ^= 0xFF
+    assert kpl.deaggregate(bytes(data), "key") == [("key", bytes(data))]
+
+
+def test_unknown_fields_are_skipped():
+    message = (
+        b"\x0a\x01a"                                       # partition_key_table
+        b"\x12\x02" b"42"                                  # explicit_hash_key_table
+        b"\x1a\x16" b"\x08\x00" b"\x10\x00" b"\x1a\x01x"   # record with an explicit hash key index,
+        b"\x22\x04tags" b"\x29" + b"\x00" * 8              # tags and a fixed64 we do not read
+    )
+    data = kpl.MAGIC + message + hashlib.md5(message).digest()
+    assert kpl.deaggregate(data) == [("a", b"x")]
+
+
+def test_record_overhead_bounds_the_growth_of_an_aggregate():
+    rng = random.Random(3)
+    records = []
+    size = len(kpl.aggregate(records))
+    for _ in range(200):
+        record = (f"player_{rng.randrange(1000)}", rng.randbytes(rng.choice([10, 200, 20000])))
+        records.append(record)
+        grown = len(kpl.aggregate(records))
+        assert grown - size <= kpl.record_overhead(*record)
+        size = grown
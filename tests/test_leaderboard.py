@@ -0,0 +1,127 @@
+"""Tests for the ranked leaderboards of src/utils/leaderboard.py."""
+import bisect
+import random
+import zlib
+
+import pytest
+
+from src.utils import leaderboard
+from src.utils.leaderboard import Leaderboard, RankedList, decode_snapshot, encode_entries, encode_snapshot
+
+
+@pytest.fixture(params=[4, leaderboard.LOAD], ids=["small-blocks", "default-blocks"])
+def load(request, monkeypatch):
+    """Small blocks make a few hundred values split and empty blocks."""
+    monkeypatch.setattr(leaderboard, "LOAD", request.param)
+    return request.param
+
+
+def test_ranked_list_matches_a_sorted_list(load):
+    rng = random.Random(load)
+    initial = [rng.randrange(-500, 500) for _ in range(300)]
+    ranked, expected = RankedList(initial), sorted(initial)
+    for step in range(5000):
+        if expected and rng.random() < 0.45:
+            value = rng.choice(expected)
+            ranked.remove(value)
+            expected.remove(value)
+        else:
+            value = rng.randrange(-600, 600)
+            ranked.add(value)
+            bisect.insort(expected, value)
+        if step % 97 == 0:
+            assert list(ranked) == expected
+            probe = rng.randrange(-700, 700)
+            assert ranked.index(probe) == bisect.bisect_left(expected, probe)
+            start = rng.randrange(len(expected) + 2)
+            assert list(ranked.slice(start, start + 25)) == expected[start:start + 25]
+    assert len(ranked) == len(expected) and list(ranked) == expected
+
+
+def test_ranked_list_drains_and_refills(load):
+    ranked = RankedList(range(50))
+    for value in range(50):
+        ranked.remove(value)
+    assert len(ranked) == 0 and list(ranked) == [] and list(ranked.slice(0, 10)) == []
+    assert ranked.index(7) == 0
+    for value in (3, 1, 2):
+        ranked.add(value)
+    assert list(ranked) == [1, 2, 3] and ranked.index(3) == 2
+
+
+def test_removing_a_missing_value_raises(load):
+    ranked = RankedList([1, 3, 5])
+    for value in (2, 6):
+        with pytest.raises(ValueError):
+            ranked.remove(value)
+    assert list(ranked) == [1, 3, 5]
+
+
+def test_slices_past_the_end():
+    ranked = RankedList(range(10))
+    assert list(ranked.slice(8, 20)) == [8, 9]
+    assert list(ranked.slice(10, 20)) == [] and list(ranked.slice(5, 5)) == []
+
+
+def test_leaderboard_keeps_each_players_best():
+    board = Leaderboard()
+    assert board.submit("a", 10) and board.submit("b", 30) and board.submit("c", 20)
+    assert not board.submit("b", 5)
+    assert board.submit("a", 40)
+    assert board.score("a") == 40 and board.score("b") == 30 and board.score("nobody") is None
+    assert [board.rank(player) for player in ("a", "b", "c")] == [1, 2, 3]
+    assert board.rank("nobody") is None
+    assert board.top(2) == [(1, "a", 40), (2, "b", 30)]
+    assert board.top(5, offset=2) == [(3, "c", 20)]
+    assert len(board) == 3
+
+
+def test_ties_rank_the_earlier_player_first():
+    board = Leaderboard()
+    for player in ("first", "second", "third"):
+        board.submit(player, 100)
+    board.submit("negative", -5)
+    assert board.top(4) == [(1, "first", 100), (2, "second", 100), (3, "third", 100), (4, "negative", -5)]
+    # Improving to a tied score does not jump the queue
+    board.submit("negative", 100)
+    assert board.rank("negative") == 4
+
+
+def test_ranks_match_a_sort_over_many_players(load):
+    rng = random.Random(1)
+    board, best, joined = Leaderboard(), {}, {}
+    for _ in range(3000):
+        player, score = f"p{rng.randrange(400)}", rng.randrange(-50, 1000)
+        joined.setdefault(player, len(joined))
+        improved = score > best.get(player, float("-inf"))
+        assert board.submit(player, score) == improved
+        if improved:
+            best[player] = score
+    expected = sorted(best, key=lambda player: (-best[player], joined[player]))
+    assert [player for _, player, _ in board.top(len(expected))] == expected
+    assert all(board.rank(player) == position + 1 for position, player in enumerate(expected))
+
+
+def test_from_entries_and_snapshots_rebuild_the_same_board():
+    rng = random.Random(2)
+    board = Leaderboard()
+    for _ in range(2000):
+        board.submit(f"player_{rng.randrange(300)}", rng.randrange(-(2 ** 40), 2 ** 40))
+    board.submit("joueur-é", 7)
+
+    rebuilt = Leaderboard.from_entries(board.entries())
+    restored = decode_snapshot(encode_snapshot(board))
+    for other in (rebuilt, restored):
+        assert other.top(len(board)) == board.top(len(board))
+        assert list(other.entries()) == list(board.entries())
+    # Repeated players keep their best score
+    assert Leaderboard.from_entries([("a", 1), ("b", 5), ("a", 9), ("a", 3)]).top(2) == [(1, "a", 9), (2, "b", 5)]
+    # Frozen entries keep the scores they were taken with
+    frozen = board.frozen_entries()
+    board.submit("joueur-é", 2 ** 41)
+    board.submit("newcomer", 1)
+    assert decode_snapshot(encode_entries(frozen)).top(len(board)) == restored.top(len(board))
+    with pytest.raises(ValueError):
+        decode_snapshot(b"not a snapshot")
+    with pytest.raises(ValueError):
+        decode_snapshot(zlib.compress(b"LB\x09"))
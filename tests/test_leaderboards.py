@@ -0,0 +1,103 @@
+"""Tests for the leaderboard snapshots of src/api/leaderboards.py."""
+import io
+import json
+
+from botocore.exceptions import ClientError
+
+from src.api.leaderboards import LeaderboardService
+
+
+class FakeS3:
+    """The S3 calls of LeaderboardService over a dict, recording the keys written and read."""
+
+    class exceptions:
+        NoSuchKey = type("NoSuchKey", (Exception,), {})
+        ClientError = ClientError
+
+    def __init__(self):
+        self.objects = {}
+        self.etags = {}
+        self.puts = []
+        self.gets = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+        self.etags[Key] = f'"{len(self.puts)}"'
+        self.puts.append(Key)
+        return {"ETag": self.etags[Key]}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        self.gets.append(Key)
+        return {"Body": io.BytesIO(self.objects[Key]), "ETag": self.etags[Key]}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ETag": self.etags[Key]}
+
+
+def service(s3: FakeS3) -> LeaderboardService:
+    return LeaderboardService("game-events-stream", kinesis_client=object(), s3_client=s3, prefix="lb/")
+
+
+def game_end(game_id: str, player_id: str, score: int):
+    return {"event_type": "game_end", "game_id": game_id, "player_id": player_id, "score": score}
+
+
+def test_snapshots_write_and_reload_only_changed_boards():
+    s3 = FakeS3()
+    consumer, worker = service(s3), service(s3)
+    consumer.apply([game_end("a", "p1", 10), game_end("b", "p2", 5), {"event_type": "purchase"}])
+    changed = consumer.capture()
+    # Applied while the snapshot is written, so left for the next one
+    consumer.apply([game_end("a", "p1", 50), game_end("a", "p3", 7)])
+    consumer.snapshot(changed, {"shard-0": "1"})
+    assert sorted(s3.puts) == ["lb/a.snapshot", "lb/b.snapshot", "lb/manifest.json"]
+    assert worker.refresh() and worker.board("a").top(5) == [(1, "p1", 10)]
+    assert worker.positions == {"shard-0": "1"}
+
+    s3.puts.clear()
+    s3.gets.clear()
+    consumer.snapshot(consumer.capture(), {"shard-0": "2"})
+    assert s3.puts == ["lb/a.snapshot", "lb/manifest.json"]
+    unchanged = worker.board("b")
+    assert worker.refresh()
+    assert s3.gets == ["lb/manifest.json", "lb/a.snapshot"]
+    assert worker.board("b") is unchanged
+    assert worker.board("a").top(5) == [(1, "p1", 50), (2, "p3", 7)]
+    assert not worker.refresh()
+
+    # A score that is not a player's best changes no board
+    consumer.apply([game_end("b", "p2", 1)])
+    assert consumer.capture() == {}
+
+
+def test_a_restarted_consumer_continues_the_versions():
+    s3 = FakeS3()
+    consumer = service(s3)
+    consumer.apply([game_end("a", "p1", 10), game_end("b", "p2", 5)])
+    consumer.snapshot(consumer.capture(), {"shard-0": "1"})
+    consumer.apply([game_end("a", "p1", 20)])
+    consumer.snapshot(consumer.capture(), {"shard-0": "2"})
+
+    restarted = service(s3)
+    assert restarted.restore() and restarted.board("a").score("p1") == 20
+    restarted.apply([game_end("b", "p9", 99)])
+    restarted.snapshot(restarted.capture(), {"shard-0": "3"})
+    manifest = json.loads(s3.objects["lb/manifest.json"])
+    assert manifest == {"snapshot": 3, "games": {"a": 2, "b": 3}, "positions": {"shard-0": "3"}}
+
+
+def test_a_manifest_without_versions_loads_every_board():
+    s3 = FakeS3()
+    consumer = service(s3)
+    consumer.apply([game_end("a", "p1", 10)])
+    consumer.snapshot(consumer.capture(), {})
+    s3.put_object(Bucket="", Key="lb/manifest.json", Body=json.dumps({"games": ["a"], "positions": {}}).encode())
+    worker = service(s3)
+    assert worker.refresh() and worker.board("a").score("p1") == 10
+    s3.put_object(Bucket="", Key="lb/manifest.json", Body=json.dumps({"games": ["a"], "positions": {}}).encode())
+    s3.gets.clear()
+    assert worker.refresh() and s3.gets == ["lb/manifest.json", "lb/a.snapshot"]
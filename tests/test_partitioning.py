@@ -0,0 +1,226 @@
+"""Tests for the partitioners and shard accounting of src/api/partitioning.py."""
+import hashlib
+from collections import Counter
+
+import pytest
+
+from benchmarks.suite import synthetic_events
+from src.api import partitioning
+from src.api.partitioning import (
+    HASH_KEY_SPACE,
+    AdaptivePartitioner,
+    ExplicitHashPartitioner,
+    PlayerPartitioner,
+    SaltedGamePartitioner,
+    SessionPartitioner,
+    ShardMap,
+    ShardThroughput,
+)
+from src.models.base import game_event_adapter
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def models(count: int):
+    return [game_event_adapter.validate_python(event) for event in synthetic_events(count)]
+
+
+def shard(shard_id: str, start: int, end: int, closed: bool = False):
+    sequence_range = {"StartingSequenceNumber": "0"}
+    if closed:
+        sequence_range["EndingSequenceNumber"] = "100"
+    return {"ShardId": shard_id, "SequenceNumberRange": sequence_range,
+            "HashKeyRange": {"StartingHashKey": str(start), "EndingHashKey": str(end)}}
+
+
+def split_map() -> ShardMap:
+    """Shard 0 split unevenly: 1 holds a quarter of its range, 2 the rest."""
+    half = HASH_KEY_SPACE // 2
+    return ShardMap([
+        shard("shardId-000000000000", 0, half - 1, closed=True),
+        shard("shardId-000000000001", 0, half // 4 - 1),
+        shard("shardId-000000000002", half // 4, half - 1),
+        shard("shardId-000000000003", half, HASH_KEY_SPACE - 1),
+    ])
+
+
+def test_hash_key_is_the_md5_of_the_key():
+    assert partitioning.hash_key("player_1") == int(hashlib.md5(b"player_1").hexdigest(), 16)
+
+
+def test_uniform_map_covers_the_key_space():
+    shard_map = ShardMap.uniform(4)
+    assert shard_map.ranges[0][0] == 0 and shard_map.ranges[-1][1] == HASH_KEY_SPACE - 1
+    for (_, end, _), (start, _, _) in zip(shard_map.ranges, shard_map.ranges[1:]):
+        assert start == end + 1
+    assert shard_map.shard_for_hash(0) == "shardId-000000000000"
+    assert shard_map.shard_for_hash(HASH_KEY_SPACE // 4 - 1) == "shardId-000000000000"
+    assert shard_map.shard_for_hash(HASH_KEY_SPACE // 4) == "shardId-000000000001"
+    assert shard_map.shard_for_hash(HASH_KEY_SPACE - 1) == "shardId-000000000003"
+
+
+def test_closed_shards_are_left_out():
+    shard_map = split_map()
+    assert shard_map.shard_ids == ["shardId-000000000001", "shardId-000000000002", "shardId-000000000003"]
+    assert shard_map.shard_for_hash(HASH_KEY_SPACE // 8 - 1) == "shardId-000000000001"
+    assert shard_map.shard_for_hash(HASH_KEY_SPACE // 8) == "shardId-000000000002"
+
+
+def test_explicit_hash_keys_override_the_partition_key():
+    shard_map = ShardMap.uniform(4)
+    key = "player_1"
+    assert shard_map.shard_for(key) == shard_map.shard_for_hash(partitioning.hash_key(key))
+    assert shard_map.shard_for(key, str(HASH_KEY_SPACE - 1)) == "shardId-000000000003"
+
+
+def test_player_and_session_keys():
+    event = models(1)[0]
+    assert PlayerPartitioner().partition(event) == (event.player_id, None)
+    assert SessionPartitioner().partition(event) == (event.session_id, None)
+
+
+def test_salted_game_keys_are_stable_per_player_and_bounded_per_game():
+    partitioner = SaltedGamePartitioner(salt_buckets=4)
+    events = models(500)
+    keys_by_player = {}
+    for event in events:
+        key, explicit_hash_key = partitioner.partition(event)
+        assert explicit_hash_key is None and key.startswith(f"{event.game_id}#")
+        assert keys_by_player.setdefault((event.game_id, event.player_id), key) == key
+    games = Counter(key.split("#")[0] for key in set(keys_by_player.values()))
+    assert all(count <= 4 for count in games.values())
+
+
+def test_explicit_hash_spreads_players_evenly_over_uneven_shards():
+    shard_map = split_map()
+    partitioner = ExplicitHashPartitioner(shard_map)
+    players = Counter()
+    for event in models(3000):
+        key, explicit_hash_key = partitioner.partition(event)
+        assert key == event.player_id
+        # A player always gets the same hash key
+        assert partitioner.partition(event)[1] == explicit_hash_key
+        players[shard_map.shard_for(key, explicit_hash_key)] += 1
+    assert set(players) == set(shard_map.shard_ids)
+    assert max(players.values()) < 1.2 * min(players.values())
+
+
+def test_key_rate_covers_the_last_two_seconds():
+    clock = Clock()
+    throughput = ShardThroughput(clock=clock)
+    for _ in range(30):
+        throughput.observe_key("hot")
+    clock.now += 1
+    for _ in range(5):
+        throughput.observe_key("hot")
+    assert throughput.key_rate("hot") == 30
+    clock.now += 1
+    assert throughput.key_rate("hot") == 5
+    clock.now += 1
+    assert throughput.key_rate("hot") == 0
+    assert throughput.key_rate("other") == 0
+
+
+def test_shard_stats_average_over_the_window():
+    clock = Clock()
+    throughput = ShardThroughput(window=10, clock=clock)
+    for second in range(12):
+        for _ in range(100):
+            throughput.record("shardId-000000000000", 1000)
+        throughput.record("shardId-000000000001", 10, throttled=True)
+        clock.now += 1
+    stats = throughput.shard_stats()
+    assert stats["shardId-000000000000"]["records_per_second"] == 100
+    assert stats["shardId-000000000000"]["bytes_per_second"] == 100_000
+    # The larger of the record and byte shares of the shard's limits
+    assert stats["shardId-000000000000"]["utilization"] == pytest.approx(100 / 1000)
+    assert stats["shardId-000000000001"]["throttles_per_second"] == 1
+    assert stats["shardId-000000000001"]["records_per_second"] == 0
+    assert throughput.throttled_records == 12
+
+
+def test_shard_stats_count_seconds_without_records():
+    clock = Clock()
+    throughput = ShardThroughput(window=10, clock=clock)
+    throughput.record("shardId-000000000000", 100)
+    clock.now += 5
+    throughput.record("shardId-000000000000", 100)
+    # Two records over the five seconds since the tracker started
+    assert throughput.shard_stats()["shardId-000000000000"]["records_per_second"] == pytest.approx(0.4)
+    clock.now += 5
+    assert throughput.shard_stats()["shardId-000000000000"]["records_per_second"] == pytest.approx(0.2)
+    assert throughput.shard_stats()["shardId-000000000000"]["bytes_per_second"] == pytest.approx(20)
+
+
+def test_shard_stats_decay_when_traffic_stops():
+    clock = Clock()
+    throughput = ShardThroughput(window=10, clock=clock)
+    for _ in range(10):
+        for _ in range(50):
+            throughput.record("shardId-000000000000", 100)
+        clock.now += 1
+    assert throughput.shard_stats()["shardId-000000000000"]["records_per_second"] == 50
+    clock.now += 5
+    assert throughput.shard_stats()["shardId-000000000000"]["records_per_second"] == 25
+    clock.now += 500
+    assert throughput.shard_stats() == {}
+
+
+def test_adaptive_salts_hot_keys_per_session():
+    clock = Clock()
+    shard_map = ShardMap.uniform(8)
+    throughput = ShardThroughput(clock=clock, shard_map=shard_map)
+    partitioner = AdaptivePartitioner(ExplicitHashPartitioner(shard_map), throughput, hot_key_threshold=50)
+    hot, cool = models(2)
+    sessions = [hot.model_copy(update={"session_id": f"session_{i}"}) for i in range(40)]
+
+    first = [partitioner.partition(hot) for _ in range(51)]
+    assert set(first) == {ExplicitHashPartitioner(shard_map).partition(hot)}
+    salted = {event.session_id: partitioner.partition(event) for event in sessions}
+    assert all(key.startswith(f"{hot.player_id}#") and explicit is None for key, explicit in salted.values())
+    # A session keeps its key, so its events stay in order
+    assert all(partitioner.partition(event) == salted[event.session_id] for event in sessions)
+    assert len({shard_map.shard_for(key) for key, _ in salted.values()}) > 1
+    assert partitioner.partition(cool) == ExplicitHashPartitioner(shard_map).partition(cool)
+
+    # Two quiet seconds later the key is routed as before
+    clock.now += 2
+    assert partitioner.partition(hot) == first[0]
+
+
+def test_random_salt_spreads_a_single_session():
+    clock = Clock()
+    shard_map = ShardMap.uniform(8)
+    partitioner = AdaptivePartitioner(PlayerPartitioner(), ShardThroughput(clock=clock), hot_key_threshold=50,
+                                      salt="random")
+    hot = models(1)[0]
+    for _ in range(51):
+        partitioner.partition(hot)
+    keys = {partitioner.partition(hot)[0] for _ in range(300)}
+    assert len(keys) == 8 and len({shard_map.shard_for(key) for key in keys}) > 1
+    with pytest.raises(ValueError):
+        AdaptivePartitioner(PlayerPartitioner(), ShardThroughput(), salt="shuffle")
+
+
+def test_create_partitioner(monkeypatch):
+    monkeypatch.delenv("PARTITION_STRATEGY", raising=False)
+    monkeypatch.delenv("HOT_KEY_SALT_BUCKETS", raising=False)
+    assert isinstance(partitioning.create_partitioner(), PlayerPartitioner)
+    assert isinstance(partitioning.create_partitioner("session"), SessionPartitioner)
+    assert isinstance(partitioning.create_partitioner("game_salted"), SaltedGamePartitioner)
+    with pytest.raises(ValueError):
+        partitioning.create_partitioner("explicit_hash")
+    with pytest.raises(ValueError):
+        partitioning.create_partitioner("round_robin")
+
+    throughput = ShardThroughput()
+    adaptive = partitioning.create_partitioner("explicit_hash", throughput, ShardMap.uniform(2))
+    assert isinstance(adaptive, AdaptivePartitioner) and isinstance(adaptive.base, ExplicitHashPartitioner)
+    monkeypatch.setenv("HOT_KEY_SALT_BUCKETS", "0")
+    assert isinstance(partitioning.create_partitioner("player", throughput), PlayerPartitioner)
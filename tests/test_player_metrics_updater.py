@@ -0,0 +1,47 @@
+"""Tests for the record decoding of src/processors/player_metrics_updater.py."""
+import base64
+import json
+
+from src.processors import player_metrics_updater
+from src.utils import kpl
+
+
+class FakeStore:
+    """PlayerMetricsStore.apply over a list of the events applied."""
+
+    def __init__(self):
+        self.events = []
+
+    def apply(self, events):
+        self.events.extend(events)
+        return len({event["player_id"] for event in events})
+
+
+def record(data: bytes, partition_key: str = "player_1"):
+    return {"kinesis": {"data": base64.b64encode(data).decode(), "partitionKey": partition_key}}
+
+
+def game_end(player_id: str, score: int) -> bytes:
+    return json.dumps({"event_type": "game_end", "player_id": player_id, "score": score}).encode()
+
+
+def test_undecodable_records_are_skipped_and_counted(monkeypatch, caplog):
+    store = FakeStore()
+    monkeypatch.setattr(player_metrics_updater, "_store", store)
+    aggregated = kpl.aggregate([("player_2", game_end("player_2", 5)), ("player_2", b"\xff{not json")])
+    event = {"Records": [
+        record(game_end("player_1", 10)),
+        record(b'{"event_type": "game_end", "player_id"'),
+        record(aggregated, "player_2"),
+        record(b"[1, 2, 3]"),
+        record(game_end("player_3", 7), "player_3"),
+    ]}
+
+    assert player_metrics_updater.handler(event) == {"events": 3, "skipped": 3, "players": 3}
+    assert [(e["player_id"], e["score"]) for e in store.events] == [("player_1", 10), ("player_2", 5), ("player_3", 7)]
+    assert "Skipping 3 undecodable records" in caplog.text
+
+
+def test_a_batch_without_bad_records_skips_none():
+    events, skipped = player_metrics_updater.decode_records([{"Data": game_end("player_1", 1)}])
+    assert events == [{"event_type": "game_end", "player_id": "player_1", "score": 1}] and skipped == 0
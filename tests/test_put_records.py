@@ -0,0 +1,117 @@
+"""Tests for PutRecords chunking and retries (src/api/ingest.py, src/api/producer.py)."""
+import asyncio
+
+import pytest
+
+from src.api import ingest
+from src.api.producer import KinesisProducer
+
+
+def entries(count: int, size: int = 100):
+    return [(index, {"Data": b"x" * size, "PartitionKey": f"player_{index:05d}"}) for index in range(count)]
+
+
+def request_bytes(chunk) -> int:
+    return sum(len(entry["Data"]) + len(entry["PartitionKey"].encode()) for _, entry in chunk)
+
+
+class ScriptedClient:
+    """A Kinesis client that rejects the records `fail(attempt, partition_key)` names."""
+
+    def __init__(self, fail=lambda attempt, partition_key: False, raise_on=()):
+        self.fail = fail
+        self.raise_on = raise_on
+        self.requests = []
+        self.written = []
+
+    def put_records(self, StreamName, Records):
+        attempt = len(self.requests)
+        self.requests.append([record["PartitionKey"] for record in Records])
+        if attempt in self.raise_on:
+            raise ConnectionError("connection reset")
+        results = []
+        for record in Records:
+            if self.fail(attempt, record["PartitionKey"]):
+                results.append({"ErrorCode": ingest.THROTTLED, "ErrorMessage": "Rate exceeded for shard"})
+            else:
+                self.written.append(record["PartitionKey"])
+                results.append({"SequenceNumber": str(len(self.written)), "ShardId": "shardId-000000000000"})
+        return {"FailedRecordCount": sum("ErrorCode" in r for r in results), "Records": results}
+
+
+def test_chunks_hold_at_most_500_records():
+    chunks = list(ingest.chunk_records(entries(1201)))
+    assert [len(chunk) for chunk in chunks] == [500, 500, 201]
+    assert [index for chunk in chunks for index, _ in chunk] == list(range(1201))
+
+
+def test_chunks_stay_within_5_mb():
+    # Records just under 1 MiB: five fit in a request, a sixth would not
+    chunks = list(ingest.chunk_records(entries(12, size=ingest.MAX_BYTES_PER_RECORD - 20)))
+    assert [len(chunk) for chunk in chunks] == [5, 5, 2]
+    for chunk in chunks:
+        assert request_bytes(chunk) <= ingest.MAX_BYTES_PER_REQUEST
+
+
+def test_chunk_closes_at_the_byte_limit_before_the_record_limit():
+    size = ingest.MAX_BYTES_PER_REQUEST // 300
+    chunks = list(ingest.chunk_records(entries(600, size=size)))
+    assert all(request_bytes(chunk) <= ingest.MAX_BYTES_PER_REQUEST for chunk in chunks)
+    assert len(chunks[0]) < ingest.MAX_RECORDS_PER_REQUEST
+    assert sum(len(chunk) for chunk in chunks) == 600
+
+
+def test_only_failed_records_are_retried():
+    client = ScriptedClient(fail=lambda attempt, key: attempt == 0 and int(key[-5:]) % 3 == 0)
+    delays = []
+    results = ingest.put_records_blocking(client, "stream", entries(30), sleep=delays.append)
+
+    assert len(client.requests) == 2
+    assert client.requests[1] == [f"player_{index:05d}" for index in range(0, 30, 3)]
+    assert sorted(client.written) == [f"player_{index:05d}" for index in range(30)]
+    assert all(result["status"] == "success" for result in results.values())
+    assert len(delays) == 1 and 0 <= delays[0] <= ingest.RETRY_BACKOFF_SECONDS
+
+
+def test_records_still_failing_after_every_attempt_report_the_error():
+    client = ScriptedClient(fail=lambda attempt, key: key == "player_00004")
+    results = ingest.put_records_blocking(client, "stream", entries(10), sleep=lambda _: None)
+
+    assert len(client.requests) == ingest.MAX_PUT_ATTEMPTS
+    assert all(request == ["player_00004"] for request in client.requests[1:])
+    assert results[4] == {"index": 4, "status": "error", "error": ingest.THROTTLED,
+                          "message": "Rate exceeded for shard"}
+    assert sum(result["status"] == "success" for result in results.values()) == 9
+
+
+def test_a_failed_request_is_retried_whole():
+    client = ScriptedClient(raise_on=(0,))
+    results = ingest.put_records_blocking(client, "stream", entries(5), sleep=lambda _: None)
+
+    assert len(client.requests) == 2
+    assert client.requests[0] == client.requests[1]
+    assert all(result["status"] == "success" for result in results.values())
+
+
+def test_each_chunk_is_retried_on_its_own():
+    client = ScriptedClient(fail=lambda attempt, key: attempt == 1)
+    results = ingest.put_records_blocking(client, "stream", entries(700), sleep=lambda _: None)
+
+    # The second chunk's first attempt fails whole and is sent again
+    assert [len(request) for request in client.requests] == [500, 200, 200]
+    assert len(results) == 700
+    assert all(result["status"] == "success" for result in results.values())
+
+
+@pytest.mark.parametrize("count", [1, 499, 500, 501, 1500])
+def test_producer_retries_like_the_blocking_path(count):
+    client = ScriptedClient(fail=lambda attempt, key: attempt < 3 and int(key[-5:]) % 4 == 0)
+    producer = KinesisProducer(client=client, max_workers=1)
+    try:
+        results = asyncio.run(producer.put_records("stream", entries(count)))
+    finally:
+        producer.close()
+
+    assert sorted(results) == list(range(count))
+    assert all(result["status"] == "success" for result in results.values())
+    assert sorted(client.written) == sorted(entry["PartitionKey"] for _, entry in entries(count))
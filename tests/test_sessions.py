@@ -0,0 +1,145 @@
+"""
+Tests for the server-side sessionization of src/processors/stream_processor.py.
+
+Runs the player_sessions query of the streaming job (an event-time session
+window over a bounded file source) and its batch form used by replays on a
+local Flink, over a few sessions whose records are worked out by hand, with
+records the streaming job must drop rather than fail on. Needs apache-flink
+and a JVM; skipped without them.
+"""
+import json
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pyflink")
+
+from src.processors import stream_processor as sp  # noqa: E402
+
+START = datetime(2024, 1, 15, 10)
+GAP = timedelta(minutes=sp.SESSION_GAP_MINUTES)
+
+
+def event(event_id: str, session_id: str, event_type: str, minutes: float, **fields):
+    return dict(event_id=event_id, session_id=session_id, player_id=f"player_{session_id}", game_id="game_1",
+                event_type=event_type, version="1.0",
+                timestamp=(START + timedelta(minutes=minutes)).isoformat(), **fields)
+
+
+EVENTS = [
+    # Played to the end, with a purchase sent twice
+    event("c1", "complete", "game_start", 0),
+    event("c2", "complete", "progress", 1, level=3, xp_earned=120),
+    event("c3", "complete", "purchase", 2, amount=4.99),
+    event("c3", "complete", "purchase", 2, amount=4.99),
+    event("c4", "complete", "progress", 3, level=4, xp_earned=80),
+    event("c5", "complete", "game_end", 5, duration=290, score=1500, level_reached=4),
+    # Never ended
+    event("a1", "abandoned", "game_start", 0),
+    event("a2", "abandoned", "progress", 10, level=2, xp_earned=30),
+    # Resumed after more than the gap: two sessions
+    event("r1", "resumed", "game_start", 0),
+    event("r2", "resumed", "progress", 40, level=1, xp_earned=10),
+    event("r3", "resumed", "game_end", 41, duration=60, score=10, level_reached=1),
+    # Exactly the gap apart: Flink merges windows that touch
+    event("t1", "touching", "game_start", 0),
+    event("t2", "touching", "progress", sp.SESSION_GAP_MINUTES, level=1, xp_earned=5),
+]
+
+
+def minutes(value: float) -> datetime:
+    return START + timedelta(minutes=value)
+
+
+EXPECTED = {
+    ("complete", minutes(0)): dict(session_end=minutes(5), duration_seconds=300, client_duration=290, event_count=5,
+                                   started=True, completed=True, purchase_count=1, revenue=4.99, progress_events=2,
+                                   max_level=4, xp_earned=200, score=1500, closed_at=minutes(5) + GAP),
+    ("abandoned", minutes(0)): dict(session_end=minutes(10), duration_seconds=600, client_duration=None,
+                                    event_count=2, started=True, completed=False, purchase_count=0, revenue=0.0,
+                                    progress_events=1, max_level=2, xp_earned=30, score=None,
+                                    closed_at=minutes(10) + GAP),
+    ("resumed", minutes(0)): dict(session_end=minutes(0), duration_seconds=0, client_duration=None, event_count=1,
+                                  started=True, completed=False, purchase_count=0, revenue=0.0, progress_events=0,
+                                  max_level=None, xp_earned=0, score=None, closed_at=minutes(0) + GAP),
+    ("resumed", minutes(40)): dict(session_end=minutes(41), duration_seconds=60, client_duration=60, event_count=2,
+                                   started=False, completed=True, purchase_count=0, revenue=0.0, progress_events=1,
+                                   max_level=1, xp_earned=10, score=10, closed_at=minutes(41) + GAP),
+    ("touching", minutes(0)): dict(session_end=minutes(30), duration_seconds=1800, client_duration=None,
+                                   event_count=2, started=True, completed=False, purchase_count=0, revenue=0.0,
+                                   progress_events=1, max_level=1, xp_earned=5, score=None,
+                                   closed_at=minutes(30) + GAP),
+}
+
+
+# Not JSON, without an event_id, and with an unreadable timestamp
+MALFORMED = [
+    "not json",
+    json.dumps({key: value for key, value in EVENTS[-1].items() if key != "event_id"}),
+    json.dumps(dict(EVENTS[-1], event_id="bad-time", timestamp="yesterday")),
+]
+
+
+def write_events(path, malformed=()) -> str:
+    # In arrival order: the streaming job drops events behind the watermark
+    with open(path / "events.json", "w") as f:
+        f.writelines(json.dumps(record) + "\n" for record in sorted(EVENTS, key=lambda record: record["timestamp"]))
+        f.writelines(line + "\n" for line in malformed)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def events_dir(tmp_path_factory):
+    return write_events(tmp_path_factory.mktemp("events"))
+
+
+class FileSource:
+    """Passes everything to a table environment, with the Kinesis source read from a directory."""
+
+    def __init__(self, t_env, path: str):
+        self.t_env = t_env
+        self.path = path
+
+    def __getattr__(self, name):
+        return getattr(self.t_env, name)
+
+    def execute_sql(self, statement: str):
+        if "'kinesis'" in statement:
+            statement = re.sub(r"'connector' = 'kinesis',(.|\n)*'format'", f"""'connector' = 'filesystem',
+            'path' = '{self.path}',
+            'format'""", statement)
+        return self.t_env.execute_sql(statement)
+
+
+def collect(t_env, query: str):
+    """The rows of an INSERT INTO query's SELECT, keyed like player_sessions."""
+    table = t_env.sql_query(re.sub(r"^\s*INSERT INTO \w+", "", query))
+    names = table.get_schema().get_field_names()
+    with table.execute().collect() as results:
+        rows = [dict(zip(names, row)) for row in results]
+    return {(row.pop("session_id"), row.pop("session_start")): row for row in rows}
+
+
+def check(sessions):
+    assert sessions.keys() == EXPECTED.keys()
+    for key, expected in EXPECTED.items():
+        row = sessions[key]
+        assert (row.pop("game_id"), row.pop("player_id")) == ("game_1", f"player_{key[0]}")
+        assert row.pop("revenue") == pytest.approx(expected["revenue"])
+        assert row == {name: value for name, value in expected.items() if name != "revenue"}, key
+
+
+def test_streaming_session_windows(tmp_path):
+    t_env = sp.create_table_environment()
+    sp.create_source_table(FileSource(t_env, write_events(tmp_path, MALFORMED)))
+    sp.create_dedup_view(t_env)
+    _, query = sp.METRICS["player_sessions"]
+    check(collect(t_env, query))
+
+
+def test_replay_sessions_match(events_dir):
+    t_env = sp.create_batch_table_environment()
+    sp.create_replay_source_table(t_env, events_dir)
+    sp.create_dedup_view(t_env, order_by="`timestamp`")
+    check(collect(t_env, sp.BATCH_QUERIES["player_sessions"]))
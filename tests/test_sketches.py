@@ -0,0 +1,221 @@
+"""Tests for the sketches of src/processors/sketches.py."""
+import base64
+import math
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.processors.sketches import DDSketch, HyperLogLog, rollup_sketches
+
+QUANTILES = (0.0, 0.01, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 0.999, 1.0)
+
+
+def ddsketch(values, **kwargs) -> DDSketch:
+    sketch = DDSketch(**kwargs)
+    sketch.update(values)
+    return sketch
+
+
+def exact_quantile(values, q: float) -> float:
+    """The value of the rank DDSketch.quantile answers for."""
+    return sorted(values)[math.floor(q * (len(values) - 1))]
+
+
+def assert_relative_accuracy(sketch: DDSketch, values, accuracy: float = 0.01):
+    for q in QUANTILES:
+        expected = exact_quantile(values, q)
+        assert abs(sketch.quantile(q) - expected) <= accuracy * abs(expected) + 1e-12, q
+
+
+def hll(values) -> HyperLogLog:
+    sketch = HyperLogLog()
+    sketch.update(values)
+    return sketch
+
+
+def test_empty_hll_counts_zero():
+    assert HyperLogLog().count() == 0
+    assert HyperLogLog.merge_all([]) is None
+
+
+@pytest.mark.parametrize("distinct", [1, 10, 100, 1000, 20000, 200000])
+def test_hll_error_bound(distinct):
+    sketch = hll(f"player_{i}" for i in range(distinct))
+    # Four standard errors of 1.04 / sqrt(4096)
+    assert abs(sketch.count() - distinct) <= max(1, 4 * 0.01625 * distinct)
+
+
+def test_hll_ignores_repeats():
+    sketch = hll(f"player_{i % 500}" for i in range(20000))
+    assert sketch.registers == hll(f"player_{i}" for i in range(500)).registers
+
+
+def test_hll_merge_is_the_sketch_of_the_union():
+    left, right = hll(f"p{i}" for i in range(0, 6000)), hll(f"p{i}" for i in range(4000, 10000))
+    union = hll(f"p{i}" for i in range(10000))
+    merged = HyperLogLog.from_bytes(left.to_bytes())
+    merged.merge(right)
+    assert merged.registers == union.registers
+    right.merge(left)
+    assert right.registers == union.registers
+
+
+def test_hll_merge_all_matches_pairwise_merges():
+    windows = [hll(f"p{i}" for i in range(start, start + 700)) for start in range(0, 5000, 500)]
+    merged = HyperLogLog.merge_all(sketch.to_bytes() for sketch in windows)
+    pairwise = HyperLogLog()
+    for sketch in windows:
+        pairwise.merge(sketch)
+    assert merged.registers == pairwise.registers
+    assert HyperLogLog.merge_all([windows[0].to_bytes()]).registers == windows[0].registers
+
+
+def test_hll_precisions_do_not_mix():
+    with pytest.raises(ValueError):
+        HyperLogLog(12).merge(HyperLogLog(10))
+    with pytest.raises(ValueError):
+        HyperLogLog.merge_all([HyperLogLog(12).to_bytes(), HyperLogLog(10).to_bytes()])
+
+
+def test_hll_serialization():
+    sketch = hll(f"p{i}" for i in range(3000))
+    data = sketch.to_bytes()
+    assert len(data) == 3 + 4096
+    restored = HyperLogLog.from_bytes(data)
+    assert restored.precision == 12 and restored.registers == sketch.registers
+    assert restored.count() == sketch.count()
+    small = HyperLogLog(4)
+    small.update(["a", "b"])
+    assert HyperLogLog.from_bytes(small.to_bytes()).registers == small.registers
+
+
+@pytest.mark.parametrize("data", [b"", b"X\x01\x0c", b"H\x02\x0c" + bytes(4096), b"H\x01\x0c" + bytes(100)])
+def test_hll_rejects_bad_bytes(data):
+    with pytest.raises(ValueError):
+        HyperLogLog.from_bytes(data)
+
+
+def test_hll_precision_is_bounded():
+    for precision in (3, 19):
+        with pytest.raises(ValueError):
+            HyperLogLog(precision)
+
+
+def test_rollup_sketches_merge_windows_per_game_and_period():
+    start = datetime(2024, 1, 31, 22)
+    records = []
+    for window in range(36):
+        window_start = start + timedelta(minutes=5 * window)
+        for game_id in ("game_1", "game_2"):
+            players = hll(f"{game_id}_{window * 10 + i}" for i in range(40))
+            records.append({"window_start": window_start.isoformat(), "game_id": game_id,
+                            "player_sketch": base64.b64encode(players.to_bytes()).decode()})
+    records.append({"window_start": start.isoformat(), "game_id": "game_1", "player_sketch": None})
+
+    hourly = rollup_sketches(records, "player_sketch", "hour")
+    assert [(row["window_start"], row["game_id"]) for row in hourly] == [
+        (hour, game_id) for hour in ("2024-01-31T22:00:00", "2024-01-31T23:00:00", "2024-02-01T00:00:00")
+        for game_id in ("game_1", "game_2")
+    ]
+    # 12 windows of 40 players, each sharing 30 with the one before
+    first = hourly[0]
+    assert abs(first["distinct_count"] - (11 * 10 + 40)) <= 4
+    expected = hll(f"game_1_{i}" for i in range(11 * 10 + 40))
+    assert HyperLogLog.from_bytes(base64.b64decode(first["player_sketch"])).registers == expected.registers
+
+    monthly = rollup_sketches(records, "player_sketch", "month")
+    assert [(row["window_start"][:10], row["game_id"]) for row in monthly] == [
+        ("2024-01-01", "game_1"), ("2024-01-01", "game_2"), ("2024-02-01", "game_1"), ("2024-02-01", "game_2")
+    ]
+    with pytest.raises(ValueError):
+        rollup_sketches(records, "player_sketch", "week")
+
+
+def distributions():
+    rng = random.Random(9)
+    return {
+        "durations": [rng.randint(1, 7200) for _ in range(20000)],
+        "amounts": [round(rng.lognormvariate(1, 1.5), 2) for _ in range(20000)],
+        "wide": [10 ** rng.uniform(-6, 9) for _ in range(20000)],
+        "signed": [rng.gauss(0, 100) for _ in range(20000)] + [0.0] * 500,
+        "constant": [42.0] * 1000,
+    }
+
+
+@pytest.mark.parametrize("name", list(distributions()))
+def test_ddsketch_relative_accuracy(name):
+    values = distributions()[name]
+    assert_relative_accuracy(ddsketch(values), values)
+
+
+def test_ddsketch_accuracy_setting():
+    values = distributions()["amounts"]
+    assert_relative_accuracy(ddsketch(values, relative_accuracy=0.05), values, accuracy=0.05)
+    assert_relative_accuracy(ddsketch(values, relative_accuracy=0.001), values, accuracy=0.001)
+
+
+def test_ddsketch_summaries():
+    values = distributions()["signed"]
+    sketch = ddsketch(values)
+    assert sketch.count == len(values)
+    assert sketch.min == min(values) and sketch.max == max(values)
+    assert min(values) <= sketch.quantile(0) and sketch.quantile(1) <= max(values)
+    assert sketch.mean == pytest.approx(sum(values) / len(values))
+    bins = list(sketch.bins())
+    assert [value for value, _ in bins] == sorted(value for value, _ in bins)
+    assert sum(count for _, count in bins) == len(values)
+
+
+def test_empty_ddsketch():
+    sketch = DDSketch()
+    assert sketch.quantile(0.5) is None and sketch.mean is None
+    assert DDSketch.from_bytes(sketch.to_bytes()).quantile(0.5) is None
+    assert DDSketch.merge_all([]) is None
+
+
+def test_ddsketch_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        ddsketch([1.0]).quantile(1.5)
+    for accuracy in (0, 1):
+        with pytest.raises(ValueError):
+            DDSketch(relative_accuracy=accuracy)
+    with pytest.raises(ValueError):
+        DDSketch().merge(DDSketch(relative_accuracy=0.02))
+
+
+def test_ddsketch_merge_is_the_sketch_of_the_union():
+    values = distributions()["signed"]
+    parts = [values[start:start + 3000] for start in range(0, len(values), 3000)]
+    merged = DDSketch.merge_all(ddsketch(part).to_bytes() for part in parts)
+    whole = ddsketch(values)
+    assert (merged.positive, merged.negative, merged.zero_count) == (whole.positive, whole.negative, whole.zero_count)
+    assert (merged.count, merged.min, merged.max) == (whole.count, whole.min, whole.max)
+    assert merged.sum == pytest.approx(whole.sum)
+    assert_relative_accuracy(merged, values)
+
+
+def test_ddsketch_serialization():
+    for values in distributions().values():
+        sketch = ddsketch(values)
+        restored = DDSketch.from_bytes(sketch.to_bytes())
+        assert restored.to_bytes() == sketch.to_bytes()
+        assert [restored.quantile(q) for q in QUANTILES] == [sketch.quantile(q) for q in QUANTILES]
+    # A window of session durations stays small
+    assert len(ddsketch(distributions()["durations"][:500]).to_bytes()) < 2048
+    with pytest.raises(ValueError):
+        DDSketch.from_bytes(HyperLogLog().to_bytes())
+
+
+def test_ddsketch_collapse_keeps_the_upper_quantiles():
+    values = distributions()["wide"]
+    sketch = ddsketch(values, max_bins=200)
+    assert len(sketch.positive) <= 200 and sketch.count == len(values)
+    # 200 bins of 2% cover the top 1.7 of the 15 decades, the top 11% of values
+    for q in (0.9, 0.95, 0.99, 1.0):
+        expected = exact_quantile(values, q)
+        assert abs(sketch.quantile(q) - expected) <= 0.01 * expected
+    # Merging collapsed sketches stays within the bin limit
+    merged = DDSketch.from_bytes(sketch.to_bytes())
+    merged.merge(ddsketch(values[::-1], max_bins=200))
+    assert len(merged.positive) <= 200 and merged.count == 2 * len(values)